@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, send_file
 
 
 
@@ -6,7 +6,15 @@ from flask_sqlalchemy import SQLAlchemy
 
 
 
-from sqlalchemy import inspect, text
+from sqlalchemy import and_, case, event, func, inspect, select, text
+
+from sqlalchemy.dialects.postgresql import JSONB, insert as postgresql_insert
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from sqlalchemy.exc import IntegrityError
+
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 
@@ -14,6 +22,39 @@ from dotenv import load_dotenv
 
 
 
+
+from metrics import init_metrics
+
+from slow_queries import init_slow_query_log, open_slow_query_log, recent_slow_queries
+
+from health_sampler import (init_health_sampler, latest_sample, psutil_available, sample_history,
+                            system_info as health_system_info)
+
+from profiler import init_profiler, list_profiles, profile_path, start_window
+
+from response_encoding import init_response_encoding, representation, wants_msgpack
+
+from shelf_billing import add_months, billing_by_month
+
+from cache import cache, cached_lookup, init_cache
+
+from coalesce import clear_coalesced, coalesce_stats, coalesced, mark_coalesced_stale
+
+from invalidation import bus_stats, ensure_invalidation_table, init_invalidation_bus, invalidate_prefixes, on_change
+
+from rental_expiry import init_expiry_scanner, scanner_stats
+
+from shelf_board import board_stats, invalidate_shelf_board, shelf_board
+
+from rate_limit import client_address, init_rate_limiter, limiter, rate_limited
+
+from permissions import auth_record, has_permission, init_permissions, store_snapshot
+
+from password_pool import PasswordPoolBusy, hash_password, init_password_pool, needs_rehash, pool_stats, verify_password
+
+
+
+
 import os
 
 
@@ -42,7 +83,7 @@ from datetime import datetime, timedelta, timezone
 
 
 
-from werkzeug.security import generate_password_hash, check_password_hash
+
 
 
 
@@ -58,7 +99,6 @@ from functools import wraps
 
 
 
-from collections import defaultdict
 
 
 
@@ -114,6 +154,14 @@ import platform
 
 
 
+import re
+
+
+
+
+
+
+
 import secrets
 
 
@@ -356,7 +404,19 @@ else:
 
     
 
-    if flask_env == 'production':
+    if database_url.startswith('sqlite'):
+
+
+
+        # Explicit SQLite file (e.g. a benchmark database) - nothing to test
+
+
+
+        print(f"Using SQLite database: {database_url}")
+
+
+
+    elif flask_env == 'production':
 
 
 
@@ -533,6 +593,54 @@ db = SQLAlchemy(app)
 
 
 
+# Request latency, status and SQL metrics exposed at /metrics
+
+init_metrics(app)
+
+# Statements slower than this are logged with their query plan (see slow_queries.py)
+
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '250'))
+
+init_slow_query_log(app)
+
+# CPU, memory, uptime and DB pool samples served by /get_system_health
+
+app.config['HEALTH_SAMPLE_INTERVAL'] = int(os.environ.get('HEALTH_SAMPLE_INTERVAL', '10'))
+
+with app.app_context():
+    init_health_sampler(app, db.engine)
+
+# Admins can profile a request with X-Profile: 1 (or ?_profile=1); output goes to PROFILES_DIR
+
+app.config['PROFILES_DIR'] = os.environ.get('PROFILES_DIR', 'profiles')
+
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+
+init_profiler(app)
+
+# orjson-backed jsonify, gzip/brotli above COMPRESS_MIN_SIZE bytes, msgpack on request
+
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+
+init_response_encoding(app)
+
+# In-process LRU in front of a cache shared by all workers (CACHE_URL: sqlite:///path, redis://..., or local)
+
+app.config['CACHE_URL'] = os.environ.get('CACHE_URL')
+
+app.config['CACHE_LOCAL_MAX_ENTRIES'] = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', '2048'))
+
+app.config['CACHE_LOCAL_TTL'] = float(os.environ.get('CACHE_LOCAL_TTL', '30'))
+
+init_cache(app)
+
+# Analytics views share one computation and serve stale results while refreshing (coalesce.py)
+
+app.config['ANALYTICS_CACHE_ENABLED'] = os.environ.get('ANALYTICS_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+
+
 
 
 
@@ -1288,7 +1396,6 @@ def ensure_database_schema():
 
 
 
-# Run automatic migration on startup
 
 
 
@@ -1296,7 +1403,6 @@ def ensure_database_schema():
 
 
 
-ensure_database_schema()
 
 
 
@@ -1314,13 +1420,37 @@ ensure_database_schema()
 
 
 
+# Configure logging (log files are opened by init_log_files(), not at import)
+if not app.debug:
+    app.logger.setLevel(logging.INFO)
+    app.logger.info('ErrantMate startup')
+else:
+    # Development logging
+    logging.basicConfig(level=logging.DEBUG)
 
+_log_files = {'open': False}
 
 
+def init_log_files():
+    """Open the rotating files in logs/: slow_queries.log, and errantmate.log outside debug mode.
 
+    Importing the app creates no files. gunicorn workers call this from post_worker_init,
+    and `python app.py` and wsgi.py call it before serving.
+    """
+    if _log_files['open']:
+        return
+    _log_files['open'] = True
+    open_slow_query_log()
+    if not app.debug:
+        os.makedirs('logs', exist_ok=True)
+        file_handler = RotatingFileHandler('logs/errantmate.log', maxBytes=10240000, backupCount=10)
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+        ))
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
 
 
-# Configure logging
 
 
 
@@ -1328,47 +1458,48 @@ ensure_database_schema()
 
 
 
-if not app.debug:
 
 
 
 
 
 
+def get_local_time():
 
-    # Production logging configuration
 
 
+    """Get current time in UTC+3 (Kenya timezone)"""
 
 
 
+    return datetime.utcnow() + timedelta(hours=3)
 
 
-    if not os.path.exists('logs'):
 
 
 
 
 
+def get_local_date():
 
 
-        os.mkdir('logs')
 
+    """Get current date in UTC+3 (Kenya timezone)"""
 
 
 
+    return (datetime.utcnow() + timedelta(hours=3)).date()
 
 
 
-    
 
 
 
 
+# Use simple datetime (browser local time will be set from frontend)
 
 
 
-    file_handler = RotatingFileHandler('logs/errantmate.log', maxBytes=10240000, backupCount=10)
 
 
 
@@ -1376,23 +1507,23 @@ if not app.debug:
 
 
 
-    file_handler.setFormatter(logging.Formatter(
 
 
 
 
 
+def get_current_time():
 
 
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
 
+    """Get current datetime in UTC+3 (Kenya timezone)."""
 
 
 
+    return datetime.utcnow() + timedelta(hours=3)
 
 
 
-    ))
 
 
 
@@ -1400,47 +1531,46 @@ if not app.debug:
 
 
 
-    file_handler.setLevel(logging.INFO)
 
 
 
 
 
+def get_local_time(current_time=None):
 
 
-    app.logger.addHandler(file_handler)
 
 
 
 
 
+    """Get current time."""
 
 
-    
 
 
 
 
 
+    if current_time is None:
 
 
-    app.logger.setLevel(logging.INFO)
 
 
 
 
 
+        return get_current_time()
 
 
-    app.logger.info('ErrantMate startup')
 
 
 
 
 
+    return current_time
 
 
-else:
 
 
 
@@ -1448,17 +1578,35 @@ else:
 
 
 
-    # Development logging
 
 
 
 
 
 
+# Requests arrive through PROXY_COUNT reverse proxies (Render's load balancer). Trust only the
+# X-Forwarded-For hops they append, so request.remote_addr is the client and cannot be spoofed
+app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', '1'))
+if app.config['PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'])
 
-    logging.basicConfig(level=logging.DEBUG)
+# Rate limits shared by all workers (rate_limit.py): policy -> 'capacity/period seconds'
 
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATE_LIMIT_URL'] = os.environ.get('RATE_LIMIT_URL')
+app.config['RATE_LIMITS'] = {
+    'login': os.environ.get('RATE_LIMIT_LOGIN', '5/300'),
+    'public_search': os.environ.get('RATE_LIMIT_PUBLIC_SEARCH', '30/60'),
+}
+init_rate_limiter(app)
 
+# Password hashing runs in a bounded process pool per worker (password_pool.py); hashes made
+# with another PASSWORD_HASH_METHOD are upgraded at the user's next login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['PASSWORD_POOL_WORKERS'] = int(os.environ.get('PASSWORD_POOL_WORKERS', 2))
+app.config['PASSWORD_POOL_QUEUE'] = int(os.environ.get('PASSWORD_POOL_QUEUE', 16))
+app.config['PASSWORD_POOL_TIMEOUT'] = float(os.environ.get('PASSWORD_POOL_TIMEOUT', 5))
+init_password_pool(app)
 
 
 
@@ -1472,15 +1620,12 @@ else:
 
 
 
-def get_local_time():
 
 
 
-    """Get current time in UTC+3 (Kenya timezone)"""
 
 
 
-    return datetime.utcnow() + timedelta(hours=3)
 
 
 
@@ -1488,15 +1633,13 @@ def get_local_time():
 
 
 
-def get_local_date():
 
 
 
-    """Get current date in UTC+3 (Kenya timezone)"""
 
 
 
-    return (datetime.utcnow() + timedelta(hours=3)).date()
+# Initialize database tables with robust error handling
 
 
 
@@ -1504,7 +1647,7 @@ def get_local_date():
 
 
 
-# Use simple datetime (browser local time will be set from frontend)
+def ensure_database_tables():
 
 
 
@@ -1512,6 +1655,7 @@ def get_local_date():
 
 
 
+    """Ensure database tables exist with simple, reliable approach."""
 
 
 
@@ -1519,16 +1663,15 @@ def get_local_date():
 
 
 
+    try:
 
-def get_current_time():
 
 
 
-    """Get current datetime in UTC+3 (Kenya timezone)."""
 
 
 
-    return datetime.utcnow() + timedelta(hours=3)
+        with app.app_context():
 
 
 
@@ -1536,6 +1679,7 @@ def get_current_time():
 
 
 
+            # Simple approach: just create all tables
 
 
 
@@ -1543,46 +1687,47 @@ def get_current_time():
 
 
 
+            print("Creating database tables...")
 
-def get_local_time(current_time=None):
 
 
 
 
 
 
+            db.create_all()
 
-    """Get current time."""
 
 
 
 
 
 
+            
 
-    if current_time is None:
 
 
 
 
 
 
+            # Verify tables exist
 
-        return get_current_time()
 
 
 
 
 
 
+            inspector = db.inspect(db.engine)
 
-    return current_time
 
 
 
 
 
 
+            tables = inspector.get_table_names()
 
 
 
@@ -1590,38 +1735,39 @@ def get_local_time(current_time=None):
 
 
 
+            required_tables = ['users', 'delivery', 'audit_log', 'shelf']
 
 
-# Rate limiting for login attempts
 
 
 
 
 
+            
 
 
-LOGIN_ATTEMPT_LIMIT = 5  # Max 5 attempts
 
 
 
 
 
+            
 
 
-LOGIN_ATTEMPT_WINDOW = 300  # 5 minutes window
 
 
 
 
 
+            if all(table in tables for table in required_tables):
 
 
-login_attempts = defaultdict(list)
 
 
 
 
 
+                print("All required tables exist")
 
 
 
@@ -1629,134 +1775,135 @@ login_attempts = defaultdict(list)
 
 
 
+                
 
 
 
-def is_rate_limited(ip_address):
 
 
 
 
+                # Create default admin user if not exists
 
 
 
-    """Check if IP address is rate limited for login attempts."""
 
 
 
 
+                try:
 
 
 
-    now = time.time()
 
 
 
 
+                    admin_user = User.query.filter_by(username='admin').first()
 
 
 
-    # Remove old attempts outside the window
 
 
 
 
+                    if not admin_user:
 
 
 
-    login_attempts[ip_address] = [
 
 
 
 
+                        admin_user = User(
 
 
 
-        attempt_time for attempt_time in login_attempts[ip_address]
 
 
 
 
+                            username='admin',
 
 
 
-        if now - attempt_time < LOGIN_ATTEMPT_WINDOW
 
 
 
 
+                            role='admin',
 
 
 
-    ]
 
 
 
 
+                            is_active=True
 
 
 
-    
 
 
 
 
+                        )
 
 
 
-    # Check if limit exceeded
 
 
 
 
+                        admin_user.set_password('ErrantMate@24!')
 
 
 
-    if len(login_attempts[ip_address]) >= LOGIN_ATTEMPT_LIMIT:
 
 
 
 
+                        db.session.add(admin_user)
 
 
 
-        return True
 
 
 
 
+                        db.session.commit()
 
 
 
-    
 
 
 
 
+                        print("Default admin user created")
 
 
 
-    # Add current attempt
 
 
 
 
+                    else:
 
 
 
-    login_attempts[ip_address].append(now)
 
 
 
 
+                        print("Admin user already exists")
 
 
 
-    return False
 
 
 
 
+                except Exception as admin_error:
 
 
 
@@ -1764,83 +1911,83 @@ def is_rate_limited(ip_address):
 
 
 
+                    print(f"Warning: Could not create admin user: {admin_error}")
 
 
 
 
-# Initialize database tables with robust error handling
 
 
 
+                
 
 
 
 
-def ensure_database_tables():
 
 
 
+                return True
 
 
 
 
-    """Ensure database tables exist with simple, reliable approach."""
 
 
 
+            else:
 
 
 
 
-    try:
 
 
 
+                missing = [table for table in required_tables if table not in tables]
 
 
 
 
-        with app.app_context():
 
 
 
+                return False
 
 
 
 
-            # Simple approach: just create all tables
 
 
 
+                
 
 
 
 
-            print("Creating database tables...")
 
 
 
+    except Exception as e:
 
 
 
 
-            db.create_all()
 
 
 
+        print(f"Error: {e}")
 
 
 
 
-            
 
 
 
+        return False
 
 
 
 
-            # Verify tables exist
 
 
 
@@ -1848,127 +1995,131 @@ def ensure_database_tables():
 
 
 
-            inspector = db.inspect(db.engine)
 
 
 
 
+# Models
 
 
 
-            tables = inspector.get_table_names()
 
 
 
 
+class User(db.Model):
 
 
 
-            required_tables = ['users', 'delivery', 'audit_log', 'shelf']
 
 
 
 
+    __tablename__ = 'users'
 
 
 
-            
 
 
 
 
+    id = db.Column(db.Integer, primary_key=True)
 
 
 
-            
 
 
 
 
+    username = db.Column(db.String(80), unique=True, nullable=False)
 
 
 
-            if all(table in tables for table in required_tables):
 
 
 
 
+    email = db.Column(db.String(120), unique=True, nullable=True)
 
 
 
-                print("All required tables exist")
 
 
 
 
+    phone_number = db.Column(db.String(20), unique=True, nullable=True)
 
 
 
-                
 
 
 
 
+    password_hash = db.Column(db.String(255), nullable=False)
 
 
 
-                # Create default admin user if not exists
 
 
 
 
+    actual_password = db.Column(db.String(255), nullable=True)  # Store actual password for admin viewing (user/staff only)
 
 
 
-                try:
 
 
 
 
+    role = db.Column(db.String(20), default='user')  # 'admin', 'staff', or 'user'
 
 
 
-                    admin_user = User.query.filter_by(username='admin').first()
 
 
 
 
+    created_at = db.Column(db.DateTime, default=get_current_time)
 
 
 
-                    if not admin_user:
 
 
 
 
+    is_active = db.Column(db.Boolean, default=True)
 
 
 
-                        admin_user = User(
 
 
 
 
+    
 
 
 
-                            username='admin',
 
 
 
 
+    def set_password(self, password):
 
 
 
-                            role='admin',
+        self.password_hash = hash_password(password)
 
 
 
+        # Store actual password for admin viewing (user/staff only)
 
+        if self.role in ['user', 'staff']:
 
+            self.actual_password = password
 
+        else:
 
-                            is_active=True
+            self.actual_password = None  # Don't store admin passwords
 
 
 
@@ -1976,7 +2127,7 @@ def ensure_database_tables():
 
 
 
-                        )
+    
 
 
 
@@ -1984,7 +2135,7 @@ def ensure_database_tables():
 
 
 
-                        admin_user.set_password('ErrantMate@24!')
+    def check_password(self, password):
 
 
 
@@ -1992,7 +2143,7 @@ def ensure_database_tables():
 
 
 
-                        db.session.add(admin_user)
+        return verify_password(self.password_hash, password)
 
 
 
@@ -2000,7 +2151,7 @@ def ensure_database_tables():
 
 
 
-                        db.session.commit()
+    
 
 
 
@@ -2008,7 +2159,7 @@ def ensure_database_tables():
 
 
 
-                        print("Default admin user created")
+    def is_admin(self):
 
 
 
@@ -2016,7 +2167,7 @@ def ensure_database_tables():
 
 
 
-                    else:
+        return self.role == 'admin'
 
 
 
@@ -2024,7 +2175,7 @@ def ensure_database_tables():
 
 
 
-                        print("Admin user already exists")
+    def is_staff(self):
 
 
 
@@ -2032,7 +2183,7 @@ def ensure_database_tables():
 
 
 
-                except Exception as admin_error:
+        return self.role == 'staff'
 
 
 
@@ -2040,7 +2191,7 @@ def ensure_database_tables():
 
 
 
-                    print(f"Warning: Could not create admin user: {admin_error}")
+    
 
 
 
@@ -2048,7 +2199,7 @@ def ensure_database_tables():
 
 
 
-                
+    def can_view_reports(self):
 
 
 
@@ -2056,31 +2207,48 @@ def ensure_database_tables():
 
 
 
-                return True
+        return self.role == 'admin'
 
+    
 
+    def can_view_audit_logs(self):
 
+        return self.role == 'admin'
 
+    
 
+    def can_view_system_health(self):
 
+        return self.role == 'admin'
 
-            else:
+    
 
+    def can_delete_delivery(self):
 
+        return self.role in ['admin', 'staff']
 
+    
 
+    def can_manage_deliveries(self):
 
+        return self.role in ['admin', 'staff']
 
+    def can_assign_deliveries(self):
+        return self.role == 'admin'
 
-                missing = [table for table in required_tables if table not in tables]
+    def can_manage_shelves(self):
+        return self.role == 'admin'
 
+    def can_view_shelf_rentals(self):
+        return self.role in ['admin', 'staff']
 
+    def can_administer(self):
+        return self.role == 'admin'
 
 
 
 
 
-                return False
 
 
 
@@ -2088,34 +2256,34 @@ def ensure_database_tables():
 
 
 
-                
 
 
 
+class Delivery(db.Model):
 
 
 
 
-    except Exception as e:
 
 
 
+    __tablename__ = 'delivery'
 
 
 
 
-        print(f"Error: {e}")
 
 
 
+    id = db.Column(db.Integer, primary_key=True)
 
 
 
 
-        return False
 
 
 
+    display_id = db.Column(db.String(20), unique=True, nullable=False)
 
 
 
@@ -2123,140 +2291,136 @@ def ensure_database_tables():
 
 
 
+    sender_name = db.Column(db.String(100), nullable=False)
 
 
 
 
 
-# Models
 
 
+    sender_phone = db.Column(db.String(20), nullable=False)
 
 
 
 
 
-class User(db.Model):
 
 
+    recipient_name = db.Column(db.String(100), nullable=False)
 
 
 
 
 
-    __tablename__ = 'users'
 
 
+    recipient_phone = db.Column(db.String(20), nullable=False)
 
 
 
 
 
-    id = db.Column(db.Integer, primary_key=True)
 
 
+    recipient_address = db.Column(db.String(200), nullable=False)
 
 
 
 
 
-    username = db.Column(db.String(80), unique=True, nullable=False)
 
 
+    delivery_person = db.Column(db.String(100), nullable=True)
 
 
 
 
 
-    email = db.Column(db.String(120), unique=True, nullable=True)
 
 
+    goods_type = db.Column(db.String(100), nullable=False)
 
 
 
 
 
-    phone_number = db.Column(db.String(20), unique=True, nullable=True)
 
 
+    quantity = db.Column(db.Integer, nullable=False)
 
 
 
 
 
-    password_hash = db.Column(db.String(255), nullable=False)
 
 
+    amount = db.Column(db.Float, nullable=False)
 
 
 
 
 
-    actual_password = db.Column(db.String(255), nullable=True)  # Store actual password for admin viewing (user/staff only)
 
 
+    expenses = db.Column(db.Float, default=0.0)
 
 
 
 
 
-    role = db.Column(db.String(20), default='user')  # 'admin', 'staff', or 'user'
 
 
+    payment_by = db.Column(db.String(50), nullable=False, default='M-Pesa')
 
 
 
 
 
-    created_at = db.Column(db.DateTime, default=get_current_time)
 
 
+    status = db.Column(db.String(20), default='Pending')
 
 
 
 
 
-    is_active = db.Column(db.Boolean, default=True)
 
 
+    created_at = db.Column(db.DateTime, default=get_current_time)
 
 
 
 
 
-    
 
 
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
 
 
 
 
-    def set_password(self, password):
 
 
+    
 
-        self.password_hash = generate_password_hash(password)
 
 
 
-        # Store actual password for admin viewing (user/staff only)
 
-        if self.role in ['user', 'staff']:
 
-            self.actual_password = password
 
-        else:
+    # Relationship to User
 
-            self.actual_password = None  # Don't store admin passwords
 
 
 
 
 
 
+    creator = db.relationship('User', backref='deliveries')
 
-    
 
 
 
@@ -2264,7 +2428,6 @@ class User(db.Model):
 
 
 
-    def check_password(self, password):
 
 
 
@@ -2272,7 +2435,7 @@ class User(db.Model):
 
 
 
-        return check_password_hash(self.password_hash, password)
+    def __repr__(self):
 
 
 
@@ -2280,7 +2443,7 @@ class User(db.Model):
 
 
 
-    
+        return f'<Delivery {self.display_id}>'
 
 
 
@@ -2288,7 +2451,6 @@ class User(db.Model):
 
 
 
-    def is_admin(self):
 
 
 
@@ -2296,255 +2458,466 @@ class User(db.Model):
 
 
 
-        return self.role == 'admin'
 
+class AuditAction(db.Model):
 
+    """Dictionary of audit action names (LOGIN_SUCCESS, CREATE, ...) referenced by AuditLog.action_id."""
 
+    __tablename__ = 'audit_action'
 
+    id = db.Column(db.Integer, primary_key=True)
 
+    name = db.Column(db.String(100), unique=True, nullable=False)
 
 
-    def is_staff(self):
+class AuditResourceType(db.Model):
 
+    """Dictionary of audit resource types (USER, DELIVERY, REPORT, ...)."""
 
+    __tablename__ = 'audit_resource_type'
 
+    id = db.Column(db.Integer, primary_key=True)
 
+    name = db.Column(db.String(50), unique=True, nullable=False)
 
 
+class AuditUserAgent(db.Model):
 
-        return self.role == 'staff'
+    """Dictionary of distinct User-Agent strings seen by the audit writer."""
 
+    __tablename__ = 'audit_user_agent'
 
+    id = db.Column(db.Integer, primary_key=True)
 
+    name = db.Column(db.String(500), unique=True, nullable=False)
 
 
+class AuditLog(db.Model):
 
+    __tablename__ = 'audit_log'
 
-    
+    __table_args__ = (
 
+        db.Index('ix_audit_log_action_timestamp', 'action_id', 'timestamp'),
 
+        db.Index('ix_audit_log_timestamp', 'timestamp'),
 
+    )
 
+    id = db.Column(db.Integer, primary_key=True)
 
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+    username = db.Column(db.String(80), nullable=False)
 
-    def can_view_reports(self):
+    action_id = db.Column(db.Integer, db.ForeignKey('audit_action.id'), nullable=True)  # LOGIN, LOGOUT, CREATE, UPDATE, DELETE, VIEW, EXPORT
 
+    resource_type_id = db.Column(db.Integer, db.ForeignKey('audit_resource_type.id'), nullable=True)  # USER, DELIVERY, REPORT
 
+    resource_id = db.Column(db.String(50), nullable=True)  # ID of the affected resource
 
+    details_json = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=True)  # Structured details, e.g. {"message": ..., "reason": ...}
 
+    ip_address = db.Column(db.String(45), nullable=True)  # User's IP address
 
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('audit_user_agent.id'), nullable=True)  # Browser/device info
 
+    timestamp = db.Column(db.DateTime, default=get_current_time)
 
-        return self.role == 'admin'
+    # Legacy free-text columns; rows written before the dictionary tables existed are
+    # moved into the *_id / details_json columns by upgrade_audit_log_storage()
 
-    
+    action = db.Column(db.String(100), nullable=True)
 
-    def can_view_audit_logs(self):
+    resource_type = db.Column(db.String(50), nullable=True)
 
-        return self.role == 'admin'
+    details = db.Column(db.Text, nullable=True)
 
-    
+    user_agent = db.Column(db.String(500), nullable=True)
 
-    def can_view_system_health(self):
+    # Relationship to User
 
-        return self.role == 'admin'
+    user = db.relationship('User', backref='audit_logs')
 
-    
+    @property
+    def action_name(self):
+        if self.action_id is not None:
+            return get_audit_lookup_name(AuditAction, self.action_id)
+        return self.action or ''
+
+    @property
+    def resource_type_name(self):
+        if self.resource_type_id is not None:
+            return get_audit_lookup_name(AuditResourceType, self.resource_type_id)
+        return self.resource_type
+
+    @property
+    def user_agent_name(self):
+        if self.user_agent_id is not None:
+            return get_audit_lookup_name(AuditUserAgent, self.user_agent_id)
+        return self.user_agent
+
+    @property
+    def details_text(self):
+        """Render details_json as a single line for the audit log table."""
+        if not self.details_json:
+            return self.details
+        details = dict(self.details_json)
+        message = details.pop('message', '')
+        extra = ', '.join(f"{key}: {value}" for key, value in details.items())
+        if message and extra:
+            return f"{message} ({extra})"
+        return message or extra
 
-    def can_delete_delivery(self):
+    def __repr__(self):
 
-        return self.role in ['admin', 'staff']
+        return f'<AuditLog {self.action_name} by {self.username} at {self.timestamp}>'
 
-    
 
-    def can_manage_deliveries(self):
 
-        return self.role in ['admin', 'staff']
 
 
 
 
+class Shelf(db.Model):
 
+    __tablename__ = 'shelf'
 
+    __table_args__ = (
+        # Serves the next-available-shelf pick (status = 'available' AND size = ? ORDER BY price)
+        db.Index('ix_shelf_status_size_price', 'status', 'size', 'price'),
+        # Serves the expiry scan and the expiring-soon list (status = 'occupied' AND due_date < ?)
+        db.Index('ix_shelf_status_due_date', 'status', 'due_date'),
+    )
 
 
 
 
+    
 
 
 
+    id = db.Column(db.String(10), primary_key=True)  # e.g., A-01, B-02
 
 
-class Delivery(db.Model):
 
+    status = db.Column(db.String(20), default='available')  # available, occupied, maintenance
 
 
 
+    size = db.Column(db.String(10), nullable=False)  # Small, Large
 
 
 
-    __tablename__ = 'delivery'
+    price = db.Column(db.Integer, nullable=False)  # Monthly fee in KSh
 
 
 
+    customer_name = db.Column(db.String(100), nullable=True)
 
 
 
+    customer_phone = db.Column(db.String(20), nullable=True)
 
-    id = db.Column(db.Integer, primary_key=True)
 
 
+    customer_email = db.Column(db.String(100), nullable=True)
 
 
 
+    card_number = db.Column(db.String(50), nullable=True)
 
 
-    display_id = db.Column(db.String(20), unique=True, nullable=False)
 
+    rented_date = db.Column(db.Date, nullable=True)
 
 
 
+    items_description = db.Column(db.Text, nullable=True)
 
 
 
-    sender_name = db.Column(db.String(100), nullable=False)
+    rental_period = db.Column(db.Integer, nullable=True)  # in months
 
 
 
+    discount = db.Column(db.Float, default=0.0)  # Discount percentage
 
 
 
+    maintenance_reason = db.Column(db.String(200), nullable=True)
+    due_date = db.Column(db.Date, nullable=True)  # rented_date + rental_period months, set by the transitions
+    expiry_notice = db.Column(db.String(10), nullable=True)  # expiring, expired (set by the expiry scan)
+    created_at = db.Column(db.DateTime, default=get_local_time)
+    updated_at = db.Column(db.DateTime, default=get_local_time, onupdate=get_local_time)
 
-    sender_phone = db.Column(db.String(20), nullable=False)
+    def __repr__(self):
+        return f'<Shelf {self.id} - {self.status}>'
 
 
+class ShelfRental(db.Model):
+    """One tenancy of a shelf, written by the rent/end transitions; end_date is NULL while running."""
+    __tablename__ = 'shelf_rental'
+    __table_args__ = (
+        db.Index('ix_shelf_rental_shelf_end', 'shelf_id', 'end_date'),
+        db.Index('ix_shelf_rental_start_date', 'start_date'),
+    )
 
+    id = db.Column(db.Integer, primary_key=True)
+    shelf_id = db.Column(db.String(10), nullable=False)
+    customer_name = db.Column(db.String(100), nullable=True)
+    customer_phone = db.Column(db.String(20), nullable=True)
+    size = db.Column(db.String(10), nullable=True)
+    monthly_price = db.Column(db.Integer, nullable=False)  # KSh, before discount
+    discount = db.Column(db.Float, default=0.0)  # percent
+    rental_period = db.Column(db.Integer, nullable=False, default=1)  # months paid for
+    start_date = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)  # start_date + rental_period months
+    end_date = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=get_local_time)
 
+    def __repr__(self):
+        return f'<ShelfRental {self.shelf_id} {self.start_date} - {self.end_date or "running"}>'
 
 
 
-    recipient_name = db.Column(db.String(100), nullable=False)
+# Additive schema upgrades for databases created before newer model columns existed
 
+def ensure_table_columns(table_name, columns):
 
+    """Add any missing (column_name, column_ddl) pairs to an existing table."""
 
+    existing = {col['name'] for col in inspect(db.engine).get_columns(table_name)}
 
+    added = []
 
+    with db.engine.begin() as conn:
 
+        for column_name, column_ddl in columns:
 
-    recipient_phone = db.Column(db.String(20), nullable=False)
+            if column_name not in existing:
 
+                conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}'))
 
+                added.append(column_name)
 
+    if added:
 
+        app.logger.info(f"Added columns to {table_name}: {added}")
 
+    return added
 
 
-    recipient_address = db.Column(db.String(200), nullable=False)
+def rebuild_sqlite_table(model):
 
+    """Recreate a SQLite table from its model, keeping rows (SQLite cannot ALTER constraints)."""
 
+    table_name = model.__tablename__
 
+    legacy_name = f'{table_name}_legacy'
 
+    legacy_columns = [col['name'] for col in inspect(db.engine).get_columns(table_name)]
 
+    shared = ', '.join(col for col in legacy_columns if col in model.__table__.c)
 
+    with db.engine.begin() as conn:
 
-    delivery_person = db.Column(db.String(100), nullable=True)
+        conn.execute(text(f'ALTER TABLE {table_name} RENAME TO {legacy_name}'))
 
+        model.__table__.create(conn)
 
+        conn.execute(text(f'INSERT INTO {table_name} ({shared}) SELECT {shared} FROM {legacy_name}'))
 
+        conn.execute(text(f'DROP TABLE {legacy_name}'))
 
+    app.logger.info(f"Rebuilt SQLite table {table_name}")
 
 
+def upgrade_audit_log_storage():
 
-    goods_type = db.Column(db.String(100), nullable=False)
+    """Move legacy AuditLog text columns into the dictionary tables and details_json."""
 
+    is_postgres = db.engine.dialect.name == 'postgresql'
 
+    action_column = next(col for col in inspect(db.engine).get_columns('audit_log') if col['name'] == 'action')
 
+    if not action_column['nullable'] and not is_postgres:
 
+        # Old SQLite databases declare action NOT NULL; new rows leave it empty
+        rebuild_sqlite_table(AuditLog)
 
+    else:
 
+        ensure_table_columns('audit_log', [
 
-    quantity = db.Column(db.Integer, nullable=False)
+            ('action_id', 'INTEGER REFERENCES audit_action(id)'),
 
+            ('resource_type_id', 'INTEGER REFERENCES audit_resource_type(id)'),
 
+            ('user_agent_id', 'INTEGER REFERENCES audit_user_agent(id)'),
 
+            ('details_json', 'JSONB' if is_postgres else 'JSON'),
 
+        ])
 
+        with db.engine.begin() as conn:
 
+            if is_postgres and not action_column['nullable']:
 
-    amount = db.Column(db.Float, nullable=False)
+                conn.execute(text('ALTER TABLE audit_log ALTER COLUMN action DROP NOT NULL'))
 
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_audit_log_action_timestamp ON audit_log (action_id, timestamp)'))
 
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_audit_log_timestamp ON audit_log (timestamp)'))
 
+    # Backfill dictionary ids set-based, then drop the duplicated text
+    json_message = 'json_build_object' if is_postgres else 'json_object'
 
+    with db.engine.begin() as conn:
 
+        for legacy_column, id_column, lookup_table in [
 
+            ('action', 'action_id', 'audit_action'),
 
-    expenses = db.Column(db.Float, default=0.0)
+            ('resource_type', 'resource_type_id', 'audit_resource_type'),
 
+            ('user_agent', 'user_agent_id', 'audit_user_agent'),
 
+        ]:
 
+            conn.execute(text(f"""
 
+                INSERT INTO {lookup_table} (name)
 
+                SELECT DISTINCT {legacy_column} FROM audit_log
 
+                WHERE {legacy_column} IS NOT NULL
 
-    payment_by = db.Column(db.String(50), nullable=False, default='M-Pesa')
+                AND {legacy_column} NOT IN (SELECT name FROM {lookup_table})
 
+            """))
 
+            conn.execute(text(f"""
 
+                UPDATE audit_log
 
+                SET {id_column} = (SELECT id FROM {lookup_table} WHERE name = audit_log.{legacy_column}),
 
+                    {legacy_column} = NULL
 
+                WHERE {legacy_column} IS NOT NULL
 
-    status = db.Column(db.String(20), default='Pending')
+            """))
 
+        conn.execute(text(f"""
 
+            UPDATE audit_log
 
+            SET details_json = {json_message}('message', details), details = NULL
 
+            WHERE details IS NOT NULL
 
+        """))
 
 
-    created_at = db.Column(db.DateTime, default=get_current_time)
+def upgrade_audit_log_search():
 
+    """Create and backfill the audit log full-text index."""
 
+    if db.engine.dialect.name == 'postgresql':
 
+        ensure_table_columns('audit_log', [('search_vector', 'TSVECTOR')])
 
+        with db.engine.begin() as conn:
 
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_audit_log_search ON audit_log USING GIN (search_vector)'))
 
+            conn.execute(text(f"UPDATE audit_log SET search_vector = {AUDIT_SEARCH_VECTOR_SQL} WHERE search_vector IS NULL"))
 
-    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+        return
 
+    if 'audit_log_fts' in inspect(db.engine).get_table_names():
 
+        return
 
+    with db.engine.begin() as conn:
 
+        conn.execute(text('CREATE VIRTUAL TABLE audit_log_fts USING fts5(username, resource_id, details)'))
 
+        conn.execute(text(f"""
 
+            INSERT INTO audit_log_fts (rowid, username, resource_id, details)
 
-    
+            SELECT id, username, resource_id, {AUDIT_SEARCH_DETAILS_SQLITE} FROM audit_log
 
+        """))
 
+        conn.execute(text("""
 
+            CREATE TRIGGER IF NOT EXISTS audit_log_fts_delete AFTER DELETE ON audit_log
 
+            BEGIN DELETE FROM audit_log_fts WHERE rowid = old.id; END
 
+        """))
 
 
-    # Relationship to User
+def upgrade_shelf_indexes():
+    """Add shelf columns and indexes that create_all() does not add to an existing table."""
+    ensure_table_columns('shelf', [('due_date', 'DATE'), ('expiry_notice', 'VARCHAR(10)')])
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_shelf_status_size_price ON shelf (status, size, price)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_shelf_status_due_date ON shelf (status, due_date)'))
 
 
+def upgrade_shelf_rental_history():
+    """Open a shelf_rental row for shelves that were occupied before the history existed."""
+    open_rentals = select(ShelfRental.shelf_id).where(ShelfRental.end_date.is_(None))
+    untracked = Shelf.query.filter(
+        Shelf.status == 'occupied', Shelf.rented_date.isnot(None), Shelf.id.notin_(open_rentals)
+    ).all()
+    for shelf in untracked:
+        db.session.add(shelf_rental_for(shelf))
+    if untracked:
+        db.session.commit()
+        app.logger.info(f"Backfilled rental history for {len(untracked)} occupied shelves")
 
 
+def upgrade_shelf_due_dates():
+    """Fill shelf.due_date for occupied shelves from their open rental, in one statement."""
+    with db.engine.begin() as conn:
+        filled = conn.execute(text(
+            "UPDATE shelf SET due_date = (SELECT MAX(r.due_date) FROM shelf_rental r "
+            "WHERE r.shelf_id = shelf.id AND r.end_date IS NULL) "
+            "WHERE status = 'occupied' AND due_date IS NULL"
+        )).rowcount
+    if filled:
+        app.logger.info(f"Filled due dates for {filled} occupied shelves")
 
 
+def upgrade_database_schema():
 
-    creator = db.relationship('User', backref='deliveries')
+    """Create tables added since the last deploy and upgrade older ones in place."""
 
+    with app.app_context():
 
+        try:
 
+            db.create_all()
 
+            upgrade_audit_log_storage()
 
+            upgrade_audit_log_search()
 
+            upgrade_shelf_indexes()
 
+            upgrade_shelf_rental_history()
 
+            upgrade_shelf_due_dates()
+            return True
+        except Exception as e:
+            app.logger.error(f"Database schema upgrade error: {str(e)}")
+            db.session.rollback()
+            return False
 
 
 
@@ -2552,17 +2925,17 @@ class Delivery(db.Model):
 
 
 
-    def __repr__(self):
 
 
+def generate_display_id():
 
 
 
 
 
-        return f'<Delivery {self.display_id}>'
 
 
+    """Generate a unique display ID for new deliveries."""
 
 
 
@@ -2570,101 +2943,103 @@ class Delivery(db.Model):
 
 
 
+    now = get_local_time()  # Use local time for display ID generation
 
 
 
 
 
 
-class AuditLog(db.Model):
 
+    date_str = now.strftime('%y%m%d')
 
 
 
 
 
 
-    __tablename__ = 'audit_log'
 
+    
 
 
 
 
 
 
-    id = db.Column(db.Integer, primary_key=True)
 
+    # Get the last delivery for TODAY only to reset sequence daily
 
 
 
 
 
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+    today_start = get_current_time().replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 
 
 
 
-    username = db.Column(db.String(80), nullable=False)
 
+    today_deliveries = Delivery.query.filter(Delivery.created_at >= today_start).order_by(Delivery.created_at.desc()).all()
 
 
 
 
 
 
-    action = db.Column(db.String(100), nullable=False)  # LOGIN, LOGOUT, CREATE, UPDATE, DELETE, VIEW, EXPORT
 
+    
 
 
 
 
 
 
-    resource_type = db.Column(db.String(50), nullable=True)  # USER, DELIVERY, REPORT
 
+    # Count deliveries made today to determine the next sequence number
 
 
 
 
 
 
-    resource_id = db.Column(db.String(50), nullable=True)  # ID of the affected resource
 
+    today_count = len(today_deliveries)
 
 
 
 
 
 
-    details = db.Column(db.Text, nullable=True)  # Additional details about the action
 
+    next_sequence = today_count + 1
 
 
 
 
 
 
-    ip_address = db.Column(db.String(45), nullable=True)  # User's IP address
 
+    
 
 
 
 
 
 
-    user_agent = db.Column(db.String(500), nullable=True)  # Browser/device info
 
+    # Generate display ID
 
 
 
 
 
 
-    timestamp = db.Column(db.DateTime, default=get_current_time)
+
+    display_id = f"{date_str}{str(next_sequence).zfill(4)}"
 
 
 
@@ -2680,7 +3055,7 @@ class AuditLog(db.Model):
 
 
 
-    # Relationship to User
+    # Check if this display_id already exists (race condition protection)
 
 
 
@@ -2688,7 +3063,7 @@ class AuditLog(db.Model):
 
 
 
-    user = db.relationship('User', backref='audit_logs')
+    max_attempts = 10
 
 
 
@@ -2696,7 +3071,7 @@ class AuditLog(db.Model):
 
 
 
-    
+    for attempt in range(max_attempts):
 
 
 
@@ -2704,7 +3079,7 @@ class AuditLog(db.Model):
 
 
 
-    def __repr__(self):
+        existing = Delivery.query.filter_by(display_id=display_id).first()
 
 
 
@@ -2712,7 +3087,7 @@ class AuditLog(db.Model):
 
 
 
-        return f'<AuditLog {self.action} by {self.username} at {self.timestamp}>'
+        if not existing:
 
 
 
@@ -2720,95 +3095,83 @@ class AuditLog(db.Model):
 
 
 
-class Shelf(db.Model):
+            return display_id
 
 
 
-    __tablename__ = 'shelf'
 
 
 
-    
 
+        
 
 
-    id = db.Column(db.String(10), primary_key=True)  # e.g., A-01, B-02
 
 
 
-    status = db.Column(db.String(20), default='available')  # available, occupied, maintenance
 
 
+        # If it exists, increment and try again
 
-    size = db.Column(db.String(10), nullable=False)  # Small, Large
 
 
 
-    price = db.Column(db.Integer, nullable=False)  # Monthly fee in KSh
 
 
 
-    customer_name = db.Column(db.String(100), nullable=True)
+        next_sequence += 1
 
 
 
-    customer_phone = db.Column(db.String(20), nullable=True)
 
 
 
-    customer_email = db.Column(db.String(100), nullable=True)
 
+        display_id = f"{date_str}{str(next_sequence).zfill(4)}"
 
 
-    card_number = db.Column(db.String(50), nullable=True)
 
 
 
-    rented_date = db.Column(db.Date, nullable=True)
 
 
+    
 
-    items_description = db.Column(db.Text, nullable=True)
 
 
 
-    rental_period = db.Column(db.Integer, nullable=True)  # in months
 
 
 
-    discount = db.Column(db.Float, default=0.0)  # Discount percentage
+    # If we still have a conflict after max attempts, use a timestamp-based fallback
 
 
 
-    maintenance_reason = db.Column(db.String(200), nullable=True)
 
 
 
-    created_at = db.Column(db.DateTime, default=get_local_time)
 
+    import time
 
 
-    updated_at = db.Column(db.DateTime, default=get_local_time, onupdate=get_local_time)
 
 
 
-    
 
 
+    timestamp_suffix = str(int(time.time()))[-4:]
 
-    def __repr__(self):
 
 
 
-        return f'<Shelf {self.id} - {self.status}>'
 
 
 
+    return f"{date_str}{timestamp_suffix}"
 
 
 
 
-def generate_display_id():
 
 
 
@@ -2816,231 +3179,230 @@ def generate_display_id():
 
 
 
-    """Generate a unique display ID for new deliveries."""
 
 
 
 
+def get_date_ranges():
 
 
 
-    now = get_local_time()  # Use local time for display ID generation
 
 
 
 
+    """Get common date ranges used throughout the application."""
 
 
 
-    date_str = now.strftime('%y%m%d')
 
 
 
 
+    now = get_local_time()
 
 
 
-    
 
 
 
 
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 
-    # Get the last delivery for TODAY only to reset sequence daily
 
 
 
 
+    today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
 
 
 
-    today_start = get_current_time().replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 
 
+    
 
 
 
-    today_deliveries = Delivery.query.filter(Delivery.created_at >= today_start).order_by(Delivery.created_at.desc()).all()
 
 
 
 
+    # Week: Sunday to Saturday
 
 
 
-    
 
 
 
 
+    week_start = today - timedelta(days=today.weekday())
 
 
 
-    # Count deliveries made today to determine the next sequence number
 
 
 
 
+    week_end = week_start + timedelta(days=6, hours=23, minutes=59, seconds=59, microseconds=999999)
 
 
 
-    today_count = len(today_deliveries)
 
 
 
 
+    
 
 
 
-    next_sequence = today_count + 1
 
 
 
 
+    # Month: First day to last day of current month
 
 
 
-    
 
 
 
 
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
 
-    # Generate display ID
 
 
 
 
+    if now.month == 12:
 
 
 
-    display_id = f"{date_str}{str(next_sequence).zfill(4)}"
 
 
 
 
+        month_end = now.replace(year=now.year+1, month=1, day=1) - timedelta(microseconds=1)
 
 
 
-    
 
 
 
 
+    else:
 
 
 
-    # Check if this display_id already exists (race condition protection)
 
 
 
 
+        month_end = now.replace(month=now.month+1, day=1) - timedelta(microseconds=1)
 
 
 
-    max_attempts = 10
 
 
 
 
+    
 
 
 
-    for attempt in range(max_attempts):
 
 
 
 
+    # Year: First day to last day of current year
 
 
 
-        existing = Delivery.query.filter_by(display_id=display_id).first()
 
 
 
 
+    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
 
-        if not existing:
 
 
 
 
+    year_end = now.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
 
 
 
-            return display_id
 
 
 
 
+    
 
 
 
-        
 
 
 
 
+    return {
 
 
 
-        # If it exists, increment and try again
 
 
 
 
+        'today': (today, today_end),
 
 
 
-        next_sequence += 1
 
 
 
 
+        'week': (week_start, week_end),
 
 
 
-        display_id = f"{date_str}{str(next_sequence).zfill(4)}"
 
 
 
 
+        'month': (month_start, month_end),
 
 
 
-    
 
 
 
 
+        'year': (year_start, year_end),
 
 
 
-    # If we still have a conflict after max attempts, use a timestamp-based fallback
 
 
 
 
+        'all': (datetime(2000, 1, 1), today_end)  # All time from year 2000
 
 
 
-    import time
 
 
 
 
+    }
 
 
 
-    timestamp_suffix = str(int(time.time()))[-4:]
 
 
 
@@ -3048,12 +3410,12 @@ def generate_display_id():
 
 
 
-    return f"{date_str}{timestamp_suffix}"
 
 
 
 
 
+@app.route('/create-admin')
 
 
 
@@ -3061,282 +3423,39 @@ def generate_display_id():
 
 
 
+def create_admin():
 
 
 
-def get_date_ranges():
 
 
 
 
+    """Create initial admin user (remove after use)."""
 
 
 
-    """Get common date ranges used throughout the application."""
 
 
 
 
+    try:
 
 
 
-    now = get_local_time()
 
 
 
 
+        # Check if admin already exists
 
 
 
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 
 
-
-
-
-    today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-
-
-
-
-
-
-    
-
-
-
-
-
-
-
-    # Week: Sunday to Saturday
-
-
-
-
-
-
-
-    week_start = today - timedelta(days=today.weekday())
-
-
-
-
-
-
-
-    week_end = week_start + timedelta(days=6, hours=23, minutes=59, seconds=59, microseconds=999999)
-
-
-
-
-
-
-
-    
-
-
-
-
-
-
-
-    # Month: First day to last day of current month
-
-
-
-
-
-
-
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-
-
-
-
-
-
-    if now.month == 12:
-
-
-
-
-
-
-
-        month_end = now.replace(year=now.year+1, month=1, day=1) - timedelta(microseconds=1)
-
-
-
-
-
-
-
-    else:
-
-
-
-
-
-
-
-        month_end = now.replace(month=now.month+1, day=1) - timedelta(microseconds=1)
-
-
-
-
-
-
-
-    
-
-
-
-
-
-
-
-    # Year: First day to last day of current year
-
-
-
-
-
-
-
-    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
-
-
-
-
-
-
-    year_end = now.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
-
-
-
-
-
-
-
-    
-
-
-
-
-
-
-
-    return {
-
-
-
-
-
-
-
-        'today': (today, today_end),
-
-
-
-
-
-
-
-        'week': (week_start, week_end),
-
-
-
-
-
-
-
-        'month': (month_start, month_end),
-
-
-
-
-
-
-
-        'year': (year_start, year_end),
-
-
-
-
-
-
-
-        'all': (datetime(2000, 1, 1), today_end)  # All time from year 2000
-
-
-
-
-
-
-
-    }
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-@app.route('/create-admin')
-
-
-
-
-
-
-
-def create_admin():
-
-
-
-
-
-
-
-    """Create initial admin user (remove after use)."""
-
-
-
-
-
-
-
-    try:
-
-
-
-
-
-
-
-        # Check if admin already exists
-
-
-
-
-
-
-
-        admin = User.query.filter_by(username='admin').first()
+        admin = User.query.filter_by(username='admin').first()
 
 
 
@@ -5280,211 +5399,358 @@ def get_time_ago(created_at):
 
 
 
-# Audit Logging Functions
-
-
+# Row projection helpers
 
+def project_rows(*columns, where=(), order_by=(), limit=None, offset=None):
+    """Fetch only the given columns as lightweight named rows.
 
+    Goes through Core select(), so no ORM entities are built and nothing lands in the
+    session identity map; rows support attribute access by column name (row.display_id).
+    """
+    stmt = select(*columns).where(*where).order_by(*order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    if offset:
+        stmt = stmt.offset(offset)
+    return db.session.execute(stmt).all()
 
 
+def count_rows(model, where=()):
+    """COUNT(*) of model rows matching where, without loading them."""
+    return db.session.execute(select(func.count()).select_from(model).where(*where)).scalar()
 
-def log_audit(action, resource_type=None, resource_id=None, details=None):
 
+# Audit Logging Functions
 
+# Per-process cache of the audit dictionary tables: {model: {'by_name': {...}, 'by_id': {...}}}
+_audit_lookup_cache = {}
 
 
+def _audit_lookup_entries(model):
 
+    return _audit_lookup_cache.setdefault(model, {'by_name': {}, 'by_id': {}})
 
 
-    """Log an audit event for security monitoring."""
+def get_audit_lookup_id(model, name):
 
+    """Return the dictionary id for name, inserting it on first use."""
 
+    if not name:
 
+        return None
 
+    entries = _audit_lookup_entries(model)
 
+    lookup_id = entries['by_name'].get(name)
 
+    if lookup_id is None:
 
-    try:
+        entry = model.query.filter_by(name=name).first()
+        if entry is None:
+            try:
+                with db.session.begin_nested():
+                    entry = model(name=name)
+                    db.session.add(entry)
+                # Only cached once the outer transaction commits: a rollback would leave a dangling id
+                db.session.info.setdefault('audit_lookups_pending', []).append((model, name, entry.id))
+                return entry.id
+            except IntegrityError:
+                # Another worker inserted the same value first
+                entry = model.query.filter_by(name=name).first()
+        lookup_id = entry.id
+        entries['by_name'][name] = lookup_id
+        entries['by_id'][lookup_id] = name
+    return lookup_id
 
 
+@event.listens_for(db.session, 'after_commit')
+def _cache_committed_audit_lookups(session):
+    for model, name, lookup_id in session.info.pop('audit_lookups_pending', ()):
+        entries = _audit_lookup_entries(model)
+        entries['by_name'][name] = lookup_id
+        entries['by_id'][lookup_id] = name
 
 
+@event.listens_for(db.session, 'after_rollback')
+def _drop_rolled_back_audit_lookups(session):
+    session.info.pop('audit_lookups_pending', None)
 
 
 
-        # Get user information from session
+def get_audit_lookup_name(model, lookup_id):
 
+    """Return the dictionary value for lookup_id, loading it on a cache miss."""
 
+    entries = _audit_lookup_entries(model)
 
+    if lookup_id not in entries['by_id']:
 
+        prime_audit_lookups(model, [lookup_id])
 
+    return entries['by_id'].get(lookup_id)
 
 
-        user_id = session.get('user_id')
+def prime_audit_lookups(model, lookup_ids):
 
+    """Load every uncached dictionary value for lookup_ids in a single query."""
 
+    entries = _audit_lookup_entries(model)
 
+    missing = {lookup_id for lookup_id in lookup_ids if lookup_id is not None and lookup_id not in entries['by_id']}
 
+    if missing:
 
+        for entry in model.query.filter(model.id.in_(missing)).all():
 
+            entries['by_id'][entry.id] = entry.name
 
-        username = session.get('username', 'Unknown')
+            entries['by_name'][entry.name] = entry.id
 
 
+def get_audit_action_ids(action_filter):
 
+    """Resolve an action filter such as LOGIN to the ids of LOGIN, LOGIN_SUCCESS, LOGIN_FAILED."""
 
+    matches = AuditAction.query.filter(db.or_(
 
+        AuditAction.name == action_filter,
 
+        AuditAction.name.like(f'{action_filter}\\_%', escape='\\')
 
+    )).all()
 
+    return [action.id for action in matches]
 
 
+# Full-text index over username, resource_id and the details_json values.
+# PostgreSQL keeps a tsvector column (GIN-indexed); SQLite keeps an FTS5 table keyed by audit_log.id.
+AUDIT_SEARCH_VECTOR_SQL = (
 
-        # Get request information
+    "to_tsvector('simple', concat_ws(' ', username, resource_id, "
 
+    "(SELECT string_agg(value, ' ') FROM jsonb_each_text(details_json))))"
 
+)
 
-        ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'Unknown'))[:45]  # Limit to 45 chars
+AUDIT_SEARCH_DETAILS_SQLITE = "(SELECT group_concat(value, ' ') FROM json_each(audit_log.details_json))"
 
 
+def index_audit_log(audit_log_id):
 
+    """Write the full-text index entry for one audit row, inside the caller's transaction."""
 
+    if db.engine.dialect.name == 'postgresql':
 
+        db.session.execute(text(f"UPDATE audit_log SET search_vector = {AUDIT_SEARCH_VECTOR_SQL} WHERE id = :id"),
 
+                           {'id': audit_log_id})
 
-        user_agent = request.headers.get('User-Agent', 'Unknown')[:500]  # Limit length
+    else:
 
+        db.session.execute(text(f"""
 
+            INSERT OR REPLACE INTO audit_log_fts (rowid, username, resource_id, details)
 
+            SELECT id, username, resource_id, {AUDIT_SEARCH_DETAILS_SQLITE} FROM audit_log WHERE id = :id
 
+        """), {'id': audit_log_id})
 
 
+def search_audit_logs(query, search_query, after=None, limit=50):
 
+    """Rank an AuditLog query by full-text relevance, one keyset page at a time.
 
+    after is the cursor returned for the previous page. Returns (audit_logs, next_cursor).
+    """
 
+    terms = re.findall(r'\w+', search_query)[:10]
 
+    if not terms:
 
-        # Create audit log entry
+        return [], None
 
+    # Lower rank sorts first on both backends (bm25 is already ascending)
+    if db.engine.dialect.name == 'postgresql':
 
+        ranked = text("""
 
+            SELECT id, -ts_rank(search_vector, to_tsquery('simple', :tsquery)) AS rank
 
+            FROM audit_log WHERE search_vector @@ to_tsquery('simple', :tsquery)
 
+        """).bindparams(tsquery=' & '.join(f'{term}:*' for term in terms))
 
+    else:
 
-        audit_log = AuditLog(
+        ranked = text("""
 
+            SELECT rowid AS id, bm25(audit_log_fts) AS rank
 
+            FROM audit_log_fts WHERE audit_log_fts MATCH :match
 
+        """).bindparams(match=' '.join(f'"{term}"*' for term in terms))
 
+    ranked = ranked.columns(id=db.Integer, rank=db.Float).subquery('ranked')
 
+    query = query.join(ranked, AuditLog.id == ranked.c.id)
 
+    if after:
 
-            user_id=user_id,
+        try:
 
+            after_rank, after_id = after.rsplit(':', 1)
 
+            after_rank, after_id = float(after_rank), int(after_id)
 
+            query = query.filter(db.or_(
 
+                ranked.c.rank > after_rank,
 
+                db.and_(ranked.c.rank == after_rank, AuditLog.id < after_id)
 
+            ))
 
-            username=username,
+        except ValueError:
 
+            pass
 
+    rows = query.add_columns(ranked.c.rank).order_by(ranked.c.rank, AuditLog.id.desc()).limit(limit + 1).all()
 
+    next_cursor = None
 
+    if len(rows) > limit:
 
+        rows = rows[:limit]
 
+        last_log, last_rank = rows[-1]
 
-            action=action,
+        next_cursor = f"{last_rank!r}:{last_log.id}"
 
+    return [audit_log for audit_log, _ in rows], next_cursor
 
 
+def record_audit(action, resource_type=None, resource_id=None, details=None):
+    """Add an audit event to the current transaction; the caller commits (or rolls back) it.
+    details may be a dict (stored as-is in details_json) or a plain message string.
+    """
+    # Get user information from session
 
+    user_id = session.get('user_id')
 
+    username = session.get('username', 'Unknown')
 
+    # Get request information
 
-            resource_type=resource_type,
+    ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'Unknown'))[:45]  # Limit to 45 chars
 
+    user_agent = request.headers.get('User-Agent', 'Unknown')[:500]  # Limit length
 
+    if details is not None and not isinstance(details, dict):
 
+        details = {'message': str(details)}
 
+    # Create audit log entry
 
+    audit_log = AuditLog(
 
+        user_id=user_id,
 
-            resource_id=str(resource_id) if resource_id else None,
+        username=username,
 
+        action_id=get_audit_lookup_id(AuditAction, action),
 
+        resource_type_id=get_audit_lookup_id(AuditResourceType, resource_type),
 
+        resource_id=str(resource_id) if resource_id else None,
 
+        details_json=details or None,
 
+        ip_address=ip_address,
 
+        user_agent_id=get_audit_lookup_id(AuditUserAgent, user_agent)
 
-            details=details,
+    )
 
+    db.session.add(audit_log)
 
+    db.session.flush()
 
+    index_audit_log(audit_log.id)
+    return audit_log
 
 
+def log_audit(action, resource_type=None, resource_id=None, details=None):
+    """Log an audit event for security monitoring in its own commit."""
+    try:
+        record_audit(action, resource_type, resource_id, details)
+        db.session.commit()
 
+    except Exception as e:
 
-            ip_address=ip_address,
-
-
-
-
-
-
-
-            user_agent=user_agent
-
-
-
-
-
-
+        # Don't fail the main operation if audit logging fails
 
-        )
+        app.logger.error(f"Error logging audit event: {str(e)}")
 
+        db.session.rollback()
 
 
+def log_login(user, success=True, reason=None):
 
+    """Log login attempts."""
 
+    action = "LOGIN_SUCCESS" if success else "LOGIN_FAILED"
 
+    details = {'message': f"Login attempt for user {user.username}"}
 
-        
+    if not success:
 
+        details['reason'] = reason or "Invalid credentials"
 
+    else:
 
+        details['role'] = user.role
 
+    log_audit(action, resource_type="USER", resource_id=user.id, details=details)
 
 
+def log_logout():
 
-        db.session.add(audit_log)
+    """Log logout events."""
 
+    username = session.get('username', 'Unknown')
 
+    details = {'message': f"User {username} logged out"}
 
+    log_audit("LOGOUT", resource_type="USER", details=details)
 
 
+def log_delivery_action(action, delivery_id, details=None):
 
+    """Log delivery-related actions."""
 
-        db.session.commit()
+    log_audit(action, resource_type="DELIVERY", resource_id=delivery_id, details=details)
 
 
+def log_export(period, format='CSV'):
 
+    """Log export actions."""
 
+    details = {'message': f"Exported {period} report in {format} format", 'period': period, 'format': format}
 
+    log_audit("EXPORT", resource_type="REPORT", details=details)
 
 
-        
+def log_page_view(page):
 
+    """Log page views for monitoring."""
 
+    details = {'message': f"Viewed {page} page", 'page': page}
 
+    log_audit("VIEW", resource_type="PAGE", details=details)
 
 
 
 
-    except Exception as e:
 
 
 
@@ -5492,27 +5758,27 @@ def log_audit(action, resource_type=None, resource_id=None, details=None):
 
 
 
-        # Don't fail the main operation if audit logging fails
 
 
 
 
+# Database check decorator to prevent recurring errors
 
 
 
-        app.logger.error(f"Error logging audit event: {str(e)}")
 
 
 
 
+@cached_lookup('schema', ttl=300)
 
 
 
-        db.session.rollback()
 
 
 
 
+def required_tables_present():
 
 
 
@@ -5520,86 +5786,87 @@ def log_audit(action, resource_type=None, resource_id=None, details=None):
 
 
 
+    """True once every table the routes need exists (cached so requests skip the inspector query)."""
 
 
 
 
-def log_login(user, success=True, reason=None):
 
 
 
+    tables = inspect(db.engine).get_table_names()
 
 
 
 
-    """Log login attempts."""
 
 
 
+    return all(table in tables for table in ['users', 'delivery', 'audit_log', 'shelf'])
 
 
 
 
-    action = "LOGIN_SUCCESS" if success else "LOGIN_FAILED"
 
 
 
+def database_required(f):
 
 
 
 
-    details = f"Login attempt for user {user.username}"
 
 
 
+    """Decorator to ensure database tables exist before executing route."""
 
 
 
 
-    if not success:
 
 
 
+    @wraps(f)
 
 
 
 
-        details += f" - {reason}" if reason else " - Invalid credentials"
 
 
 
+    def decorated_function(*args, **kwargs):
 
 
 
 
-    else:
 
 
 
+        try:
 
 
 
 
-        details += f" - Role: {user.role}"
 
 
 
+            # Quick check if tables exist
 
 
 
 
-    
 
 
 
+            if not required_tables_present():
 
 
 
 
-    log_audit(action, resource_type="USER", resource_id=user.id, details=details)
 
 
 
+                required_tables_present.invalidate()
 
 
 
@@ -5607,46 +5874,47 @@ def log_login(user, success=True, reason=None):
 
 
 
+                # Try to create tables if missing
 
 
 
 
 
-def log_logout():
 
 
+                if not ensure_database_tables():
 
 
 
 
 
-    """Log logout events."""
 
 
+                    return jsonify({
 
 
 
 
 
-    username = session.get('username', 'Unknown')
 
 
+                        'error': 'Database tables missing',
 
 
 
 
 
-    details = f"User {username} logged out"
 
 
+                        'message': 'Please visit /force-init-db to initialize database',
 
 
 
 
 
-    log_audit("LOGOUT", resource_type="USER", details=details)
 
 
+                        'status': 'database_error'
 
 
 
@@ -5654,30 +5922,31 @@ def log_logout():
 
 
 
+                    }), 503
 
 
 
 
 
 
-def log_delivery_action(action, delivery_id, details=None):
 
+            
 
 
 
 
 
 
-    """Log delivery-related actions."""
 
+            return f(*args, **kwargs)
 
 
 
 
 
 
-    log_audit(action, resource_type="DELIVERY", resource_id=delivery_id, details=details)
 
+            
 
 
 
@@ -5685,6 +5954,7 @@ def log_delivery_action(action, delivery_id, details=None):
 
 
 
+        except Exception as e:
 
 
 
@@ -5692,7 +5962,7 @@ def log_delivery_action(action, delivery_id, details=None):
 
 
 
-def log_export(period, format='CSV'):
+            return jsonify({
 
 
 
@@ -5700,7 +5970,7 @@ def log_export(period, format='CSV'):
 
 
 
-    """Log export actions."""
+                'error': 'Database connection failed',
 
 
 
@@ -5708,7 +5978,7 @@ def log_export(period, format='CSV'):
 
 
 
-    details = f"Exported {period} report in {format} format"
+                'message': str(e),
 
 
 
@@ -5716,7 +5986,7 @@ def log_export(period, format='CSV'):
 
 
 
-    log_audit("EXPORT", resource_type="REPORT", details=details)
+                'status': 'database_error'
 
 
 
@@ -5724,6 +5994,7 @@ def log_export(period, format='CSV'):
 
 
 
+            }), 503
 
 
 
@@ -5731,8 +6002,8 @@ def log_export(period, format='CSV'):
 
 
 
+    return decorated_function
 
-def log_page_view(page):
 
 
 
@@ -5740,7 +6011,6 @@ def log_page_view(page):
 
 
 
-    """Log page views for monitoring."""
 
 
 
@@ -5748,7 +6018,7 @@ def log_page_view(page):
 
 
 
-    details = f"Viewed {page} page"
+# Login required decorator
 
 
 
@@ -5756,7 +6026,7 @@ def log_page_view(page):
 
 
 
-    log_audit("VIEW", resource_type="PAGE", details=details)
+def login_required(f):
 
 
 
@@ -5764,6 +6034,7 @@ def log_page_view(page):
 
 
 
+    @wraps(f)
 
 
 
@@ -5771,40 +6042,40 @@ def log_page_view(page):
 
 
 
+    def decorated_function(*args, **kwargs):
 
-# Database check decorator to prevent recurring errors
 
 
 
 
 
 
+        if 'user_id' not in session:
 
-def database_required(f):
 
 
 
 
 
 
+            return redirect(url_for('login', next=request.url))
 
-    """Decorator to ensure database tables exist before executing route."""
 
 
 
 
 
 
+        return f(*args, **kwargs)
 
-    @wraps(f)
 
 
 
 
 
 
+    return decorated_function
 
-    def decorated_function(*args, **kwargs):
 
 
 
@@ -5812,7 +6083,6 @@ def database_required(f):
 
 
 
-        try:
 
 
 
@@ -5820,87 +6090,96 @@ def database_required(f):
 
 
 
-            # Quick check if tables exist
+# Seconds a user's role/is_active may be served from the cache (the invalidation bus clears it sooner on change)
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', '60'))
 
 
+@cached_lookup('user', ttl=app.config['USER_CACHE_TTL'])
+def load_user_auth(user_id):
+    """Role, is_active and permission bits of user_id, or None if the user is gone (see permissions.py)."""
+    user = db.session.get(User, user_id)
+    return auth_record(user) if user else None
 
 
+# Session permission snapshots are checked against load_user_auth() before every signed-in request
+init_permissions(app, load_user_auth)
 
 
+# Admin required decorator
+def admin_required(f):
 
-            inspector = inspect(db.engine)
 
 
 
 
 
 
+    @wraps(f)
 
-            tables = inspector.get_table_names()
 
 
 
 
 
 
+    def decorated_function(*args, **kwargs):
 
-            required_tables = ['users', 'delivery', 'audit_log', 'shelf']
 
 
 
 
 
 
+        if 'user_id' not in session:
 
-            
 
 
 
 
 
 
+            return redirect(url_for('login', next=request.url))
 
-            if not all(table in tables for table in required_tables):
 
 
 
 
 
 
+        if not has_permission('administer'):
 
-                # Try to create tables if missing
 
 
 
 
 
 
+            flash('Admin access required', 'danger')
 
-                if not ensure_database_tables():
 
 
 
 
 
 
+            return redirect(url_for('add_delivery'))
 
-                    return jsonify({
 
 
 
 
 
 
+        return f(*args, **kwargs)
 
-                        'error': 'Database tables missing',
 
 
 
 
 
 
+    return decorated_function
 
-                        'message': 'Please visit /force-init-db to initialize database',
 
 
 
@@ -5908,7 +6187,6 @@ def database_required(f):
 
 
 
-                        'status': 'database_error'
 
 
 
@@ -5916,7 +6194,7 @@ def database_required(f):
 
 
 
-                    }), 503
+# Login required decorator for API endpoints (returns JSON instead of redirects)
 
 
 
@@ -5924,7 +6202,7 @@ def database_required(f):
 
 
 
-            
+def login_required_api(f):
 
 
 
@@ -5932,7 +6210,7 @@ def database_required(f):
 
 
 
-            return f(*args, **kwargs)
+    @wraps(f)
 
 
 
@@ -5940,7 +6218,7 @@ def database_required(f):
 
 
 
-            
+    def decorated_function(*args, **kwargs):
 
 
 
@@ -5948,7 +6226,7 @@ def database_required(f):
 
 
 
-        except Exception as e:
+        if 'user_id' not in session:
 
 
 
@@ -5964,7 +6242,7 @@ def database_required(f):
 
 
 
-                'error': 'Database connection failed',
+                'error': 'Authentication required',
 
 
 
@@ -5972,7 +6250,7 @@ def database_required(f):
 
 
 
-                'message': str(e),
+                'redirect': '/login'
 
 
 
@@ -5980,7 +6258,7 @@ def database_required(f):
 
 
 
-                'status': 'database_error'
+            }), 401
 
 
 
@@ -5988,7 +6266,7 @@ def database_required(f):
 
 
 
-            }), 503
+        return f(*args, **kwargs)
 
 
 
@@ -6012,7 +6290,7 @@ def database_required(f):
 
 
 
-# Login required decorator
+# Admin required decorator for API endpoints (returns JSON instead of redirects)
 
 
 
@@ -6020,7 +6298,7 @@ def database_required(f):
 
 
 
-def login_required(f):
+def admin_required_api(f):
 
 
 
@@ -6052,25 +6330,23 @@ def login_required(f):
 
 
 
-            return redirect(url_for('login', next=request.url))
-
-
+            return jsonify({
 
 
 
 
 
-        return f(*args, **kwargs)
 
 
+                'error': 'Authentication required',
 
 
 
 
 
-    return decorated_function
 
 
+                'redirect': '/login'
 
 
 
@@ -6078,61 +6354,61 @@ def login_required(f):
 
 
 
+            }), 401
 
 
 
 
 
 
-# Admin required decorator
 
+        if not has_permission('administer'):
 
 
 
 
 
 
-def admin_required(f):
 
+            return jsonify({
 
 
 
 
 
 
-    @wraps(f)
 
+                'error': 'Admin access required'
 
 
 
 
 
 
-    def decorated_function(*args, **kwargs):
 
+            }), 403
 
 
 
 
 
 
-        if 'user_id' not in session:
 
+        return f(*args, **kwargs)
 
 
 
 
 
 
-            return redirect(url_for('login', next=request.url))
 
+    return decorated_function
 
 
 
 
 
 
-        if session.get('user_role') != 'admin':
 
 
 
@@ -6140,7 +6416,6 @@ def admin_required(f):
 
 
 
-            flash('Admin access required', 'danger')
 
 
 
@@ -6148,26 +6423,26 @@ def admin_required(f):
 
 
 
-            return redirect(url_for('add_delivery'))
 
 
 
+@app.route('/reset-db')
 
 
 
 
-        return f(*args, **kwargs)
 
 
 
+@admin_required_api
 
 
 
 
-    return decorated_function
 
 
 
+def reset_database():
 
 
 
@@ -6175,94 +6450,95 @@ def admin_required(f):
 
 
 
+    """Reset database completely - admin only with confirmation."""
 
 
 
 
 
-# Login required decorator for API endpoints (returns JSON instead of redirects)
 
 
+    # Require confirmation parameter
 
 
 
 
 
-def login_required_api(f):
 
 
+    confirm = request.args.get('confirm')
 
 
 
 
 
-    @wraps(f)
 
 
+    if confirm != 'RESET_CONFIRMED':
 
 
 
 
 
-    def decorated_function(*args, **kwargs):
 
 
+        return jsonify({
 
 
 
 
 
-        if 'user_id' not in session:
 
 
+            'status': 'error', 
 
 
 
 
 
-            return jsonify({
 
 
+            'error': 'Confirmation required. Add ?confirm=RESET_CONFIRMED to proceed'
 
 
 
 
 
-                'error': 'Authentication required',
 
 
+        }), 400
 
 
 
 
 
-                'redirect': '/login'
 
 
+    
 
 
 
 
 
-            }), 401
 
 
+    # Log the reset attempt
 
 
 
 
 
-        return f(*args, **kwargs)
 
 
+    user_id = session.get('user_id')
 
 
 
 
 
-    return decorated_function
 
 
+    username = session.get('username', 'Unknown')
 
 
 
@@ -6270,126 +6546,127 @@ def login_required_api(f):
 
 
 
+    app.logger.warning(f"Database reset initiated by admin user {username} (ID: {user_id})")
 
 
 
 
 
 
-# Admin required decorator for API endpoints (returns JSON instead of redirects)
 
+    
 
 
 
 
 
 
-def admin_required_api(f):
 
+    try:
 
 
 
 
 
 
-    @wraps(f)
 
+        with app.app_context():
 
 
 
 
 
 
-    def decorated_function(*args, **kwargs):
 
+            # Drop all tables
 
 
 
 
 
 
-        if 'user_id' not in session:
 
+            db.drop_all()
 
 
 
 
 
 
-            return jsonify({
 
+            # Create all tables fresh
 
 
 
 
 
 
-                'error': 'Authentication required',
 
+            app.logger.info("Database tables dropped and recreated successfully")
 
 
 
 
 
 
-                'redirect': '/login'
 
+            return jsonify({
 
 
 
 
 
 
-            }), 401
 
+                'status': 'success', 
 
 
 
 
 
 
-        if session.get('user_role') != 'admin':
 
+                'message': 'Database reset successfully',
 
 
 
 
 
 
-            return jsonify({
 
+                'performed_by': username,
 
 
 
 
 
 
-                'error': 'Admin access required'
 
+                'timestamp': get_current_time().isoformat()
 
 
 
 
 
 
-            }), 403
 
+            }), 200
 
 
 
 
 
 
-        return f(*args, **kwargs)
 
+    except Exception as e:
 
 
 
 
 
 
-    return decorated_function
 
+        app.logger.error(f"Database reset failed: {str(e)}")
 
 
 
@@ -6397,6 +6674,7 @@ def admin_required_api(f):
 
 
 
+        return jsonify({'status': 'error', 'error': str(e)}), 500
 
 
 
@@ -6412,7 +6690,7 @@ def admin_required_api(f):
 
 
 
-@app.route('/reset-db')
+@app.route('/force-init-db')
 
 
 
@@ -6428,7 +6706,7 @@ def admin_required_api(f):
 
 
 
-def reset_database():
+def force_init_database():
 
 
 
@@ -6436,7 +6714,7 @@ def reset_database():
 
 
 
-    """Reset database completely - admin only with confirmation."""
+    """Force database initialization with admin protection and confirmation."""
 
 
 
@@ -6460,7 +6738,7 @@ def reset_database():
 
 
 
-    if confirm != 'RESET_CONFIRMED':
+    if confirm != 'FORCE_INIT_CONFIRMED':
 
 
 
@@ -6484,7 +6762,7 @@ def reset_database():
 
 
 
-            'error': 'Confirmation required. Add ?confirm=RESET_CONFIRMED to proceed'
+            'error': 'Confirmation required. Add ?confirm=FORCE_INIT_CONFIRMED to proceed'
 
 
 
@@ -6508,7 +6786,7 @@ def reset_database():
 
 
 
-    # Log the reset attempt
+    # Log the force init attempt
 
 
 
@@ -6532,7 +6810,7 @@ def reset_database():
 
 
 
-    app.logger.warning(f"Database reset initiated by admin user {username} (ID: {user_id})")
+    app.logger.warning(f"Database force initialization initiated by admin user {username} (ID: {user_id})")
 
 
 
@@ -6564,7 +6842,7 @@ def reset_database():
 
 
 
-            # Drop all tables
+            
 
 
 
@@ -6572,7 +6850,7 @@ def reset_database():
 
 
 
-            db.drop_all()
+            # Drop all tables
 
 
 
@@ -6580,7 +6858,7 @@ def reset_database():
 
 
 
-            # Create all tables fresh
+            print("Dropping existing tables...")
 
 
 
@@ -6588,7 +6866,7 @@ def reset_database():
 
 
 
-            app.logger.info("Database tables dropped and recreated successfully")
+            app.logger.info("Dropping existing database tables")
 
 
 
@@ -6596,7 +6874,7 @@ def reset_database():
 
 
 
-            return jsonify({
+            db.drop_all()
 
 
 
@@ -6604,7 +6882,7 @@ def reset_database():
 
 
 
-                'status': 'success', 
+            
 
 
 
@@ -6612,7 +6890,7 @@ def reset_database():
 
 
 
-                'message': 'Database reset successfully',
+            # Create all tables
 
 
 
@@ -6620,7 +6898,7 @@ def reset_database():
 
 
 
-                'performed_by': username,
+            print("Creating tables...")
 
 
 
@@ -6628,7 +6906,7 @@ def reset_database():
 
 
 
-                'timestamp': get_current_time().isoformat()
+            app.logger.info("Creating fresh database tables")
 
 
 
@@ -6636,7 +6914,7 @@ def reset_database():
 
 
 
-            }), 200
+            db.create_all()
 
 
 
@@ -6644,7 +6922,7 @@ def reset_database():
 
 
 
-    except Exception as e:
+            
 
 
 
@@ -6652,7 +6930,7 @@ def reset_database():
 
 
 
-        app.logger.error(f"Database reset failed: {str(e)}")
+            # Verify tables were created
 
 
 
@@ -6660,7 +6938,7 @@ def reset_database():
 
 
 
-        return jsonify({'status': 'error', 'error': str(e)}), 500
+            inspector = inspect(db.engine)
 
 
 
@@ -6668,6 +6946,7 @@ def reset_database():
 
 
 
+            tables = inspector.get_table_names()
 
 
 
@@ -6675,352 +6954,352 @@ def reset_database():
 
 
 
+            required_tables = ['users', 'delivery', 'audit_log', 'shelf']
 
-@app.route('/force-init-db')
 
 
 
 
 
 
+            
 
-@admin_required_api
 
 
 
 
 
 
+            if all(table in tables for table in required_tables):
 
-def force_init_database():
 
 
 
 
 
 
+                
 
-    """Force database initialization with admin protection and confirmation."""
 
 
 
 
 
 
+                # Create default admin user
 
-    # Require confirmation parameter
 
 
 
 
 
 
+                admin_user = User.query.filter_by(username='admin').first()
 
-    confirm = request.args.get('confirm')
 
 
 
 
 
 
+                if not admin_user:
 
-    if confirm != 'FORCE_INIT_CONFIRMED':
 
 
 
 
 
 
+                    admin_user = User(
 
-        return jsonify({
 
 
 
 
 
 
+                        username='admin',
 
-            'status': 'error', 
 
 
 
 
 
 
+                        role='admin',
 
-            'error': 'Confirmation required. Add ?confirm=FORCE_INIT_CONFIRMED to proceed'
 
 
 
 
 
 
+                        is_active=True
 
-        }), 400
 
 
 
 
 
 
+                    )
 
-    
 
 
 
 
 
 
+                    admin_user.set_password('ErrantMate@24!')
 
-    # Log the force init attempt
 
 
 
 
 
 
+                    db.session.add(admin_user)
 
-    user_id = session.get('user_id')
 
 
 
 
 
 
+                    db.session.commit()
 
-    username = session.get('username', 'Unknown')
 
 
 
 
 
 
+                    print("Default admin user created")
 
-    app.logger.warning(f"Database force initialization initiated by admin user {username} (ID: {user_id})")
 
 
 
 
 
 
+                    app.logger.info("Default admin user created successfully")
 
-    
 
 
 
 
 
 
+                else:
 
-    try:
 
 
 
 
 
 
+                    print("Admin user already exists")
 
-        with app.app_context():
 
 
 
 
 
 
+                    app.logger.info("Admin user already exists")
 
-            
 
 
 
 
 
 
+                
 
-            # Drop all tables
 
 
 
 
 
 
+                return jsonify({
 
-            print("Dropping existing tables...")
 
 
 
 
 
 
+                    'status': 'success', 
 
-            app.logger.info("Dropping existing database tables")
 
 
 
 
 
 
+                    'message': 'Database force initialized successfully',
 
-            db.drop_all()
 
 
 
 
 
 
+                    'tables': tables,
 
-            
 
 
 
 
 
 
+                    'database_url': str(app.config['SQLALCHEMY_DATABASE_URI']),
 
-            # Create all tables
 
 
 
 
 
 
+                    'admin_created': True,
 
-            print("Creating tables...")
 
 
 
 
 
 
+                    'performed_by': username,
 
-            app.logger.info("Creating fresh database tables")
 
 
 
 
 
 
+                    'timestamp': get_current_time().isoformat()
 
-            db.create_all()
 
 
 
 
 
 
+                }), 200
 
-            
 
 
 
 
 
 
+            else:
 
-            # Verify tables were created
 
 
 
 
 
 
+                missing = [table for table in required_tables if table not in tables]
 
-            inspector = inspect(db.engine)
 
 
 
 
 
 
+                raise Exception(f"Missing tables: {missing}")
 
-            tables = inspector.get_table_names()
 
 
 
 
 
 
+            
 
-            required_tables = ['users', 'delivery', 'audit_log', 'shelf']
 
 
 
 
 
 
+    except Exception as e:
 
-            
 
 
 
 
 
 
+        import traceback
 
-            if all(table in tables for table in required_tables):
 
 
 
 
 
 
+        error_details = traceback.format_exc()
 
-                
 
 
 
 
 
 
+        app.logger.error(f"Database force initialization failed: {str(e)}\n{error_details}")
 
-                # Create default admin user
 
 
 
 
 
 
+        
 
-                admin_user = User.query.filter_by(username='admin').first()
 
 
 
 
 
 
+        return jsonify({
 
-                if not admin_user:
 
 
 
 
 
 
+            'status': 'error', 
 
-                    admin_user = User(
 
 
 
 
 
 
+            'error': str(e),
 
-                        username='admin',
 
 
 
 
 
 
+            'traceback': error_details
 
-                        role='admin',
 
 
 
 
 
 
+        }), 500
 
-                        is_active=True
 
 
 
@@ -7028,7 +7307,6 @@ def force_init_database():
 
 
 
-                    )
 
 
 
@@ -7036,7 +7314,7 @@ def force_init_database():
 
 
 
-                    admin_user.set_password('ErrantMate@24!')
+@app.route('/add_delivery', methods=['GET', 'POST'])
 
 
 
@@ -7044,7 +7322,7 @@ def force_init_database():
 
 
 
-                    db.session.add(admin_user)
+@login_required
 
 
 
@@ -7052,7 +7330,7 @@ def force_init_database():
 
 
 
-                    db.session.commit()
+@database_required
 
 
 
@@ -7060,7 +7338,7 @@ def force_init_database():
 
 
 
-                    print("Default admin user created")
+def add_delivery():
 
 
 
@@ -7068,224 +7346,229 @@ def force_init_database():
 
 
 
-                    app.logger.info("Default admin user created successfully")
+    """Handle adding a new delivery."""
 
+    if request.method == 'GET':
 
+        # Log page view
 
+        log_page_view("Add Delivery")
 
+        return render_template('add_delivery.html')
 
 
 
-                else:
+    if request.method == 'POST':
 
+        try:
 
 
 
 
 
 
-                    print("Admin user already exists")
 
+            # Use browser local time if provided, otherwise use current time
 
 
 
 
 
 
-                    app.logger.info("Admin user already exists")
 
+            browser_local_time = request.form.get('browser_local_time')
 
 
 
 
 
 
-                
 
+            if browser_local_time:
 
 
 
 
 
 
-                return jsonify({
 
+                # Parse browser local time directly as naive datetime (no timezone conversion)
 
 
 
 
 
 
-                    'status': 'success', 
 
+                current_time = datetime.fromisoformat(browser_local_time)
 
 
 
 
 
 
-                    'message': 'Database force initialized successfully',
 
+            else:
 
 
 
 
 
 
-                    'tables': tables,
 
+                # Fallback to current time if browser time not available
 
 
 
 
 
 
-                    'database_url': str(app.config['SQLALCHEMY_DATABASE_URI']),
 
+                current_time = get_current_time()
 
 
 
 
 
 
-                    'admin_created': True,
 
+            
 
 
 
 
 
 
-                    'performed_by': username,
 
+            delivery = Delivery(
 
 
 
 
 
 
-                    'timestamp': get_current_time().isoformat()
 
+                display_id=generate_display_id(),
 
 
 
 
 
 
-                }), 200
 
+                sender_name=request.form['sender_name'],
 
 
 
 
 
 
-            else:
 
+                sender_phone=request.form['sender_phone'],
 
 
 
 
 
 
-                missing = [table for table in required_tables if table not in tables]
 
+                recipient_name=request.form['recipient_name'],
 
 
 
 
 
 
-                raise Exception(f"Missing tables: {missing}")
 
+                recipient_phone=request.form['recipient_phone'],
 
 
 
 
 
 
-            
 
+                recipient_address=request.form['recipient_address'],
 
 
 
 
 
 
-    except Exception as e:
 
+                goods_type=request.form['goods_type'],
 
 
 
 
 
 
-        import traceback
 
+                quantity=int(request.form['quantity']),
 
 
 
 
 
 
-        error_details = traceback.format_exc()
 
+                amount=float(request.form['amount']),
 
 
 
 
 
 
-        app.logger.error(f"Database force initialization failed: {str(e)}\n{error_details}")
 
+                expenses=0.0,  # Will be set later via Quick Actions
 
 
 
 
 
 
-        
 
+                payment_by=request.form.get('payment_by', 'M-Pesa'),  # Use form value or default
 
 
 
 
 
 
-        return jsonify({
 
+                status=request.form.get('status', 'Pending'),
 
 
 
 
 
 
-            'status': 'error', 
 
+                created_at=current_time,  # Use browser local time
 
 
 
 
 
 
-            'error': str(e),
 
+                created_by=session.get('user_id'),  # Set the creator
 
 
 
 
 
 
-            'traceback': error_details
 
+                delivery_person=session.get('username') if session.get('user_role') == 'admin' else None  # Auto-assign to admin users
 
 
 
 
 
 
-        }), 500
 
+            )
 
 
 
@@ -7293,6 +7576,7 @@ def force_init_database():
 
 
 
+            db.session.add(delivery)
 
 
 
@@ -7300,7 +7584,7 @@ def force_init_database():
 
 
 
-@app.route('/add_delivery', methods=['GET', 'POST'])
+            db.session.commit()
 
 
 
@@ -7308,7 +7592,7 @@ def force_init_database():
 
 
 
-@login_required
+            
 
 
 
@@ -7316,7 +7600,7 @@ def force_init_database():
 
 
 
-@database_required
+            # Log delivery creation
 
 
 
@@ -7324,7 +7608,7 @@ def force_init_database():
 
 
 
-def add_delivery():
+            details = {'message': f"Created delivery {delivery.display_id}: {delivery.sender_name} -> {delivery.recipient_name} ({delivery.goods_type}, KSh{delivery.amount})", 'display_id': delivery.display_id}
 
 
 
@@ -7332,525 +7616,521 @@ def add_delivery():
 
 
 
-    """Handle adding a new delivery."""
+            log_delivery_action("CREATE", delivery.id, details)
 
-    if request.method == 'GET':
 
-        # Log page view
 
-        log_page_view("Add Delivery")
 
-        return render_template('add_delivery.html')
 
 
 
-    if request.method == 'POST':
+            
 
-        try:
 
 
 
 
 
 
+            flash('Delivery added successfully!', 'success')
 
-            # Use browser local time if provided, otherwise use current time
 
 
 
 
 
 
+            return redirect(url_for('add_delivery'))
 
-            browser_local_time = request.form.get('browser_local_time')
 
 
 
 
 
 
+        except Exception as e:
 
-            if browser_local_time:
 
 
 
 
 
 
+            db.session.rollback()
 
-                # Parse browser local time directly as naive datetime (no timezone conversion)
 
 
 
 
 
 
+            app.logger.error(f"Error adding delivery: {str(e)}")
 
-                current_time = datetime.fromisoformat(browser_local_time)
 
 
 
 
 
 
+            
 
-            else:
 
 
 
 
 
 
+            # Check for specific database errors
 
-                # Fallback to current time if browser time not available
 
 
 
 
 
 
+            error_str = str(e).lower()
 
-                current_time = get_current_time()
 
 
 
 
 
 
+            if 'duplicate key' in error_str or 'unique constraint' in error_str:
 
-            
 
 
 
 
 
 
+                # Try again with a new display ID
 
-            delivery = Delivery(
 
 
 
 
 
 
+                try:
 
-                display_id=generate_display_id(),
 
 
 
 
 
 
+                    # Generate a new display ID with timestamp fallback
 
-                sender_name=request.form['sender_name'],
 
 
 
 
 
 
+                    import time
 
-                sender_phone=request.form['sender_phone'],
 
 
 
 
 
 
+                    now = get_local_time()
 
-                recipient_name=request.form['recipient_name'],
 
 
 
 
 
 
+                    date_str = now.strftime('%y%m%d')
 
-                recipient_phone=request.form['recipient_phone'],
 
 
 
 
 
 
+                    timestamp_suffix = str(int(time.time()))[-4:]
 
-                recipient_address=request.form['recipient_address'],
 
 
 
 
 
 
+                    new_display_id = f"{date_str}{timestamp_suffix}"
 
-                goods_type=request.form['goods_type'],
 
 
 
 
 
 
+                    
 
-                quantity=int(request.form['quantity']),
 
 
 
 
 
 
+                    delivery = Delivery(
 
-                amount=float(request.form['amount']),
 
 
 
 
 
 
+                        display_id=new_display_id,
 
-                expenses=0.0,  # Will be set later via Quick Actions
 
 
 
 
 
 
+                        sender_name=request.form['sender_name'],
 
-                payment_by=request.form.get('payment_by', 'M-Pesa'),  # Use form value or default
 
 
 
 
 
 
+                        sender_phone=request.form['sender_phone'],
 
-                status=request.form.get('status', 'Pending'),
 
 
 
 
 
 
+                        recipient_name=request.form['recipient_name'],
 
-                created_at=current_time,  # Use browser local time
 
 
 
 
 
 
+                        recipient_phone=request.form['recipient_phone'],
 
-                created_by=session.get('user_id'),  # Set the creator
 
 
 
 
 
 
+                        recipient_address=request.form['recipient_address'],
 
-                delivery_person=session.get('username') if session.get('user_role') == 'admin' else None  # Auto-assign to admin users
 
 
 
 
 
 
+                        goods_type=request.form['goods_type'],
 
-            )
 
 
 
 
 
 
+                        quantity=int(request.form['quantity']),
 
-            db.session.add(delivery)
 
 
 
 
 
 
+                        amount=float(request.form['amount']),
 
-            db.session.commit()
 
 
 
 
 
 
+                        expenses=0.0,  # Will be set later via Quick Actions
 
-            
 
 
 
 
 
 
+                        payment_by=request.form.get('payment_by', 'M-Pesa'),  # Use form value or default
 
-            # Log delivery creation
 
 
 
 
 
 
+                        status=request.form.get('status', 'Pending'),
 
-            details = f"Created delivery {delivery.display_id}: {delivery.sender_name} -> {delivery.recipient_name} ({delivery.goods_type}, KSh{delivery.amount})"
 
 
 
 
 
 
+                        created_at=current_time,  # Use browser local time
 
-            log_delivery_action("CREATE", delivery.id, details)
 
 
 
 
 
 
+                        created_by=session.get('user_id'),  # Set the creator
 
-            
 
 
 
 
 
 
+                        delivery_person=session.get('username') if session.get('user_role') == 'admin' else None  # Auto-assign to admin users
 
-            flash('Delivery added successfully!', 'success')
 
 
 
 
 
 
-
-            return redirect(url_for('add_delivery'))
-
+                    )
 
 
 
 
 
 
-        except Exception as e:
 
+                    db.session.add(delivery)
 
 
 
 
 
 
-            db.session.rollback()
 
+                    db.session.commit()
 
 
 
 
 
 
-            app.logger.error(f"Error adding delivery: {str(e)}")
 
+                    
 
 
 
 
 
 
-            
 
+                    # Log delivery creation
 
 
 
 
 
 
-            # Check for specific database errors
 
+                    details = {'message': f"Created delivery {delivery.display_id}: {delivery.sender_name} -> {delivery.recipient_name} ({delivery.goods_type}, KSh{delivery.amount})", 'display_id': delivery.display_id}
 
 
 
 
 
 
-            error_str = str(e).lower()
 
+                    log_delivery_action("CREATE", delivery.id, details)
 
 
 
 
 
 
-            if 'duplicate key' in error_str or 'unique constraint' in error_str:
 
+                    
 
 
 
 
 
 
-                # Try again with a new display ID
 
+                    flash('Delivery added successfully!', 'success')
 
 
 
 
 
 
-                try:
 
+                    return redirect(url_for('add_delivery'))
 
 
 
 
 
 
-                    # Generate a new display ID with timestamp fallback
 
+                    
 
 
 
 
 
 
-                    import time
 
+                except Exception as retry_error:
 
 
 
 
 
 
-                    now = get_local_time()
 
+                    db.session.rollback()
 
 
 
 
 
 
-                    date_str = now.strftime('%y%m%d')
 
+                    app.logger.error(f"Retry failed for delivery creation: {str(retry_error)}")
 
 
 
 
 
 
-                    timestamp_suffix = str(int(time.time()))[-4:]
 
+                    flash('System is experiencing high traffic. Please try again in a moment.', 'warning')
 
 
 
 
 
 
-                    new_display_id = f"{date_str}{timestamp_suffix}"
 
+            else:
 
 
 
 
 
 
-                    
 
+                flash('Error adding delivery. Please check form and try again.', 'danger')
 
 
 
+@app.route('/api/update_delivery_status', methods=['POST'])
 
 
 
-                    delivery = Delivery(
 
 
+@login_required_api
 
 
 
 
 
-                        display_id=new_display_id,
 
 
+@database_required
 
 
 
 
 
-                        sender_name=request.form['sender_name'],
 
 
+def api_update_delivery_status():
 
 
 
 
 
-                        sender_phone=request.form['sender_phone'],
 
 
+    """Update delivery status and assign delivery person (admin only)."""
 
 
 
 
 
-                        recipient_name=request.form['recipient_name'],
 
 
+    try:
 
 
 
 
 
-                        recipient_phone=request.form['recipient_phone'],
 
 
+        # Check if user is admin
 
 
 
 
 
-                        recipient_address=request.form['recipient_address'],
 
 
+        user_id = session.get('user_id')
 
 
 
 
 
-                        goods_type=request.form['goods_type'],
 
 
+        if not user_id:
 
 
 
 
 
-                        quantity=int(request.form['quantity']),
 
 
+            return jsonify({'success': False, 'error': 'Authentication required'}), 401
 
 
 
 
 
-                        amount=float(request.form['amount']),
 
 
+        
 
 
 
 
 
-                        expenses=0.0,  # Will be set later via Quick Actions
 
 
+        # Session permission snapshot, kept current by permissions.py
+        if not has_permission('assign_deliveries'):
+            return jsonify({'success': False, 'error': 'Admin access required'}), 403
 
 
 
 
 
-                        payment_by=request.form.get('payment_by', 'M-Pesa'),  # Use form value or default
+        data = request.get_json()
 
 
 
@@ -7858,7 +8138,7 @@ def add_delivery():
 
 
 
-                        status=request.form.get('status', 'Pending'),
+        delivery_id = data.get('delivery_id')
 
 
 
@@ -7866,7 +8146,7 @@ def add_delivery():
 
 
 
-                        created_at=current_time,  # Use browser local time
+        new_status = data.get('status')
 
 
 
@@ -7874,7 +8154,7 @@ def add_delivery():
 
 
 
-                        created_by=session.get('user_id'),  # Set the creator
+        delivery_person = data.get('delivery_person')
 
 
 
@@ -7882,7 +8162,7 @@ def add_delivery():
 
 
 
-                        delivery_person=session.get('username') if session.get('user_role') == 'admin' else None  # Auto-assign to admin users
+        
 
 
 
@@ -7890,7 +8170,7 @@ def add_delivery():
 
 
 
-                    )
+        if not delivery_id or not new_status:
 
 
 
@@ -7898,7 +8178,7 @@ def add_delivery():
 
 
 
-                    db.session.add(delivery)
+            return jsonify({'success': False, 'error': 'Missing required fields'}), 400
 
 
 
@@ -7906,7 +8186,7 @@ def add_delivery():
 
 
 
-                    db.session.commit()
+        
 
 
 
@@ -7914,7 +8194,7 @@ def add_delivery():
 
 
 
-                    
+        if new_status not in ['Pending', 'In Transit', 'Delivered']:
 
 
 
@@ -7922,7 +8202,7 @@ def add_delivery():
 
 
 
-                    # Log delivery creation
+            return jsonify({'success': False, 'error': 'Invalid status'}), 400
 
 
 
@@ -7930,7 +8210,7 @@ def add_delivery():
 
 
 
-                    details = f"Created delivery {delivery.display_id}: {delivery.sender_name} -> {delivery.recipient_name} ({delivery.goods_type}, KSh{delivery.amount})"
+        
 
 
 
@@ -7938,7 +8218,7 @@ def add_delivery():
 
 
 
-                    log_delivery_action("CREATE", delivery.id, details)
+        delivery = Delivery.query.get_or_404(delivery_id)
 
 
 
@@ -7946,7 +8226,7 @@ def add_delivery():
 
 
 
-                    
+        
 
 
 
@@ -7954,81 +8234,81 @@ def add_delivery():
 
 
 
-                    flash('Delivery added successfully!', 'success')
+        # Additional validation: Admin users can update any delivery (no restrictions)
 
+        # Removed previous restrictions that limited access to assigned deliveries
 
 
 
 
 
 
-                    return redirect(url_for('add_delivery'))
 
+        
 
 
 
 
 
 
-                    
 
+        delivery.status = new_status
 
 
 
 
 
 
-                except Exception as retry_error:
 
+        
 
 
 
 
 
 
-                    db.session.rollback()
 
+        # Only assign delivery person if it's provided (for admin users)
 
 
 
 
 
 
-                    app.logger.error(f"Retry failed for delivery creation: {str(retry_error)}")
 
+        if delivery_person:
 
 
 
 
 
 
-                    flash('System is experiencing high traffic. Please try again in a moment.', 'warning')
 
+            delivery.delivery_person = delivery_person
 
 
 
 
 
 
-            else:
 
+        
 
 
 
 
 
 
-                flash('Error adding delivery. Please check form and try again.', 'danger')
 
+        db.session.commit()
 
 
-@app.route('/api/update_delivery_status', methods=['POST'])
 
 
 
 
 
-@login_required_api
+        
 
 
 
@@ -8036,7 +8316,7 @@ def add_delivery():
 
 
 
-@database_required
+        message = f'Status updated to {new_status}'
 
 
 
@@ -8044,7 +8324,7 @@ def add_delivery():
 
 
 
-def api_update_delivery_status():
+        if delivery_person:
 
 
 
@@ -8052,7 +8332,7 @@ def api_update_delivery_status():
 
 
 
-    """Update delivery status and assign delivery person (admin only)."""
+            message += f' and assigned to {delivery_person}'
 
 
 
@@ -8060,7 +8340,7 @@ def api_update_delivery_status():
 
 
 
-    try:
+        
 
 
 
@@ -8068,7 +8348,7 @@ def api_update_delivery_status():
 
 
 
-        # Check if user is admin
+        return jsonify({
 
 
 
@@ -8076,7 +8356,7 @@ def api_update_delivery_status():
 
 
 
-        user_id = session.get('user_id')
+            'success': True,
 
 
 
@@ -8084,7 +8364,7 @@ def api_update_delivery_status():
 
 
 
-        if not user_id:
+            'message': message
 
 
 
@@ -8092,7 +8372,7 @@ def api_update_delivery_status():
 
 
 
-            return jsonify({'success': False, 'error': 'Authentication required'}), 401
+        })
 
 
 
@@ -8108,17 +8388,15 @@ def api_update_delivery_status():
 
 
 
-        user = User.query.get(user_id)
+    except Exception as e:
 
-        if not user or not user.is_admin():
 
-            return jsonify({'success': False, 'error': 'Admin access required'}), 403
 
 
 
 
 
-        data = request.get_json()
+        db.session.rollback()
 
 
 
@@ -8126,7 +8404,7 @@ def api_update_delivery_status():
 
 
 
-        delivery_id = data.get('delivery_id')
+        app.logger.error(f"Error updating delivery status: {str(e)}")
 
 
 
@@ -8134,7 +8412,7 @@ def api_update_delivery_status():
 
 
 
-        new_status = data.get('status')
+        return jsonify({'success': False, 'error': 'Error updating delivery status'}), 500
 
 
 
@@ -8142,7 +8420,6 @@ def api_update_delivery_status():
 
 
 
-        delivery_person = data.get('delivery_person')
 
 
 
@@ -8150,81 +8427,80 @@ def api_update_delivery_status():
 
 
 
-        
 
+@app.route('/update_status/<int:delivery_id>/<status>', methods=['GET', 'POST'])
 
 
 
 
 
 
-        if not delivery_id or not new_status:
 
+@login_required
 
 
 
 
 
 
-            return jsonify({'success': False, 'error': 'Missing required fields'}), 400
 
+@database_required
 
 
 
 
 
 
-        
 
+def update_status(delivery_id, status):
 
 
 
 
 
 
-        if new_status not in ['Pending', 'In Transit', 'Delivered']:
 
+    """Update the status of a delivery."""
 
 
 
 
 
 
-            return jsonify({'success': False, 'error': 'Invalid status'}), 400
 
+    try:
 
 
 
 
 
 
-        
 
+        # Check if user is admin
 
 
 
 
 
 
-        delivery = Delivery.query.get_or_404(delivery_id)
 
+        user_id = session.get('user_id')
 
 
 
 
 
 
-        
 
+        if not user_id:
 
 
 
 
 
 
-        # Additional validation: Admin users can update any delivery (no restrictions)
 
-        # Removed previous restrictions that limited access to assigned deliveries
+            if request.is_json:
 
 
 
@@ -8232,7 +8508,7 @@ def api_update_delivery_status():
 
 
 
-        
+                return jsonify({'success': False, 'error': 'Authentication required'}), 401
 
 
 
@@ -8240,7 +8516,7 @@ def api_update_delivery_status():
 
 
 
-        delivery.status = new_status
+            return redirect(url_for('login'))
 
 
 
@@ -8256,7 +8532,8 @@ def api_update_delivery_status():
 
 
 
-        # Only assign delivery person if it's provided (for admin users)
+        if not has_permission('assign_deliveries'):
+            if request.is_json:
 
 
 
@@ -8264,7 +8541,7 @@ def api_update_delivery_status():
 
 
 
-        if delivery_person:
+                return jsonify({'success': False, 'error': 'Admin access required'}), 403
 
 
 
@@ -8272,7 +8549,7 @@ def api_update_delivery_status():
 
 
 
-            delivery.delivery_person = delivery_person
+            flash('Admin access required', 'error')
 
 
 
@@ -8280,7 +8557,7 @@ def api_update_delivery_status():
 
 
 
-        
+            return redirect(url_for('dashboard'))
 
 
 
@@ -8288,7 +8565,7 @@ def api_update_delivery_status():
 
 
 
-        db.session.commit()
+        
 
 
 
@@ -8296,117 +8573,121 @@ def api_update_delivery_status():
 
 
 
-        
+        delivery = Delivery.query.get_or_404(delivery_id)
 
 
 
 
 
+        
 
+        # Additional validation: Users can only update their own assigned deliveries
 
-        message = f'Status updated to {new_status}'
+        if session.get('user_role') == 'user' and delivery.delivery_person and delivery.delivery_person != session.get('username'):
 
+            if request.is_json:
 
 
 
 
 
+                return jsonify({
 
-        if delivery_person:
 
 
 
 
 
 
+                    'success': False, 
 
-            message += f' and assigned to {delivery_person}'
 
 
 
 
 
 
+                    'error': 'You can only update status for deliveries assigned to you'
 
-        
 
 
 
 
 
 
+                }), 403
 
-        return jsonify({
 
 
 
 
 
 
+            flash('You can only update status for deliveries assigned to you', 'error')
 
-            'success': True,
 
 
 
 
 
 
+            return redirect(url_for('dashboard'))
 
-            'message': message
 
 
 
 
 
 
+        
 
-        })
 
 
 
 
 
 
+        delivery.status = status
 
-        
 
 
 
 
 
 
+        db.session.commit()
 
-    except Exception as e:
 
 
 
 
 
 
+        
 
-        db.session.rollback()
 
 
 
 
 
 
+        # Check if this is an AJAX request
 
-        app.logger.error(f"Error updating delivery status: {str(e)}")
 
 
 
 
 
 
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
 
-        return jsonify({'success': False, 'error': 'Error updating delivery status'}), 500
 
 
 
 
 
 
+            return jsonify({
 
 
 
@@ -8414,187 +8695,183 @@ def api_update_delivery_status():
 
 
 
+                'success': True,
 
 
-@app.route('/update_status/<int:delivery_id>/<status>', methods=['GET', 'POST'])
 
 
 
 
 
+                'message': f'Delivery status updated to {status}',
 
 
-@login_required
 
 
 
 
 
+                'new_status': status
 
 
-@database_required
 
 
 
 
 
+            })
 
 
-def update_status(delivery_id, status):
 
 
 
 
 
+        else:
 
 
-    """Update the status of a delivery."""
 
 
 
 
 
+            flash(f'Delivery status updated to {status}', 'success')
 
 
-    try:
 
 
 
 
 
+            return redirect(url_for('dashboard'))
 
 
-        # Check if user is admin
 
 
 
 
 
+            
 
 
-        user_id = session.get('user_id')
 
 
 
 
 
+    except Exception as e:
 
 
-        if not user_id:
 
 
 
 
 
+        db.session.rollback()
 
 
-            if request.is_json:
 
 
 
 
 
+        app.logger.error(f"Error updating status: {str(e)}")
 
 
-                return jsonify({'success': False, 'error': 'Authentication required'}), 401
 
 
 
 
 
+        
 
 
-            return redirect(url_for('login'))
 
 
 
 
 
+        # Check if this is an AJAX request
 
 
-        
 
 
 
 
 
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
 
 
-        user = User.query.get(user_id)
 
 
 
 
 
+            return jsonify({
 
 
-        if not user or not user.is_admin():
 
 
 
 
 
+                'success': False,
 
 
-            if request.is_json:
 
 
 
 
 
+                'error': 'Error updating status'
 
 
-                return jsonify({'success': False, 'error': 'Admin access required'}), 403
 
 
 
 
 
+            }), 500
 
 
-            flash('Admin access required', 'error')
 
 
 
 
 
+        else:
 
 
-            return redirect(url_for('dashboard'))
 
 
 
 
 
+            flash('Error updating status', 'danger')
 
 
-        
 
 
 
 
 
+            return redirect(url_for('dashboard'))
 
 
-        delivery = Delivery.query.get_or_404(delivery_id)
 
 
 
 
 
-        
 
-        # Additional validation: Users can only update their own assigned deliveries
 
-        if user.role == 'user' and delivery.delivery_person and delivery.delivery_person != user.username:
 
-            if request.is_json:
 
 
 
 
 
-                return jsonify({
+@app.route('/delete_delivery/<int:delivery_id>', methods=['DELETE'])
 
 
 
@@ -8602,7 +8879,7 @@ def update_status(delivery_id, status):
 
 
 
-                    'success': False, 
+@database_required
 
 
 
@@ -8610,7 +8887,7 @@ def update_status(delivery_id, status):
 
 
 
-                    'error': 'You can only update status for deliveries assigned to you'
+def delete_delivery(delivery_id):
 
 
 
@@ -8618,7 +8895,7 @@ def update_status(delivery_id, status):
 
 
 
-                }), 403
+    """Delete a delivery."""
 
 
 
@@ -8626,7 +8903,7 @@ def update_status(delivery_id, status):
 
 
 
-            flash('You can only update status for deliveries assigned to you', 'error')
+    try:
 
 
 
@@ -8634,7 +8911,7 @@ def update_status(delivery_id, status):
 
 
 
-            return redirect(url_for('dashboard'))
+        delivery = Delivery.query.get_or_404(delivery_id)
 
 
 
@@ -8642,7 +8919,7 @@ def update_status(delivery_id, status):
 
 
 
-        
+        db.session.delete(delivery)
 
 
 
@@ -8650,7 +8927,7 @@ def update_status(delivery_id, status):
 
 
 
-        delivery.status = status
+        db.session.commit()
 
 
 
@@ -8658,47 +8935,45 @@ def update_status(delivery_id, status):
 
 
 
-        db.session.commit()
-
+        return jsonify({'success': True, 'message': 'Delivery deleted successfully'})
 
 
 
 
 
 
-        
 
+    except Exception as e:
 
 
 
 
 
 
-        # Check if this is an AJAX request
 
+        db.session.rollback()
 
 
 
 
 
 
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
 
+        app.logger.error(f"Error deleting delivery: {str(e)}", exc_info=True)
 
 
 
 
 
 
-            return jsonify({
 
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 
 
 
 
-                'success': True,
 
 
 
@@ -8706,163 +8981,183 @@ def update_status(delivery_id, status):
 
 
 
-                'message': f'Delivery status updated to {status}',
 
 
+@app.route('/login', methods=['GET', 'POST'])
 
 
 
 
 
-                'new_status': status
 
 
+def login():
 
 
 
 
 
-            })
 
 
+    """Handle user login."""
 
 
 
 
 
-        else:
 
 
+    if request.method == 'POST':
 
 
 
 
 
-            flash(f'Delivery status updated to {status}', 'success')
 
 
+        # Get client IP for rate limiting
+        client_ip = client_address()
 
+        # Check rate limiting
+        if not limiter.hit('login', client_ip).allowed:
 
 
 
 
-            return redirect(url_for('dashboard'))
 
 
 
+            app.logger.warning(f'Rate limit exceeded for IP: {client_ip}')
 
 
 
 
-            
 
 
 
+            flash('Too many login attempts. Please try again later.', 'danger')
 
 
 
 
-    except Exception as e:
 
 
 
+            return render_template('login.html')
 
 
 
 
-        db.session.rollback()
 
 
 
+        
 
 
 
 
-        app.logger.error(f"Error updating status: {str(e)}")
 
 
 
+        username = request.form.get('username', '').strip()
 
 
 
 
-        
 
 
 
+        password = request.form.get('password', '')
 
 
 
 
-        # Check if this is an AJAX request
 
 
 
+        
 
 
 
 
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
 
 
 
+        if not username or not password:
 
 
 
 
-            return jsonify({
 
 
 
+            flash('Please enter both username and password', 'danger')
 
 
 
 
-                'success': False,
 
 
 
+            return render_template('login.html')
 
 
 
 
-                'error': 'Error updating status'
 
 
 
+        
 
 
 
 
-            }), 500
 
 
 
+        user = User.query.filter_by(username=username).first()
+        try:
+            # Unknown usernames are checked against a dummy hash so they take as long as a wrong password
+            password_ok = verify_password(user.password_hash if user else None, password)
+        except PasswordPoolBusy:
+            app.logger.warning(f'Password pool busy, login for {username} refused')
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
+        if password_ok and user.is_active:
+            if needs_rehash(user.password_hash):
+                # Stored with older KDF parameters: upgrade now that we have the plaintext
+                try:
+                    user.password_hash = hash_password(password)
+                    db.session.commit()
+                    app.logger.info(f'Upgraded password hash for user {user.username}')
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.warning(f'Could not upgrade password hash for user {user.username}: {e}')
 
 
 
 
-        else:
 
 
 
 
+            session['user_id'] = user.id
 
 
 
-            flash('Error updating status', 'danger')
 
 
 
 
+            session['username'] = user.username
 
 
 
-            return redirect(url_for('dashboard'))
 
 
 
 
+            store_snapshot(auth_record(user))  # Role and permission bits, checked on later requests
 
 
 
@@ -8870,110 +9165,111 @@ def update_status(delivery_id, status):
 
 
 
+            session.permanent = True
 
 
 
 
-@app.route('/delete_delivery/<int:delivery_id>', methods=['DELETE'])
 
 
 
+            
 
 
 
 
-@database_required
 
 
 
+            # Log successful login
 
 
 
 
-def delete_delivery(delivery_id):
 
 
 
+            log_login(user, success=True)
 
 
 
 
-    """Delete a delivery."""
 
 
 
+            
 
 
 
 
-    try:
 
 
 
+            # Redirect to the page they were trying to access, or role-appropriate page
 
 
 
 
-        delivery = Delivery.query.get_or_404(delivery_id)
 
 
 
+            next_page = request.args.get('next')
 
 
 
 
-        db.session.delete(delivery)
 
 
 
+            if next_page:
 
 
 
 
-        db.session.commit()
 
 
 
+                return redirect(next_page)
 
 
 
 
-        return jsonify({'success': True, 'message': 'Delivery deleted successfully'})
 
 
 
+            
 
 
 
 
-    except Exception as e:
 
 
 
+            # Role-based redirect
 
 
 
 
-        db.session.rollback()
 
 
 
+            if user.role == 'admin':
 
 
 
 
-        app.logger.error(f"Error deleting delivery: {str(e)}", exc_info=True)
 
 
 
+                return redirect(url_for('reports'))
 
 
 
 
-        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 
+            elif user.role == 'staff':
 
 
 
@@ -8981,108 +9277,108 @@ def delete_delivery(delivery_id):
 
 
 
+                return redirect(url_for('add_delivery'))
 
 
 
 
 
-@app.route('/login', methods=['GET', 'POST'])
 
 
+            else:
 
 
 
 
 
-def login():
 
 
+                return redirect(url_for('add_delivery'))
 
 
 
 
 
-    """Handle user login."""
 
 
+        else:
 
 
 
 
 
-    if request.method == 'POST':
 
 
+            # Log failed login attempt
 
 
 
 
 
-        # Get client IP for rate limiting
 
 
+            if username:
 
 
 
 
 
-        client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
 
 
+                if user:
 
 
 
 
 
-        
 
 
+                    log_login(user, success=False, reason="Invalid password")
 
 
 
 
 
-        # Check rate limiting
 
 
+                else:
 
 
 
 
 
-        if is_rate_limited(client_ip):
 
 
+                    log_login(User(username=username, id=0), success=False, reason="User not found")
 
 
 
 
 
-            app.logger.warning(f'Rate limit exceeded for IP: {client_ip}')
 
 
+            flash('Invalid username or password', 'danger')
 
 
 
 
 
-            flash('Too many login attempts. Please try again later.', 'danger')
 
 
+    
 
 
 
 
 
-            return render_template('login.html')
 
 
+    return render_template('login.html')
 
 
 
 
 
-        
 
 
 
@@ -9090,71 +9386,70 @@ def login():
 
 
 
-        username = request.form.get('username', '').strip()
 
 
 
+@app.route('/logout')
 
 
 
 
-        password = request.form.get('password', '')
 
 
 
+def logout():
 
 
 
 
-        
 
 
 
+    """Handle user logout."""
 
 
 
 
-        if not username or not password:
 
 
 
+    # Log logout before clearing session
 
 
 
 
-            flash('Please enter both username and password', 'danger')
 
 
 
+    log_logout()
 
 
 
 
-            return render_template('login.html')
 
 
 
+    session.clear()
 
 
 
 
-        
 
 
 
+    flash('You have been logged out successfully', 'info')
 
 
 
 
-        user = User.query.filter_by(username=username).first()
 
 
 
+    return redirect(url_for('login'))
 
 
 
 
-        
 
 
 
@@ -9162,119 +9457,118 @@ def login():
 
 
 
-        if user and user.check_password(password) and user.is_active:
 
 
 
 
+@app.route('/reports')
 
 
 
-            session['user_id'] = user.id
 
 
 
 
+@admin_required
 
 
 
-            session['username'] = user.username
 
 
 
 
+@database_required
 
 
 
-            session['user_role'] = user.role  # Store user role in session
 
 
 
 
+def reports():
 
 
 
-            session.permanent = True
 
 
 
 
+    """Render the reports page - Admin only."""
 
 
 
-            
 
 
 
 
+    try:
 
 
 
-            # Log successful login
 
 
 
 
+        # Log page view
 
 
 
-            log_login(user, success=True)
 
 
 
 
+        log_page_view("Reports")
 
 
 
-            
 
 
 
 
+        # Get recent deliveries (last 10)
 
 
 
-            # Redirect to the page they were trying to access, or role-appropriate page
 
 
 
 
+        recent_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).limit(10).all()
 
 
 
-            next_page = request.args.get('next')
 
 
 
 
+        return render_template('reports.html', recent_deliveries=recent_deliveries)
 
 
 
-            if next_page:
 
 
 
 
+    except Exception as e:
 
 
 
-                return redirect(next_page)
 
 
 
 
+        app.logger.error(f"Error loading reports page: {str(e)}", exc_info=True)
 
 
 
-            
 
 
 
 
+        return render_template('reports.html', recent_deliveries=[])
 
 
 
-            # Role-based redirect
 
 
 
@@ -9282,119 +9576,133 @@ def login():
 
 
 
-            if user.role == 'admin':
 
 
 
 
 
+def load_shelf_board():
+    """Every shelf as its /api/shelves dict plus this month's billing; shelf_board() calls it on a miss."""
+    shelves = [shelf_to_dict(row) for row in project_rows(*Shelf.__table__.c, order_by=(Shelf.id,))]
+    today = get_local_date()
+    billing = billing_by_month(db.session, ShelfRental.__table__, today, today, as_of=today)[0]
+    return shelves, {'billing': billing}
 
 
-                return redirect(url_for('reports'))
+def current_shelf_board():
+    return shelf_board(load_shelf_board)
 
 
+def board_conditional_response(response, version):
+    """Tag response with the board version; a matching If-None-Match gets 304 Not Modified."""
+    # JSON and msgpack bodies of the same board version are different representations
+    response.set_etag(version if representation() == 'json' else f'{version}-msgpack')
+    response.vary.add('Accept')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 
+@app.route('/rent_shelf')
 
 
 
-            elif user.role == 'staff':
 
 
 
 
+@login_required
 
 
 
-                return redirect(url_for('add_delivery'))
 
 
 
 
+@database_required
 
 
 
-            else:
 
 
 
 
+def rent_shelf():
 
 
 
-                return redirect(url_for('add_delivery'))
 
 
 
 
+    """Render the rent a shelf page - Available to all users."""
 
 
 
-        else:
 
 
 
 
+    try:
 
 
 
-            # Log failed login attempt
 
 
 
 
+        # Log page view
 
 
 
-            if username:
 
 
 
 
+        log_page_view("Rent a Shelf")
 
 
 
-                # Try to get user for logging (even if password is wrong)
 
 
 
 
+        
 
 
 
-                user = User.query.filter_by(username=username).first()
 
 
 
 
+        # Initial shelf data for server-side rendering, from the shared board snapshot
+        return render_template('rent_shelf.html', shelves_data=current_shelf_board()['shelves'])
 
 
 
-                if user:
 
 
 
 
+    except Exception as e:
 
 
 
-                    log_login(user, success=False, reason="Invalid password")
 
 
 
 
+        app.logger.error(f"Error loading rent shelf page: {str(e)}", exc_info=True)
 
 
 
-                else:
 
 
 
 
+        return render_template('rent_shelf.html')
 
 
 
-                    log_login(User(username=username, id=0), success=False, reason="User not found")
 
 
 
@@ -9402,195 +9710,232 @@ def login():
 
 
 
-            flash('Invalid username or password', 'danger')
 
 
 
+@app.route('/api/shelves', methods=['GET'])
 
 
 
+@login_required
 
-    
 
 
+@database_required
 
 
 
+def get_shelves():
 
 
-    return render_template('login.html')
 
+    """Get all shelves with role-based filtering."""
 
 
 
+    try:
 
 
 
+        board = current_shelf_board()
+        if wants_msgpack():
+            response = jsonify(board['shelves'])
+        else:
+            # Serialized once per board version, not per request
+            response = app.response_class(board['body'], mimetype='application/json')
+        return board_conditional_response(response, board['version'])
 
 
 
+        
 
 
 
+    except Exception as e:
 
 
-@app.route('/logout')
 
+        app.logger.error(f"Error fetching shelves: {str(e)}", exc_info=True)
 
 
 
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
 
-def logout():
 
 
 
 
+@app.route('/api/test/time', methods=['GET'])
 
 
 
-    """Handle user logout."""
+@login_required
 
 
 
+@database_required
 
 
 
+def test_server_time():
 
-    # Log logout before clearing session
 
 
+    """Test server current time and date."""
 
 
 
+    try:
 
 
-    log_logout()
 
+        from datetime import datetime
 
 
 
+        import time
 
 
 
-    session.clear()
+        
 
 
 
+        utc_now = datetime.utcnow()
 
 
 
+        local_now = datetime.now()
 
-    flash('You have been logged out successfully', 'info')
 
 
+        timestamp_now = datetime.fromtimestamp(time.time())
 
 
 
+        
 
 
-    return redirect(url_for('login'))
 
+        return jsonify({
 
 
 
+            'success': True,
 
 
 
+            'utc_now': str(utc_now),
 
 
 
+            'local_now': str(local_now),
 
 
 
+            'timestamp_now': str(timestamp_now),
 
 
-@app.route('/reports')
 
+            'utc_date': str(utc_now.date()),
 
 
 
+            'local_date': str(local_now.date()),
 
 
 
-@admin_required
+            'server_timezone': 'Local server time'
 
 
 
+        })
 
 
 
+    except Exception as e:
 
-@database_required
 
 
+        return jsonify({
 
 
 
+            'success': False,
 
 
-def reports():
 
+            'error': str(e)
 
 
 
+        }), 500
 
 
 
-    """Render the reports page - Admin only."""
 
 
 
 
+@app.route('/api/test/db', methods=['GET'])
 
 
 
-    try:
+@login_required
 
 
 
+@database_required
 
 
 
+def test_database():
 
-        # Log page view
 
 
+    """Test database connection and shelf table."""
 
 
 
+    try:
 
 
-        log_page_view("Reports")
 
+        # Test basic database connection
 
 
 
+        shelves = Shelf.query.limit(1).all()
 
 
 
-        # Get recent deliveries (last 10)
+        app.logger.info(f"Database test successful - found {len(shelves)} shelves")
 
 
 
+        
 
 
 
+        return jsonify({
 
-        recent_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).limit(10).all()
 
 
+            'success': True,
 
 
 
+            'message': 'Database connection successful',
 
 
-        return render_template('reports.html', recent_deliveries=recent_deliveries)
 
+            'shelves_found': len(shelves)
 
 
 
+        })
 
 
 
@@ -9598,24 +9943,27 @@ def reports():
 
 
 
+        app.logger.error(f"Database test failed: {str(e)}", exc_info=True)
 
 
 
+        return jsonify({
 
-        app.logger.error(f"Error loading reports page: {str(e)}", exc_info=True)
 
 
+            'success': False,
 
 
 
+            'error': str(e),
 
 
-        return render_template('reports.html', recent_deliveries=[])
-
 
+            'message': 'Database connection failed'
 
 
 
+        }), 500
 
 
 
@@ -9623,4403 +9971,582 @@ def reports():
 
 
 
+# Shelf state machine: available -> occupied -> maintenance -> available.
+# Every transition is one conditional UPDATE ... RETURNING plus its audit row, committed together,
+# so two desks acting on the same shelf cannot both succeed.
 
+# action: (allowed current states, new state, admin only, audit action)
+SHELF_TRANSITIONS = {
+    'rent': (('available',), 'occupied', False, 'SHELF_RENT'),
+    'update': (('occupied',), 'occupied', True, 'SHELF_UPDATE'),
+    'end_rental': (('occupied',), 'maintenance', True, 'SHELF_END_RENTAL'),
+    'start_maintenance': (('available',), 'maintenance', True, 'SHELF_START_MAINTENANCE'),
+    'complete_maintenance': (('maintenance',), 'available', True, 'SHELF_COMPLETE_MAINTENANCE'),
+}
 
+SHELF_TRANSITION_MESSAGES = {
+    'rent': 'Shelf {shelf_id} successfully rented to {customer}',
+    'update': 'Shelf {shelf_id} details updated successfully',
+    'end_rental': 'Shelf {shelf_id} rental ended; the shelf is in maintenance until it is checked',
+    'start_maintenance': 'Shelf {shelf_id} is now in maintenance',
+    'complete_maintenance': 'Shelf {shelf_id} is now available',
+}
 
-@app.route('/rent_shelf')
+# Request field -> shelf column for the rental details
+SHELF_RENTAL_FIELDS = {
+    'customerName': 'customer_name',
+    'customerPhone': 'customer_phone',
+    'customerEmail': 'customer_email',
+    'cardNumber': 'card_number',
+    'itemsDescription': 'items_description',
+    'rentalPeriod': 'rental_period',
+    'discount': 'discount',
+}
 
+POST_RENTAL_MAINTENANCE_REASON = 'Post-rental inspection'
 
+SHELF_SIZES = ('Small', 'Large')
 
 
+class ShelfTransitionError(Exception):
+    """A transition that is not allowed from the shelf's current state (or bad input)."""
 
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
 
 
-@login_required
+def shelf_to_dict(shelf):
+    """The /api/shelves representation of a Shelf or a shelf row."""
+    return {
+        'id': shelf.id,
+        'status': shelf.status,
+        'size': shelf.size,
+        'price': shelf.price,
+        'customer': shelf.customer_name,
+        'phone': shelf.customer_phone,
+        'customerEmail': shelf.customer_email,
+        'cardNumber': shelf.card_number,
+        'rentedDate': shelf.rented_date.strftime('%Y-%m-%d') if shelf.rented_date else None,
+        'itemsDescription': shelf.items_description,
+        'rentalPeriod': shelf.rental_period,
+        'discount': shelf.discount,
+        'reason': shelf.maintenance_reason,
+        'dueDate': shelf.due_date.strftime('%Y-%m-%d') if shelf.due_date else None,
+        'expiryNotice': shelf.expiry_notice
+    }
 
 
+def _shelf_rental_values(data, skip_empty):
+    """Column values for the rental details in data; empty strings are skipped when skip_empty."""
+    values = {}
+    for field, column in SHELF_RENTAL_FIELDS.items():
+        value = data.get(field)
+        if value is None or (skip_empty and value == ''):
+            continue
+        try:
+            if column == 'rental_period':
+                value = int(value) if value != '' else None
+            elif column == 'discount':
+                value = float(value) if value != '' else 0.0
+        except (TypeError, ValueError):
+            raise ShelfTransitionError(f'{field} must be a number')
+        values[column] = value
+    return values
+
+
+def _shelf_transition_values(action, data):
+    if action == 'rent':
+        if not data.get('customerName') or not data.get('customerPhone'):
+            raise ShelfTransitionError('Missing required fields')
+        values = dict(dict.fromkeys(SHELF_RENTAL_FIELDS.values()), discount=0.0)
+        values.update(_shelf_rental_values(data, skip_empty=False))
+        today = get_local_date()
+        return dict(values, rented_date=today, maintenance_reason=None, expiry_notice=None,
+                    due_date=add_months(today, values['rental_period'] or 1))
+    if action == 'update':
+        values = _shelf_rental_values(data, skip_empty=True)
+        if not values:
+            raise ShelfTransitionError('No fields to update')
+        return values
+    if action == 'end_rental':
+        values = dict.fromkeys(SHELF_RENTAL_FIELDS.values())
+        return dict(values, discount=0.0, rented_date=None, due_date=None, expiry_notice=None,
+                    maintenance_reason=(data.get('reason') or POST_RENTAL_MAINTENANCE_REASON)[:200])
+    if action == 'start_maintenance':
+        return {'maintenance_reason': (data.get('reason') or 'Maintenance')[:200]}
+    return {'maintenance_reason': None}
+
+
+def shelf_rental_for(shelf):
+    """A new ShelfRental for a shelf (or shelf row) that has just been rented."""
+    rental_period = shelf.rental_period or 1
+    return ShelfRental(
+        shelf_id=shelf.id,
+        customer_name=shelf.customer_name,
+        customer_phone=shelf.customer_phone,
+        size=shelf.size,
+        monthly_price=shelf.price,
+        discount=shelf.discount or 0.0,
+        rental_period=rental_period,
+        start_date=shelf.rented_date,
+        due_date=add_months(shelf.rented_date, rental_period),
+    )
+
+
+def record_shelf_rental(action, shelf, values):
+    """Keep shelf_rental in step with a transition, in the transition's transaction."""
+    rental_table = ShelfRental.__table__
+    open_rental = and_(rental_table.c.shelf_id == shelf.id, rental_table.c.end_date.is_(None))
+    if action == 'rent':
+        db.session.add(shelf_rental_for(shelf))
+    elif action == 'end_rental':
+        db.session.execute(rental_table.update().where(open_rental).values(end_date=get_local_date()))
+    elif action == 'update':
+        changes = {column: values[column] for column in ('customer_name', 'customer_phone', 'discount', 'rental_period')
+                   if column in values}
+        if 'rental_period' in changes and shelf.rented_date:
+            changes['due_date'] = add_months(shelf.rented_date, changes['rental_period'] or 1)
+        if changes:
+            db.session.execute(rental_table.update().where(open_rental).values(**changes))
+
+
+def _apply_shelf_transition(target_id, action, data):
+    """Run action's conditional UPDATE ... RETURNING against the shelf whose id equals target_id.
+
+    target_id is a value or a scalar subquery; returns the updated row (None if nothing
+    matched) with its audit row added, uncommitted.
+    """
+    from_states, to_state, _, audit_action = SHELF_TRANSITIONS[action]
+    values = _shelf_transition_values(action, data or {})
+    shelf_table = Shelf.__table__
+    stmt = (
+        shelf_table.update()
+        .where(shelf_table.c.id == target_id, shelf_table.c.status.in_(from_states))
+        .values(status=to_state, updated_at=get_local_time(), **values)
+        .returning(*shelf_table.c)
+    )
+    shelf = db.session.execute(stmt).first()
+    if shelf is None:
+        return None
+    if action == 'update' and 'rental_period' in values and shelf.rented_date:
+        # A changed period (an extension) moves the due date; the term still runs from rented_date
+        shelf = db.session.execute(
+            shelf_table.update().where(shelf_table.c.id == shelf.id)
+            .values(due_date=add_months(shelf.rented_date, values['rental_period']), expiry_notice=None)
+            .returning(*shelf_table.c)
+        ).first()
+    record_shelf_rental(action, shelf, values)
+    record_audit(audit_action, resource_type='SHELF', resource_id=shelf.id, details={
+        'message': SHELF_TRANSITION_MESSAGES[action].format(shelf_id=shelf.id, customer=shelf.customer_name),
+        'to_status': to_state,
+        **{column: value for column, value in values.items()
+           if column in ('customer_name', 'rental_period', 'maintenance_reason') and value is not None}
+    })
+    return shelf
 
 
+def transition_shelf(shelf_id, action, data=None):
+    """Apply action to shelf_id atomically and audit it; returns the updated shelf as a dict.
 
+    Raises ShelfTransitionError (404 unknown shelf, 409 wrong state, 400 bad input).
+    """
+    shelf = _apply_shelf_transition(shelf_id, action, data)
+    if shelf is None:
+        db.session.rollback()
+        shelf_table = Shelf.__table__
+        current = db.session.execute(select(shelf_table.c.status).where(shelf_table.c.id == shelf_id)).scalar()
+        if current is None:
+            raise ShelfTransitionError('Shelf not found', 404)
+        raise ShelfTransitionError(f"Shelf {shelf_id} is {current}; cannot {action.replace('_', ' ')}", 409)
+    db.session.commit()
+    return shelf_to_dict(shelf)
+
+
+def claim_next_shelf(size, data, max_price=None, zone=None):
+    """Rent the cheapest available shelf of size (within max_price), preferring ids that start with zone.
+
+    The pick and the UPDATE are one statement. On PostgreSQL the pick is FOR UPDATE SKIP
+    LOCKED, so concurrent clerks each get a different shelf without waiting or retrying;
+    SQLite runs the whole statement under its single write lock. Raises ShelfTransitionError.
+    """
+    shelf_table = Shelf.__table__
+    conditions = [shelf_table.c.status == 'available', shelf_table.c.size == size]
+    if max_price is not None:
+        conditions.append(shelf_table.c.price <= max_price)
+    order_by = [shelf_table.c.price, shelf_table.c.id]
+    if zone:
+        order_by.insert(0, case((shelf_table.c.id.startswith(zone, autoescape=True), 0), else_=1))
+    candidate = (
+        select(shelf_table.c.id).where(*conditions).order_by(*order_by).limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    shelf = _apply_shelf_transition(candidate, 'rent', data)
+    if shelf is None:
+        db.session.rollback()
+        within = f' at or under KSh {max_price}' if max_price is not None else ''
+        raise ShelfTransitionError(f'No available {size} shelf{within}', 409)
+    db.session.commit()
+    return shelf_to_dict(shelf)
 
 
+@app.route('/api/shelves/transition', methods=['POST'])
+@login_required
 @database_required
-
-
-
-
-
-
-
-def rent_shelf():
-
-
-
-
-
-
-
-    """Render the rent a shelf page - Available to all users."""
-
-
-
-
-
-
-
+def shelf_transition():
+    """Move a shelf through its lifecycle: rent, update, end_rental, start_maintenance, complete_maintenance."""
+    data = request.get_json(silent=True) or {}
+    shelf_id = str(data.get('shelfId') or '').strip()
+    action = data.get('action')
+    if not shelf_id:
+        return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
+    if action not in SHELF_TRANSITIONS:
+        return jsonify({'success': False, 'error': f"Unknown action. Use one of: {', '.join(SHELF_TRANSITIONS)}"}), 400
+    if SHELF_TRANSITIONS[action][2] and not has_permission('manage_shelves'):
+        return jsonify({'success': False, 'error': 'Permission denied'}), 403
     try:
-
-
-
-
-
-
-
-        # Log page view
-
-
-
-
-
-
-
-        log_page_view("Rent a Shelf")
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Get initial shelf data for server-side rendering
-
-
-
-        shelves = Shelf.query.all()
-
-
-
-        shelves_data = []
-
-
-
-        
-
-
-
-        for shelf in shelves:
-
-
-
-            shelf_dict = {
-
-
-
-                'id': shelf.id,
-
-
-
-                'status': shelf.status,
-
-
-
-                'size': shelf.size,
-
-
-
-                'price': shelf.price,
-
-
-
-                'customer': shelf.customer_name,
-
-
-
-                'phone': shelf.customer_phone,
-
-
-
-                'rentedDate': shelf.rented_date.strftime('%Y-%m-%d') if shelf.rented_date else None,
-
-
-
-                'itemsDescription': shelf.items_description,
-
-
-
-                'rentalPeriod': shelf.rental_period,
-
-
-
-                'reason': shelf.maintenance_reason
-
-
-
-            }
-
-
-
-            shelves_data.append(shelf_dict)
-
-
-
-
-
-
-
-        return render_template('rent_shelf.html', shelves_data=shelves_data)
-
-
-
-
-
-
-
+        shelf = transition_shelf(shelf_id, action, data)
+    except ShelfTransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
     except Exception as e:
-
-
-
-
-
-
-
-        app.logger.error(f"Error loading rent shelf page: {str(e)}", exc_info=True)
-
-
-
-
-
-
-
-        return render_template('rent_shelf.html')
-
-
-
-
-
-
-
-
-
-
-
-
-
-@app.route('/api/shelves', methods=['GET'])
-
-
-
+        db.session.rollback()
+        app.logger.error(f"Shelf transition {action} failed for {shelf_id}: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+    app.logger.info(f"Shelf {shelf_id}: {action} -> {shelf['status']} by {session.get('username', 'unknown')}")
+    return jsonify({
+        'success': True,
+        'message': SHELF_TRANSITION_MESSAGES[action].format(shelf_id=shelf_id, customer=shelf['customer']),
+        'shelf': shelf
+    }), 200
+@app.route('/api/shelves/allocate', methods=['POST'])
 @login_required
-
-
-
 @database_required
-
-
-
-def get_shelves():
-
-
-
-    """Get all shelves with role-based filtering."""
-
-
-
+def allocate_shelf():
+    """Rent the next available shelf of a size, optionally under a max price and preferring a zone."""
+    data = request.get_json(silent=True) or {}
+    size = str(data.get('size') or '').strip().capitalize()
+    if size not in SHELF_SIZES:
+        return jsonify({'success': False, 'error': f"size must be one of: {', '.join(SHELF_SIZES)}"}), 400
     try:
+        max_price = int(data['maxPrice']) if data.get('maxPrice') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'maxPrice must be a number'}), 400
+    zone = str(data.get('zone') or '').strip().upper() or None
+    try:
+        shelf = claim_next_shelf(size, data, max_price=max_price, zone=zone)
+    except ShelfTransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Shelf allocation failed for {size}: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+    app.logger.info(f"Allocated shelf {shelf['id']} ({size}) by {session.get('username', 'unknown')}")
+    return jsonify({
+        'success': True,
+        'message': SHELF_TRANSITION_MESSAGES['rent'].format(shelf_id=shelf['id'], customer=shelf['customer']),
+        'shelf': shelf
+    }), 200
+
+
+# Bulk shelf operations: each is one set-based statement plus one audit row.
+# operation: audit action (maintenance toggles reuse the transitions' states and values)
+SHELF_BULK_OPERATIONS = {
+    'provision': 'SHELF_BULK_PROVISION',
+    'reprice': 'SHELF_BULK_REPRICE',
+    'start_maintenance': 'SHELF_BULK_START_MAINTENANCE',
+    'complete_maintenance': 'SHELF_BULK_COMPLETE_MAINTENANCE',
+}
+
+# Requests expanding to more shelves than this are refused
+MAX_BULK_SHELVES = 1000
+
+SHELF_ID_NUMBER = re.compile(r'^(.*?)(\d+)$')
+
+
+def expand_shelf_ids(patterns):
+    """Shelf ids for patterns like 'A-01..A-60', 'B-01..40' or 'C-07', in order, without duplicates.
+
+    A range keeps the zero padding of its start. Raises ShelfTransitionError for a
+    malformed range, an id too long for the shelf table, or more than MAX_BULK_SHELVES ids.
+    """
+    if isinstance(patterns, str):
+        patterns = patterns.split(',')
+    ids = []
+    for pattern in patterns or []:
+        pattern = str(pattern).strip()
+        if '..' not in pattern:
+            if pattern:
+                ids.append(pattern)
+            continue
+        start, end = (part.strip() for part in pattern.split('..', 1))
+        start_match, end_match = SHELF_ID_NUMBER.match(start), SHELF_ID_NUMBER.match(end)
+        if not start_match or not end_match or end_match.group(1) not in ('', start_match.group(1)):
+            raise ShelfTransitionError(f'Invalid shelf id range: {pattern}')
+        prefix, width = start_match.group(1), len(start_match.group(2))
+        first, last = int(start_match.group(2)), int(end_match.group(2))
+        if last < first:
+            raise ShelfTransitionError(f'Shelf id range runs backwards: {pattern}')
+        if len(ids) + last - first + 1 > MAX_BULK_SHELVES:
+            raise ShelfTransitionError(f'At most {MAX_BULK_SHELVES} shelves per request')
+        ids.extend(f'{prefix}{number:0{width}d}' for number in range(first, last + 1))
+
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BULK_SHELVES:
+        raise ShelfTransitionError(f'At most {MAX_BULK_SHELVES} shelves per request')
+    too_long = [shelf_id for shelf_id in ids if len(shelf_id) > Shelf.__table__.c.id.type.length]
+    if too_long:
+        raise ShelfTransitionError(f"Shelf ids too long: {', '.join(too_long[:5])}")
+    return ids
+
+
+def bulk_shelf_operation(operation, shelf_ids, size=None, price=None, data=None):
+    """Apply operation to shelf_ids (and/or every shelf of size, for reprice) in one statement.
+
+    provision inserts the missing shelves as available (existing ids are left alone);
+    reprice sets price; the maintenance toggles move only shelves in the transition's
+    starting state. Commits with one audit row and returns (changed ids, skipped ids).
+    """
+    shelf_table = Shelf.__table__
+    now = get_local_time()
 
+    if operation == 'provision':
+        insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+        rows = [{'id': shelf_id, 'status': 'available', 'size': size, 'price': price, 'discount': 0.0,
+                 'created_at': now, 'updated_at': now} for shelf_id in shelf_ids]
+        stmt = insert(shelf_table).values(rows).on_conflict_do_nothing(index_elements=['id'])
+    else:
+        conditions = []
+        if shelf_ids:
+            conditions.append(shelf_table.c.id.in_(shelf_ids))
+        if operation == 'reprice':
+            if size:
+                conditions.append(shelf_table.c.size == size)
+            values = {'price': price}
+        else:
+            from_states, to_state, _, _ = SHELF_TRANSITIONS[operation]
+            conditions.append(shelf_table.c.status.in_(from_states))
+            values = dict(_shelf_transition_values(operation, data or {}), status=to_state)
+        stmt = shelf_table.update().where(*conditions).values(updated_at=now, **values)
+
+    changed = list(db.session.execute(stmt.returning(shelf_table.c.id)).scalars())
+    changed_set = set(changed)
+    skipped = [shelf_id for shelf_id in shelf_ids if shelf_id not in changed_set]
+    record_audit(SHELF_BULK_OPERATIONS[operation], resource_type='SHELF', details={
+        'message': f'Bulk {operation.replace("_", " ")}: {len(changed)} shelves changed, {len(skipped)} skipped',
+        'changed': sorted(changed),
+        **{key: value for key, value in (('size', size), ('price', price)) if value is not None}
+    })
+    db.session.commit()
+    return sorted(changed), skipped
 
 
-        # Check if shelf table exists
-        from sqlalchemy import inspect
-        inspector = inspect(db.engine)
-        if 'shelf' not in inspector.get_table_names():
-            # Return empty data if table doesn't exist
-            return jsonify([])
-
-        shelves = Shelf.query.all()
-
-
-
-        shelves_data = []
-
-
-
-        
-
-
-
-        for shelf in shelves:
-
-
-
-            shelf_dict = {
-
-
-
-                'id': shelf.id,
-
-
-
-                'status': shelf.status,
-
-
-
-                'size': shelf.size,
-
-
-
-                'price': shelf.price,
-
-
-
-                'customer': shelf.customer_name,
-
-
-
-                'phone': shelf.customer_phone,
-
-
-
-                'customerEmail': shelf.customer_email,
-
+@app.route('/api/shelves/bulk', methods=['POST'])
+@admin_required_api
+@database_required
+def bulk_shelves():
+    """Provision, reprice or toggle maintenance for many shelves at once.
+
+    Body: operation (provision, reprice, start_maintenance, complete_maintenance),
+    ids (list of ids or ranges such as 'A-01..A-60'), size, price, reason.
+    """
+    data = request.get_json(silent=True) or {}
+    operation = data.get('operation')
+    if operation not in SHELF_BULK_OPERATIONS:
+        return jsonify({'success': False, 'error': f"Unknown operation. Use one of: {', '.join(SHELF_BULK_OPERATIONS)}"}), 400
+    size = str(data.get('size') or '').strip().capitalize() or None
+    try:
+        shelf_ids = expand_shelf_ids(data.get('ids'))
+        price = int(data['price']) if data.get('price') not in (None, '') else None
+    except ShelfTransitionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'price must be a number'}), 400
+
+    if size is not None and size not in SHELF_SIZES:
+        return jsonify({'success': False, 'error': f"size must be one of: {', '.join(SHELF_SIZES)}"}), 400
+    if price is not None and price < 0:
+        return jsonify({'success': False, 'error': 'Price must be positive'}), 400
+    if operation == 'provision' and (not shelf_ids or size is None or price is None):
+        return jsonify({'success': False, 'error': 'ids, size and price are required'}), 400
+    if operation == 'reprice' and (price is None or not (shelf_ids or size)):
+        return jsonify({'success': False, 'error': 'price and ids or size are required'}), 400
+    if operation.endswith('maintenance') and not shelf_ids:
+        return jsonify({'success': False, 'error': 'ids are required'}), 400
 
+    try:
+        changed, skipped = bulk_shelf_operation(operation, shelf_ids, size=size, price=price, data=data)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Bulk shelf {operation} failed: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
-                'cardNumber': shelf.card_number,
+    app.logger.info(f"Bulk shelf {operation}: {len(changed)} changed, {len(skipped)} skipped by {session.get('username', 'unknown')}")
+    return jsonify({
+        'success': True,
+        'operation': operation,
+        'requested': len(shelf_ids) if shelf_ids else len(changed),
+        'changed': changed,
+        'skipped': skipped
+    }), 200
+
+
+# Maintenance reason recorded when the expiry scan ends an overdue rental (RENTAL_EXPIRY_AUTO_END_DAYS)
+EXPIRED_RENTAL_MAINTENANCE_REASON = 'Rental expired - clear out and inspect'
+
+
+def _flag_rental_expiry(notice, due_condition, batch_size):
+    """Set expiry_notice on occupied shelves matching due_condition, batch_size rows per transaction."""
+    shelf_table = Shelf.__table__
+    flagged = 0
+    while True:
+        batch = (
+            select(shelf_table.c.id)
+            .where(shelf_table.c.status == 'occupied', due_condition,
+                   shelf_table.c.expiry_notice.is_distinct_from(notice))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        count = db.session.execute(
+            shelf_table.update().where(shelf_table.c.id.in_(batch)).values(expiry_notice=notice)
+        ).rowcount
+        db.session.commit()
+        flagged += count
+        if count < batch_size:
+            return flagged
+
+
+def scan_rental_expiry():
+    """Flag rentals due within RENTAL_EXPIRING_DAYS and past due; end long-overdue ones when enabled.
+
+    Runs through the (status, due_date) index in batches of RENTAL_EXPIRY_BATCH_SIZE
+    shelves per transaction. Every statement is conditional, so scans running at the
+    same time in several workers do not double-apply. Auto-ending and flagging run as
+    separate steps, each rolled back on its own, so a failure in one does not stop the
+    other. Returns the shelves per outcome and the number of failed steps.
+    """
+    today = get_local_date()
+    batch_size = app.config.get('RENTAL_EXPIRY_BATCH_SIZE', 200)
+    due_date = Shelf.__table__.c.due_date
+    result = {'ended': 0, 'expired': 0, 'expiring': 0, 'errors': 0}
+
+    auto_end_days = app.config.get('RENTAL_EXPIRY_AUTO_END_DAYS')
+    if auto_end_days is not None:
+        shelf_table = Shelf.__table__
+        candidate = (
+            select(shelf_table.c.id)
+            .where(shelf_table.c.status == 'occupied', due_date < today - timedelta(days=auto_end_days))
+            .order_by(due_date).limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        try:
+            while True:
+                ended = 0
+                while ended < batch_size and _apply_shelf_transition(
+                        candidate, 'end_rental', {'reason': EXPIRED_RENTAL_MAINTENANCE_REASON}) is not None:
+                    ended += 1
+                db.session.commit()
+                result['ended'] += ended
+                if ended < batch_size:
+                    break
+        except Exception as e:
+            db.session.rollback()
+            result['errors'] += 1
+            app.logger.error(f"Rental expiry auto-end failed: {str(e)}", exc_info=True)
 
+    expiring_until = today + timedelta(days=app.config.get('RENTAL_EXPIRING_DAYS', 7))
+    for notice, condition in (('expired', due_date < today),
+                              ('expiring', and_(due_date >= today, due_date <= expiring_until))):
+        try:
+            result[notice] = _flag_rental_expiry(notice, condition, batch_size)
+        except Exception as e:
+            db.session.rollback()
+            result['errors'] += 1
+            app.logger.error(f"Rental expiry flagging ({notice}) failed: {str(e)}", exc_info=True)
+    return result
 
 
-                'rentedDate': shelf.rented_date.strftime('%Y-%m-%d') if shelf.rented_date else None,
-
-
-
-                'itemsDescription': shelf.items_description,
-
-
-
-                'rentalPeriod': shelf.rental_period,
-
-
-
-                'discount': shelf.discount,
-
-
-
-                'reason': shelf.maintenance_reason
-
-
-
-            }
-
-
-
-            shelves_data.append(shelf_dict)
-
-
-
-        
-
-
-
-        return jsonify(shelves_data), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Error fetching shelves: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/test/time', methods=['GET'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def test_server_time():
-
-
-
-    """Test server current time and date."""
-
-
-
-    try:
-
-
-
-        from datetime import datetime
-
-
-
-        import time
-
-
-
-        
-
-
-
-        utc_now = datetime.utcnow()
-
-
-
-        local_now = datetime.now()
-
-
-
-        timestamp_now = datetime.fromtimestamp(time.time())
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'utc_now': str(utc_now),
-
-
-
-            'local_now': str(local_now),
-
-
-
-            'timestamp_now': str(timestamp_now),
-
-
-
-            'utc_date': str(utc_now.date()),
-
-
-
-            'local_date': str(local_now.date()),
-
-
-
-            'server_timezone': 'Local server time'
-
-
-
-        })
-
-
-
-    except Exception as e:
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': str(e)
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/test/db', methods=['GET'])
-
-
-
-@login_required
 
+@app.route('/api/shelves/expiring', methods=['GET'])
+@login_required
+@database_required
+def get_expiring_shelves():
+    """Occupied shelves due within ?days= days (default RENTAL_EXPIRING_DAYS), overdue ones first."""
+    if not has_permission('view_shelf_rentals'):
+        return jsonify({'success': False, 'error': 'Permission denied'}), 403
+    days = request.args.get('days', app.config.get('RENTAL_EXPIRING_DAYS', 7), type=int)
+    if days is None or not 0 <= days <= 365:
+        return jsonify({'success': False, 'error': 'days must be between 0 and 365'}), 400
+    try:
+        today = get_local_date()
+        shelves = (
+            Shelf.query
+            .filter(Shelf.status == 'occupied', Shelf.due_date <= today + timedelta(days=days))
+            .order_by(Shelf.due_date, Shelf.id)
+            .limit(500)
+            .all()
+        )
+        return jsonify({
+            'success': True,
+            'days': days,
+            'shelves': [dict(shelf_to_dict(shelf), daysLeft=(shelf.due_date - today).days) for shelf in shelves]
+        }), 200
+    except Exception as e:
+        app.logger.error(f"Error fetching expiring shelves: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
+@app.route('/api/shelves/expiry-scan', methods=['GET', 'POST'])
+@admin_required_api
 @database_required
+def rental_expiry_scan():
+    """GET: the background scanner's stats. POST: run a scan now, as the calling admin."""
+    if request.method == 'GET':
+        return jsonify({'success': True, 'scanner': scanner_stats()}), 200
+    try:
+        result = scan_rental_expiry()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Rental expiry scan failed: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+    app.logger.info(f"Rental expiry scan by {session.get('username', 'unknown')}: {result}")
+    return jsonify({'success': True, 'result': result}), 200
 
 
-
-def test_database():
-
-
-
-    """Test database connection and shelf table."""
-
-
-
-    try:
-
-
-
-        # Test basic database connection
-
-
-
-        shelves = Shelf.query.limit(1).all()
-
-
-
-        app.logger.info(f"Database test successful - found {len(shelves)} shelves")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': 'Database connection successful',
-
-
-
-            'shelves_found': len(shelves)
-
-
-
-        })
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Database test failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': str(e),
-
-
-
-            'message': 'Database connection failed'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/update-ultra', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def update_shelf_details_ultra():
-
-
-
-    """Ultra-simple PostgreSQL update details - most basic approach"""
-
-
-
-    try:
-
-
-
-        # Check permissions
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        customer_name = data.get('customerName', '')
-
-
-
-        customer_email = data.get('customerEmail', '')
-
-
-
-        card_number = data.get('cardNumber', '')
-
-
-
-        items_description = data.get('itemsDescription', '')
-
-
-
-        rental_period = data.get('rentalPeriod', '')
-
-
-
-        discount = data.get('discount', 0)
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID required'}), 400
-
-
-
-        
-
-
-
-        app.logger.info(f"Ultra-simple update for shelf: {shelf_id}")
-
-
-
-        
-
-
-
-        # Use the most basic approach possible
-
-
-
-        try:
-
-
-
-            # Use raw SQL with the simplest possible syntax
-
-
-
-            with db.engine.connect() as conn:
-
-
-
-                # Build basic UPDATE statement - only update non-empty fields
-
-
-
-                updates = []
-
-
-
-                if customer_name:
-
-
-
-                    updates.append(f"customer_name = '{customer_name}'")
-
-
-
-                if customer_email:
-
-
-
-                    updates.append(f"customer_email = '{customer_email}'")
-
-
-
-                if card_number:
-
-
-
-                    updates.append(f"card_number = '{card_number}'")
-
-
-
-                if items_description:
-
-
-
-                    updates.append(f"items_description = '{items_description}'")
-
-
-
-                if rental_period:
-
-
-
-                    updates.append(f"rental_period = '{rental_period}'")
-
-
-
-                if discount:
-
-
-
-                    updates.append(f"discount = {discount}")
-
-
-
-                
-
-
-
-                if not updates:
-
-
-
-                    return jsonify({'success': False, 'error': 'No fields to update'}), 400
-
-
-
-                
-
-
-
-                # Add updated_at
-
-
-
-                if 'sqlite' in str(db.engine.url).lower():
-
-
-
-                    updates.append("updated_at = datetime('now')")
-
-
-
-                else:
-
-
-
-                    updates.append("updated_at = NOW()")
-
-
-
-                
-
-
-
-                # Construct SQL
-
-
-
-                sql = "UPDATE shelf SET " + ", ".join(updates) + f" WHERE id = '{shelf_id}'"
-
-
-
-                
-
-
-
-                result = conn.execute(db.text(sql))
-
-
-
-                conn.commit()
-
-
-
-                
-
-
-
-                if result.rowcount > 0:
-
-
-
-                    app.logger.info(f"Ultra-simple update success: {shelf_id}")
-
-
-
-                    
-
-
-
-                    # Simple logging
-
-
-
-                    app.logger.info(f"User {session.get('username', 'unknown')} updated shelf {shelf_id}")
-
-
-
-                    
-
-
-
-                    return jsonify({
-
-
-
-                        'success': True,
-
-
-
-                        'message': f'Shelf {shelf_id} details updated successfully'
-
-
-
-                    }), 200
-
-
-
-                else:
-
-
-
-                    return jsonify({
-
-
-
-                        'success': False,
-
-
-
-                        'error': 'Shelf not found'
-
-
-
-                    }), 400
-
-
-
-                    
-
-
-
-        except Exception as e:
-
-
-
-            app.logger.error(f"Ultra-simple update DB error: {str(e)}", exc_info=True)
-
-
-
-            return jsonify({
-
-
-
-                'success': False,
-
-
-
-                'error': f'Database operation failed: {str(e)}'
-
-
-
-            }), 500
-
-
-
-            
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Ultra-simple update failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/complete-maintenance', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def complete_maintenance():
-
-
-
-    """Complete maintenance for a shelf - change status from maintenance to available."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId', '').strip()
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Check if shelf is in maintenance
-
-
-
-        if shelf.status != 'maintenance':
-
-
-
-            return jsonify({'success': False, 'error': f'Shelf is not in maintenance (current status: {shelf.status})'}), 400
-
-
-
-        
-
-
-
-        # Update shelf status to available and clear maintenance reason
-
-
-
-        shelf.status = 'available'
-
-
-
-        shelf.maintenance_reason = None
-
-
-
-        shelf.updated_at = get_local_time()
-
-
-
-        
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        app.logger.info(f"Maintenance completed for shelf: {shelf_id} by {session.get('username', 'unknown')}")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} is now available'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Complete maintenance failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/create-orm', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def create_shelf_orm():
-
-
-
-    """Create shelf using SQLAlchemy ORM for maximum PostgreSQL compatibility."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId', '').strip()
-
-
-
-        price = data.get('price', 0)
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
-
-
-
-        
-
-
-
-        if price < 0:
-
-
-
-            return jsonify({'success': False, 'error': 'Price must be positive'}), 400
-
-
-
-        
-
-
-
-        # Check if shelf already exists using ORM
-
-
-
-        existing_shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if existing_shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
-
-
-
-        
-
-
-
-        # Create new shelf using ORM (most compatible)
-
-
-
-        new_shelf = Shelf(
-
-
-
-            id=shelf_id,
-
-
-
-            size='Small',  # Default size
-
-
-
-            price=price,
-
-
-
-            status='available'
-
-
-
-        )
-
-
-
-        
-
-
-
-        db.session.add(new_shelf)
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        app.logger.info(f"New shelf created: {shelf_id} by {session.get('username', 'unknown')}")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} created successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"ORM create shelf failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-@app.route('/api/shelves/create', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def create_shelf():
-
-
-
-    """Create a new shelf - for staff/admin only."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId', '').strip()
-
-
-
-        price = data.get('price', 0)
-
-
-
-        size = data.get('size', 'Small')  # Default size
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
-
-
-
-        
-
-
-
-        if price < 0:
-
-
-
-            return jsonify({'success': False, 'error': 'Price must be positive'}), 400
-
-
-
-        
-
-
-
-        # Check if shelf already exists
-
-
-
-        existing_shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if existing_shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
-
-
-
-        
-
-
-
-        # Create new shelf
-
-
-
-        new_shelf = Shelf(
-
-
-
-            id=shelf_id,
-
-
-
-            size=size,
-
-
-
-            price=price,
-
-
-
-            status='available'
-
-
-
-        )
-
-
-
-        
-
-
-
-        db.session.add(new_shelf)
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        app.logger.info(f"New shelf created: {shelf_id} by {session.get('username', 'unknown')}")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} created successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error creating shelf: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/update-info', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def update_shelf_info():
-
-
-
-    """Update shelf ID and price - for staff/admin only."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        original_shelf_id = data.get('originalShelfId', '').strip()
-
-
-
-        new_shelf_id = data.get('newShelfId', '').strip()
-
-
-
-        price = data.get('price', 0)
-
-
-
-        
-
-
-
-        if not original_shelf_id or not new_shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf IDs are required'}), 400
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=original_shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Check if new ID already exists (if different from original)
-
-
-
-        if new_shelf_id != original_shelf_id:
-
-
-
-            existing_shelf = Shelf.query.filter_by(id=new_shelf_id).first()
-
-
-
-            if existing_shelf:
-
-
-
-                return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
-
-
-
-        
-
-
-
-        # Update shelf information
-
-
-
-        shelf.id = new_shelf_id
-
-
-
-        if price > 0:
-
-
-
-            shelf.price = price
-
-
-
-        
-
-
-
-        shelf.updated_at = get_local_time()
-
-
-
-        
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        app.logger.info(f"Shelf info updated: {original_shelf_id} -> {new_shelf_id} by {session.get('username', 'unknown')}")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf information updated successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error updating shelf info: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/delete', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def delete_shelf():
-
-
-
-    """Delete a shelf - for staff/admin only."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId', '').strip()
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Check if shelf is occupied (prevent deletion of occupied shelves)
-
-
-
-        if shelf.status == 'occupied':
-
-
-
-            return jsonify({'success': False, 'error': 'Cannot delete occupied shelf'}), 400
-
-
-
-        
-
-
-
-        # Delete the shelf
-
-
-
-        db.session.delete(shelf)
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        app.logger.info(f"Shelf deleted: {shelf_id} by {session.get('username', 'unknown')}")
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} deleted successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error deleting shelf: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/update', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def update_shelf_details():
-
-
-
-    """Update shelf details - for staff/admin only."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        app.logger.info(f"Received update shelf request: {data}")
-
-
-
-        
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        customer_name = data.get('customerName')
-
-
-
-        customer_phone = data.get('customerPhone')
-
-
-
-        customer_email = data.get('customerEmail')
-
-
-
-        card_number = data.get('cardNumber')
-
-
-
-        items_description = data.get('itemsDescription')
-
-
-
-        rental_period = data.get('rentalPeriod')
-
-
-
-        monthly_fee = data.get('monthlyFee')
-
-
-
-        discount = data.get('discount')
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Update shelf information
-
-
-
-        if customer_name is not None:
-
-
-
-            shelf.customer_name = customer_name
-
-
-
-        if customer_phone is not None:
-
-
-
-            shelf.customer_phone = customer_phone
-
-
-
-        if customer_email is not None:
-
-
-
-            shelf.customer_email = customer_email
-
-
-
-        if card_number is not None:
-
-
-
-            shelf.card_number = card_number
-
-
-
-        if items_description is not None:
-
-
-
-            shelf.items_description = items_description
-
-
-
-        if rental_period is not None:
-
-
-
-            shelf.rental_period = rental_period
-
-
-
-        if monthly_fee is not None:
-
-
-
-            shelf.price = float(monthly_fee)
-
-
-
-        if discount is not None:
-
-
-
-            shelf.discount = float(discount)
-
-
-
-        
-
-
-
-        shelf.updated_at = datetime.now()
-
-
-
-        
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        # Log the action
-
-
-
-        log_action(
-
-
-
-            username=session.get('username', 'unknown'),
-
-
-
-            action=f"Updated shelf {shelf_id} details",
-
-
-
-            details=f"Customer: {customer_name}, Period: {rental_period} months"
-
-
-
-        )
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} details updated successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error updating shelf: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/end-rental-ultra', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def end_shelf_rental_ultra():
-
-
-
-    """Ultra-simple PostgreSQL end rental - most basic approach"""
-
-
-
-    try:
-
-
-
-        # Check permissions
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID required'}), 400
-
-
-
-        
-
-
-
-        app.logger.info(f"Ultra-simple end-rental for shelf: {shelf_id}")
-
-
-
-        
-
-
-
-        # Use the most basic approach possible
-
-
-
-        try:
-
-
-
-            # Use raw SQL with the simplest possible syntax
-
-
-
-            with db.engine.connect() as conn:
-
-
-
-                # Use the most basic UPDATE statement
-
-
-
-                sql = "UPDATE shelf SET status = 'available' WHERE id = '" + shelf_id + "'"
-
-
-
-                
-
-
-
-                result = conn.execute(db.text(sql))
-
-
-
-                conn.commit()
-
-
-
-                
-
-
-
-                if result.rowcount > 0:
-
-
-
-                    app.logger.info(f"Ultra-simple end-rental success: {shelf_id}")
-
-
-
-                    
-
-
-
-                    # Simple logging without log_action function
-
-
-
-                    app.logger.info(f"User {session.get('username', 'unknown')} ended rental for shelf {shelf_id}")
-
-
-
-                    
-
-
-
-                    return jsonify({
-
-
-
-                        'success': True,
-
-
-
-                        'message': f'Shelf {shelf_id} rental ended successfully'
-
-
-
-                    }), 200
-
-
-
-                else:
-
-
-
-                    return jsonify({
-
-
-
-                        'success': False,
-
-
-
-                        'error': 'Shelf not found or already available'
-
-
-
-                    }), 400
-
-
-
-                    
-
-
-
-        except Exception as e:
-
-
-
-            app.logger.error(f"Ultra-simple end-rental DB error: {str(e)}", exc_info=True)
-
-
-
-            return jsonify({
-
-
-
-                'success': False,
-
-
-
-                'error': f'Database operation failed: {str(e)}'
-
-
-
-            }), 500
-
-
-
-            
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Ultra-simple end-rental failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/end-rental-safe', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def end_shelf_rental_safe():
-
-
-
-    """PostgreSQL-safe end rental - minimal approach"""
-
-
-
-    try:
-
-
-
-        # Check permissions
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID required'}), 400
-
-
-
-        
-
-
-
-        app.logger.info(f"Safe end-rental for shelf: {shelf_id}")
-
-
-
-        
-
-
-
-        # Use the simplest possible approach - just update status
-
-
-
-        try:
-
-
-
-            with db.engine.connect() as conn:
-
-
-
-                # Simple update that just changes status
-
-
-
-                if 'sqlite' in str(db.engine.url).lower():
-
-
-
-                    sql = "UPDATE shelf SET status = 'available' WHERE id = ?"
-
-
-
-                    params = (shelf_id,)
-
-
-
-                else:
-
-
-
-                    # PostgreSQL - use string formatting for safety
-
-
-
-                    sql = f"UPDATE shelf SET status = 'available' WHERE id = '{shelf_id}'"
-
-
-
-                    params = None
-
-
-
-                
-
-
-
-                result = conn.execute(db.text(sql), params or {})
-
-
-
-                conn.commit()
-
-
-
-                
-
-
-
-                if result.rowcount > 0:
-
-
-
-                    app.logger.info(f"Safe end-rental success: {shelf_id}")
-
-
-
-                    
-
-
-
-                    # Log the action
-
-
-
-                    log_action(
-
-
-
-                        username=session.get('username', 'unknown'),
-
-
-
-                        action=f"Ended rental for shelf {shelf_id} (safe method)",
-
-
-
-                        details="Rental ended using minimal SQL update"
-
-
-
-                    )
-
-
-
-                    
-
-
-
-                    return jsonify({
-
-
-
-                        'success': True,
-
-
-
-                        'message': f'Shelf {shelf_id} rental ended successfully'
-
-
-
-                    }), 200
-
-
-
-                else:
-
-
-
-                    return jsonify({
-
-
-
-                        'success': False,
-
-
-
-                        'error': 'Shelf not found or already available'
-
-
-
-                    }), 400
-
-
-
-                    
-
-
-
-        except Exception as e:
-
-
-
-            app.logger.error(f"Safe end-rental DB error: {str(e)}", exc_info=True)
-
-
-
-            return jsonify({
-
-
-
-                'success': False,
-
-
-
-                'error': 'Database operation failed'
-
-
-
-            }), 500
-
-
-
-            
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Safe end-rental failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/end-rental-simple', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def end_shelf_rental_simple():
-
-
-
-    """Simple end rental that bypasses model field recognition issues"""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        
-
-
-
-        if not shelf_id:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf ID required'}), 400
-
-
-
-        
-
-
-
-        app.logger.info(f"Simple end-rental requested for shelf: {shelf_id}")
-
-
-
-        
-
-
-
-        # Direct database update without using Shelf model to avoid field recognition issues
-
-
-
-        try:
-
-
-
-            # Use SQLAlchemy ORM approach for better PostgreSQL compatibility
-
-
-
-            with db.engine.connect() as conn:
-
-
-
-                # First check if shelf exists and is occupied
-
-
-
-                if 'sqlite' in str(db.engine.url).lower():
-
-
-
-                    check_sql = "SELECT id FROM shelf WHERE id = ? AND status = 'occupied'"
-
-
-
-                    check_params = (shelf_id,)
-
-
-
-                else:
-
-
-
-                    check_sql = "SELECT id FROM shelf WHERE id = :shelf_id AND status = 'occupied'"
-
-
-
-                    check_params = {'shelf_id': shelf_id}
-
-
-
-                
-
-
-
-                check_result = conn.execute(db.text(check_sql), check_params)
-
-
-
-                shelf_exists = check_result.fetchone()
-
-
-
-                
-
-
-
-                if not shelf_exists:
-
-
-
-                    app.logger.warning(f"Shelf {shelf_id} not found or not occupied")
-
-
-
-                    return jsonify({
-
-
-
-                        'success': False,
-
-
-
-                        'error': 'Shelf not found or not currently occupied'
-
-
-
-                    }), 400
-
-
-
-                
-
-
-
-                # Update the shelf using raw SQL with proper PostgreSQL syntax
-
-
-
-                if 'sqlite' in str(db.engine.url).lower():
-
-
-
-                    update_sql = """
-
-
-
-                    UPDATE shelf 
-
-
-
-                    SET status = 'available',
-
-
-
-                        customer_name = NULL,
-
-
-
-                        customer_phone = NULL,
-
-
-
-                        customer_email = NULL,
-
-
-
-                        card_number = NULL,
-
-
-
-                        items_description = NULL,
-
-
-
-                        rental_period = NULL,
-
-
-
-                        discount = NULL,
-
-
-
-                        rented_date = NULL,
-
-
-
-                        maintenance_reason = NULL,
-
-
-
-                        updated_at = datetime('now')
-
-
-
-                    WHERE id = ?
-
-
-
-                    """
-
-
-
-                    update_params = (shelf_id,)
-
-
-
-                else:
-
-
-
-                    # PostgreSQL - use proper parameter binding
-
-
-
-                    update_sql = """
-
-
-
-                    UPDATE shelf 
-
-
-
-                    SET status = 'available',
-
-
-
-                        customer_name = NULL,
-
-
-
-                        customer_phone = NULL,
-
-
-
-                        customer_email = NULL,
-
-
-
-                        card_number = NULL,
-
-
-
-                        items_description = NULL,
-
-
-
-                        rental_period = NULL,
-
-
-
-                        discount = NULL,
-
-
-
-                        rented_date = NULL,
-
-
-
-                        maintenance_reason = NULL,
-
-
-
-                        updated_at = NOW()
-
-
-
-                    WHERE id = :shelf_id
-
-
-
-                    """
-
-
-
-                    update_params = {'shelf_id': shelf_id}
-
-
-
-                
-
-
-
-                # Execute the update
-
-
-
-                result = conn.execute(db.text(update_sql), update_params)
-
-
-
-                conn.commit()
-
-
-
-                
-
-
-
-                if result.rowcount > 0:
-
-
-
-                    app.logger.info(f"PostgreSQL end-rental successful for shelf: {shelf_id}")
-
-
-
-                    
-
-
-
-                    # Log the action
-
-
-
-                    log_action(
-
-
-
-                        username=session.get('username', 'unknown'),
-
-
-
-                        action=f"Ended rental for shelf {shelf_id} (PostgreSQL method)",
-
-
-
-                        details="Rental ended using PostgreSQL-compatible SQL update"
-
-
-
-                    )
-
-
-
-                    
-
-
-
-                    return jsonify({
-
-
-
-                        'success': True,
-
-
-
-                        'message': f'Shelf {shelf_id} rental ended successfully'
-
-
-
-                    }), 200
-
-
-
-                else:
-
-
-
-                    app.logger.error(f"PostgreSQL update failed for shelf: {shelf_id}")
-
-
-
-                    return jsonify({
-
-
-
-                        'success': False,
-
-
-
-                        'error': 'Failed to update shelf'
-
-
-
-                    }), 500
-
-
-
-            
-
-
-
-        except Exception as e:
-
-
-
-            app.logger.error(f"PostgreSQL end-rental database error: {str(e)}", exc_info=True)
-
-
-
-            return jsonify({
-
-
-
-                'success': False,
-
-
-
-                'error': 'Database update failed'
-
-
-
-            }), 500
-
-
-
-            
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"❌ Simple end-rental failed: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({
-
-
-
-            'success': False,
-
-
-
-            'error': 'Internal server error'
-
-
-
-        }), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/end-rental', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def end_shelf_rental():
-
-
-
-    """End shelf rental and free up the shelf - for staff/admin only."""
-
-
-
-    try:
-
-
-
-        # Check if user has permission
-
-
-
-        if session.get('user_role') != 'admin':
-
-
-
-            return jsonify({'success': False, 'error': 'Permission denied'}), 403
-
-
-
-        
-
-
-
-        data = request.get_json()
-
-
-
-        app.logger.info(f"Received end rental request: {data}")
-
-
-
-        
-
-
-
-        shelf_id = data.get('shelfId')
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Check if shelf is occupied
-
-
-
-        if shelf.status != 'occupied':
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf is not currently occupied'}), 400
-
-
-
-        
-
-
-
-        # Store rental info for logging
-
-
-
-        customer_name = shelf.customer_name
-
-
-
-        rental_period = shelf.rental_period
-
-
-
-        
-
-
-
-        # Clear rental information
-
-
-
-        shelf.status = 'available'
-
-
-
-        shelf.customer_name = None
-
-
-
-        shelf.customer_phone = None
-
-
-
-        shelf.customer_email = None
-
-
-
-        shelf.card_number = None
-
-
-
-        shelf.items_description = None
-
-
-
-        shelf.rental_period = None
-
-
-
-        shelf.discount = None
-
-
-
-        shelf.rented_date = None
-
-
-
-        shelf.maintenance_reason = None
-
-
-
-        shelf.updated_at = datetime.now()
-
-
-
-        
-
-
-
-        db.session.commit()
-
-
-
-        
-
-
-
-        # Log the action
-
-
-
-        log_action(
-
-
-
-            username=session.get('username', 'unknown'),
-
-
-
-            action=f"Ended rental for shelf {shelf_id}",
-
-
-
-            details=f"Previous customer: {customer_name}, Period: {rental_period} months"
-
-
-
-        )
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True,
-
-
-
-            'message': f'Shelf {shelf_id} rental ended successfully'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error ending rental: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/rent', methods=['POST'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def rent_shelf_api():
-
-
-
-    """Rent a shelf - update shelf status and customer information."""
-
-
-
-    try:
-
-
-
-        data = request.get_json()
-
-
-
-        
-
-
-
-        shelf_id = data.get('shelfId')  # Changed from shelf_id to shelfId
-
-
-
-        customer_name = data.get('customerName')  # Changed from customerName to customer_name
-
-
-
-        customer_phone = data.get('customerPhone')  # Changed from customerPhone to customer_phone
-
-
-
-        items_description = data.get('itemsDescription')  # Changed from itemsDescription to items_description
-
-
-
-        rental_period = data.get('rentalPeriod')  # Changed from rentalPeriod to rental_period
-
-
-
-        
-
-
-
-        # Validate required fields
-
-
-
-        if not shelf_id or not customer_name or not customer_phone:
-
-
-
-            return jsonify({'success': False, 'error': 'Missing required fields'}), 400
-
-
-
-        
-
-
-
-        # Find the shelf
-
-
-
-        shelf = Shelf.query.filter_by(id=shelf_id).first()
-
-
-
-        if not shelf:
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
-
-
-
-        
-
-
-
-        # Check if shelf is available
-
-
-
-        if shelf.status != 'available':
-
-
-
-            return jsonify({'success': False, 'error': 'Shelf is not available'}), 400
-
-
-
-        
-
-
-
-        # Update shelf information
-
-
-
-        current_date = get_local_date()
-
-
-
-        current_datetime = get_local_time()
-
-
-
-        
-
-
-
-        app.logger.info(f"DEBUG: Current local date: {current_date}")
-
-
-
-        app.logger.info(f"DEBUG: Current local datetime: {current_datetime}")
-
-
-
-        
-
-
-
-        shelf.status = 'occupied'
-
-
-
-        shelf.customer_name = customer_name
-
-
-
-        shelf.customer_phone = customer_phone
-
-
-
-        shelf.rented_date = current_date  # Use local date instead of UTC
-
-
-
-        shelf.items_description = items_description
-
-
-
-        shelf.rental_period = rental_period
-
-
-
-        shelf.maintenance_reason = None  # Clear any maintenance reason
-
-
-
-        shelf.updated_at = current_datetime  # Use local datetime instead of UTC
-
-
-
-        
-
-
-
-        app.logger.info(f"FINAL: Setting rented_date to: {current_date}")
-
-
-
-        app.logger.info(f"FINAL: Setting updated_at to: {current_datetime}")
-
-
-
-        
-
-
-
-        try:
-
-
-
-            db.session.commit()
-
-
-
-            app.logger.info(f"Successfully committed shelf rental for {shelf_id}")
-
-
-
-        except Exception as db_error:
-
-
-
-            app.logger.error(f"Database commit error: {str(db_error)}", exc_info=True)
-
-
-
-            db.session.rollback()
-
-
-
-            return jsonify({'success': False, 'error': 'Database error occurred'}), 500
-
-
-
-        
-
-
-
-        # Log the action
-
-
-
-        try:
-
-
-
-            log_action(
-
-
-
-                username=session.get('username', 'unknown'),
-
-
-
-                action=f"Rented shelf {shelf_id} to {customer_name}",
-
-
-
-                details=f"Phone: {customer_phone}, Period: {rental_period} months"
-
-
-
-            )
-
-
-
-            app.logger.info(f"Successfully logged rental action for {shelf_id}")
-
-
-
-        except Exception as log_error:
-
-
-
-            app.logger.warning(f"Failed to log action but rental succeeded: {str(log_error)}")
-
-
-
-            # Don't fail the request if logging fails
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'success': True, 
-
-
-
-            'message': f'Shelf {shelf_id} successfully rented to {customer_name}'
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        db.session.rollback()
-
-
-
-        app.logger.error(f"Error renting shelf: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-@app.route('/api/shelves/stats', methods=['GET'])
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-def get_shelf_stats():
-
-
-
-    """Get shelf statistics for reports."""
-
-
-
-    try:
-
-
-
-        available = Shelf.query.filter_by(status='available').count()
-
-
-
-        occupied = Shelf.query.filter_by(status='occupied').count()
-
-
-
-        maintenance = Shelf.query.filter_by(status='maintenance').count()
-
-
-
-        
-
-
-
-        # Calculate monthly revenue from occupied shelves
-
-
-
-        occupied_shelves = Shelf.query.filter_by(status='occupied').all()
-
-
-
-        revenue = sum(shelf.price for shelf in occupied_shelves)
-
-
-
-        
-
-
-
-        return jsonify({
-
-
-
-            'available': available,
-
-
-
-            'occupied': occupied,
-
-
-
-            'maintenance': maintenance,
-
-
-
-            'revenue': revenue
-
-
-
-        }), 200
-
-
-
-        
-
-
-
-    except Exception as e:
-
-
-
-        app.logger.error(f"Error fetching shelf stats: {str(e)}", exc_info=True)
-
-
-
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-@app.route('/get_delivery_persons')
-
-
-
-@login_required
-
-
-
-@database_required
-
-
-
-
-
-
-
-def get_delivery_persons():
-
-
-
-
-
-
-
-    """Get delivery persons and their delivery counts for a specific period."""
-
-
-
-
-
-
-
-    try:
-
-
-
-
-
-
-
-        # Get period parameter from query string
-
-
-
-
-
-
-
-        period = request.args.get('period', 'all')
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Calculate date range based on period
-
-
-
-
-
-
-
-        end_date = get_current_time()
-
-
-
-
-
-
-
-        if period == 'today':
-
-
-
-
-
-
-
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-
-
-
-
-
-
-        elif period == 'week':
-
-
-
-
-
-
-
-            start_date = end_date - timedelta(days=7)
-
-
-
-
-
-
-
-        elif period == 'month':
-
-
-
-
-
-
-
-            start_date = end_date - timedelta(days=30)
-
-
-
-
-
-
-
-        else:  # all
-
-
-
-
-
-
-
-            start_date = end_date - timedelta(days=365)  # Limit to 1 year for performance
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Get all admin users
-
-
-
-
-
-
-
-        staff_users = User.query.filter(User.role == 'admin', User.is_active == True).all()
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Get all deliveries with non-empty delivery person within the date range
-
-
-
-
-
-
-
-        deliveries = Delivery.query.filter(
-
-
-
-
-
-
-
-            Delivery.delivery_person != '',
-
-
-
-
-
-
-
-            Delivery.delivery_person.isnot(None),
-
-
-
-
-
-
-
-            Delivery.created_at.between(start_date, end_date)
-
-
-
-
-
-
-
-        ).all()
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        persons_data = {}
-
-
-
-
-
-
-
-        for delivery in deliveries:
-
-
-
-
-
-
-
-            person = delivery.delivery_person or 'Unknown'
-
-
-
-
-
-
-
-            if person not in persons_data:
-
-
-
-
-
-
-
-                persons_data[person] = {
-
-
-
-
-
-
-
-                    'name': person,
-
-
-
-
-
-
-
-                    'deliveries': 0,
-
-
-
-
-
-
-
-                    'revenue': 0.0,
-
-
-
-
-
-
-
-                    'completed': 0,
-
-
-
-
-
-
-
-                    'pending_count': 0,
-
-
-
-
-
-
-
-                    'delivered_count': 0,
-
-
-
-
-
-
-
-                    'daily_deliveries': {}
-
-
-
-
-
-
-
-                }
-
-
-
-
-
-
-
-            
-
-
-
-
-
-
-
-            persons_data[person]['deliveries'] += 1
-
-
-
-
-
-
-
-            persons_data[person]['revenue'] += float(delivery.amount or 0)
-
-
-
-
-
-
-
-            if delivery.status == 'Delivered':
-
-
-
-
-
-
-
-                persons_data[person]['completed'] += 1
-
-
-
-
-
-
-
-            
-
-
-
-
-
-
-
-            # Count pending deliveries
-
-
-
-
-
-
-
-            if delivery.status == 'Pending':
-
-
-
-
-
-
-
-                persons_data[person]['pending_count'] += 1
-
-
-
-
-
-
-
-            
-
-
-
-
-
-
-
-            # Count delivered deliveries
-
-
-
-
-
-
-
-            if delivery.status == 'Delivered' or delivery.status == 'delivered':
-
-
-
-
-
-
-
-                persons_data[person]['delivered_count'] += 1
-
-
-
-
-
-
-
-            
-
-
-
-
-
-
-
-            # Group by date
-
-
-
-
-
-
-
-            delivery_date = delivery.created_at.strftime('%Y-%m-%d')
-
-
-
-
-
-
-
-            if delivery_date not in persons_data[person]['daily_deliveries']:
-
-
-
-
-
-
-
-                persons_data[person]['daily_deliveries'][delivery_date] = []
-
-
-
-
-
-
-
-            
-
-
-
-
-
-
-
-            persons_data[person]['daily_deliveries'][delivery_date].append({
-
-
-
-
-
-
-
-                'display_id': delivery.display_id,
-
-
-
-
-
-
-
-                'amount': float(delivery.amount) if delivery.amount else 0.0,
-
-
-
-
-
-
-
-                'expenses': float(delivery.expenses) if delivery.expenses else 0.0,
-
-
-
-
-
-
-
-                'status': delivery.status
-
-
-
-
-
-
-
-            })
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Add staff users who haven't been assigned deliveries yet
-
-
-
-
-
-
-
-        for staff_user in staff_users:
-
-
-
-
-
-
-
-            if staff_user.username not in persons_data:
-
-
-
-
-
-
-
-                persons_data[staff_user.username] = {
-
-
-
-
-
-
-
-                    'name': staff_user.username,
-
-
-
-
-
-
-
-                    'deliveries': 0,
-
-
-
-
-
-
-
-                    'revenue': 0.0,
-
-
-
-
-
-
-
-                    'completed': 0,
-
-
-
-
-
-
-
-                    'pending_count': 0,
-
-
-
-
-
-
-
-                    'delivered_count': 0,
-
-
-
-
-
-
-
-                    'daily_deliveries': {}
-
-
-
-
-
-
-
-                }
-
-
-
-
-
-
-
-        
-
+@app.route('/api/shelves/create-orm', methods=['POST'])
 
 
 
+@login_required
 
 
 
-        # Convert to list and sort by delivery count (descending)
+@database_required
 
 
 
+def create_shelf_orm():
 
 
 
+    """Create shelf using SQLAlchemy ORM for maximum PostgreSQL compatibility."""
 
-        result = list(persons_data.values())
 
 
+    try:
 
 
 
+        # Check if user has permission
 
 
-        result.sort(key=lambda x: x['deliveries'], reverse=True)
 
+        if not has_permission('manage_shelves'):
 
 
 
+            return jsonify({'success': False, 'error': 'Permission denied'}), 403
 
 
 
@@ -14027,147 +10554,169 @@ def get_delivery_persons():
 
 
 
+        data = request.get_json()
 
 
 
-
-        return jsonify(result)
+        shelf_id = data.get('shelfId', '').strip()
 
 
 
+        price = data.get('price', 0)
 
 
 
+        
 
-    except Exception as e:
 
 
+        if not shelf_id:
 
 
 
+            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
 
 
-        app.logger.error(f"Error getting delivery persons: {str(e)}")
 
+        
 
 
 
+        if price < 0:
 
 
 
-        return jsonify([])
+            return jsonify({'success': False, 'error': 'Price must be positive'}), 400
 
 
 
+        
 
 
 
+        # Check if shelf already exists using ORM
 
 
 
+        existing_shelf = Shelf.query.filter_by(id=shelf_id).first()
 
 
 
+        if existing_shelf:
 
 
 
-@app.route('/get_summary')
+            return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
 
 
 
+        
 
 
 
+        # Create new shelf using ORM (most compatible)
 
-@admin_required
 
 
+        new_shelf = Shelf(
 
 
 
+            id=shelf_id,
 
 
-@database_required
 
+            size='Small',  # Default size
 
 
 
+            price=price,
 
 
 
-def get_summary():
+            status='available'
 
 
 
+        )
 
 
 
+        
 
-    """Get summary statistics for deliveries."""
 
 
+        db.session.add(new_shelf)
 
 
 
+        db.session.commit()
 
 
-    try:
 
+        
 
 
 
+        app.logger.info(f"New shelf created: {shelf_id} by {session.get('username', 'unknown')}")
 
 
 
-        dates = get_date_ranges()
+        
 
 
 
+        return jsonify({
 
 
 
+            'success': True,
 
-        
 
 
+            'message': f'Shelf {shelf_id} created successfully'
 
 
 
+        }), 200
 
 
-        # Get all deliveries for detailed filtering
 
+        
 
 
 
+    except Exception as e:
 
 
 
-        all_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).all()
+        db.session.rollback()
 
 
 
+        app.logger.error(f"ORM create shelf failed: {str(e)}", exc_info=True)
 
 
 
+        return jsonify({
 
-        
 
 
+            'success': False,
 
 
 
+            'error': 'Internal server error'
 
 
-        # Convert deliveries to dictionary format for JSON response
 
+        }), 500
 
 
 
 
 
 
-        deliveries_data = []
 
 
 
@@ -14175,171 +10724,197 @@ def get_summary():
 
 
 
-        for delivery in all_deliveries:
 
 
+@app.route('/api/shelves/create', methods=['POST'])
 
 
 
+@login_required
 
 
-            delivery_dict = {
 
+@database_required
 
 
 
+def create_shelf():
 
 
 
-                'id': delivery.id,
+    """Create a new shelf - for staff/admin only."""
 
 
 
+    try:
 
 
 
+        # Check if user has permission
 
-                'display_id': delivery.display_id,
 
 
+        if not has_permission('manage_shelves'):
 
 
 
+            return jsonify({'success': False, 'error': 'Permission denied'}), 403
 
 
-                'sender_name': delivery.sender_name,
 
+        
 
 
 
+        data = request.get_json()
 
 
 
-                'recipient_name': delivery.recipient_name,
+        shelf_id = data.get('shelfId', '').strip()
 
 
 
+        price = data.get('price', 0)
 
 
 
+        size = data.get('size', 'Small')  # Default size
 
-                'status': delivery.status,
 
 
+        
 
 
 
+        if not shelf_id:
 
 
-                'amount': float(delivery.amount) if delivery.amount else 0.0,
 
+            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
 
 
 
+        
 
 
 
-                'expenses': float(delivery.expenses) if delivery.expenses else 0.0,
+        if price < 0:
 
 
 
+            return jsonify({'success': False, 'error': 'Price must be positive'}), 400
 
 
 
+        
 
-                'delivery_person': delivery.delivery_person or '',
 
 
+        # Check if shelf already exists
 
 
 
+        existing_shelf = Shelf.query.filter_by(id=shelf_id).first()
 
 
-                'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
 
+        if existing_shelf:
 
 
 
+            return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
 
 
 
-                'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown"
+        
 
 
 
+        # Create new shelf
 
 
 
+        new_shelf = Shelf(
 
-            }
 
 
+            id=shelf_id,
 
 
 
+            size=size,
 
 
-            deliveries_data.append(delivery_dict)
 
+            price=price,
 
 
 
+            status='available'
 
 
 
-        
+        )
 
 
 
+        
 
 
 
+        db.session.add(new_shelf)
 
-        def get_summary_data(query):
 
 
+        db.session.commit()
 
 
 
+        
 
 
-            """Helper function to get summary data for a query."""
 
+        app.logger.info(f"New shelf created: {shelf_id} by {session.get('username', 'unknown')}")
 
 
 
+        
 
 
 
-            deliveries = query.all()
+        return jsonify({
 
 
 
+            'success': True,
 
 
 
+            'message': f'Shelf {shelf_id} created successfully'
 
-            total_amount = sum(float(d.amount) for d in deliveries if d.amount)  # Use actual delivery amounts as revenue
 
 
+        }), 200
 
-            total_expenses = 0  # No operational costs by default
 
 
+        
 
 
 
+    except Exception as e:
 
 
-            return {
 
+        db.session.rollback()
 
 
 
+        app.logger.error(f"Error creating shelf: {str(e)}", exc_info=True)
 
 
 
-                'total_deliveries': len(deliveries),
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
 
@@ -14347,51 +10922,59 @@ def get_summary():
 
 
 
-                'total_amount': total_amount,
+@app.route('/api/shelves/update-info', methods=['POST'])
 
 
 
+@login_required
 
 
 
+@database_required
 
-                'total_expenses': total_expenses,
 
 
+def update_shelf_info():
 
 
 
+    """Update shelf ID and price - for staff/admin only."""
 
 
-                'pending': len([d for d in deliveries if d.status == 'Pending']),
 
+    try:
 
 
 
+        # Check if user has permission
 
 
 
-                'in_transit': len([d for d in deliveries if d.status == 'In Transit']),
+        if not has_permission('manage_shelves'):
 
 
 
+            return jsonify({'success': False, 'error': 'Permission denied'}), 403
 
 
 
+        
 
-                'delivered': len([d for d in deliveries if d.status == 'Delivered'])
 
 
+        data = request.get_json()
 
 
 
+        original_shelf_id = data.get('originalShelfId', '').strip()
 
 
-            }
 
+        new_shelf_id = data.get('newShelfId', '').strip()
 
 
 
+        price = data.get('price', 0)
 
 
 
@@ -14399,259 +10982,303 @@ def get_summary():
 
 
 
+        if not original_shelf_id or not new_shelf_id:
 
 
 
-
-        return jsonify({
+            return jsonify({'success': False, 'error': 'Shelf IDs are required'}), 400
 
 
 
+        
 
 
 
+        # Find the shelf
 
-            'deliveries': deliveries_data,  # Add individual delivery records
 
 
+        shelf = Shelf.query.filter_by(id=original_shelf_id).first()
 
 
 
+        if not shelf:
 
 
-            'summary': {
 
+            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
 
 
 
+        
 
 
 
-                'total_revenue': sum(float(d.amount) for d in all_deliveries if d.amount),  # Use actual delivery amounts as revenue
+        # Check if new ID already exists (if different from original)
 
 
 
-                'total_expenses': 0,  # No operational costs by default
+        if new_shelf_id != original_shelf_id:
 
 
 
-                'total_deliveries': len(all_deliveries),
+            existing_shelf = Shelf.query.filter_by(id=new_shelf_id).first()
 
 
 
+            if existing_shelf:
 
 
 
+                return jsonify({'success': False, 'error': 'Shelf with this ID already exists'}), 400
 
-                'pending': len([d for d in all_deliveries if d.status == 'Pending']),
 
 
+        
 
 
 
+        # Update shelf information
 
 
-                'in_transit': len([d for d in all_deliveries if d.status == 'In Transit']),
 
+        if new_shelf_id != original_shelf_id:
+            # Rental history follows the shelf to its new id
+            ShelfRental.query.filter_by(shelf_id=original_shelf_id).update({'shelf_id': new_shelf_id})
+        shelf.id = new_shelf_id
+        if price > 0:
 
 
 
+            shelf.price = price
 
 
 
-                'delivered': len([d for d in all_deliveries if d.status == 'Delivered'])
+        
 
 
 
+        shelf.updated_at = get_local_time()
 
 
 
+        
 
-            },
 
 
+        db.session.commit()
 
 
 
+        
 
 
-            'today': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['today'][0])),
 
+        app.logger.info(f"Shelf info updated: {original_shelf_id} -> {new_shelf_id} by {session.get('username', 'unknown')}")
 
 
 
+        
 
 
 
-            'week': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['week'][0])),
+        return jsonify({
 
 
 
+            'success': True,
 
 
 
+            'message': f'Shelf information updated successfully'
 
-            'month': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['month'][0])),
 
 
+        }), 200
 
 
 
+        
 
 
-            'year': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['year'][0])),
 
+    except Exception as e:
 
 
 
+        db.session.rollback()
 
 
 
-            'all': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['all'][0]))
+        app.logger.error(f"Error updating shelf info: {str(e)}", exc_info=True)
 
 
 
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
 
 
-        })
 
 
 
+@app.route('/api/shelves/delete', methods=['POST'])
 
 
 
+@login_required
 
-    except Exception as e:
 
 
+@database_required
 
 
 
+def delete_shelf():
 
 
-        app.logger.error(f"Error getting summary: {str(e)}")
 
+    """Delete a shelf - for staff/admin only."""
 
 
 
+    try:
 
 
 
-        return jsonify({'error': str(e)}), 500
+        # Check if user has permission
 
 
 
+        if not has_permission('manage_shelves'):
 
 
 
+            return jsonify({'success': False, 'error': 'Permission denied'}), 403
 
 
 
+        
 
 
 
+        data = request.get_json()
 
 
 
-@app.route('/export/<period>')
+        shelf_id = data.get('shelfId', '').strip()
 
 
 
+        
 
 
 
+        if not shelf_id:
 
-@login_required
 
 
+            return jsonify({'success': False, 'error': 'Shelf ID is required'}), 400
 
 
 
+        
 
 
-@database_required
 
+        # Find the shelf
 
 
 
+        shelf = Shelf.query.filter_by(id=shelf_id).first()
 
 
 
-def export(period):
+        if not shelf:
 
 
 
+            return jsonify({'success': False, 'error': 'Shelf not found'}), 404
 
 
 
+        
 
-    """Export deliveries data as CSV for the specified period."""
 
 
+        # Check if shelf is occupied (prevent deletion of occupied shelves)
 
 
 
+        if shelf.status == 'occupied':
 
 
-    try:
 
+            return jsonify({'success': False, 'error': 'Cannot delete occupied shelf'}), 400
 
 
 
+        
 
 
 
-        date_ranges = get_date_ranges()
+        # Delete the shelf
 
 
 
+        db.session.delete(shelf)
 
 
 
+        db.session.commit()
 
-        
 
 
+        
 
 
 
+        app.logger.info(f"Shelf deleted: {shelf_id} by {session.get('username', 'unknown')}")
 
 
-        # Define date ranges using the new format
 
+        
 
 
 
+        return jsonify({
 
 
 
-        if period == 'daily':
+            'success': True,
 
 
 
+            'message': f'Shelf {shelf_id} deleted successfully'
 
 
 
+        }), 200
 
-            start_date, end_date = date_ranges['today']
 
 
+        
 
 
 
+    except Exception as e:
 
 
-            filename = f'deliveries_{get_current_time().strftime("%Y-%m-%d")}.csv'
 
+        db.session.rollback()
 
 
 
+        app.logger.error(f"Error deleting shelf: {str(e)}", exc_info=True)
 
 
 
-            date_range = 'today'
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
 
@@ -14659,47 +11286,65 @@ def export(period):
 
 
 
-        elif period == 'weekly':
+@app.route('/api/shelves/stats', methods=['GET'])
 
 
 
+@login_required
 
 
 
+@database_required
 
-            start_date, end_date = date_ranges['week']
 
 
+def get_shelf_stats():
 
 
 
+    """Get shelf statistics for reports."""
 
 
-            filename = f'deliveries_week_{get_current_time().strftime("%Y-%U")}.csv'
 
+    try:
 
 
 
+        board = current_shelf_board()
+        totals, billing = board['totals'], board['billing']
 
+        # revenue is this month's billing from the rental history (charges falling due)
+        response = jsonify({
+            'available': totals['available'],
+            'occupied': totals['occupied'],
+            'maintenance': totals['maintenance'],
+            'revenue': billing['expected'],
+            'accrued': billing['accrued'],
+            'overdue': billing['overdue'],
+            'zones': board['zones'],
+            'sizes': board['sizes']
+        })
+        return board_conditional_response(response, f"{board['version']}-stats")
 
 
-            date_range = 'this week'
 
+        
 
 
 
+    except Exception as e:
 
 
 
-        elif period == 'monthly':
+        app.logger.error(f"Error fetching shelf stats: {str(e)}", exc_info=True)
 
 
 
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 
 
 
-            start_date, end_date = date_ranges['month']
 
 
 
@@ -14707,23 +11352,43 @@ def export(period):
 
 
 
-            filename = f'deliveries_{get_current_time().strftime("%Y-%m")}.csv'
 
 
 
 
+@app.route('/api/shelves/billing', methods=['GET'])
+@admin_required_api
+@database_required
+def get_shelf_billing():
+    """Accrued, expected and overdue shelf revenue per month, for the last ?months= months (default 12)."""
+    try:
+        months = request.args.get('months', 12, type=int)
+        if not months or not 1 <= months <= 120:
+            return jsonify({'success': False, 'error': 'months must be between 1 and 120'}), 400
 
+        today = get_local_date()
+        first_month = add_months(today.replace(day=1), 1 - months)
+        billing = billing_by_month(db.session, ShelfRental.__table__, first_month, today, as_of=today)
 
+        return jsonify({
+            'success': True,
+            'months': billing,
+            'totals': {key: round(sum(month[key] for month in billing), 2) for key in ('accrued', 'expected', 'overdue')}
+        }), 200
+    except Exception as e:
+        app.logger.error(f"Error computing shelf billing: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
-            date_range = 'this month'
 
+@app.route('/get_delivery_persons')
 
 
 
+@login_required
 
 
 
-        elif period == 'yearly':
+@database_required
 
 
 
@@ -14731,7 +11396,7 @@ def export(period):
 
 
 
-            start_date, end_date = date_ranges['year']
+@coalesced(fresh=60, stale=600)
 
 
 
@@ -14739,7 +11404,7 @@ def export(period):
 
 
 
-            filename = f'deliveries_{get_current_time().year}.csv'
+def get_delivery_persons():
 
 
 
@@ -14747,7 +11412,7 @@ def export(period):
 
 
 
-            date_range = 'this year'
+    """Get delivery persons and their delivery counts for a specific period."""
 
 
 
@@ -14755,7 +11420,7 @@ def export(period):
 
 
 
-        elif period == 'all':
+    try:
 
 
 
@@ -14763,7 +11428,7 @@ def export(period):
 
 
 
-            start_date, end_date = date_ranges['all']
+        # Get period parameter from query string
 
 
 
@@ -14771,7 +11436,7 @@ def export(period):
 
 
 
-            filename = f'deliveries_all_time_{get_current_time().strftime("%Y-%m-%d")}.csv'
+        period = request.args.get('period', 'all')
 
 
 
@@ -14779,7 +11444,7 @@ def export(period):
 
 
 
-            date_range = 'all time'
+        
 
 
 
@@ -14787,7 +11452,7 @@ def export(period):
 
 
 
-        else:  # default to yearly for backward compatibility
+        # Calculate date range based on period
 
 
 
@@ -14795,7 +11460,7 @@ def export(period):
 
 
 
-            start_date, end_date = date_ranges['year']
+        end_date = get_current_time()
 
 
 
@@ -14803,7 +11468,7 @@ def export(period):
 
 
 
-            filename = f'deliveries_{get_current_time().year}.csv'
+        if period == 'today':
 
 
 
@@ -14811,7 +11476,7 @@ def export(period):
 
 
 
-            date_range = 'this year'
+            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 
@@ -14819,7 +11484,7 @@ def export(period):
 
 
 
-        
+        elif period == 'week':
 
 
 
@@ -14827,7 +11492,7 @@ def export(period):
 
 
 
-        # Query deliveries
+            start_date = end_date - timedelta(days=7)
 
 
 
@@ -14835,7 +11500,7 @@ def export(period):
 
 
 
-        deliveries = Delivery.query.filter(
+        elif period == 'month':
 
 
 
@@ -14843,7 +11508,7 @@ def export(period):
 
 
 
-            Delivery.created_at.between(start_date, end_date)
+            start_date = end_date - timedelta(days=30)
 
 
 
@@ -14851,7 +11516,7 @@ def export(period):
 
 
 
-        ).order_by(Delivery.created_at.desc()).all()
+        else:  # all
 
 
 
@@ -14859,7 +11524,7 @@ def export(period):
 
 
 
-        
+            start_date = end_date - timedelta(days=365)  # Limit to 1 year for performance
 
 
 
@@ -14867,7 +11532,7 @@ def export(period):
 
 
 
-        if not deliveries:
+        
 
 
 
@@ -14875,7 +11540,18 @@ def export(period):
 
 
 
-            flash(f'No delivery records found for {date_range}.', 'info')
+        # Get all admin users
+        staff_users = project_rows(User.username, where=(User.role == 'admin', User.is_active == True))
+        # Get all deliveries with non-empty delivery person within the date range
+        deliveries = project_rows(
+            Delivery.delivery_person, Delivery.display_id, Delivery.amount, Delivery.expenses,
+            Delivery.status, Delivery.created_at,
+            where=(
+                Delivery.delivery_person != '',
+                Delivery.delivery_person.isnot(None),
+                Delivery.created_at.between(start_date, end_date)
+            )
+        )
 
 
 
@@ -14883,7 +11559,7 @@ def export(period):
 
 
 
-            return redirect(url_for('reports'))
+        
 
 
 
@@ -14891,7 +11567,7 @@ def export(period):
 
 
 
-        
+        persons_data = {}
 
 
 
@@ -14899,7 +11575,7 @@ def export(period):
 
 
 
-        # Generate CSV
+        for delivery in deliveries:
 
 
 
@@ -14907,7 +11583,7 @@ def export(period):
 
 
 
-        si = io.StringIO()
+            person = delivery.delivery_person or 'Unknown'
 
 
 
@@ -14915,7 +11591,7 @@ def export(period):
 
 
 
-        writer = csv.writer(si)
+            if person not in persons_data:
 
 
 
@@ -14923,7 +11599,7 @@ def export(period):
 
 
 
-        
+                persons_data[person] = {
 
 
 
@@ -14931,7 +11607,7 @@ def export(period):
 
 
 
-        # Write header
+                    'name': person,
 
 
 
@@ -14939,7 +11615,7 @@ def export(period):
 
 
 
-        writer.writerow([
+                    'deliveries': 0,
 
 
 
@@ -14947,7 +11623,7 @@ def export(period):
 
 
 
-            'ID', 'Display ID', 'Sender', 'Recipient', 'Delivery Person',
+                    'revenue': 0.0,
 
 
 
@@ -14955,7 +11631,7 @@ def export(period):
 
 
 
-            'Goods Type', 'Quantity', 'Amount (KSh)', 'Expenses (KSh)', 'Profit (KSh)', 'Status', 'Created At'
+                    'completed': 0,
 
 
 
@@ -14963,7 +11639,7 @@ def export(period):
 
 
 
-        ])
+                    'pending_count': 0,
 
 
 
@@ -14971,7 +11647,7 @@ def export(period):
 
 
 
-        
+                    'delivered_count': 0,
 
 
 
@@ -14979,7 +11655,7 @@ def export(period):
 
 
 
-        # Write data
+                    'daily_deliveries': {}
 
 
 
@@ -14987,7 +11663,7 @@ def export(period):
 
 
 
-        for delivery in deliveries:
+                }
 
 
 
@@ -14995,7 +11671,7 @@ def export(period):
 
 
 
-            profit = delivery.amount - delivery.expenses
+            
 
 
 
@@ -15003,7 +11679,7 @@ def export(period):
 
 
 
-            writer.writerow([
+            persons_data[person]['deliveries'] += 1
 
 
 
@@ -15011,7 +11687,7 @@ def export(period):
 
 
 
-                str(delivery.id),
+            persons_data[person]['revenue'] += float(delivery.amount or 0)
 
 
 
@@ -15019,7 +11695,7 @@ def export(period):
 
 
 
-                f"'{delivery.display_id}",
+            if delivery.status == 'Delivered':
 
 
 
@@ -15027,7 +11703,7 @@ def export(period):
 
 
 
-                delivery.sender_name,
+                persons_data[person]['completed'] += 1
 
 
 
@@ -15035,7 +11711,7 @@ def export(period):
 
 
 
-                delivery.recipient_name,
+            
 
 
 
@@ -15043,7 +11719,7 @@ def export(period):
 
 
 
-                delivery.delivery_person,
+            # Count pending deliveries
 
 
 
@@ -15051,7 +11727,7 @@ def export(period):
 
 
 
-                delivery.goods_type,
+            if delivery.status == 'Pending':
 
 
 
@@ -15059,7 +11735,7 @@ def export(period):
 
 
 
-                delivery.quantity,
+                persons_data[person]['pending_count'] += 1
 
 
 
@@ -15067,7 +11743,7 @@ def export(period):
 
 
 
-                f"{delivery.amount:.2f}",
+            
 
 
 
@@ -15075,7 +11751,7 @@ def export(period):
 
 
 
-                f"{delivery.expenses:.2f}",
+            # Count delivered deliveries
 
 
 
@@ -15083,7 +11759,7 @@ def export(period):
 
 
 
-                f"{profit:.2f}",
+            if delivery.status == 'Delivered' or delivery.status == 'delivered':
 
 
 
@@ -15091,7 +11767,7 @@ def export(period):
 
 
 
-                delivery.status,
+                persons_data[person]['delivered_count'] += 1
 
 
 
@@ -15099,7 +11775,7 @@ def export(period):
 
 
 
-                delivery.created_at.strftime('%Y-%m-%d %H:%M')
+            
 
 
 
@@ -15107,7 +11783,7 @@ def export(period):
 
 
 
-            ])
+            # Group by date
 
 
 
@@ -15115,7 +11791,7 @@ def export(period):
 
 
 
-        
+            delivery_date = delivery.created_at.strftime('%Y-%m-%d')
 
 
 
@@ -15123,7 +11799,7 @@ def export(period):
 
 
 
-        # Log export action
+            if delivery_date not in persons_data[person]['daily_deliveries']:
 
 
 
@@ -15131,7 +11807,7 @@ def export(period):
 
 
 
-        log_export(date_range, 'CSV')
+                persons_data[person]['daily_deliveries'][delivery_date] = []
 
 
 
@@ -15139,7 +11815,7 @@ def export(period):
 
 
 
-        
+            
 
 
 
@@ -15147,7 +11823,7 @@ def export(period):
 
 
 
-        # Create response
+            persons_data[person]['daily_deliveries'][delivery_date].append({
 
 
 
@@ -15155,7 +11831,7 @@ def export(period):
 
 
 
-        response = make_response(si.getvalue().encode('utf-8'))
+                'display_id': delivery.display_id,
 
 
 
@@ -15163,7 +11839,7 @@ def export(period):
 
 
 
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+                'amount': float(delivery.amount) if delivery.amount else 0.0,
 
 
 
@@ -15171,7 +11847,7 @@ def export(period):
 
 
 
-        response.headers['Content-type'] = 'text/csv; charset=utf-8'
+                'expenses': float(delivery.expenses) if delivery.expenses else 0.0,
 
 
 
@@ -15179,7 +11855,7 @@ def export(period):
 
 
 
-        return response
+                'status': delivery.status
 
 
 
@@ -15187,7 +11863,7 @@ def export(period):
 
 
 
-        
+            })
 
 
 
@@ -15195,7 +11871,7 @@ def export(period):
 
 
 
-    except Exception as e:
+        
 
 
 
@@ -15203,7 +11879,7 @@ def export(period):
 
 
 
-        app.logger.error(f"Error exporting {period} data: {str(e)}")
+        # Add staff users who haven't been assigned deliveries yet
 
 
 
@@ -15211,7 +11887,7 @@ def export(period):
 
 
 
-        flash(f'Error exporting {period} data: {str(e)}', 'danger')
+        for staff_user in staff_users:
 
 
 
@@ -15219,7 +11895,7 @@ def export(period):
 
 
 
-        return jsonify({'error': str(e)}), 500
+            if staff_user.username not in persons_data:
 
 
 
@@ -15227,6 +11903,7 @@ def export(period):
 
 
 
+                persons_data[staff_user.username] = {
 
 
 
@@ -15234,136 +11911,136 @@ def export(period):
 
 
 
+                    'name': staff_user.username,
 
-@app.route('/get_delivery_details/<int:delivery_id>')
 
 
 
 
 
 
+                    'deliveries': 0,
 
-@login_required
 
 
 
 
 
 
+                    'revenue': 0.0,
 
-@database_required
 
 
 
 
 
 
+                    'completed': 0,
 
-def get_delivery_details(delivery_id):
 
 
 
 
 
 
+                    'pending_count': 0,
 
-    """Get detailed information for a specific delivery."""
 
 
 
 
 
 
+                    'delivered_count': 0,
 
-    try:
 
 
 
 
 
 
+                    'daily_deliveries': {}
 
-        delivery = Delivery.query.get(delivery_id)
 
 
 
 
 
 
+                }
 
-        if not delivery:
 
 
 
 
 
 
+        
 
-            return jsonify({'error': 'Delivery not found'}), 404
 
 
 
 
 
 
+        # Convert to list and sort by delivery count (descending)
 
-        
 
 
 
 
 
 
+        result = list(persons_data.values())
 
-        # Convert delivery to dictionary for JSON response - only use existing fields
 
 
 
 
 
 
+        result.sort(key=lambda x: x['deliveries'], reverse=True)
 
-        delivery_data = {
 
 
 
 
 
 
+        
 
-            'id': delivery.id,
 
 
 
 
 
 
+        return jsonify(result)
 
-            'display_id': delivery.display_id,
 
 
 
 
 
 
+    except Exception as e:
 
-            'sender_name': delivery.sender_name,
 
 
 
 
 
 
+        app.logger.error(f"Error getting delivery persons: {str(e)}")
 
-            'sender_phone': delivery.sender_phone,
 
 
 
 
 
 
+        return jsonify([])
 
-            'sender_address': '',  # Field doesn't exist in model
 
 
 
@@ -15371,7 +12048,6 @@ def get_delivery_details(delivery_id):
 
 
 
-            'recipient_name': delivery.recipient_name,
 
 
 
@@ -15379,7 +12055,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'recipient_phone': delivery.recipient_phone,
+@app.route('/get_summary')
 
 
 
@@ -15387,7 +12063,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'recipient_address': delivery.recipient_address,
+@admin_required
 
 
 
@@ -15395,7 +12071,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'status': delivery.status,
+@database_required
 
 
 
@@ -15403,7 +12079,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'amount': delivery.amount,
+@coalesced(fresh=60, stale=600)
 
 
 
@@ -15411,7 +12087,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'expenses': delivery.expenses,
+def get_summary():
 
 
 
@@ -15419,7 +12095,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'delivery_person': delivery.delivery_person,
+    """Get summary statistics for deliveries."""
 
 
 
@@ -15427,7 +12103,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'notes': '',  # Field doesn't exist in model
+    try:
 
 
 
@@ -15435,7 +12111,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'goods_type': delivery.goods_type,
+        dates = get_date_ranges()
 
 
 
@@ -15443,7 +12119,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'quantity': delivery.quantity,
+        
 
 
 
@@ -15451,7 +12127,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'payment_by': delivery.payment_by,
+        # Get all deliveries for detailed filtering
 
 
 
@@ -15459,7 +12135,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
+        all_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).all()
 
 
 
@@ -15467,7 +12143,7 @@ def get_delivery_details(delivery_id):
 
 
 
-                'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown",
+        
 
 
 
@@ -15475,7 +12151,7 @@ def get_delivery_details(delivery_id):
 
 
 
-            'updated_at': delivery.created_at.isoformat() if delivery.created_at else None  # Use created_at since updated_at doesn't exist
+        # Convert deliveries to dictionary format for JSON response
 
 
 
@@ -15483,7 +12159,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        }
+        deliveries_data = []
 
 
 
@@ -15491,7 +12167,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        
+        for delivery in all_deliveries:
 
 
 
@@ -15499,7 +12175,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        return jsonify(delivery_data)
+            delivery_dict = {
 
 
 
@@ -15507,7 +12183,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        
+                'id': delivery.id,
 
 
 
@@ -15515,7 +12191,7 @@ def get_delivery_details(delivery_id):
 
 
 
-    except Exception as e:
+                'display_id': delivery.display_id,
 
 
 
@@ -15523,7 +12199,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        app.logger.error(f"Error getting delivery details for ID {delivery_id}: {str(e)}")
+                'sender_name': delivery.sender_name,
 
 
 
@@ -15531,7 +12207,7 @@ def get_delivery_details(delivery_id):
 
 
 
-        return jsonify({'error': 'Failed to load delivery details'}), 500
+                'recipient_name': delivery.recipient_name,
 
 
 
@@ -15539,6 +12215,7 @@ def get_delivery_details(delivery_id):
 
 
 
+                'status': delivery.status,
 
 
 
@@ -15546,305 +12223,307 @@ def get_delivery_details(delivery_id):
 
 
 
+                'amount': float(delivery.amount) if delivery.amount else 0.0,
 
-@app.route('/get_delivery_by_display_id/<display_id>')
 
 
 
 
 
 
+                'expenses': float(delivery.expenses) if delivery.expenses else 0.0,
 
-@login_required
 
 
 
 
 
 
+                'delivery_person': delivery.delivery_person or '',
 
-@database_required
 
 
 
 
 
 
+                'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
 
-def get_delivery_by_display_id(display_id):
 
 
 
 
 
 
+                'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown"
 
-    """Get delivery details by display ID (for Quick Reassign functionality)."""
 
 
 
 
 
 
+            }
 
-    try:
 
 
 
 
 
 
+            deliveries_data.append(delivery_dict)
 
-        delivery = Delivery.query.filter_by(display_id=display_id).first()
 
 
 
 
 
 
+        
 
-        if not delivery:
 
 
 
 
 
 
+        def get_summary_data(query):
 
-            return jsonify({'error': 'Delivery not found'}), 404
 
 
 
 
 
 
+            """Helper function to get summary data for a query."""
 
-        
 
 
 
 
 
 
+            deliveries = query.all()
 
-        # Convert delivery to dictionary for JSON response
 
 
 
 
 
 
+            total_amount = sum(float(d.amount) for d in deliveries if d.amount)  # Use actual delivery amounts as revenue
 
-        delivery_data = {
 
 
+            total_expenses = 0  # No operational costs by default
 
 
 
 
 
-            'id': delivery.id,
 
 
+            return {
 
 
 
 
 
-            'display_id': delivery.display_id,
 
 
+                'total_deliveries': len(deliveries),
 
 
 
 
 
-            'sender_name': delivery.sender_name,
 
 
+                'total_amount': total_amount,
 
 
 
 
 
-            'sender_phone': delivery.sender_phone,
 
 
+                'total_expenses': total_expenses,
 
 
 
 
 
-            'sender_address': '',  # Field doesn't exist in model
 
 
+                'pending': len([d for d in deliveries if d.status == 'Pending']),
 
 
 
 
 
-            'recipient_name': delivery.recipient_name,
 
 
+                'in_transit': len([d for d in deliveries if d.status == 'In Transit']),
 
 
 
 
 
-            'recipient_phone': delivery.recipient_phone,
 
 
+                'delivered': len([d for d in deliveries if d.status == 'Delivered'])
 
 
 
 
 
-            'recipient_address': delivery.recipient_address,
 
 
+            }
 
 
 
 
 
-            'status': delivery.status,
 
 
+        
 
 
 
 
 
-            'amount': delivery.amount,
 
 
+        return jsonify({
 
 
 
 
 
-            'expenses': delivery.expenses,
 
 
+            'deliveries': deliveries_data,  # Add individual delivery records
 
 
 
 
 
-            'delivery_person': delivery.delivery_person,
 
 
+            'summary': {
 
 
 
 
 
-            'notes': '',  # Field doesn't exist in model
 
 
+                'total_revenue': sum(float(d.amount) for d in all_deliveries if d.amount),  # Use actual delivery amounts as revenue
 
 
 
+                'total_expenses': 0,  # No operational costs by default
 
 
-            'goods_type': delivery.goods_type,
 
+                'total_deliveries': len(all_deliveries),
 
 
 
 
 
 
-            'quantity': delivery.quantity,
 
+                'pending': len([d for d in all_deliveries if d.status == 'Pending']),
 
 
 
 
 
 
-            'payment_by': delivery.payment_by,
 
+                'in_transit': len([d for d in all_deliveries if d.status == 'In Transit']),
 
 
 
 
 
 
-            'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
 
+                'delivered': len([d for d in all_deliveries if d.status == 'Delivered'])
 
 
 
 
 
 
-            'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown",
 
+            },
 
 
 
 
 
 
-            'updated_at': delivery.created_at.isoformat() if delivery.created_at else None  # Use created_at since updated_at doesn't exist
 
+            'today': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['today'][0])),
 
 
 
 
 
 
-        }
 
+            'week': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['week'][0])),
 
 
 
 
 
 
-        
 
+            'month': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['month'][0])),
 
 
 
 
 
 
-        return jsonify(delivery_data)
 
+            'year': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['year'][0])),
 
 
 
 
 
 
-        
 
+            'all': get_summary_data(Delivery.query.filter(Delivery.created_at >= dates['all'][0]))
 
 
 
 
 
 
-    except Exception as e:
 
+        })
 
 
 
 
 
 
-        app.logger.error(f"Error getting delivery details for display ID {display_id}: {str(e)}")
 
+    except Exception as e:
 
 
 
 
 
 
-        return jsonify({'error': 'Failed to load delivery details'}), 500
 
+        app.logger.error(f"Error getting summary: {str(e)}")
 
 
 
@@ -15852,6 +12531,7 @@ def get_delivery_by_display_id(display_id):
 
 
 
+        return jsonify({'error': str(e)}), 500
 
 
 
@@ -15859,7 +12539,6 @@ def get_delivery_by_display_id(display_id):
 
 
 
-def normalize_phone_number(phone):
 
 
 
@@ -15867,168 +12546,168 @@ def normalize_phone_number(phone):
 
 
 
-    """Normalize phone number to a standard format for comparison."""
 
+@app.route('/export/<period>')
 
 
 
 
 
 
-    if not phone:
 
+@login_required
 
 
 
 
 
 
-        return phone
 
+@database_required
 
 
 
 
 
 
-    
 
+def export(period):
 
 
 
 
 
 
-    # Remove all non-digit characters
 
+    """Export deliveries data as CSV for the specified period."""
 
 
 
 
 
 
-    digits_only = ''.join(c for c in phone if c.isdigit())
 
+    try:
 
 
 
 
 
 
-    
 
+        date_ranges = get_date_ranges()
 
 
 
 
 
 
-    # If starts with '254' (Kenya country code), keep as is
 
+        
 
 
 
 
 
 
-    if digits_only.startswith('254') and len(digits_only) >= 12:
 
+        # Define date ranges using the new format
 
 
 
 
 
 
-        return digits_only
 
+        if period == 'daily':
 
 
 
 
 
 
-    
 
+            start_date, end_date = date_ranges['today']
 
 
 
 
 
 
-    # If starts with '0' and has 10 digits (Kenyan local format), convert to international
 
+            filename = f'deliveries_{get_current_time().strftime("%Y-%m-%d")}.csv'
 
 
 
 
 
 
-    if digits_only.startswith('0') and len(digits_only) == 10:
 
+            date_range = 'today'
 
 
 
 
 
 
-        return '254' + digits_only[1:]
 
+        elif period == 'weekly':
 
 
 
 
 
 
-    
 
+            start_date, end_date = date_ranges['week']
 
 
 
 
 
 
-    # If starts with '7' or '1' and has 9 digits (Kenyan mobile without prefix), add 254
 
+            filename = f'deliveries_week_{get_current_time().strftime("%Y-%U")}.csv'
 
 
 
 
 
 
-    if len(digits_only) == 9 and (digits_only.startswith('7') or digits_only.startswith('1')):
 
+            date_range = 'this week'
 
 
 
 
 
 
-        return '254' + digits_only
 
+        elif period == 'monthly':
 
 
 
 
 
 
-    
 
+            start_date, end_date = date_ranges['month']
 
 
 
 
 
 
-    # Otherwise return as is
 
+            filename = f'deliveries_{get_current_time().strftime("%Y-%m")}.csv'
 
 
 
 
 
 
-    return digits_only
 
+            date_range = 'this month'
 
 
 
@@ -16036,6 +12715,7 @@ def normalize_phone_number(phone):
 
 
 
+        elif period == 'yearly':
 
 
 
@@ -16043,7 +12723,7 @@ def normalize_phone_number(phone):
 
 
 
-@app.route('/search_delivery_by_display_id', methods=['GET'])
+            start_date, end_date = date_ranges['year']
 
 
 
@@ -16051,7 +12731,7 @@ def normalize_phone_number(phone):
 
 
 
-@database_required
+            filename = f'deliveries_{get_current_time().year}.csv'
 
 
 
@@ -16059,7 +12739,7 @@ def normalize_phone_number(phone):
 
 
 
-def search_delivery_by_display_id():
+            date_range = 'this year'
 
 
 
@@ -16067,7 +12747,7 @@ def search_delivery_by_display_id():
 
 
 
-    """Search delivery by Display ID or Phone Number for dashboard search functionality."""
+        elif period == 'all':
 
 
 
@@ -16075,7 +12755,7 @@ def search_delivery_by_display_id():
 
 
 
-    try:
+            start_date, end_date = date_ranges['all']
 
 
 
@@ -16083,7 +12763,7 @@ def search_delivery_by_display_id():
 
 
 
-        search_query = request.args.get('display_id', '').strip()
+            filename = f'deliveries_all_time_{get_current_time().strftime("%Y-%m-%d")}.csv'
 
 
 
@@ -16091,7 +12771,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+            date_range = 'all time'
 
 
 
@@ -16099,7 +12779,7 @@ def search_delivery_by_display_id():
 
 
 
-        if not search_query:
+        else:  # default to yearly for backward compatibility
 
 
 
@@ -16107,7 +12787,7 @@ def search_delivery_by_display_id():
 
 
 
-            return jsonify({'success': False, 'error': 'Search value is required'}), 400
+            start_date, end_date = date_ranges['year']
 
 
 
@@ -16115,7 +12795,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+            filename = f'deliveries_{get_current_time().year}.csv'
 
 
 
@@ -16123,7 +12803,7 @@ def search_delivery_by_display_id():
 
 
 
-        delivery = None
+            date_range = 'this year'
 
 
 
@@ -16139,7 +12819,7 @@ def search_delivery_by_display_id():
 
 
 
-        # First try to search by Display ID
+        # Query deliveries
 
 
 
@@ -16147,7 +12827,7 @@ def search_delivery_by_display_id():
 
 
 
-        delivery = Delivery.query.filter_by(display_id=search_query).first()
+        deliveries = Delivery.query.filter(
 
 
 
@@ -16155,7 +12835,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+            Delivery.created_at.between(start_date, end_date)
 
 
 
@@ -16163,7 +12843,7 @@ def search_delivery_by_display_id():
 
 
 
-        # If not found by Display ID, try searching by Phone Number
+        ).order_by(Delivery.created_at.desc()).all()
 
 
 
@@ -16171,7 +12851,7 @@ def search_delivery_by_display_id():
 
 
 
-        if not delivery:
+        
 
 
 
@@ -16179,7 +12859,7 @@ def search_delivery_by_display_id():
 
 
 
-            # Clean phone number - remove spaces, dashes, plus signs, etc.
+        if not deliveries:
 
 
 
@@ -16187,7 +12867,7 @@ def search_delivery_by_display_id():
 
 
 
-            cleaned_phone = ''.join(c for c in search_query if c.isdigit())
+            flash(f'No delivery records found for {date_range}.', 'info')
 
 
 
@@ -16195,7 +12875,7 @@ def search_delivery_by_display_id():
 
 
 
-            if len(cleaned_phone) >= 9:  # Only search if we have at least 9 digits
+            return redirect(url_for('reports'))
 
 
 
@@ -16203,7 +12883,7 @@ def search_delivery_by_display_id():
 
 
 
-                # Normalize the search phone number
+        
 
 
 
@@ -16211,7 +12891,7 @@ def search_delivery_by_display_id():
 
 
 
-                normalized_search = normalize_phone_number(cleaned_phone)
+        # Generate CSV
 
 
 
@@ -16219,7 +12899,7 @@ def search_delivery_by_display_id():
 
 
 
-                
+        si = io.StringIO()
 
 
 
@@ -16227,7 +12907,7 @@ def search_delivery_by_display_id():
 
 
 
-                # Get all deliveries and check phone numbers manually for better matching
+        writer = csv.writer(si)
 
 
 
@@ -16235,7 +12915,7 @@ def search_delivery_by_display_id():
 
 
 
-                all_deliveries = Delivery.query.all()
+        
 
 
 
@@ -16243,7 +12923,7 @@ def search_delivery_by_display_id():
 
 
 
-                for d in all_deliveries:
+        # Write header
 
 
 
@@ -16251,7 +12931,7 @@ def search_delivery_by_display_id():
 
 
 
-                    # Clean and normalize the stored phone number
+        writer.writerow([
 
 
 
@@ -16259,7 +12939,7 @@ def search_delivery_by_display_id():
 
 
 
-                    stored_phone_clean = ''.join(c for c in d.recipient_phone if c.isdigit())
+            'ID', 'Display ID', 'Sender', 'Recipient', 'Delivery Person',
 
 
 
@@ -16267,7 +12947,7 @@ def search_delivery_by_display_id():
 
 
 
-                    normalized_stored = normalize_phone_number(stored_phone_clean)
+            'Goods Type', 'Quantity', 'Amount (KSh)', 'Expenses (KSh)', 'Profit (KSh)', 'Status', 'Created At'
 
 
 
@@ -16275,7 +12955,7 @@ def search_delivery_by_display_id():
 
 
 
-                    
+        ])
 
 
 
@@ -16283,7 +12963,7 @@ def search_delivery_by_display_id():
 
 
 
-                    # Check if normalized numbers match or if one contains the other
+        
 
 
 
@@ -16291,7 +12971,7 @@ def search_delivery_by_display_id():
 
 
 
-                    if (normalized_search == normalized_stored or 
+        # Write data
 
 
 
@@ -16299,7 +12979,7 @@ def search_delivery_by_display_id():
 
 
 
-                        normalized_search in stored_phone_clean or 
+        for delivery in deliveries:
 
 
 
@@ -16307,7 +12987,7 @@ def search_delivery_by_display_id():
 
 
 
-                        stored_phone_clean.endswith(normalized_search[-9:]) or
+            profit = delivery.amount - delivery.expenses
 
 
 
@@ -16315,7 +12995,7 @@ def search_delivery_by_display_id():
 
 
 
-                        normalized_search.endswith(stored_phone_clean[-9:])):
+            writer.writerow([
 
 
 
@@ -16323,7 +13003,7 @@ def search_delivery_by_display_id():
 
 
 
-                        delivery = d
+                str(delivery.id),
 
 
 
@@ -16331,7 +13011,7 @@ def search_delivery_by_display_id():
 
 
 
-                        break
+                f"'{delivery.display_id}",
 
 
 
@@ -16339,7 +13019,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+                delivery.sender_name,
 
 
 
@@ -16347,7 +13027,7 @@ def search_delivery_by_display_id():
 
 
 
-        if not delivery:
+                delivery.recipient_name,
 
 
 
@@ -16355,7 +13035,7 @@ def search_delivery_by_display_id():
 
 
 
-            return jsonify({'success': False, 'error': 'Delivery not found'}), 404
+                delivery.delivery_person,
 
 
 
@@ -16363,7 +13043,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+                delivery.goods_type,
 
 
 
@@ -16371,7 +13051,7 @@ def search_delivery_by_display_id():
 
 
 
-        # Return only the required fields: Display ID, Recipient Name, Recipient Number, Status
+                delivery.quantity,
 
 
 
@@ -16379,7 +13059,7 @@ def search_delivery_by_display_id():
 
 
 
-        delivery_data = {
+                f"{delivery.amount:.2f}",
 
 
 
@@ -16387,7 +13067,7 @@ def search_delivery_by_display_id():
 
 
 
-            'display_id': delivery.display_id,
+                f"{delivery.expenses:.2f}",
 
 
 
@@ -16395,7 +13075,7 @@ def search_delivery_by_display_id():
 
 
 
-            'recipient_name': delivery.recipient_name,
+                f"{profit:.2f}",
 
 
 
@@ -16403,7 +13083,7 @@ def search_delivery_by_display_id():
 
 
 
-            'recipient_phone': delivery.recipient_phone,
+                delivery.status,
 
 
 
@@ -16411,7 +13091,7 @@ def search_delivery_by_display_id():
 
 
 
-            'status': delivery.status
+                delivery.created_at.strftime('%Y-%m-%d %H:%M')
 
 
 
@@ -16419,7 +13099,7 @@ def search_delivery_by_display_id():
 
 
 
-        }
+            ])
 
 
 
@@ -16435,7 +13115,7 @@ def search_delivery_by_display_id():
 
 
 
-        return jsonify({'success': True, 'delivery': delivery_data})
+        # Log export action
 
 
 
@@ -16443,7 +13123,7 @@ def search_delivery_by_display_id():
 
 
 
-        
+        log_export(date_range, 'CSV')
 
 
 
@@ -16451,7 +13131,7 @@ def search_delivery_by_display_id():
 
 
 
-    except Exception as e:
+        
 
 
 
@@ -16459,7 +13139,7 @@ def search_delivery_by_display_id():
 
 
 
-        app.logger.error(f"Error searching delivery by query '{search_query}': {str(e)}")
+        # Create response
 
 
 
@@ -16467,7 +13147,7 @@ def search_delivery_by_display_id():
 
 
 
-        return jsonify({'success': False, 'error': 'Search failed'}), 500
+        response = make_response(si.getvalue().encode('utf-8'))
 
 
 
@@ -16475,63 +13155,66 @@ def search_delivery_by_display_id():
 
 
 
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+
 
 
 
 
 
 
+        response.headers['Content-type'] = 'text/csv; charset=utf-8'
 
 
-@app.route('/update_delivery/<int:delivery_id>', methods=['PUT'])
 
 
 
 
 
+        return response
 
 
-@login_required
 
 
 
 
 
+        
 
 
-@database_required
 
 
 
 
 
+    except Exception as e:
 
 
-def update_delivery_details(delivery_id):
 
 
 
 
 
+        app.logger.error(f"Error exporting {period} data: {str(e)}")
 
 
-    """Update delivery details."""
 
 
 
 
 
+        flash(f'Error exporting {period} data: {str(e)}', 'danger')
 
 
-    try:
 
 
 
 
 
+        return jsonify({'error': str(e)}), 500
+
 
 
-        delivery = Delivery.query.get(delivery_id)
 
 
 
@@ -16539,243 +13222,244 @@ def update_delivery_details(delivery_id):
 
 
 
-        if not delivery:
 
 
 
 
 
+@app.route('/get_delivery_details/<int:delivery_id>')
 
 
-            return jsonify({'error': 'Delivery not found'}), 404
 
 
 
 
 
+@login_required
 
 
-        
 
 
 
 
 
+@database_required
 
 
-        data = request.get_json()
 
 
 
 
 
+def get_delivery_details(delivery_id):
 
 
-        if not data:
 
 
 
 
 
+    """Get detailed information for a specific delivery."""
 
 
-            return jsonify({'error': 'No data provided'}), 400
 
 
 
 
 
+    try:
 
 
-        
 
 
 
 
 
+        delivery = Delivery.query.get(delivery_id)
 
 
-        # Update delivery fields
 
 
 
 
 
+        if not delivery:
 
 
-        delivery.sender_name = data.get('sender_name', delivery.sender_name)
 
 
 
 
 
+            return jsonify({'error': 'Delivery not found'}), 404
 
 
-        delivery.sender_phone = data.get('sender_phone', delivery.sender_phone)
 
 
 
 
 
+        
+
 
 
-        delivery.recipient_name = data.get('recipient_name', delivery.recipient_name)
 
 
 
 
+        # Convert delivery to dictionary for JSON response - only use existing fields
 
 
 
-        delivery.recipient_phone = data.get('recipient_phone', delivery.recipient_phone)
 
 
 
 
+        delivery_data = {
 
 
 
-        delivery.recipient_address = data.get('recipient_address', delivery.recipient_address)
 
 
 
 
+            'id': delivery.id,
 
 
 
-        delivery.goods_type = data.get('goods_type', delivery.goods_type)
 
 
 
 
+            'display_id': delivery.display_id,
 
 
 
-        delivery.quantity = data.get('quantity', delivery.quantity)
 
 
 
 
+            'sender_name': delivery.sender_name,
 
 
 
-        delivery.amount = data.get('amount', delivery.amount)
 
 
 
 
+            'sender_phone': delivery.sender_phone,
 
 
 
-        delivery.payment_by = data.get('payment_by', delivery.payment_by)  # Use form value or keep existing
 
 
 
 
+            'sender_address': '',  # Field doesn't exist in model
 
 
 
-        delivery.status = data.get('status', delivery.status)
 
 
 
 
+            'recipient_name': delivery.recipient_name,
 
 
 
-        
 
 
 
 
+            'recipient_phone': delivery.recipient_phone,
 
 
 
-        db.session.commit()
 
 
 
 
+            'recipient_address': delivery.recipient_address,
 
 
 
-        
 
 
 
 
+            'status': delivery.status,
 
 
 
-        return jsonify({
 
 
 
 
+            'amount': delivery.amount,
 
 
 
-            'success': True, 
 
 
 
 
+            'expenses': delivery.expenses,
 
 
 
-            'message': 'Delivery updated successfully'
 
 
 
 
+            'delivery_person': delivery.delivery_person,
 
 
 
-        })
 
 
 
 
+            'notes': '',  # Field doesn't exist in model
 
 
 
-        
 
 
 
 
+            'goods_type': delivery.goods_type,
 
 
 
-    except Exception as e:
 
 
 
 
+            'quantity': delivery.quantity,
 
 
 
-        db.session.rollback()
 
 
 
 
+            'payment_by': delivery.payment_by,
 
 
 
-        app.logger.error(f"Error updating delivery {delivery_id}: {str(e)}")
 
 
 
 
+            'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
 
 
 
-        return jsonify({'error': 'Failed to update delivery'}), 500
 
 
 
 
+                'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown",
 
 
 
@@ -16783,6 +13467,7 @@ def update_delivery_details(delivery_id):
 
 
 
+            'updated_at': delivery.created_at.isoformat() if delivery.created_at else None  # Use created_at since updated_at doesn't exist
 
 
 
@@ -16790,441 +13475,311 @@ def update_delivery_details(delivery_id):
 
 
 
+        }
 
-@app.route('/get_unassigned_deliveries')
-@login_required
-@database_required
-def get_unassigned_deliveries():
-    """Get unassigned deliveries for staff quick assignment"""
-    try:
-        # Get deliveries with no delivery person assigned OR assigned to 'admin' and status is 'Pending'
-        # This shows truly unassigned deliveries plus those assigned to admin (effectively unassigned for staff)
-        unassigned_deliveries = Delivery.query.filter(
-            db.or_(
-                Delivery.delivery_person.is_(None),
-                Delivery.delivery_person == 'admin'
-            ),
-            Delivery.status == 'Pending'
-        ).order_by(Delivery.created_at.desc()).limit(10).all()
 
-        deliveries_data = []
 
-        for delivery in unassigned_deliveries:
 
-            deliveries_data.append({
 
-                'id': delivery.id,
 
-                'display_id': delivery.display_id,
 
-                'sender_name': delivery.sender_name,
+        
 
-                'recipient_name': delivery.recipient_name,
 
-                'recipient_address': delivery.recipient_address,
 
-                'goods_type': delivery.goods_type,
 
-                'quantity': delivery.quantity,
 
-                'amount': delivery.amount,
 
-                'created_at': delivery.created_at.strftime('%Y-%m-%d %H:%M') if delivery.created_at else None
 
-            })
+        return jsonify(delivery_data)
 
-        
 
-        return jsonify({
 
-            'success': True,
 
-            'count': len(deliveries_data),
 
-            'deliveries': deliveries_data
 
-        })
 
         
 
-    except Exception as e:
 
-        app.logger.error(f"Error getting unassigned deliveries: {str(e)}")
 
-        return jsonify({'success': False, 'error': 'Failed to get unassigned deliveries'}), 500
 
 
 
 
+    except Exception as e:
 
-@app.route('/quick_assign_delivery/<int:delivery_id>', methods=['POST'])
 
-@login_required
 
-@database_required
 
-def quick_assign_delivery(delivery_id):
 
-    """Quick assign delivery to current staff user and change status to In Transit"""
 
-    try:
 
-        # Get the delivery
-        delivery = Delivery.query.get_or_404(delivery_id)
+        app.logger.error(f"Error getting delivery details for ID {delivery_id}: {str(e)}")
 
-        # Check if delivery is unassigned or assigned to admin and is pending
-        if (delivery.delivery_person and delivery.delivery_person != 'admin') or delivery.status != 'Pending':
-            return jsonify({
-                'success': False, 
-                'error': 'Delivery is already assigned or not in Pending status'
-            }), 400
 
-        # Get current user
 
-        current_username = session.get('username')
 
-        if not current_username:
 
-            return jsonify({'success': False, 'error': 'User not logged in'}), 401
 
-        
 
-        # Assign to current user and change status
+        return jsonify({'error': 'Failed to load delivery details'}), 500
 
-        delivery.delivery_person = current_username
 
-        delivery.status = 'In Transit'
 
-        delivery.updated_at = get_current_time()
 
-        
 
-        db.session.commit()
 
-        
 
-        # Create audit log
 
-        try:
 
-            audit_log = AuditLog(
 
-                action='QUICK_ASSIGN',
 
-                table_name='delivery',
 
-                record_id=delivery.id,
 
-                old_values={
 
-                    'delivery_person': None,
 
-                    'status': 'Pending'
+@app.route('/get_delivery_by_display_id/<display_id>')
 
-                },
 
-                new_values={
 
-                    'delivery_person': current_username,
 
-                    'status': 'In Transit'
 
-                },
 
-                performed_by=current_username
 
-            )
+@login_required
 
-            db.session.add(audit_log)
 
-            db.session.commit()
 
-        except Exception as audit_error:
 
-            app.logger.error(f"Error creating audit log: {str(audit_error)}")
 
-        
 
-        return jsonify({
 
-            'success': True,
+@database_required
 
-            'message': f'Delivery {delivery.display_id} assigned to {current_username} and marked as In Transit',
 
-            'delivery': {
 
-                'id': delivery.id,
 
-                'display_id': delivery.display_id,
 
-                'delivery_person': delivery.delivery_person,
 
-                'status': delivery.status
 
-            }
+def get_delivery_by_display_id(display_id):
 
-        })
 
-        
 
-    except Exception as e:
 
-        db.session.rollback()
 
-        app.logger.error(f"Error quick assigning delivery: {str(e)}")
 
-        return jsonify({'success': False, 'error': 'Failed to assign delivery'}), 500
 
+    """Get delivery details by display ID (for Quick Reassign functionality)."""
 
 
 
 
-@app.route('/get_staff_stats')
 
-@login_required
 
-@database_required
 
-def get_staff_stats():
+    try:
 
-    """Get staff statistics for quick actions dashboard"""
 
-    try:
 
-        current_username = session.get('username')
 
-        if not current_username:
 
-            return jsonify({'success': False, 'error': 'User not logged in'}), 401
 
-        
 
-        # Get deliveries assigned to current user
+        delivery = Delivery.query.filter_by(display_id=display_id).first()
 
-        my_assigned = Delivery.query.filter(
 
-            Delivery.delivery_person == current_username
 
-        ).count()
 
-        
 
-        # Get deliveries in transit assigned to current user
 
-        in_transit = Delivery.query.filter(
 
-            Delivery.delivery_person == current_username,
+        if not delivery:
 
-            Delivery.status == 'In Transit'
 
-        ).count()
 
-        # Get completed deliveries for current user
-        completed = Delivery.query.filter(
-            Delivery.delivery_person == current_username,
-            Delivery.status == 'Delivered'
-        ).count()
-        
-        # Get unassigned deliveries (no person or assigned to admin, pending status)
-        unassigned = Delivery.query.filter(
-            db.or_(
-                Delivery.delivery_person.is_(None),
-                Delivery.delivery_person == 'admin'
-            ),
-            Delivery.status == 'Pending'
-        ).count()
-        
-        return jsonify({
-            'success': True,
-            'my_assigned': my_assigned,
-            'in_transit': in_transit,
-            'completed': completed,
-            'unassigned': unassigned
-        })
-        
-    except Exception as e:
-        app.logger.error(f"Error getting staff stats: {str(e)}")
-        return jsonify({'success': False, 'error': 'Failed to get staff stats'}), 500
 
 
 
 
+            return jsonify({'error': 'Delivery not found'}), 404
 
-@app.route('/get_users')
 
 
 
 
 
 
+        
 
-@admin_required_api
 
 
 
 
 
 
+        # Convert delivery to dictionary for JSON response
 
-@database_required
 
 
 
 
 
 
+        delivery_data = {
 
-def get_users():
 
 
 
 
 
 
+            'id': delivery.id,
 
-    """Get all users for admin management."""
 
 
 
 
 
 
+            'display_id': delivery.display_id,
 
-    try:
 
 
 
 
 
 
+            'sender_name': delivery.sender_name,
 
-        # Get all users (both active and inactive)
 
 
 
 
 
 
+            'sender_phone': delivery.sender_phone,
 
-        users = User.query.order_by(User.is_active.desc(), User.username).all()
 
 
 
 
 
 
+            'sender_address': '',  # Field doesn't exist in model
 
-        users_data = []
 
 
 
 
 
 
+            'recipient_name': delivery.recipient_name,
 
-        for user in users:
 
 
 
 
 
 
+            'recipient_phone': delivery.recipient_phone,
 
-            users_data.append({
 
 
 
 
 
 
+            'recipient_address': delivery.recipient_address,
 
-                'id': user.id,
 
 
 
 
 
 
+            'status': delivery.status,
 
-                'username': user.username,
 
 
 
 
 
 
+            'amount': delivery.amount,
 
-                'role': user.role,
 
 
 
 
 
 
+            'expenses': delivery.expenses,
 
-                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M') if user.created_at else None,
 
 
 
 
 
 
+            'delivery_person': delivery.delivery_person,
 
-                'is_active': user.is_active,
 
 
 
 
 
 
+            'notes': '',  # Field doesn't exist in model
 
-                'is_admin': user.is_admin()
 
 
 
 
 
 
+            'goods_type': delivery.goods_type,
 
-            })
 
 
 
 
 
 
+            'quantity': delivery.quantity,
 
-        return jsonify(users_data)
 
 
 
 
 
 
+            'payment_by': delivery.payment_by,
 
-    except Exception as e:
 
 
 
 
 
 
+            'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
 
-        app.logger.error(f"Error getting users: {str(e)}")
 
 
 
 
 
 
+            'time_ago': get_time_ago(delivery.created_at) if delivery.created_at else "Unknown",
 
-        return jsonify({'error': 'Failed to load users'}), 500
 
 
 
 
 
 
+            'updated_at': delivery.created_at.isoformat() if delivery.created_at else None  # Use created_at since updated_at doesn't exist
 
 
 
@@ -17232,57 +13787,57 @@ def get_users():
 
 
 
+        }
 
 
-@app.route('/api/health')
 
 
 
 
 
+        
 
 
-def api_health():
 
 
 
 
 
+        return jsonify(delivery_data)
 
 
-    """Health check endpoint"""
 
 
 
 
 
+        
 
 
-    return jsonify({
 
 
 
 
 
+    except Exception as e:
 
 
-        'status': 'healthy',
 
 
 
 
 
+        app.logger.error(f"Error getting delivery details for display ID {display_id}: {str(e)}")
 
 
-        'message': 'API is working',
 
 
 
 
 
+        return jsonify({'error': 'Failed to load delivery details'}), 500
 
 
-        'routes_registered': [str(rule) for rule in app.url_map.iter_rules()]
 
 
 
@@ -17290,13 +13845,13 @@ def api_health():
 
 
 
-    })
 
 
 
 
 
 
+def normalize_phone_number(phone):
 
 
 
@@ -17304,14 +13859,15 @@ def api_health():
 
 
 
+    """Normalize phone number to a standard format for comparison."""
 
 
-# api_test endpoint removed to avoid duplicate function name conflicts
 
 
 
 
 
+    if not phone:
 
 
 
@@ -17319,6 +13875,7 @@ def api_health():
 
 
 
+        return phone
 
 
 
@@ -17326,7 +13883,7 @@ def api_health():
 
 
 
-@app.route('/api/senders', methods=['GET'])
+    
 
 
 
@@ -17334,7 +13891,7 @@ def api_health():
 
 
 
-@login_required
+    # Remove all non-digit characters
 
 
 
@@ -17342,7 +13899,7 @@ def api_health():
 
 
 
-@database_required
+    digits_only = ''.join(c for c in phone if c.isdigit())
 
 
 
@@ -17350,7 +13907,7 @@ def api_health():
 
 
 
-def api_get_senders():
+    
 
 
 
@@ -17358,7 +13915,7 @@ def api_get_senders():
 
 
 
-    """Get unique sender names and phone numbers for autocomplete"""
+    # If starts with '254' (Kenya country code), keep as is
 
 
 
@@ -17366,7 +13923,7 @@ def api_get_senders():
 
 
 
-    try:
+    if digits_only.startswith('254') and len(digits_only) >= 12:
 
 
 
@@ -17374,7 +13931,7 @@ def api_get_senders():
 
 
 
-        query = request.args.get('q', '').strip()
+        return digits_only
 
 
 
@@ -17382,7 +13939,7 @@ def api_get_senders():
 
 
 
-        
+    
 
 
 
@@ -17390,7 +13947,7 @@ def api_get_senders():
 
 
 
-        if len(query) < 1:
+    # If starts with '0' and has 10 digits (Kenyan local format), convert to international
 
 
 
@@ -17398,7 +13955,7 @@ def api_get_senders():
 
 
 
-            return jsonify({'senders': []})
+    if digits_only.startswith('0') and len(digits_only) == 10:
 
 
 
@@ -17406,7 +13963,7 @@ def api_get_senders():
 
 
 
-        
+        return '254' + digits_only[1:]
 
 
 
@@ -17414,7 +13971,7 @@ def api_get_senders():
 
 
 
-        # Get unique sender names that contain the query (anywhere in the name)
+    
 
 
 
@@ -17422,12 +13979,7 @@ def api_get_senders():
 
 
 
-        senders = db.session.query(Delivery.sender_name, Delivery.sender_phone)\
-            .filter(Delivery.sender_name.ilike(f'%{query}%'))\
-            .distinct()\
-            .order_by(Delivery.sender_name)\
-            .limit(10)\
-            .all()
+    # If starts with '7' or '1' and has 9 digits (Kenyan mobile without prefix), add 254
 
 
 
@@ -17435,7 +13987,7 @@ def api_get_senders():
 
 
 
-        
+    if len(digits_only) == 9 and (digits_only.startswith('7') or digits_only.startswith('1')):
 
 
 
@@ -17443,7 +13995,7 @@ def api_get_senders():
 
 
 
-        sender_list = []
+        return '254' + digits_only
 
 
 
@@ -17451,7 +14003,7 @@ def api_get_senders():
 
 
 
-        for name, phone in senders:
+    
 
 
 
@@ -17459,7 +14011,7 @@ def api_get_senders():
 
 
 
-            sender_list.append({
+    # Otherwise return as is
 
 
 
@@ -17467,7 +14019,7 @@ def api_get_senders():
 
 
 
-                'name': name,
+    return digits_only
 
 
 
@@ -17475,7 +14027,6 @@ def api_get_senders():
 
 
 
-                'phone': phone
 
 
 
@@ -17483,56 +14034,58 @@ def api_get_senders():
 
 
 
-            })
 
+@app.route('/search_delivery_by_display_id', methods=['GET'])
+@rate_limited('public_search')
+@database_required
 
 
 
 
 
 
-        
 
+def search_delivery_by_display_id():
 
 
 
 
 
 
-        return jsonify({'senders': sender_list})
 
+    """Search delivery by Display ID or Phone Number for dashboard search functionality."""
 
 
 
 
 
 
-        
 
+    try:
 
 
 
 
 
 
-    except Exception as e:
 
+        search_query = request.args.get('display_id', '').strip()
 
 
 
 
 
 
-        app.logger.error(f"Error getting senders: {str(e)}")
 
+        
 
 
 
 
 
 
-        return jsonify({'success': False, 'error': 'Failed to load senders'}), 500
 
+        if not search_query:
 
 
 
@@ -17540,6 +14093,7 @@ def api_get_senders():
 
 
 
+            return jsonify({'success': False, 'error': 'Search value is required'}), 400
 
 
 
@@ -17547,7 +14101,7 @@ def api_get_senders():
 
 
 
-@app.route('/auto_hard_delete_user', methods=['POST'])
+        
 
 
 
@@ -17555,7 +14109,7 @@ def api_get_senders():
 
 
 
-@admin_required
+        delivery = None
 
 
 
@@ -17563,7 +14117,7 @@ def api_get_senders():
 
 
 
-@database_required
+        
 
 
 
@@ -17571,7 +14125,7 @@ def api_get_senders():
 
 
 
-def auto_hard_delete_user():
+        # First try to search by Display ID
 
 
 
@@ -17579,7 +14133,7 @@ def auto_hard_delete_user():
 
 
 
-    """Automatic hard delete user from database"""
+        delivery = Delivery.query.filter_by(display_id=search_query).first()
 
 
 
@@ -17587,7 +14141,7 @@ def auto_hard_delete_user():
 
 
 
-    try:
+        
 
 
 
@@ -17595,7 +14149,7 @@ def auto_hard_delete_user():
 
 
 
-        data = request.get_json()
+        # If not found by Display ID, try searching by Phone Number
 
 
 
@@ -17603,7 +14157,7 @@ def auto_hard_delete_user():
 
 
 
-        username = data.get('username')
+        if not delivery:
 
 
 
@@ -17611,7 +14165,7 @@ def auto_hard_delete_user():
 
 
 
-        
+            # Clean phone number - remove spaces, dashes, plus signs, etc.
 
 
 
@@ -17619,7 +14173,7 @@ def auto_hard_delete_user():
 
 
 
-        if not username:
+            cleaned_phone = ''.join(c for c in search_query if c.isdigit())
 
 
 
@@ -17627,7 +14181,7 @@ def auto_hard_delete_user():
 
 
 
-            return jsonify({'success': False, 'error': 'Username required'})
+            if len(cleaned_phone) >= 9:  # Only search if we have at least 9 digits
 
 
 
@@ -17635,7 +14189,7 @@ def auto_hard_delete_user():
 
 
 
-        
+                # Normalize the search phone number
 
 
 
@@ -17643,7 +14197,7 @@ def auto_hard_delete_user():
 
 
 
-        # Find user
+                normalized_search = normalize_phone_number(cleaned_phone)
 
 
 
@@ -17651,7 +14205,7 @@ def auto_hard_delete_user():
 
 
 
-        user = User.query.filter_by(username=username).first()
+                
 
 
 
@@ -17659,7 +14213,7 @@ def auto_hard_delete_user():
 
 
 
-        if not user:
+                # Get all deliveries and check phone numbers manually for better matching
 
 
 
@@ -17667,7 +14221,7 @@ def auto_hard_delete_user():
 
 
 
-            return jsonify({'success': False, 'error': 'User not found'})
+                all_deliveries = Delivery.query.all()
 
 
 
@@ -17675,7 +14229,7 @@ def auto_hard_delete_user():
 
 
 
-        
+                for d in all_deliveries:
 
 
 
@@ -17683,7 +14237,7 @@ def auto_hard_delete_user():
 
 
 
-        # Delete all deliveries created by this user
+                    # Clean and normalize the stored phone number
 
 
 
@@ -17691,7 +14245,7 @@ def auto_hard_delete_user():
 
 
 
-        deliveries_to_delete = Delivery.query.filter_by(created_by=user.id).all()
+                    stored_phone_clean = ''.join(c for c in d.recipient_phone if c.isdigit())
 
 
 
@@ -17699,7 +14253,7 @@ def auto_hard_delete_user():
 
 
 
-        delivery_count = len(deliveries_to_delete)
+                    normalized_stored = normalize_phone_number(stored_phone_clean)
 
 
 
@@ -17707,7 +14261,7 @@ def auto_hard_delete_user():
 
 
 
-        
+                    
 
 
 
@@ -17715,7 +14269,7 @@ def auto_hard_delete_user():
 
 
 
-        for delivery in deliveries_to_delete:
+                    # Check if normalized numbers match or if one contains the other
 
 
 
@@ -17723,7 +14277,7 @@ def auto_hard_delete_user():
 
 
 
-            db.session.delete(delivery)
+                    if (normalized_search == normalized_stored or 
 
 
 
@@ -17731,7 +14285,7 @@ def auto_hard_delete_user():
 
 
 
-        
+                        normalized_search in stored_phone_clean or 
 
 
 
@@ -17739,7 +14293,7 @@ def auto_hard_delete_user():
 
 
 
-        # Delete the user
+                        stored_phone_clean.endswith(normalized_search[-9:]) or
 
 
 
@@ -17747,7 +14301,7 @@ def auto_hard_delete_user():
 
 
 
-        db.session.delete(user)
+                        normalized_search.endswith(stored_phone_clean[-9:])):
 
 
 
@@ -17755,7 +14309,7 @@ def auto_hard_delete_user():
 
 
 
-        db.session.commit()
+                        delivery = d
 
 
 
@@ -17763,7 +14317,7 @@ def auto_hard_delete_user():
 
 
 
-        
+                        break
 
 
 
@@ -17771,7 +14325,7 @@ def auto_hard_delete_user():
 
 
 
-        app.logger.info(f"Auto hard deleted user: {username} and {delivery_count} deliveries")
+        
 
 
 
@@ -17779,7 +14333,7 @@ def auto_hard_delete_user():
 
 
 
-        
+        if not delivery:
 
 
 
@@ -17787,7 +14341,7 @@ def auto_hard_delete_user():
 
 
 
-        return jsonify({
+            return jsonify({'success': False, 'error': 'Delivery not found'}), 404
 
 
 
@@ -17795,7 +14349,7 @@ def auto_hard_delete_user():
 
 
 
-            'success': True, 
+        
 
 
 
@@ -17803,7 +14357,7 @@ def auto_hard_delete_user():
 
 
 
-            'message': f'User {username} and {delivery_count} deliveries hard deleted'
+        # Return only the required fields: Display ID, Recipient Name, Recipient Number, Status
 
 
 
@@ -17811,7 +14365,7 @@ def auto_hard_delete_user():
 
 
 
-        })
+        delivery_data = {
 
 
 
@@ -17819,7 +14373,7 @@ def auto_hard_delete_user():
 
 
 
-    except Exception as e:
+            'display_id': delivery.display_id,
 
 
 
@@ -17827,7 +14381,7 @@ def auto_hard_delete_user():
 
 
 
-        db.session.rollback()
+            'recipient_name': delivery.recipient_name,
 
 
 
@@ -17835,7 +14389,7 @@ def auto_hard_delete_user():
 
 
 
-        app.logger.error(f"Error in auto hard delete: {str(e)}")
+            'recipient_phone': delivery.recipient_phone,
 
 
 
@@ -17843,7 +14397,7 @@ def auto_hard_delete_user():
 
 
 
-        return jsonify({'success': False, 'error': str(e)}), 500
+            'status': delivery.status
 
 
 
@@ -17851,6 +14405,7 @@ def auto_hard_delete_user():
 
 
 
+        }
 
 
 
@@ -17858,48 +14413,48 @@ def auto_hard_delete_user():
 
 
 
+        
 
-@app.route('/complete_hard_delete_user', methods=['POST'])
 
 
 
 
 
 
+        return jsonify({'success': True, 'delivery': delivery_data})
 
-@admin_required
 
 
 
 
 
 
+        
 
-@database_required
 
 
 
 
 
 
+    except Exception as e:
 
-def complete_hard_delete_user():
 
 
 
 
 
 
+        app.logger.error(f"Error searching delivery by query '{search_query}': {str(e)}")
 
-    """Complete hard delete user with audit log cleanup"""
 
 
 
 
 
 
+        return jsonify({'success': False, 'error': 'Search failed'}), 500
 
-    try:
 
 
 
@@ -17907,7 +14462,6 @@ def complete_hard_delete_user():
 
 
 
-        data = request.get_json()
 
 
 
@@ -17915,7 +14469,7 @@ def complete_hard_delete_user():
 
 
 
-        username = data.get('username')
+@app.route('/update_delivery/<int:delivery_id>', methods=['PUT'])
 
 
 
@@ -17923,7 +14477,7 @@ def complete_hard_delete_user():
 
 
 
-        
+@login_required
 
 
 
@@ -17931,7 +14485,7 @@ def complete_hard_delete_user():
 
 
 
-        if not username:
+@database_required
 
 
 
@@ -17939,7 +14493,7 @@ def complete_hard_delete_user():
 
 
 
-            return jsonify({'success': False, 'error': 'Username required'})
+def update_delivery_details(delivery_id):
 
 
 
@@ -17947,7 +14501,7 @@ def complete_hard_delete_user():
 
 
 
-        
+    """Update delivery details."""
 
 
 
@@ -17955,7 +14509,7 @@ def complete_hard_delete_user():
 
 
 
-        # Find user
+    try:
 
 
 
@@ -17963,7 +14517,7 @@ def complete_hard_delete_user():
 
 
 
-        user = User.query.filter_by(username=username).first()
+        delivery = Delivery.query.get(delivery_id)
 
 
 
@@ -17971,7 +14525,7 @@ def complete_hard_delete_user():
 
 
 
-        if not user:
+        if not delivery:
 
 
 
@@ -17979,7 +14533,7 @@ def complete_hard_delete_user():
 
 
 
-            return jsonify({'success': False, 'error': 'User not found'})
+            return jsonify({'error': 'Delivery not found'}), 404
 
 
 
@@ -17995,7 +14549,7 @@ def complete_hard_delete_user():
 
 
 
-        user_id = user.id
+        data = request.get_json()
 
 
 
@@ -18003,7 +14557,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        if not data:
 
 
 
@@ -18011,7 +14565,7 @@ def complete_hard_delete_user():
 
 
 
-        # Step 1: Delete audit logs for this user
+            return jsonify({'error': 'No data provided'}), 400
 
 
 
@@ -18019,7 +14573,7 @@ def complete_hard_delete_user():
 
 
 
-        from app import AuditLog
+        
 
 
 
@@ -18027,7 +14581,7 @@ def complete_hard_delete_user():
 
 
 
-        audit_logs_to_delete = AuditLog.query.filter_by(username=username).all()
+        # Update delivery fields
 
 
 
@@ -18035,7 +14589,7 @@ def complete_hard_delete_user():
 
 
 
-        audit_count = len(audit_logs_to_delete)
+        delivery.sender_name = data.get('sender_name', delivery.sender_name)
 
 
 
@@ -18043,7 +14597,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        delivery.sender_phone = data.get('sender_phone', delivery.sender_phone)
 
 
 
@@ -18051,7 +14605,7 @@ def complete_hard_delete_user():
 
 
 
-        for audit_log in audit_logs_to_delete:
+        delivery.recipient_name = data.get('recipient_name', delivery.recipient_name)
 
 
 
@@ -18059,7 +14613,7 @@ def complete_hard_delete_user():
 
 
 
-            db.session.delete(audit_log)
+        delivery.recipient_phone = data.get('recipient_phone', delivery.recipient_phone)
 
 
 
@@ -18067,7 +14621,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        delivery.recipient_address = data.get('recipient_address', delivery.recipient_address)
 
 
 
@@ -18075,7 +14629,7 @@ def complete_hard_delete_user():
 
 
 
-        # Step 2: Delete all deliveries created by this user
+        delivery.goods_type = data.get('goods_type', delivery.goods_type)
 
 
 
@@ -18083,7 +14637,7 @@ def complete_hard_delete_user():
 
 
 
-        from app import Delivery
+        delivery.quantity = data.get('quantity', delivery.quantity)
 
 
 
@@ -18091,7 +14645,7 @@ def complete_hard_delete_user():
 
 
 
-        deliveries_to_delete = Delivery.query.filter_by(created_by=user_id).all()
+        delivery.amount = data.get('amount', delivery.amount)
 
 
 
@@ -18099,7 +14653,7 @@ def complete_hard_delete_user():
 
 
 
-        delivery_count = len(deliveries_to_delete)
+        delivery.payment_by = data.get('payment_by', delivery.payment_by)  # Use form value or keep existing
 
 
 
@@ -18107,7 +14661,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        delivery.status = data.get('status', delivery.status)
 
 
 
@@ -18115,7 +14669,7 @@ def complete_hard_delete_user():
 
 
 
-        for delivery in deliveries_to_delete:
+        
 
 
 
@@ -18123,7 +14677,7 @@ def complete_hard_delete_user():
 
 
 
-            db.session.delete(delivery)
+        db.session.commit()
 
 
 
@@ -18139,7 +14693,7 @@ def complete_hard_delete_user():
 
 
 
-        # Step 3: Delete the user
+        return jsonify({
 
 
 
@@ -18147,7 +14701,7 @@ def complete_hard_delete_user():
 
 
 
-        db.session.delete(user)
+            'success': True, 
 
 
 
@@ -18155,7 +14709,7 @@ def complete_hard_delete_user():
 
 
 
-        db.session.commit()
+            'message': 'Delivery updated successfully'
 
 
 
@@ -18163,7 +14717,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        })
 
 
 
@@ -18171,7 +14725,7 @@ def complete_hard_delete_user():
 
 
 
-        app.logger.info(f"Complete hard deleted user: {username}")
+        
 
 
 
@@ -18179,7 +14733,7 @@ def complete_hard_delete_user():
 
 
 
-        app.logger.info(f"Deleted {audit_count} audit logs and {delivery_count} deliveries")
+    except Exception as e:
 
 
 
@@ -18187,7 +14741,7 @@ def complete_hard_delete_user():
 
 
 
-        
+        db.session.rollback()
 
 
 
@@ -18195,7 +14749,7 @@ def complete_hard_delete_user():
 
 
 
-        return jsonify({
+        app.logger.error(f"Error updating delivery {delivery_id}: {str(e)}")
 
 
 
@@ -18203,7 +14757,8 @@ def complete_hard_delete_user():
 
 
 
-            'success': True, 
+        return jsonify({'error': 'Failed to update delivery'}), 500
+
 
 
 
@@ -18211,7 +14766,6 @@ def complete_hard_delete_user():
 
 
 
-            'message': f'User {username} completely deleted with {audit_count} audit logs and {delivery_count} deliveries'
 
 
 
@@ -18219,311 +14773,449 @@ def complete_hard_delete_user():
 
 
 
-        })
 
 
 
 
+@app.route('/get_unassigned_deliveries')
+@login_required
+@database_required
+def get_unassigned_deliveries():
+    """Get unassigned deliveries for staff quick assignment"""
+    try:
+        # Get deliveries with no delivery person assigned OR assigned to 'admin' and status is 'Pending'
+        # This shows truly unassigned deliveries plus those assigned to admin (effectively unassigned for staff)
+        unassigned_deliveries = project_rows(
+            Delivery.id, Delivery.display_id, Delivery.sender_name, Delivery.recipient_name,
+            Delivery.recipient_address, Delivery.goods_type, Delivery.quantity, Delivery.amount, Delivery.created_at,
+            where=(
+                db.or_(
+                    Delivery.delivery_person.is_(None),
+                    Delivery.delivery_person == 'admin'
+                ),
+                Delivery.status == 'Pending'
+            ),
+            order_by=(Delivery.created_at.desc(),),
+            limit=10
+        )
 
+        deliveries_data = []
 
+        for delivery in unassigned_deliveries:
 
-    except Exception as e:
+            deliveries_data.append({
 
+                'id': delivery.id,
 
+                'display_id': delivery.display_id,
 
+                'sender_name': delivery.sender_name,
 
+                'recipient_name': delivery.recipient_name,
 
+                'recipient_address': delivery.recipient_address,
 
+                'goods_type': delivery.goods_type,
 
-        db.session.rollback()
+                'quantity': delivery.quantity,
+
+                'amount': delivery.amount,
 
+                'created_at': delivery.created_at.strftime('%Y-%m-%d %H:%M') if delivery.created_at else None
 
+            })
 
+        
 
+        return jsonify({
 
+            'success': True,
 
+            'count': len(deliveries_data),
 
-        app.logger.error(f"Error in complete hard delete: {str(e)}")
+            'deliveries': deliveries_data
 
+        })
 
+        
 
+    except Exception as e:
 
+        app.logger.error(f"Error getting unassigned deliveries: {str(e)}")
 
+        return jsonify({'success': False, 'error': 'Failed to get unassigned deliveries'}), 500
 
 
-        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 
+@app.route('/quick_assign_delivery/<int:delivery_id>', methods=['POST'])
 
+@login_required
 
+@database_required
 
+def quick_assign_delivery(delivery_id):
 
+    """Quick assign delivery to current staff user and change status to In Transit"""
 
+    try:
 
+        # Get the delivery
+        delivery = Delivery.query.get_or_404(delivery_id)
 
+        # Check if delivery is unassigned or assigned to admin and is pending
+        if (delivery.delivery_person and delivery.delivery_person != 'admin') or delivery.status != 'Pending':
+            return jsonify({
+                'success': False, 
+                'error': 'Delivery is already assigned or not in Pending status'
+            }), 400
 
+        # Get current user
 
+        current_username = session.get('username')
 
+        if not current_username:
 
+            return jsonify({'success': False, 'error': 'User not logged in'}), 401
 
-# ==================== LEGACY USER MANAGEMENT (KEEP FOR COMPATIBILITY) ====================
+        
 
+        # Assign to current user and change status
 
+        delivery.delivery_person = current_username
 
+        delivery.status = 'In Transit'
 
+        delivery.updated_at = get_current_time()
 
+        
 
+        db.session.commit()
 
+        
 
+        # Create audit log
 
+        try:
 
+            audit_log = AuditLog(
 
+                action='QUICK_ASSIGN',
 
+                table_name='delivery',
 
+                record_id=delivery.id,
 
+                old_values={
 
-@app.route('/create_user', methods=['POST'])
+                    'delivery_person': None,
 
+                    'status': 'Pending'
 
+                },
 
+                new_values={
 
+                    'delivery_person': current_username,
 
+                    'status': 'In Transit'
 
+                },
 
-@admin_required_api
+                performed_by=current_username
 
+            )
 
+            db.session.add(audit_log)
 
+            db.session.commit()
 
+        except Exception as audit_error:
 
+            app.logger.error(f"Error creating audit log: {str(audit_error)}")
 
+        
 
-@database_required
+        return jsonify({
 
+            'success': True,
 
+            'message': f'Delivery {delivery.display_id} assigned to {current_username} and marked as In Transit',
 
+            'delivery': {
 
+                'id': delivery.id,
 
+                'display_id': delivery.display_id,
 
+                'delivery_person': delivery.delivery_person,
 
-def create_user():
+                'status': delivery.status
 
+            }
 
+        })
 
+        
 
+    except Exception as e:
 
+        db.session.rollback()
 
+        app.logger.error(f"Error quick assigning delivery: {str(e)}")
 
-    """Create a new user."""
+        return jsonify({'success': False, 'error': 'Failed to assign delivery'}), 500
 
 
 
 
 
+@app.route('/get_staff_stats')
 
+@login_required
 
-    try:
+@database_required
 
+def get_staff_stats():
 
+    """Get staff statistics for quick actions dashboard"""
 
+    try:
 
+        current_username = session.get('username')
 
+        if not current_username:
 
+            return jsonify({'success': False, 'error': 'User not logged in'}), 401
 
-        app.logger.info(f"Create user attempt - Session: {dict(session)}")
+        
 
+        # Get deliveries assigned to current user
 
+        my_assigned = Delivery.query.filter(
 
+            Delivery.delivery_person == current_username
 
+        ).count()
 
+        
 
+        # Get deliveries in transit assigned to current user
 
-        
+        in_transit = Delivery.query.filter(
 
+            Delivery.delivery_person == current_username,
 
+            Delivery.status == 'In Transit'
 
+        ).count()
 
+        # Get completed deliveries for current user
+        completed = Delivery.query.filter(
+            Delivery.delivery_person == current_username,
+            Delivery.status == 'Delivered'
+        ).count()
+        
+        # Get unassigned deliveries (no person or assigned to admin, pending status)
+        unassigned = Delivery.query.filter(
+            db.or_(
+                Delivery.delivery_person.is_(None),
+                Delivery.delivery_person == 'admin'
+            ),
+            Delivery.status == 'Pending'
+        ).count()
+        
+        return jsonify({
+            'success': True,
+            'my_assigned': my_assigned,
+            'in_transit': in_transit,
+            'completed': completed,
+            'unassigned': unassigned
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Error getting staff stats: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to get staff stats'}), 500
 
 
 
-        # Check if user is authenticated
 
 
+@app.route('/get_users')
 
 
 
 
 
-        if 'user_id' not in session:
 
 
+@admin_required_api
 
 
 
 
 
-            app.logger.warning("Unauthorized access attempt to create_user")
 
 
+@database_required
 
 
 
 
 
-            return jsonify({
 
 
+def get_users():
 
 
 
 
 
-                'error': 'Authentication required',
 
 
+    """Get all users for admin management."""
 
 
 
 
 
-                'redirect': '/login'
 
 
+    try:
 
 
 
 
 
-            }), 401
 
 
+        # Get all users (both active and inactive), except the scheduled jobs' system account
 
 
 
 
 
-        
 
 
+        users = User.query.filter(User.role != SYSTEM_ROLE).order_by(User.is_active.desc(), User.username).all()
 
 
 
 
 
-        # Check if user is admin
 
 
+        users_data = []
 
 
 
 
 
-        if session.get('user_role') != 'admin':
 
 
+        for user in users:
 
 
 
 
 
-            app.logger.warning(f"Non-admin user attempted to create user. Role: {session.get('user_role')}")
 
 
+            users_data.append({
 
 
 
 
 
-            return jsonify({
 
 
+                'id': user.id,
 
 
 
 
 
-                'error': 'Admin access required'
 
 
+                'username': user.username,
 
 
 
 
 
-            }), 403
 
 
+                'role': user.role,
 
 
 
 
 
-        
 
 
+                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M') if user.created_at else None,
 
 
 
 
 
-        # Get JSON data with better error handling
 
 
+                'is_active': user.is_active,
 
 
 
 
 
-        try:
 
 
+                'is_admin': user.is_admin()
 
 
 
 
 
-            data = request.get_json()
 
 
+            })
 
 
 
 
 
-            app.logger.info(f"Raw request data: {data}")
 
 
+        return jsonify(users_data)
 
 
 
 
 
-        except Exception as json_error:
 
 
+    except Exception as e:
 
 
 
 
 
-            app.logger.error(f"JSON parsing error: {str(json_error)}")
 
 
+        app.logger.error(f"Error getting users: {str(e)}")
 
 
 
 
 
-            return jsonify({'error': 'Invalid JSON data'}), 400
 
 
+        return jsonify({'error': 'Failed to load users'}), 500
 
 
 
 
 
-        
 
 
 
@@ -18531,71 +15223,70 @@ def create_user():
 
 
 
-        if not data:
 
 
 
+@app.route('/api/health')
 
 
 
 
-            app.logger.error("No JSON data received in create_user")
 
 
 
+def api_health():
 
 
 
 
-            return jsonify({'error': 'No data provided'}), 400
 
 
 
+    """Health check endpoint"""
 
 
 
 
-            
 
 
 
+    return jsonify({
 
 
 
 
-        username = data.get('username', '').strip()
 
 
 
+        'status': 'healthy',
 
 
 
 
-        password = data.get('password', '')
 
 
 
+        'message': 'API is working',
 
 
 
 
-        role = data.get('role', 'user')  # Default to 'user' if not specified
 
 
 
+        'routes_registered': [str(rule) for rule in app.url_map.iter_rules()]
 
 
 
 
-        
 
 
 
+    })
 
 
 
 
-        app.logger.info(f"Creating user: {username}, role: {role}")
 
 
 
@@ -18603,15 +15294,14 @@ def create_user():
 
 
 
-        app.logger.info(f"Received data: {dict(data)}")
 
 
 
 
+# api_test endpoint removed to avoid duplicate function name conflicts
 
 
 
-        
 
 
 
@@ -18619,7 +15309,6 @@ def create_user():
 
 
 
-        # Enhanced validation
 
 
 
@@ -18627,215 +15316,219 @@ def create_user():
 
 
 
-        if not username:
 
 
+@app.route('/api/senders', methods=['GET'])
 
 
 
 
 
-            app.logger.error("Username is empty")
 
 
+@login_required
 
 
 
 
 
-            return jsonify({'error': 'Username is required'}), 400
 
 
+@database_required
 
 
 
 
 
-            
 
 
+def api_get_senders():
 
 
 
 
 
-        if not password:
 
 
+    """Get unique sender names and phone numbers for autocomplete"""
 
 
 
 
 
-            app.logger.error("Password is empty")
 
 
+    try:
 
 
 
 
 
-            return jsonify({'error': 'Password is required'}), 400
 
 
+        query = request.args.get('q', '').strip()
 
 
 
 
 
-            
 
 
+        
 
 
 
 
 
-        if len(username) < 3:
 
 
+        if len(query) < 1:
 
 
 
 
 
-            app.logger.error(f"Username too short: {username}")
 
 
+            return jsonify({'senders': []})
 
 
 
 
 
-            return jsonify({'error': 'Username must be at least 3 characters long'}), 400
 
 
+        
 
 
 
 
 
-            
 
 
+        # Get unique sender names that contain the query (anywhere in the name)
 
 
 
 
 
-        if len(password) < 6:
 
 
+        senders = db.session.query(Delivery.sender_name, Delivery.sender_phone)\
+            .filter(Delivery.sender_name.ilike(f'%{query}%'))\
+            .distinct()\
+            .order_by(Delivery.sender_name)\
+            .limit(10)\
+            .all()
 
 
 
 
 
-            app.logger.error(f"Password too short: {len(password)} characters")
 
 
+        
 
 
 
 
 
-            return jsonify({'error': 'Password must be at least 6 characters long'}), 400
 
 
+        sender_list = []
 
 
 
 
 
-        
 
 
+        for name, phone in senders:
 
 
 
 
 
-        if role not in ['admin', 'user']:
 
 
+            sender_list.append({
 
 
 
 
 
-            app.logger.error(f"Invalid role: {role}")
 
 
+                'name': name,
 
 
 
 
 
-            return jsonify({'error': 'Role must be admin or user'}), 400
 
 
+                'phone': phone
 
 
 
 
 
-        
 
 
+            })
 
 
 
 
 
-        # Check if user already exists
 
 
+        
 
 
 
 
 
-        try:
 
 
+        return jsonify({'senders': sender_list})
 
 
 
 
 
-            existing_user = User.query.filter_by(username=username).first()
 
 
+        
 
 
 
 
 
-            if existing_user:
 
 
+    except Exception as e:
 
 
 
 
 
-                app.logger.warning(f"Username already exists: {username}")
 
 
+        app.logger.error(f"Error getting senders: {str(e)}")
 
 
 
 
 
-                return jsonify({'error': 'Username already exists'}), 400
 
 
+        return jsonify({'success': False, 'error': 'Failed to load senders'}), 500
 
 
 
 
 
-        except Exception as db_error:
 
 
 
@@ -18843,243 +15536,245 @@ def create_user():
 
 
 
-            app.logger.error(f"Database query error: {str(db_error)}")
 
 
 
+@app.route('/auto_hard_delete_user', methods=['POST'])
 
 
 
 
-            return jsonify({'error': 'Database error checking username'}), 500
 
 
 
+@admin_required
 
 
 
 
-        
 
 
 
+@database_required
 
 
 
 
-        # Create new user with transaction handling
 
 
 
+def auto_hard_delete_user():
 
 
 
 
-        try:
 
 
 
+    """Automatic hard delete user from database"""
 
 
 
 
-            new_user = User(username=username, role=role)
 
 
 
+    try:
 
 
 
 
-            new_user.set_password(password)
 
 
 
+        data = request.get_json()
 
 
 
 
-            db.session.add(new_user)
 
 
 
+        username = data.get('username')
 
 
 
 
-            db.session.commit()
 
 
 
+        
 
 
 
 
-            
 
 
 
+        if not username:
 
 
 
 
-            app.logger.info(f"User created successfully: {username} (ID: {new_user.id})")
 
 
 
+            return jsonify({'success': False, 'error': 'Username required'})
 
 
 
 
-            
 
 
 
+        
 
 
 
 
-            return jsonify({
 
 
 
+        # Find user
 
 
 
 
-                'success': True, 
 
 
 
+        user = User.query.filter_by(username=username).first()
 
 
 
 
-                'message': 'User created successfully',
 
 
 
+        if not user:
 
 
 
 
-                'user': {
 
 
 
+            return jsonify({'success': False, 'error': 'User not found'})
 
+        if user.role == SYSTEM_ROLE:
+            return jsonify({'success': False, 'error': 'Cannot delete the system account'})
 
 
 
-                    'id': new_user.id,
 
 
 
 
+        
 
 
 
-                    'username': new_user.username,
 
 
 
 
+        # Delete all deliveries created by this user
 
 
 
-                    'role': new_user.role,
 
 
 
 
+        deliveries_to_delete = Delivery.query.filter_by(created_by=user.id).all()
 
 
 
-                    'created_at': new_user.created_at.strftime('%Y-%m-%d %H:%M') if new_user.created_at else None
 
 
 
 
+        delivery_count = len(deliveries_to_delete)
 
 
 
-                }
 
 
 
 
+        
 
 
 
-            })
 
 
 
 
+        for delivery in deliveries_to_delete:
 
 
 
-            
 
 
 
 
+            db.session.delete(delivery)
 
 
 
-        except Exception as commit_error:
 
 
 
 
+        
 
 
 
-            db.session.rollback()
 
 
 
 
+        # Delete the user
 
 
 
-            app.logger.error(f"Database commit error: {str(commit_error)}")
 
 
 
 
+        db.session.delete(user)
 
 
 
-            return jsonify({'error': 'Failed to save user to database'}), 500
 
 
 
 
+        db.session.commit()
 
 
 
-        
 
 
 
 
+        
 
 
 
-    except Exception as e:
 
 
 
 
+        app.logger.info(f"Auto hard deleted user: {username} and {delivery_count} deliveries")
 
 
 
-        db.session.rollback()
 
 
 
 
+        
 
 
 
@@ -19087,6 +15782,7 @@ def create_user():
 
 
 
+        return jsonify({
 
 
 
@@ -19094,56 +15790,56 @@ def create_user():
 
 
 
+            'success': True, 
 
-@app.route('/update_user/<int:user_id>', methods=['PUT'])
 
 
 
 
 
 
+            'message': f'User {username} and {delivery_count} deliveries hard deleted'
 
-@admin_required_api
 
 
 
 
 
 
+        })
 
-@database_required
 
 
 
 
 
 
+    except Exception as e:
 
-def update_user(user_id):
 
 
 
 
 
 
+        db.session.rollback()
 
-    """Update an existing user."""
 
 
 
 
 
 
+        app.logger.error(f"Error in auto hard delete: {str(e)}")
 
-    try:
 
 
 
 
 
 
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        user = User.query.get_or_404(user_id)
 
 
 
@@ -19151,7 +15847,6 @@ def update_user(user_id):
 
 
 
-        
 
 
 
@@ -19159,7 +15854,7 @@ def update_user(user_id):
 
 
 
-        # Prevent editing the main admin
+@app.route('/complete_hard_delete_user', methods=['POST'])
 
 
 
@@ -19167,7 +15862,7 @@ def update_user(user_id):
 
 
 
-        if user.username == 'Admin':
+@admin_required
 
 
 
@@ -19175,7 +15870,7 @@ def update_user(user_id):
 
 
 
-            return jsonify({'error': 'Cannot modify admin user'}), 403
+@database_required
 
 
 
@@ -19183,7 +15878,7 @@ def update_user(user_id):
 
 
 
-        
+def complete_hard_delete_user():
 
 
 
@@ -19191,7 +15886,7 @@ def update_user(user_id):
 
 
 
-        data = request.get_json()
+    """Complete hard delete user with audit log cleanup"""
 
 
 
@@ -19199,7 +15894,7 @@ def update_user(user_id):
 
 
 
-        username = data.get('username', '').strip()
+    try:
 
 
 
@@ -19207,7 +15902,7 @@ def update_user(user_id):
 
 
 
-        password = data.get('password', '')
+        data = request.get_json()
 
 
 
@@ -19215,7 +15910,7 @@ def update_user(user_id):
 
 
 
-        role = data.get('role', user.role)
+        username = data.get('username')
 
 
 
@@ -19239,7 +15934,7 @@ def update_user(user_id):
 
 
 
-            return jsonify({'error': 'Username is required'}), 400
+            return jsonify({'success': False, 'error': 'Username required'})
 
 
 
@@ -19255,7 +15950,7 @@ def update_user(user_id):
 
 
 
-        if role not in ['admin', 'user']:
+        # Find user
 
 
 
@@ -19263,7 +15958,7 @@ def update_user(user_id):
 
 
 
-            return jsonify({'error': 'Role must be admin or user'}), 400
+        user = User.query.filter_by(username=username).first()
 
 
 
@@ -19271,7 +15966,7 @@ def update_user(user_id):
 
 
 
-        
+        if not user:
 
 
 
@@ -19279,216 +15974,218 @@ def update_user(user_id):
 
 
 
-        # Check if username is taken by another user
+            return jsonify({'success': False, 'error': 'User not found'})
 
+        if user.role == SYSTEM_ROLE:
+            return jsonify({'success': False, 'error': 'Cannot delete the system account'})
 
 
 
 
 
 
-        existing_user = User.query.filter(User.username == username, User.id != user_id).first()
 
+        
 
 
 
 
 
 
-        if existing_user:
 
+        user_id = user.id
 
 
 
 
 
 
-            return jsonify({'error': 'Username already exists'}), 400
 
+        
 
 
 
 
 
 
-        
 
+        # Step 1: Delete audit logs for this user
 
 
 
 
 
 
-        # Update user
 
+        from app import AuditLog
 
 
 
 
 
 
-        user.username = username
 
+        audit_logs_to_delete = AuditLog.query.filter_by(username=username).all()
 
 
 
 
 
 
-        user.role = role
 
+        audit_count = len(audit_logs_to_delete)
 
 
 
 
 
 
-        if password:  # Only update password if provided
 
+        
 
 
 
 
 
 
-            user.set_password(password)
 
+        for audit_log in audit_logs_to_delete:
 
 
 
 
 
 
-        
 
+            db.session.delete(audit_log)
 
 
 
 
 
 
-        db.session.commit()
 
+        
 
 
 
 
 
 
-        
 
+        # Step 2: Delete all deliveries created by this user
 
 
 
 
 
 
-        return jsonify({
 
+        from app import Delivery
 
 
 
 
 
 
-            'success': True, 
 
+        deliveries_to_delete = Delivery.query.filter_by(created_by=user_id).all()
 
 
 
 
 
 
-            'message': 'User updated successfully',
 
+        delivery_count = len(deliveries_to_delete)
 
 
 
 
 
 
-            'user': {
 
+        
 
 
 
 
 
 
-                'id': user.id,
 
+        for delivery in deliveries_to_delete:
 
 
 
 
 
 
-                'username': user.username,
 
+            db.session.delete(delivery)
 
 
 
 
 
 
-                'role': user.role,
 
+        
 
 
 
 
 
 
-                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M') if user.created_at else None
 
+        # Step 3: Delete the user
 
 
 
 
 
 
-            }
 
+        db.session.delete(user)
 
 
 
 
 
 
-        })
 
+        db.session.commit()
 
 
 
 
 
 
-    except Exception as e:
 
+        
 
 
 
 
 
 
-        db.session.rollback()
 
+        app.logger.info(f"Complete hard deleted user: {username}")
 
 
 
 
 
 
-        app.logger.error(f"Error updating user: {str(e)}")
 
+        app.logger.info(f"Deleted {audit_count} audit logs and {delivery_count} deliveries")
 
 
 
 
 
 
-        return jsonify({'error': 'Failed to update user'}), 500
 
+        
 
 
 
@@ -19496,6 +16193,7 @@ def update_user(user_id):
 
 
 
+        return jsonify({
 
 
 
@@ -19503,7 +16201,7 @@ def update_user(user_id):
 
 
 
-@app.route('/delete_user/<int:user_id>', methods=['DELETE'])
+            'success': True, 
 
 
 
@@ -19511,7 +16209,7 @@ def update_user(user_id):
 
 
 
-@admin_required_api
+            'message': f'User {username} completely deleted with {audit_count} audit logs and {delivery_count} deliveries'
 
 
 
@@ -19519,7 +16217,7 @@ def update_user(user_id):
 
 
 
-@database_required
+        })
 
 
 
@@ -19527,7 +16225,7 @@ def update_user(user_id):
 
 
 
-def delete_user(user_id):
+    except Exception as e:
 
 
 
@@ -19535,7 +16233,7 @@ def delete_user(user_id):
 
 
 
-    """Delete a user."""
+        db.session.rollback()
 
 
 
@@ -19543,7 +16241,7 @@ def delete_user(user_id):
 
 
 
-    try:
+        app.logger.error(f"Error in complete hard delete: {str(e)}")
 
 
 
@@ -19551,7 +16249,7 @@ def delete_user(user_id):
 
 
 
-        user = User.query.get_or_404(user_id)
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 
@@ -19559,7 +16257,6 @@ def delete_user(user_id):
 
 
 
-        
 
 
 
@@ -19567,15 +16264,14 @@ def delete_user(user_id):
 
 
 
-        # Prevent deleting the main admin
 
+# ==================== LEGACY USER MANAGEMENT (KEEP FOR COMPATIBILITY) ====================
 
 
 
 
 
 
-        if user.username == 'Admin':
 
 
 
@@ -19583,89 +16279,89 @@ def delete_user(user_id):
 
 
 
-            return jsonify({'error': 'Cannot delete admin user'}), 403
 
 
+@app.route('/create_user', methods=['POST'])
 
 
 
 
 
-        
 
 
+@admin_required_api
 
 
 
 
 
-        # Soft delete by deactivating
 
 
+@database_required
 
 
 
 
 
-        user.is_active = False
 
 
+def create_user():
 
 
 
 
 
-        db.session.commit()
 
 
+    """Create a new user."""
 
 
 
 
 
-        
 
 
+    try:
 
 
 
 
 
-        return jsonify({'success': True, 'message': 'User deleted successfully'})
 
 
+        app.logger.info(f"Create user attempt - Session: {dict(session)}")
 
 
 
 
 
-    except Exception as e:
 
 
+        
 
 
 
 
 
-        db.session.rollback()
 
 
+        # Check if user is authenticated
 
 
 
 
 
-        app.logger.error(f"Error deleting user: {str(e)}")
 
 
+        if 'user_id' not in session:
 
 
 
 
 
-        return jsonify({'error': 'Failed to delete user'}), 500
 
 
+            app.logger.warning("Unauthorized access attempt to create_user")
 
 
 
@@ -19673,61 +16369,63 @@ def delete_user(user_id):
 
 
 
+            return jsonify({
 
 
 
 
 
 
-@app.route('/get_delivery_trends')
 
+                'error': 'Authentication required',
 
 
 
 
 
 
-@login_required
 
+                'redirect': '/login'
 
 
 
 
 
 
-@database_required
 
+            }), 401
 
 
 
 
 
 
-def get_delivery_trends():
 
+        
 
 
 
 
 
 
-    """Get delivery trends data for charts."""
 
+        # Check if user is admin
 
 
 
 
 
 
-    try:
 
+        if not has_permission('administer'):
 
 
 
 
 
 
-        # Get date range from query params (default to last 30 days)
+
+            app.logger.warning(f"Non-admin user attempted to create user. Role: {session.get('user_role')}")
 
 
 
@@ -19735,7 +16433,7 @@ def get_delivery_trends():
 
 
 
-        days = request.args.get('days', 30, type=int)
+            return jsonify({
 
 
 
@@ -19743,7 +16441,7 @@ def get_delivery_trends():
 
 
 
-        end_date = get_current_time()
+                'error': 'Admin access required'
 
 
 
@@ -19751,7 +16449,7 @@ def get_delivery_trends():
 
 
 
-        start_date = end_date - timedelta(days=days)
+            }), 403
 
 
 
@@ -19767,7 +16465,7 @@ def get_delivery_trends():
 
 
 
-        # Get deliveries within date range
+        # Get JSON data with better error handling
 
 
 
@@ -19775,7 +16473,7 @@ def get_delivery_trends():
 
 
 
-        deliveries = Delivery.query.filter(
+        try:
 
 
 
@@ -19783,7 +16481,7 @@ def get_delivery_trends():
 
 
 
-            Delivery.created_at >= start_date,
+            data = request.get_json()
 
 
 
@@ -19791,7 +16489,7 @@ def get_delivery_trends():
 
 
 
-            Delivery.created_at <= end_date
+            app.logger.info(f"Raw request data: {data}")
 
 
 
@@ -19799,7 +16497,7 @@ def get_delivery_trends():
 
 
 
-        ).order_by(Delivery.created_at).all()
+        except Exception as json_error:
 
 
 
@@ -19807,7 +16505,7 @@ def get_delivery_trends():
 
 
 
-        
+            app.logger.error(f"JSON parsing error: {str(json_error)}")
 
 
 
@@ -19815,7 +16513,7 @@ def get_delivery_trends():
 
 
 
-        # Group by date and status
+            return jsonify({'error': 'Invalid JSON data'}), 400
 
 
 
@@ -19823,7 +16521,7 @@ def get_delivery_trends():
 
 
 
-        daily_data = {}
+        
 
 
 
@@ -19831,7 +16529,7 @@ def get_delivery_trends():
 
 
 
-        
+        if not data:
 
 
 
@@ -19839,7 +16537,7 @@ def get_delivery_trends():
 
 
 
-        for delivery in deliveries:
+            app.logger.error("No JSON data received in create_user")
 
 
 
@@ -19847,7 +16545,7 @@ def get_delivery_trends():
 
 
 
-            date_key = delivery.created_at.strftime('%Y-%m-%d')
+            return jsonify({'error': 'No data provided'}), 400
 
 
 
@@ -19863,401 +16561,399 @@ def get_delivery_trends():
 
 
 
-            if date_key not in daily_data:
-
-
+        username = data.get('username', '').strip()
 
 
 
 
 
-                daily_data[date_key] = {'Pending': 0, 'In Transit': 0, 'Delivered': 0}
 
 
+        password = data.get('password', '')
 
 
 
 
 
-            
 
 
+        role = data.get('role', 'user')  # Default to 'user' if not specified
 
 
 
 
 
-            daily_data[date_key][delivery.status] = daily_data[date_key].get(delivery.status, 0) + 1
 
 
+        
 
 
 
 
 
-        
 
 
+        app.logger.info(f"Creating user: {username}, role: {role}")
 
 
 
 
 
-        # Prepare data for Chart.js
 
 
+        app.logger.info(f"Received data: {dict(data)}")
 
 
 
 
 
-        dates = sorted(daily_data.keys())
 
 
+        
 
 
 
 
 
-        pending_counts = [daily_data[date].get('Pending', 0) for date in dates]
 
 
+        # Enhanced validation
 
 
 
 
 
-        in_transit_counts = [daily_data[date].get('In Transit', 0) for date in dates]
 
 
+        if not username:
 
 
 
 
 
-        delivered_counts = [daily_data[date].get('Delivered', 0) for date in dates]
 
 
+            app.logger.error("Username is empty")
 
 
 
 
 
-        
 
 
+            return jsonify({'error': 'Username is required'}), 400
 
 
 
 
 
-        return jsonify({
 
 
+            
 
 
 
 
 
-            'labels': [datetime.strptime(date, '%Y-%m-%d').strftime('%b %d') for date in dates],
 
 
+        if not password:
 
 
 
 
 
-            'datasets': [
 
 
+            app.logger.error("Password is empty")
 
 
 
 
 
-                {
 
 
+            return jsonify({'error': 'Password is required'}), 400
 
 
 
 
 
-                    'label': 'Pending',
 
 
+            
 
 
 
 
 
-                    'data': pending_counts,
 
 
+        if len(username) < 3:
 
 
 
 
 
-                    'borderColor': '#f59e0b',
 
 
+            app.logger.error(f"Username too short: {username}")
 
 
 
 
 
-                    'backgroundColor': 'rgba(245, 158, 11, 0.1)',
 
 
+            return jsonify({'error': 'Username must be at least 3 characters long'}), 400
 
 
 
 
 
-                    'tension': 0.3,
 
 
+            
 
 
 
 
 
-                    'borderWidth': 2,
 
 
+        if len(password) < 6:
 
 
 
 
 
-                    'pointRadius': 3,
 
 
+            app.logger.error(f"Password too short: {len(password)} characters")
 
 
 
 
 
-                    'pointHoverRadius': 5
 
 
+            return jsonify({'error': 'Password must be at least 6 characters long'}), 400
 
 
 
 
 
-                },
 
 
+        
 
 
 
 
 
-                {
 
 
+        if role not in ['admin', 'user']:
 
 
 
 
 
-                    'label': 'In Transit',
 
 
+            app.logger.error(f"Invalid role: {role}")
 
 
 
 
 
-                    'data': in_transit_counts,
 
 
+            return jsonify({'error': 'Role must be admin or user'}), 400
 
 
 
 
 
-                    'borderColor': '#3b82f6',
 
 
+        
 
 
 
 
 
-                    'backgroundColor': 'rgba(59, 130, 246, 0.1)',
 
 
+        # Check if user already exists
 
 
 
 
 
-                    'tension': 0.3,
 
 
+        try:
 
 
 
 
 
-                    'borderWidth': 2,
 
 
+            existing_user = User.query.filter_by(username=username).first()
 
 
 
 
 
-                    'pointRadius': 3,
 
 
+            if existing_user:
 
 
 
 
 
-                    'pointHoverRadius': 5
 
 
+                app.logger.warning(f"Username already exists: {username}")
 
 
 
 
 
-                },
 
 
+                return jsonify({'error': 'Username already exists'}), 400
 
 
 
 
 
-                {
 
 
+        except Exception as db_error:
 
 
 
 
 
-                    'label': 'Delivered',
 
 
+            app.logger.error(f"Database query error: {str(db_error)}")
 
 
 
 
 
-                    'data': delivered_counts,
 
 
+            return jsonify({'error': 'Database error checking username'}), 500
 
 
 
 
 
-                    'borderColor': '#10b981',
 
 
+        
 
 
 
 
 
-                    'backgroundColor': 'rgba(16, 185, 129, 0.1)',
 
 
+        # Create new user with transaction handling
 
 
 
 
 
-                    'tension': 0.3,
 
 
+        try:
 
 
 
 
 
-                    'borderWidth': 2,
 
 
+            new_user = User(username=username, role=role)
 
 
 
 
 
-                    'pointRadius': 3,
 
 
+            new_user.set_password(password)
 
 
 
 
 
-                    'pointHoverRadius': 5
 
 
+            db.session.add(new_user)
 
 
 
 
 
-                }
 
 
+            db.session.commit()
 
 
 
 
 
-            ]
 
 
+            
 
 
 
 
 
-        })
 
 
+            app.logger.info(f"User created successfully: {username} (ID: {new_user.id})")
 
 
 
 
 
-        
 
 
+            
 
 
 
 
 
-    except Exception as e:
 
 
+            return jsonify({
 
 
 
 
 
-        app.logger.error(f"Error getting delivery trends: {str(e)}")
 
 
+                'success': True, 
 
 
 
 
 
-        return jsonify({'error': 'Failed to load delivery trends'}), 500
 
 
+                'message': 'User created successfully',
 
 
 
@@ -20265,125 +16961,125 @@ def get_delivery_trends():
 
 
 
+                'user': {
 
 
 
 
 
 
-@app.route('/get_revenue_charts')
 
+                    'id': new_user.id,
 
 
 
 
 
 
-@login_required
 
+                    'username': new_user.username,
 
 
 
 
 
 
-@database_required
 
+                    'role': new_user.role,
 
 
 
 
 
 
-def get_revenue_charts():
 
+                    'created_at': new_user.created_at.strftime('%Y-%m-%d %H:%M') if new_user.created_at else None
 
 
 
 
 
 
-    """Get revenue data for charts."""
 
+                }
 
 
 
 
 
 
-    try:
 
+            })
 
 
 
 
 
 
-        # Check if user is authenticated
 
+            
 
 
 
 
 
 
-        if 'user_id' not in session:
 
+        except Exception as commit_error:
 
 
 
 
 
 
-            app.logger.warning("Unauthorized access attempt to get_revenue_charts")
 
+            db.session.rollback()
 
 
 
 
 
 
-            return jsonify({
 
+            app.logger.error(f"Database commit error: {str(commit_error)}")
 
 
 
 
 
 
-                'line_chart': {'labels': [], 'datasets': []},
 
+            return jsonify({'error': 'Failed to save user to database'}), 500
 
 
 
 
 
 
-                'summary': {
 
+        
 
 
 
 
 
 
-                    'total_revenue': 0,
 
+    except Exception as e:
 
 
 
 
 
 
-                    'total_expenses': 0,
 
+        db.session.rollback()
 
 
 
 
 
 
-                    'total_profit': 0,
 
 
 
@@ -20391,95 +17087,96 @@ def get_revenue_charts():
 
 
 
-                    'profit_margin': 0
 
 
 
 
 
 
+@app.route('/update_user/<int:user_id>', methods=['PUT'])
 
-                },
 
 
 
 
 
 
+@admin_required_api
 
-                'error': 'Authentication required'
 
 
 
 
 
 
+@database_required
 
-            }), 401
 
 
 
 
 
 
+def update_user(user_id):
 
-        
 
 
 
 
 
 
+    """Update an existing user."""
 
-        # Get date range from query params (default to last 30 days)
 
 
 
 
 
 
+    try:
 
-        days = request.args.get('days', 30, type=int)
 
 
 
 
 
 
+        user = User.query.get_or_404(user_id)
 
-        end_date = get_current_time()
 
 
 
 
 
 
+        
 
-        start_date = end_date - timedelta(days=days)
 
 
 
 
 
 
+        # Prevent editing the main admin
 
-        
 
 
 
 
 
 
+        if user.username == 'Admin':
 
-        # Get deliveries within date range
 
 
 
 
 
 
+            return jsonify({'error': 'Cannot modify admin user'}), 403
 
-        deliveries = Delivery.query.filter(
+        if user.role == SYSTEM_ROLE:
+            return jsonify({'error': 'Cannot modify the system account'}), 403
 
 
 
@@ -20487,7 +17184,7 @@ def get_revenue_charts():
 
 
 
-            Delivery.created_at >= start_date,
+        
 
 
 
@@ -20495,7 +17192,7 @@ def get_revenue_charts():
 
 
 
-            Delivery.created_at <= end_date
+        data = request.get_json()
 
 
 
@@ -20503,7 +17200,7 @@ def get_revenue_charts():
 
 
 
-        ).order_by(Delivery.created_at).all()
+        username = data.get('username', '').strip()
 
 
 
@@ -20511,7 +17208,7 @@ def get_revenue_charts():
 
 
 
-        
+        password = data.get('password', '')
 
 
 
@@ -20519,7 +17216,7 @@ def get_revenue_charts():
 
 
 
-        # Group by date
+        role = data.get('role', user.role)
 
 
 
@@ -20527,7 +17224,7 @@ def get_revenue_charts():
 
 
 
-        daily_revenue = {}
+        
 
 
 
@@ -20535,7 +17232,7 @@ def get_revenue_charts():
 
 
 
-        daily_expenses = {}
+        if not username:
 
 
 
@@ -20543,7 +17240,7 @@ def get_revenue_charts():
 
 
 
-        
+            return jsonify({'error': 'Username is required'}), 400
 
 
 
@@ -20551,7 +17248,7 @@ def get_revenue_charts():
 
 
 
-        for delivery in deliveries:
+        
 
 
 
@@ -20559,7 +17256,7 @@ def get_revenue_charts():
 
 
 
-            date_key = delivery.created_at.strftime('%Y-%m-%d')
+        if role not in ['admin', 'user']:
 
 
 
@@ -20567,7 +17264,7 @@ def get_revenue_charts():
 
 
 
-            
+            return jsonify({'error': 'Role must be admin or user'}), 400
 
 
 
@@ -20575,7 +17272,7 @@ def get_revenue_charts():
 
 
 
-            amount = float(delivery.amount) if delivery.amount else 0.0
+        
 
 
 
@@ -20583,7 +17280,7 @@ def get_revenue_charts():
 
 
 
-            expenses = float(delivery.expenses) if delivery.expenses else 0.0
+        # Check if username is taken by another user
 
 
 
@@ -20591,7 +17288,7 @@ def get_revenue_charts():
 
 
 
-            
+        existing_user = User.query.filter(User.username == username, User.id != user_id).first()
 
 
 
@@ -20599,7 +17296,7 @@ def get_revenue_charts():
 
 
 
-            daily_revenue[date_key] = daily_revenue.get(date_key, 0) + amount
+        if existing_user:
 
 
 
@@ -20607,7 +17304,7 @@ def get_revenue_charts():
 
 
 
-            daily_expenses[date_key] = daily_expenses.get(date_key, 0) + expenses
+            return jsonify({'error': 'Username already exists'}), 400
 
 
 
@@ -20623,7 +17320,7 @@ def get_revenue_charts():
 
 
 
-        # Prepare data for Chart.js
+        # Update user
 
 
 
@@ -20631,7 +17328,7 @@ def get_revenue_charts():
 
 
 
-        dates = sorted(daily_revenue.keys())
+        user.username = username
 
 
 
@@ -20639,7 +17336,7 @@ def get_revenue_charts():
 
 
 
-        revenue_data = [daily_revenue[date] for date in dates]
+        user.role = role
 
 
 
@@ -20647,7 +17344,7 @@ def get_revenue_charts():
 
 
 
-        expenses_data = [daily_expenses[date] for date in dates]
+        if password:  # Only update password if provided
 
 
 
@@ -20655,7 +17352,7 @@ def get_revenue_charts():
 
 
 
-        
+            user.set_password(password)
 
 
 
@@ -20663,7 +17360,7 @@ def get_revenue_charts():
 
 
 
-        # Calculate totals
+        
 
 
 
@@ -20671,7 +17368,7 @@ def get_revenue_charts():
 
 
 
-        total_revenue = sum(revenue_data)
+        db.session.commit()
 
 
 
@@ -20679,7 +17376,7 @@ def get_revenue_charts():
 
 
 
-        total_expenses = sum(expenses_data)
+        
 
 
 
@@ -20687,7 +17384,7 @@ def get_revenue_charts():
 
 
 
-        
+        return jsonify({
 
 
 
@@ -20695,7 +17392,7 @@ def get_revenue_charts():
 
 
 
-        return jsonify({
+            'success': True, 
 
 
 
@@ -20703,7 +17400,7 @@ def get_revenue_charts():
 
 
 
-            'line_chart': {
+            'message': 'User updated successfully',
 
 
 
@@ -20711,7 +17408,7 @@ def get_revenue_charts():
 
 
 
-                'labels': [datetime.strptime(date, '%Y-%m-%d').strftime('%b %d') for date in dates],
+            'user': {
 
 
 
@@ -20719,7 +17416,7 @@ def get_revenue_charts():
 
 
 
-                'datasets': [
+                'id': user.id,
 
 
 
@@ -20727,7 +17424,7 @@ def get_revenue_charts():
 
 
 
-                    {
+                'username': user.username,
 
 
 
@@ -20735,7 +17432,7 @@ def get_revenue_charts():
 
 
 
-                        'label': 'Revenue',
+                'role': user.role,
 
 
 
@@ -20743,7 +17440,7 @@ def get_revenue_charts():
 
 
 
-                        'data': revenue_data,
+                'created_at': user.created_at.strftime('%Y-%m-%d %H:%M') if user.created_at else None
 
 
 
@@ -20751,7 +17448,7 @@ def get_revenue_charts():
 
 
 
-                        'borderColor': '#10b981',
+            }
 
 
 
@@ -20759,7 +17456,7 @@ def get_revenue_charts():
 
 
 
-                        'backgroundColor': 'rgba(16, 185, 129, 0.1)',
+        })
 
 
 
@@ -20767,7 +17464,7 @@ def get_revenue_charts():
 
 
 
-                        'tension': 0.3,
+    except Exception as e:
 
 
 
@@ -20775,7 +17472,7 @@ def get_revenue_charts():
 
 
 
-                        'borderWidth': 2,
+        db.session.rollback()
 
 
 
@@ -20783,7 +17480,7 @@ def get_revenue_charts():
 
 
 
-                        'pointRadius': 3,
+        app.logger.error(f"Error updating user: {str(e)}")
 
 
 
@@ -20791,7 +17488,7 @@ def get_revenue_charts():
 
 
 
-                        'pointHoverRadius': 5
+        return jsonify({'error': 'Failed to update user'}), 500
 
 
 
@@ -20799,7 +17496,6 @@ def get_revenue_charts():
 
 
 
-                    },
 
 
 
@@ -20807,175 +17503,177 @@ def get_revenue_charts():
 
 
 
-                    {
 
+@app.route('/delete_user/<int:user_id>', methods=['DELETE'])
 
 
 
 
 
 
-                        'label': 'Expenses',
 
+@admin_required_api
 
 
 
 
 
 
-                        'data': expenses_data,
 
+@database_required
 
 
 
 
 
 
-                        'borderColor': '#ef4444',
 
+def delete_user(user_id):
 
 
 
 
 
 
-                        'backgroundColor': 'rgba(239, 68, 68, 0.1)',
 
+    """Delete a user."""
 
 
 
 
 
 
-                        'tension': 0.3,
 
+    try:
 
 
 
 
 
 
-                        'borderWidth': 2,
 
+        user = User.query.get_or_404(user_id)
 
 
 
 
 
 
-                        'pointRadius': 3,
 
+        
 
 
 
 
 
 
-                        'pointHoverRadius': 5
 
+        # Prevent deleting the main admin
 
 
 
 
 
 
-                    }
 
+        if user.username == 'Admin':
 
 
 
 
 
 
-                ]
 
+            return jsonify({'error': 'Cannot delete admin user'}), 403
 
+        if user.role == SYSTEM_ROLE:
+            return jsonify({'error': 'Cannot delete the system account'}), 403
 
 
 
 
 
-            },
 
 
+        
 
 
 
 
 
-            'summary': {
 
 
+        # Soft delete by deactivating
 
 
 
 
 
-                'total_revenue': round(total_revenue, 2),
 
 
+        user.is_active = False
 
 
 
 
 
-                'total_expenses': round(total_expenses, 2)
 
 
+        db.session.commit()
 
 
 
 
 
-            }
 
 
+        
 
 
 
 
 
-        })
 
 
+        return jsonify({'success': True, 'message': 'User deleted successfully'})
 
 
 
 
 
-        
 
 
+    except Exception as e:
 
 
 
 
 
-    except Exception as e:
 
 
+        db.session.rollback()
 
 
 
 
 
-        app.logger.error(f"Error getting revenue charts: {str(e)}")
 
 
+        app.logger.error(f"Error deleting user: {str(e)}")
 
 
 
 
 
-        # Return empty data structure with zeros to prevent JavaScript errors
 
 
+        return jsonify({'error': 'Failed to delete user'}), 500
+
 
 
 
 
 
-        return jsonify({
 
 
 
@@ -20983,96 +17681,97 @@ def get_revenue_charts():
 
 
 
-            'line_chart': {
 
 
+@app.route('/get_delivery_trends')
 
 
 
 
 
-                'labels': [],
 
 
+@login_required
 
 
 
 
 
-                'datasets': []
 
 
+@database_required
+
 
 
 
 
 
-            },
 
+@coalesced(fresh=120, stale=900)
 
 
 
 
 
 
-            'summary': {
 
+def get_delivery_trends():
 
 
 
 
 
 
-                'total_revenue': 0,
 
+    """Get delivery trends data for charts."""
 
 
 
 
 
 
-                'total_expenses': 0,
 
+    try:
 
 
 
 
 
 
-                'total_profit': 0,
 
+        # Get date range from query params (default to last 30 days)
 
 
 
 
 
 
-                'profit_margin': 0
 
+        days = request.args.get('days', 30, type=int)
 
 
 
 
 
 
-            },
 
+        end_date = get_current_time()
 
 
 
 
 
 
-            'error': 'Failed to load revenue charts'
 
+        start_date = end_date - timedelta(days=days)
 
 
 
 
 
 
-        }), 500
 
+        
 
 
 
@@ -21080,6 +17779,7 @@ def get_revenue_charts():
 
 
 
+        # Get deliveries within date range
 
 
 
@@ -21087,7 +17787,7 @@ def get_revenue_charts():
 
 
 
-@app.route('/get_revenue_analytics')
+        deliveries = Delivery.query.filter(
 
 
 
@@ -21095,7 +17795,7 @@ def get_revenue_charts():
 
 
 
-@login_required_api
+            Delivery.created_at >= start_date,
 
 
 
@@ -21103,7 +17803,7 @@ def get_revenue_charts():
 
 
 
-@database_required
+            Delivery.created_at <= end_date
 
 
 
@@ -21111,7 +17811,7 @@ def get_revenue_charts():
 
 
 
-def get_revenue_analytics():
+        ).order_by(Delivery.created_at).all()
 
 
 
@@ -21119,7 +17819,7 @@ def get_revenue_analytics():
 
 
 
-    """Get revenue analytics data with real-time updates."""
+        
 
 
 
@@ -21127,7 +17827,7 @@ def get_revenue_analytics():
 
 
 
-    try:
+        # Group by date and status
 
 
 
@@ -21135,7 +17835,7 @@ def get_revenue_analytics():
 
 
 
-        # Get period from query params (daily, weekly, monthly)
+        daily_data = {}
 
 
 
@@ -21143,7 +17843,7 @@ def get_revenue_analytics():
 
 
 
-        period = request.args.get('period', 'daily')
+        
 
 
 
@@ -21151,7 +17851,7 @@ def get_revenue_analytics():
 
 
 
-        
+        for delivery in deliveries:
 
 
 
@@ -21159,7 +17859,7 @@ def get_revenue_analytics():
 
 
 
-        # Calculate date ranges based on period
+            date_key = delivery.created_at.strftime('%Y-%m-%d')
 
 
 
@@ -21167,7 +17867,7 @@ def get_revenue_analytics():
 
 
 
-        end_date = get_current_time()
+            
 
 
 
@@ -21175,7 +17875,7 @@ def get_revenue_analytics():
 
 
 
-        
+            if date_key not in daily_data:
 
 
 
@@ -21183,7 +17883,7 @@ def get_revenue_analytics():
 
 
 
-        if period == 'daily':
+                daily_data[date_key] = {'Pending': 0, 'In Transit': 0, 'Delivered': 0}
 
 
 
@@ -21191,7 +17891,7 @@ def get_revenue_analytics():
 
 
 
-            start_date = end_date - timedelta(days=7)
+            
 
 
 
@@ -21199,7 +17899,7 @@ def get_revenue_analytics():
 
 
 
-            period_days = 7
+            daily_data[date_key][delivery.status] = daily_data[date_key].get(delivery.status, 0) + 1
 
 
 
@@ -21207,7 +17907,7 @@ def get_revenue_analytics():
 
 
 
-        elif period == 'weekly':
+        
 
 
 
@@ -21215,7 +17915,7 @@ def get_revenue_analytics():
 
 
 
-            start_date = end_date - timedelta(weeks=5)
+        # Prepare data for Chart.js
 
 
 
@@ -21223,7 +17923,7 @@ def get_revenue_analytics():
 
 
 
-            period_days = 35
+        dates = sorted(daily_data.keys())
 
 
 
@@ -21231,7 +17931,7 @@ def get_revenue_analytics():
 
 
 
-        else:  # monthly
+        pending_counts = [daily_data[date].get('Pending', 0) for date in dates]
 
 
 
@@ -21239,7 +17939,7 @@ def get_revenue_analytics():
 
 
 
-            start_date = end_date - timedelta(days=365)
+        in_transit_counts = [daily_data[date].get('In Transit', 0) for date in dates]
 
 
 
@@ -21247,7 +17947,7 @@ def get_revenue_analytics():
 
 
 
-            period_days = 365
+        delivered_counts = [daily_data[date].get('Delivered', 0) for date in dates]
 
 
 
@@ -21263,7 +17963,7 @@ def get_revenue_analytics():
 
 
 
-        # Get deliveries within date range
+        return jsonify({
 
 
 
@@ -21271,7 +17971,7 @@ def get_revenue_analytics():
 
 
 
-        deliveries = Delivery.query.filter(
+            'labels': [datetime.strptime(date, '%Y-%m-%d').strftime('%b %d') for date in dates],
 
 
 
@@ -21279,7 +17979,7 @@ def get_revenue_analytics():
 
 
 
-            Delivery.created_at >= start_date,
+            'datasets': [
 
 
 
@@ -21287,7 +17987,7 @@ def get_revenue_analytics():
 
 
 
-            Delivery.created_at <= end_date
+                {
 
 
 
@@ -21295,7 +17995,7 @@ def get_revenue_analytics():
 
 
 
-        ).order_by(Delivery.created_at).all()
+                    'label': 'Pending',
 
 
 
@@ -21303,7 +18003,7 @@ def get_revenue_analytics():
 
 
 
-        
+                    'data': pending_counts,
 
 
 
@@ -21311,7 +18011,7 @@ def get_revenue_analytics():
 
 
 
-        # Group by date
+                    'borderColor': '#f59e0b',
 
 
 
@@ -21319,7 +18019,7 @@ def get_revenue_analytics():
 
 
 
-        daily_data = {}
+                    'backgroundColor': 'rgba(245, 158, 11, 0.1)',
 
 
 
@@ -21327,7 +18027,7 @@ def get_revenue_analytics():
 
 
 
-        for delivery in deliveries:
+                    'tension': 0.3,
 
 
 
@@ -21335,7 +18035,7 @@ def get_revenue_analytics():
 
 
 
-            date_key = delivery.created_at.strftime('%Y-%m-%d')
+                    'borderWidth': 2,
 
 
 
@@ -21343,7 +18043,7 @@ def get_revenue_analytics():
 
 
 
-            amount = float(delivery.amount) if delivery.amount else 0.0
+                    'pointRadius': 3,
 
 
 
@@ -21351,7 +18051,7 @@ def get_revenue_analytics():
 
 
 
-            
+                    'pointHoverRadius': 5
 
 
 
@@ -21359,7 +18059,7 @@ def get_revenue_analytics():
 
 
 
-            if date_key not in daily_data:
+                },
 
 
 
@@ -21367,7 +18067,7 @@ def get_revenue_analytics():
 
 
 
-                daily_data[date_key] = {'revenue': 0.0, 'count': 0, 'costs': 0.0}
+                {
 
 
 
@@ -21375,7 +18075,7 @@ def get_revenue_analytics():
 
 
 
-            daily_data[date_key]['revenue'] += float(amount)  # Use actual delivery amount as revenue
+                    'label': 'In Transit',
 
 
 
@@ -21383,7 +18083,7 @@ def get_revenue_analytics():
 
 
 
-            daily_data[date_key]['costs'] += 0  # No operational costs by default
+                    'data': in_transit_counts,
 
 
 
@@ -21391,7 +18091,7 @@ def get_revenue_analytics():
 
 
 
-            daily_data[date_key]['count'] += 1
+                    'borderColor': '#3b82f6',
 
 
 
@@ -21399,7 +18099,7 @@ def get_revenue_analytics():
 
 
 
-        
+                    'backgroundColor': 'rgba(59, 130, 246, 0.1)',
 
 
 
@@ -21407,7 +18107,7 @@ def get_revenue_analytics():
 
 
 
-        # Process data based on period
+                    'tension': 0.3,
 
 
 
@@ -21415,7 +18115,7 @@ def get_revenue_analytics():
 
 
 
-        if period == 'daily':
+                    'borderWidth': 2,
 
 
 
@@ -21423,7 +18123,7 @@ def get_revenue_analytics():
 
 
 
-            labels, revenue_data = process_daily_data(daily_data, period_days)
+                    'pointRadius': 3,
 
 
 
@@ -21431,7 +18131,7 @@ def get_revenue_analytics():
 
 
 
-        elif period == 'weekly':
+                    'pointHoverRadius': 5
 
 
 
@@ -21439,7 +18139,7 @@ def get_revenue_analytics():
 
 
 
-            labels, revenue_data = process_weekly_data(daily_data, period_days)
+                },
 
 
 
@@ -21447,7 +18147,7 @@ def get_revenue_analytics():
 
 
 
-        else:  # monthly
+                {
 
 
 
@@ -21455,7 +18155,7 @@ def get_revenue_analytics():
 
 
 
-            labels, revenue_data = process_monthly_data(daily_data, period_days)
+                    'label': 'Delivered',
 
 
 
@@ -21463,7 +18163,7 @@ def get_revenue_analytics():
 
 
 
-        
+                    'data': delivered_counts,
 
 
 
@@ -21471,7 +18171,7 @@ def get_revenue_analytics():
 
 
 
-        # Calculate metrics
+                    'borderColor': '#10b981',
 
 
 
@@ -21479,7 +18179,7 @@ def get_revenue_analytics():
 
 
 
-        total_revenue = sum(revenue_data)
+                    'backgroundColor': 'rgba(16, 185, 129, 0.1)',
 
 
 
@@ -21487,7 +18187,7 @@ def get_revenue_analytics():
 
 
 
-        avg_daily = total_revenue / len(revenue_data) if revenue_data else 0
+                    'tension': 0.3,
 
 
 
@@ -21495,7 +18195,7 @@ def get_revenue_analytics():
 
 
 
-        peak_revenue = max(revenue_data) if revenue_data else 0
+                    'borderWidth': 2,
 
 
 
@@ -21503,7 +18203,7 @@ def get_revenue_analytics():
 
 
 
-        peak_index = revenue_data.index(peak_revenue) if revenue_data else 0
+                    'pointRadius': 3,
 
 
 
@@ -21511,7 +18211,7 @@ def get_revenue_analytics():
 
 
 
-        peak_label = labels[peak_index] if labels else 'N/A'
+                    'pointHoverRadius': 5
 
 
 
@@ -21519,7 +18219,7 @@ def get_revenue_analytics():
 
 
 
-        
+                }
 
 
 
@@ -21527,7 +18227,7 @@ def get_revenue_analytics():
 
 
 
-        # Calculate growth rate
+            ]
 
 
 
@@ -21535,7 +18235,7 @@ def get_revenue_analytics():
 
 
 
-        growth_rate = calculate_growth_rate(revenue_data)
+        })
 
 
 
@@ -21551,7 +18251,7 @@ def get_revenue_analytics():
 
 
 
-        # Generate target data (80% of average, minimum values)
+    except Exception as e:
 
 
 
@@ -21559,7 +18259,7 @@ def get_revenue_analytics():
 
 
 
-        avg_target = max(avg_daily * 0.8, 500 if period == 'daily' else 2000 if period == 'weekly' else 6000)
+        app.logger.error(f"Error getting delivery trends: {str(e)}")
 
 
 
@@ -21567,7 +18267,7 @@ def get_revenue_analytics():
 
 
 
-        target_data = [avg_target] * len(revenue_data)
+        return jsonify({'error': 'Failed to load delivery trends'}), 500
 
 
 
@@ -21575,7 +18275,6 @@ def get_revenue_analytics():
 
 
 
-        
 
 
 
@@ -21583,176 +18282,176 @@ def get_revenue_analytics():
 
 
 
-        return jsonify({
 
+@app.route('/get_revenue_charts')
 
 
 
 
 
 
-            'period': period,
 
+@login_required
 
 
 
 
 
 
-            'date_range': {
 
+@database_required
 
 
 
 
 
 
-                'start': start_date.strftime('%Y-%m-%d'),
 
+@coalesced(fresh=60, stale=600)
 
 
 
 
 
 
-                'end': end_date.strftime('%Y-%m-%d'),
 
+def get_revenue_charts():
 
 
 
 
 
 
-                'description': get_period_description(period)
 
+    """Get revenue data for charts."""
 
 
 
 
 
 
-            },
 
+    try:
 
 
 
 
 
 
-            'labels': labels,
 
+        # Check if user is authenticated
 
 
 
 
 
 
-            'revenue': revenue_data,
 
+        if 'user_id' not in session:
 
 
 
 
 
 
-            'target': target_data,
 
+            app.logger.warning("Unauthorized access attempt to get_revenue_charts")
 
 
 
 
 
 
-            'metrics': {
 
+            return jsonify({
 
 
 
 
 
 
-                'total_revenue': total_revenue,
 
+                'line_chart': {'labels': [], 'datasets': []},
 
 
 
 
 
 
-                'avg_daily': avg_daily,
 
+                'summary': {
 
 
 
 
 
 
-                'peak_revenue': peak_revenue,
 
+                    'total_revenue': 0,
 
 
 
 
 
 
-                'peak_label': peak_label,
 
+                    'total_expenses': 0,
 
 
 
 
 
 
-                'growth_rate': growth_rate
 
+                    'total_profit': 0,
 
 
 
 
 
 
-            }
 
+                    'profit_margin': 0
 
 
 
 
 
 
-        })
 
+                },
 
 
 
 
 
 
-        
 
+                'error': 'Authentication required'
 
 
 
 
 
 
-    except Exception as e:
 
+            }), 401
 
 
 
 
 
 
-        app.logger.error(f"Error getting revenue analytics: {str(e)}")
 
+        
 
 
 
 
 
 
-        return jsonify({'error': 'Failed to load revenue analytics'}), 500
 
+        # Get date range from query params (default to last 30 days)
 
 
 
@@ -21760,6 +18459,7 @@ def get_revenue_analytics():
 
 
 
+        days = request.args.get('days', 30, type=int)
 
 
 
@@ -21767,7 +18467,7 @@ def get_revenue_analytics():
 
 
 
-def process_daily_data(daily_data, days):
+        end_date = get_current_time()
 
 
 
@@ -21775,7 +18475,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    """Process daily data for revenue analytics."""
+        start_date = end_date - timedelta(days=days)
 
 
 
@@ -21783,7 +18483,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    labels = []
+        
 
 
 
@@ -21791,7 +18491,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    revenue = []
+        # Get deliveries within date range
 
 
 
@@ -21799,7 +18499,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    
+        deliveries = Delivery.query.filter(
 
 
 
@@ -21807,7 +18507,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    for i in range(days):
+            Delivery.created_at >= start_date,
 
 
 
@@ -21815,7 +18515,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        date = get_current_time() - timedelta(days=days-1-i)
+            Delivery.created_at <= end_date
 
 
 
@@ -21823,7 +18523,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        date_key = date.strftime('%Y-%m-%d')
+        ).order_by(Delivery.created_at).all()
 
 
 
@@ -21839,7 +18539,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        # Format label as day name
+        # Group by date
 
 
 
@@ -21847,7 +18547,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        label = date.strftime('%a')
+        daily_revenue = {}
 
 
 
@@ -21855,7 +18555,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        if i == 0 or i == days - 1:
+        daily_expenses = {}
 
 
 
@@ -21863,7 +18563,7 @@ def process_daily_data(daily_data, days):
 
 
 
-            label = date.strftime('%b %d')  # Show date for first and last
+        
 
 
 
@@ -21871,7 +18571,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        
+        for delivery in deliveries:
 
 
 
@@ -21879,7 +18579,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        labels.append(label)
+            date_key = delivery.created_at.strftime('%Y-%m-%d')
 
 
 
@@ -21887,7 +18587,7 @@ def process_daily_data(daily_data, days):
 
 
 
-        revenue.append(daily_data.get(date_key, {}).get('revenue', 0.0))
+            
 
 
 
@@ -21895,7 +18595,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    
+            amount = float(delivery.amount) if delivery.amount else 0.0
 
 
 
@@ -21903,7 +18603,7 @@ def process_daily_data(daily_data, days):
 
 
 
-    return labels, revenue
+            expenses = float(delivery.expenses) if delivery.expenses else 0.0
 
 
 
@@ -21911,6 +18611,7 @@ def process_daily_data(daily_data, days):
 
 
 
+            
 
 
 
@@ -21918,250 +18619,255 @@ def process_daily_data(daily_data, days):
 
 
 
+            daily_revenue[date_key] = daily_revenue.get(date_key, 0) + amount
 
-def process_weekly_data(daily_data, days):
 
 
 
 
 
 
+            daily_expenses[date_key] = daily_expenses.get(date_key, 0) + expenses
 
-    """Process weekly data for revenue analytics."""
 
 
 
 
 
 
+        
 
-    labels = ['Week 1', 'Week 2', 'Week 3', 'Week 4', 'Week 5']
 
 
 
 
 
 
+        # Prepare data for Chart.js
 
-    revenue = [0.0] * 5
 
 
 
 
 
 
+        dates = sorted(daily_revenue.keys())
 
-    
 
 
 
 
 
 
+        revenue_data = [daily_revenue[date] for date in dates]
 
-    for date_key, data in daily_data.items():
 
 
 
 
 
 
+        expenses_data = [daily_expenses[date] for date in dates]
 
-        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
 
 
 
 
 
 
+        
 
-        days_ago = (get_current_time() - date_obj).days
 
 
 
 
 
 
+        # Calculate totals
 
-        
 
 
 
 
 
 
+        total_revenue = sum(revenue_data)
 
-        if days_ago < 35:  # Within 5 weeks
 
 
 
 
 
 
+        total_expenses = sum(expenses_data)
 
-            week_num = min(days_ago // 7, 4)
 
 
 
 
 
 
+        
 
-            revenue[4 - week_num] += data['revenue']  # Reverse order for chronological
 
 
 
 
 
 
+        return jsonify({
 
-    
 
 
 
 
 
 
+            'line_chart': {
 
-    return labels, revenue
 
 
 
 
 
 
+                'labels': [datetime.strptime(date, '%Y-%m-%d').strftime('%b %d') for date in dates],
+
 
 
 
 
 
 
+                'datasets': [
 
 
 
-def process_monthly_data(daily_data, days):
 
 
 
 
+                    {
 
 
 
-    """Process monthly data for revenue analytics."""
 
 
 
 
+                        'label': 'Revenue',
 
 
 
-    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
 
 
 
 
+                        'data': revenue_data,
+
+
 
 
 
-                   'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
 
+                        'borderColor': '#10b981',
 
 
 
 
 
-    labels = month_names
 
 
+                        'backgroundColor': 'rgba(16, 185, 129, 0.1)',
 
 
 
 
 
-    revenue = [0.0] * 12
 
 
+                        'tension': 0.3,
 
 
 
 
 
-    
 
 
+                        'borderWidth': 2,
 
 
 
 
 
-    for date_key, data in daily_data.items():
 
 
+                        'pointRadius': 3,
 
 
 
 
 
-        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
 
 
+                        'pointHoverRadius': 5
 
 
 
 
 
-        month_num = date_obj.month - 1  # 0-indexed
 
 
+                    },
 
 
 
 
 
-        
 
 
+                    {
 
 
 
 
 
-        # Only include data from the last 12 months
 
 
+                        'label': 'Expenses',
 
 
 
 
 
-        if (get_current_time() - date_obj).days < 365:
 
 
+                        'data': expenses_data,
 
 
 
 
 
-            revenue[month_num] += data['revenue']
 
 
+                        'borderColor': '#ef4444',
 
 
 
 
 
-    
 
 
+                        'backgroundColor': 'rgba(239, 68, 68, 0.1)',
 
 
 
 
 
-    return labels, revenue
 
 
+                        'tension': 0.3,
 
 
 
@@ -22169,118 +18875,119 @@ def process_monthly_data(daily_data, days):
 
 
 
+                        'borderWidth': 2,
 
 
 
 
 
 
-def calculate_growth_rate(revenue_data):
 
+                        'pointRadius': 3,
 
 
 
 
 
 
-    """Calculate growth rate from first to last period."""
 
+                        'pointHoverRadius': 5
 
 
 
 
 
 
-    if len(revenue_data) < 2:
 
+                    }
 
 
 
 
 
 
-        return '+0.0%'
 
+                ]
 
 
 
 
 
 
-    
 
+            },
 
 
 
 
 
 
-    first = revenue_data[0]
 
+            'summary': {
 
 
 
 
 
 
-    last = revenue_data[-1]
 
+                'total_revenue': round(total_revenue, 2),
 
 
 
 
 
 
-    
 
+                'total_expenses': round(total_expenses, 2)
 
 
 
 
 
 
-    if first == 0:
 
+            }
 
 
 
 
 
 
-        return '+100.0%' if last > 0 else '+0.0%'
 
+        })
 
 
 
 
 
 
-    
 
+        
 
 
 
 
 
 
-    growth = ((last - first) / first) * 100
 
+    except Exception as e:
 
 
 
 
 
 
-    sign = '+' if growth >= 0 else ''
 
+        app.logger.error(f"Error getting revenue charts: {str(e)}")
 
 
 
 
 
 
-    return f'{sign}{growth:.1f}%'
 
+        # Return empty data structure with zeros to prevent JavaScript errors
 
 
 
@@ -22288,6 +18995,7 @@ def calculate_growth_rate(revenue_data):
 
 
 
+        return jsonify({
 
 
 
@@ -22295,7 +19003,7 @@ def calculate_growth_rate(revenue_data):
 
 
 
-def get_period_description(period):
+            'line_chart': {
 
 
 
@@ -22303,7 +19011,7 @@ def get_period_description(period):
 
 
 
-    """Get human-readable period description."""
+                'labels': [],
 
 
 
@@ -22311,7 +19019,7 @@ def get_period_description(period):
 
 
 
-    descriptions = {
+                'datasets': []
 
 
 
@@ -22319,7 +19027,7 @@ def get_period_description(period):
 
 
 
-        'daily': 'Last 7 days',
+            },
 
 
 
@@ -22327,7 +19035,7 @@ def get_period_description(period):
 
 
 
-        'weekly': 'Last 5 weeks',
+            'summary': {
 
 
 
@@ -22335,7 +19043,7 @@ def get_period_description(period):
 
 
 
-        'monthly': 'Last 12 months'
+                'total_revenue': 0,
 
 
 
@@ -22343,7 +19051,7 @@ def get_period_description(period):
 
 
 
-    }
+                'total_expenses': 0,
 
 
 
@@ -22351,7 +19059,7 @@ def get_period_description(period):
 
 
 
-    return descriptions.get(period, 'Last 7 days')
+                'total_profit': 0,
 
 
 
@@ -22359,6 +19067,7 @@ def get_period_description(period):
 
 
 
+                'profit_margin': 0
 
 
 
@@ -22366,24 +19075,24 @@ def get_period_description(period):
 
 
 
+            },
 
-@app.route('/system_health')
 
 
 
 
 
 
+            'error': 'Failed to load revenue charts'
 
-@admin_required
 
 
 
 
 
 
+        }), 500
 
-def system_health():
 
 
 
@@ -22391,7 +19100,6 @@ def system_health():
 
 
 
-    """System health monitoring page (admin only)."""
 
 
 
@@ -22399,7 +19107,7 @@ def system_health():
 
 
 
-    return render_template('system_health.html')
+@app.route('/get_revenue_analytics')
 
 
 
@@ -22407,7 +19115,7 @@ def system_health():
 
 
 
-@login_required
+@login_required_api
 
 
 
@@ -22415,7 +19123,7 @@ def system_health():
 
 
 
-def get_system_health():
+@database_required
 
 
 
@@ -22423,7 +19131,7 @@ def get_system_health():
 
 
 
-    """Get system health and performance metrics."""
+@coalesced(fresh=30, stale=300)
 
 
 
@@ -22431,7 +19139,7 @@ def get_system_health():
 
 
 
-    try:
+def get_revenue_analytics():
 
 
 
@@ -22439,7 +19147,7 @@ def get_system_health():
 
 
 
-        # Try to import psutil, provide fallback if not available
+    """Get revenue analytics data with real-time updates."""
 
 
 
@@ -22447,7 +19155,7 @@ def get_system_health():
 
 
 
-        try:
+    try:
 
 
 
@@ -22455,7 +19163,7 @@ def get_system_health():
 
 
 
-            import psutil
+        # Get period from query params (daily, weekly, monthly)
 
 
 
@@ -22463,7 +19171,7 @@ def get_system_health():
 
 
 
-            psutil_available = True
+        period = request.args.get('period', 'daily')
 
 
 
@@ -22471,7 +19179,7 @@ def get_system_health():
 
 
 
-        except ImportError:
+        
 
 
 
@@ -22479,7 +19187,7 @@ def get_system_health():
 
 
 
-            psutil_available = False
+        # Calculate date ranges based on period
 
 
 
@@ -22487,7 +19195,7 @@ def get_system_health():
 
 
 
-            app.logger.warning("psutil not available - using fallback data")
+        end_date = get_current_time()
 
 
 
@@ -22503,7 +19211,7 @@ def get_system_health():
 
 
 
-        # Get system information (always available)
+        if period == 'daily':
 
 
 
@@ -22511,7 +19219,7 @@ def get_system_health():
 
 
 
-        system_info = {
+            start_date = end_date - timedelta(days=7)
 
 
 
@@ -22519,7 +19227,7 @@ def get_system_health():
 
 
 
-            'platform': platform.system(),
+            period_days = 7
 
 
 
@@ -22527,7 +19235,7 @@ def get_system_health():
 
 
 
-            'platform_release': platform.release(),
+        elif period == 'weekly':
 
 
 
@@ -22535,7 +19243,7 @@ def get_system_health():
 
 
 
-            'platform_version': platform.version(),
+            start_date = end_date - timedelta(weeks=5)
 
 
 
@@ -22543,7 +19251,7 @@ def get_system_health():
 
 
 
-            'architecture': platform.machine(),
+            period_days = 35
 
 
 
@@ -22551,7 +19259,7 @@ def get_system_health():
 
 
 
-            'hostname': platform.node(),
+        else:  # monthly
 
 
 
@@ -22559,7 +19267,7 @@ def get_system_health():
 
 
 
-            'processor': platform.processor(),
+            start_date = end_date - timedelta(days=365)
 
 
 
@@ -22567,7 +19275,7 @@ def get_system_health():
 
 
 
-        }
+            period_days = 365
 
 
 
@@ -22583,7 +19291,7 @@ def get_system_health():
 
 
 
-        if psutil_available:
+        # Get deliveries within date range
 
 
 
@@ -22591,7 +19299,7 @@ def get_system_health():
 
 
 
-            # Get real system metrics
+        deliveries = Delivery.query.filter(
 
 
 
@@ -22599,479 +19307,481 @@ def get_system_health():
 
 
 
-            try:
+            Delivery.created_at >= start_date,
+
 
 
 
 
 
 
+            Delivery.created_at <= end_date
+
 
-                # Get CPU usage
 
 
 
 
 
+        ).order_by(Delivery.created_at).all()
 
 
-                cpu_usage = psutil.cpu_percent(interval=0.1)
 
 
 
 
 
+        
 
 
-                cpu_count = psutil.cpu_count()
 
 
 
 
 
+        # Group by date
 
 
-                cpu_freq = psutil.cpu_freq()
 
 
 
 
 
+        daily_data = {}
 
 
-                
 
 
 
 
 
+        for delivery in deliveries:
 
 
-                # Get memory usage
 
 
 
 
 
+            date_key = delivery.created_at.strftime('%Y-%m-%d')
 
 
-                memory = psutil.virtual_memory()
 
 
 
 
 
+            amount = float(delivery.amount) if delivery.amount else 0.0
 
 
-                memory_usage = memory.percent
 
 
 
 
 
+            
 
 
-                memory_total = memory.total
 
 
 
 
 
+            if date_key not in daily_data:
 
 
-                memory_available = memory.available
 
 
 
 
 
+                daily_data[date_key] = {'revenue': 0.0, 'count': 0, 'costs': 0.0}
 
 
-                memory_used = memory.used
 
 
 
 
 
+            daily_data[date_key]['revenue'] += float(amount)  # Use actual delivery amount as revenue
 
 
-                
 
 
 
 
 
+            daily_data[date_key]['costs'] += 0  # No operational costs by default
 
 
-                # Get disk usage
 
 
 
 
 
+            daily_data[date_key]['count'] += 1
 
 
-                disk = psutil.disk_usage('/')
 
 
 
 
 
+        
 
 
-                disk_usage = disk.percent
 
 
 
 
 
+        # Process data based on period
 
 
-                disk_total = disk.total
 
 
 
 
 
+        if period == 'daily':
 
 
-                disk_free = disk.free
 
 
 
 
 
+            labels, revenue_data = process_daily_data(daily_data, period_days)
 
 
-                disk_used = disk.used
 
 
 
 
 
+        elif period == 'weekly':
 
 
-                
 
 
 
 
 
+            labels, revenue_data = process_weekly_data(daily_data, period_days)
 
 
-                # Get network stats
 
 
 
 
 
+        else:  # monthly
 
 
-                network = psutil.net_io_counters()
 
 
 
 
 
+            labels, revenue_data = process_monthly_data(daily_data, period_days)
 
 
-                bytes_sent = network.bytes_sent if network else 0
 
 
 
 
 
+        
 
 
-                bytes_recv = network.bytes_recv if network else 0
 
 
 
 
 
+        # Calculate metrics
 
 
-                
 
 
 
 
 
+        total_revenue = sum(revenue_data)
 
 
-                # Get process information
 
 
 
 
 
+        avg_daily = total_revenue / len(revenue_data) if revenue_data else 0
 
 
-                process_count = len(psutil.pids())
 
 
 
 
 
+        peak_revenue = max(revenue_data) if revenue_data else 0
 
 
-                current_process = psutil.Process()
 
 
 
 
 
+        peak_index = revenue_data.index(peak_revenue) if revenue_data else 0
 
 
-                process_memory = current_process.memory_info()
 
 
 
 
 
+        peak_label = labels[peak_index] if labels else 'N/A'
 
 
-                process_cpu = current_process.cpu_percent()
 
 
 
 
 
+        
 
 
-                
 
 
 
 
 
+        # Calculate growth rate
 
 
-            except Exception as psutil_error:
 
 
 
 
 
+        growth_rate = calculate_growth_rate(revenue_data)
 
 
-                app.logger.error(f"psutil error: {str(psutil_error)}")
 
 
 
 
 
+        
 
 
-                # Fallback to mock data
 
 
 
 
 
+        # Generate target data (80% of average, minimum values)
 
 
-                cpu_usage = 25
 
 
 
 
 
+        avg_target = max(avg_daily * 0.8, 500 if period == 'daily' else 2000 if period == 'weekly' else 6000)
 
 
-                cpu_count = 4
 
 
 
 
 
+        target_data = [avg_target] * len(revenue_data)
 
 
-                cpu_freq = None
 
 
 
 
 
+        
 
 
-                memory_usage = 45
 
 
 
 
 
+        return jsonify({
 
 
-                memory_total = 8 * 1024**3  # 8GB
 
 
 
 
 
+            'period': period,
 
 
-                memory_available = memory_total * 0.55
 
 
 
 
 
+            'date_range': {
 
 
-                memory_used = memory_total * 0.45
 
 
 
 
 
+                'start': start_date.strftime('%Y-%m-%d'),
 
 
-                disk_usage = 30
 
 
 
 
 
+                'end': end_date.strftime('%Y-%m-%d'),
 
 
-                disk_total = 500 * 1024**3  # 500GB
 
 
 
 
 
+                'description': get_period_description(period)
 
 
-                disk_free = disk_total * 0.70
 
 
 
 
 
+            },
 
 
-                disk_used = disk_total * 0.30
 
 
 
 
 
+            'labels': labels,
 
 
-                bytes_sent = 1024 * 1024 * 100  # 100MB
 
 
 
 
 
+            'revenue': revenue_data,
 
 
-                bytes_recv = 1024 * 1024 * 150  # 150MB
 
 
 
 
 
+            'target': target_data,
 
 
-                process_count = 120
 
 
 
 
 
+            'metrics': {
 
 
-                process_memory = type('obj', (object,), {'rss': 1024 * 1024 * 50})()  # 50MB
 
 
 
 
 
+                'total_revenue': total_revenue,
 
 
-                process_cpu = 5.0
 
 
 
 
 
+                'avg_daily': avg_daily,
 
 
-        else:
 
 
 
 
 
+                'peak_revenue': peak_revenue,
 
 
-            # Fallback mock data when psutil is not available
 
 
 
 
 
+                'peak_label': peak_label,
 
 
-            cpu_usage = 25
 
 
 
 
 
+                'growth_rate': growth_rate
 
 
-            cpu_count = 4
 
 
 
 
 
+            }
 
 
-            cpu_freq = None
 
 
 
 
 
+        })
 
 
-            memory_usage = 45
 
 
 
 
 
+        
 
 
-            memory_total = 8 * 1024**3  # 8GB
 
 
 
 
 
+    except Exception as e:
 
 
-            memory_available = memory_total * 0.55
 
 
 
 
 
+        app.logger.error(f"Error getting revenue analytics: {str(e)}")
 
 
-            memory_used = memory_total * 0.45
 
 
 
 
 
+        return jsonify({'error': 'Failed to load revenue analytics'}), 500
 
 
-            disk_usage = 30
 
 
 
@@ -23079,151 +19789,150 @@ def get_system_health():
 
 
 
-            disk_total = 500 * 1024**3  # 500GB
 
 
 
 
 
 
+def process_daily_data(daily_data, days):
 
-            disk_free = disk_total * 0.70
 
 
 
 
 
 
+    """Process daily data for revenue analytics."""
 
-            disk_used = disk_total * 0.30
 
 
 
 
 
 
+    labels = []
 
-            bytes_sent = 1024 * 1024 * 100  # 100MB
 
 
 
 
 
 
+    revenue = []
 
-            bytes_recv = 1024 * 1024 * 150  # 150MB
 
 
 
 
 
 
+    
 
-            process_count = 120
 
 
 
 
 
 
+    for i in range(days):
 
-            process_memory = type('obj', (object,), {'rss': 1024 * 1024 * 50})()  # 50MB
 
 
 
 
 
 
+        date = get_current_time() - timedelta(days=days-1-i)
 
-            process_cpu = 5.0
 
 
 
 
 
 
+        date_key = date.strftime('%Y-%m-%d')
 
-        
 
 
 
 
 
 
+        
 
-        # Calculate system uptime (simplified - using app start time)
 
 
 
 
 
 
+        # Format label as day name
 
-        app_start_time = datetime.now() - timedelta(hours=24)  # Simulated 24 hours uptime
 
 
 
 
 
 
+        label = date.strftime('%a')
 
-        uptime = datetime.now() - app_start_time
 
 
 
 
 
 
+        if i == 0 or i == days - 1:
 
-        uptime_str = f"{uptime.days}d {uptime.seconds // 3600}h {(uptime.seconds % 3600) // 60}m"
 
 
 
 
 
 
+            label = date.strftime('%b %d')  # Show date for first and last
 
-        
 
 
 
 
 
 
+        
 
-        # Get database performance (always available)
 
 
 
 
 
 
+        labels.append(label)
 
-        db_start = datetime.now()
 
 
 
 
 
 
+        revenue.append(daily_data.get(date_key, {}).get('revenue', 0.0))
 
-        delivery_count = Delivery.query.count()
 
 
 
 
 
 
+    
 
-        db_query_time = (datetime.now() - db_start).total_seconds() * 1000
 
 
 
 
 
 
+    return labels, revenue
 
-        
 
 
 
@@ -23231,7 +19940,6 @@ def get_system_health():
 
 
 
-        return jsonify({
 
 
 
@@ -23239,7 +19947,7 @@ def get_system_health():
 
 
 
-            'system_info': system_info,
+def process_weekly_data(daily_data, days):
 
 
 
@@ -23247,7 +19955,7 @@ def get_system_health():
 
 
 
-            'performance': {
+    """Process weekly data for revenue analytics."""
 
 
 
@@ -23255,7 +19963,7 @@ def get_system_health():
 
 
 
-                'cpu': {
+    labels = ['Week 1', 'Week 2', 'Week 3', 'Week 4', 'Week 5']
 
 
 
@@ -23263,7 +19971,7 @@ def get_system_health():
 
 
 
-                    'usage_percent': cpu_usage,
+    revenue = [0.0] * 5
 
 
 
@@ -23271,7 +19979,7 @@ def get_system_health():
 
 
 
-                    'count': cpu_count,
+    
 
 
 
@@ -23279,7 +19987,7 @@ def get_system_health():
 
 
 
-                    'frequency': cpu_freq.current if cpu_freq else 0,
+    for date_key, data in daily_data.items():
 
 
 
@@ -23287,7 +19995,7 @@ def get_system_health():
 
 
 
-                    'status': 'healthy' if cpu_usage < 80 else 'warning' if cpu_usage < 95 else 'critical'
+        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
 
 
 
@@ -23295,7 +20003,7 @@ def get_system_health():
 
 
 
-                },
+        days_ago = (get_current_time() - date_obj).days
 
 
 
@@ -23303,7 +20011,7 @@ def get_system_health():
 
 
 
-                'memory': {
+        
 
 
 
@@ -23311,7 +20019,7 @@ def get_system_health():
 
 
 
-                    'usage_percent': memory_usage,
+        if days_ago < 35:  # Within 5 weeks
 
 
 
@@ -23319,7 +20027,7 @@ def get_system_health():
 
 
 
-                    'total_gb': round(memory_total / (1024**3), 2),
+            week_num = min(days_ago // 7, 4)
 
 
 
@@ -23327,7 +20035,7 @@ def get_system_health():
 
 
 
-                    'available_gb': round(memory_available / (1024**3), 2),
+            revenue[4 - week_num] += data['revenue']  # Reverse order for chronological
 
 
 
@@ -23335,7 +20043,7 @@ def get_system_health():
 
 
 
-                    'used_gb': round(memory_used / (1024**3), 2),
+    
 
 
 
@@ -23343,7 +20051,7 @@ def get_system_health():
 
 
 
-                    'status': 'healthy' if memory_usage < 80 else 'warning' if memory_usage < 95 else 'critical'
+    return labels, revenue
 
 
 
@@ -23351,7 +20059,6 @@ def get_system_health():
 
 
 
-                },
 
 
 
@@ -23359,135 +20066,134 @@ def get_system_health():
 
 
 
-                'disk': {
 
+def process_monthly_data(daily_data, days):
 
 
 
 
 
 
-                    'usage_percent': disk_usage,
 
+    """Process monthly data for revenue analytics."""
 
 
 
 
 
 
-                    'total_gb': round(disk_total / (1024**3), 2),
 
+    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
 
 
 
 
 
 
-                    'free_gb': round(disk_free / (1024**3), 2),
 
+                   'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
 
 
 
 
 
-                    'used_gb': round(disk_used / (1024**3), 2),
 
+    labels = month_names
 
 
 
 
 
 
-                    'status': 'healthy' if disk_usage < 80 else 'warning' if disk_usage < 95 else 'critical'
 
+    revenue = [0.0] * 12
 
 
 
 
 
 
-                },
 
+    
 
 
 
 
 
 
-                'network': {
 
+    for date_key, data in daily_data.items():
 
 
 
 
 
 
-                    'bytes_sent_mb': round(bytes_sent / (1024**2), 2),
 
+        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
 
 
 
 
 
 
-                    'bytes_recv_mb': round(bytes_recv / (1024**2), 2),
 
+        month_num = date_obj.month - 1  # 0-indexed
 
 
 
 
 
 
-                    'status': 'healthy'
 
+        
 
 
 
 
 
 
-                }
 
+        # Only include data from the last 12 months
 
 
 
 
 
 
-            },
 
+        if (get_current_time() - date_obj).days < 365:
 
 
 
 
 
 
-            'processes': {
 
+            revenue[month_num] += data['revenue']
 
 
 
 
 
 
-                'total_count': process_count,
 
+    
 
 
 
 
 
 
-                'current_app': {
 
+    return labels, revenue
 
 
 
 
 
 
-                    'memory_mb': round(process_memory.rss / (1024**2), 2),
 
 
 
@@ -23495,119 +20201,118 @@ def get_system_health():
 
 
 
-                    'cpu_percent': process_cpu,
 
 
+def calculate_growth_rate(revenue_data):
 
 
 
 
 
-                    'status': 'healthy'
 
 
+    """Calculate growth rate from first to last period."""
 
 
 
 
 
-                }
 
 
+    if len(revenue_data) < 2:
 
 
 
 
 
-            },
 
 
+        return '+0.0%'
 
 
 
 
 
-            'database': {
 
 
+    
 
 
 
 
 
-                'query_time_ms': round(db_query_time, 2),
 
 
+    first = revenue_data[0]
 
 
 
 
 
-                'delivery_count': delivery_count,
 
 
+    last = revenue_data[-1]
 
 
 
 
 
-                'status': 'healthy' if db_query_time < 100 else 'warning' if db_query_time < 500 else 'critical'
 
 
+    
 
 
 
 
 
-            },
 
 
+    if first == 0:
 
 
 
 
 
-            'uptime': {
 
 
+        return '+100.0%' if last > 0 else '+0.0%'
 
 
 
 
 
-                'formatted': uptime_str,
 
 
+    
 
 
 
 
 
-                'total_hours': uptime.total_seconds() / 3600,
 
 
+    growth = ((last - first) / first) * 100
 
 
 
 
 
-                'status': 'healthy'
 
 
+    sign = '+' if growth >= 0 else ''
 
 
 
 
 
-            },
 
 
+    return f'{sign}{growth:.1f}%'
 
 
 
 
 
-            'overall_status': 'healthy' if cpu_usage < 80 and memory_usage < 80 and disk_usage < 80 and db_query_time < 100 else 'warning' if cpu_usage < 95 and memory_usage < 95 and disk_usage < 95 and db_query_time < 500 else 'critical',
 
 
 
@@ -23615,71 +20320,70 @@ def get_system_health():
 
 
 
-            'timestamp': datetime.now().isoformat(),
 
 
 
+def get_period_description(period):
 
 
 
 
-            'psutil_available': psutil_available
 
 
 
+    """Get human-readable period description."""
 
 
 
 
-        })
 
 
 
+    descriptions = {
 
 
 
 
-        
 
 
 
+        'daily': 'Last 7 days',
 
 
 
 
-    except Exception as e:
 
 
 
+        'weekly': 'Last 5 weeks',
 
 
 
 
-        app.logger.error(f"Error getting system health: {str(e)}")
 
 
 
+        'monthly': 'Last 12 months'
 
 
 
 
-        # Return fallback data instead of error
 
 
 
+    }
 
 
 
 
-        return jsonify({
 
 
 
+    return descriptions.get(period, 'Last 7 days')
 
 
 
 
-            'error': 'System monitoring unavailable',
 
 
 
@@ -23687,128 +20391,259 @@ def get_system_health():
 
 
 
-            'fallback_data': {
 
 
 
 
+@app.route('/system_health')
 
 
 
-                'system_info': {
 
 
 
 
+@admin_required
 
 
 
-                    'platform': 'Unknown',
 
 
 
 
+def system_health():
 
 
 
-                    'architecture': 'Unknown',
 
 
 
 
+    """System health monitoring page (admin only)."""
 
 
 
-                    'hostname': 'Unknown'
 
 
 
 
+    return render_template('system_health.html')
 
 
 
-                },
 
 
 
 
+@app.route('/get_slow_queries')
+@admin_required_api
+def get_slow_queries():
+    """Recent slow SQL statements with their query plans (admin only)."""
+    limit = min(request.args.get('limit', 50, type=int), 100)
+    return jsonify({
+        'success': True,
+        'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+        'queries': recent_slow_queries(limit)
+    })
 
 
+@app.route('/analytics_cache', methods=['GET', 'DELETE'])
 
-                'performance': {
 
 
 
 
 
 
+@admin_required_api
 
-                    'cpu': {'usage_percent': 0, 'status': 'unknown'},
 
 
 
 
 
 
+def analytics_cache():
 
-                    'memory': {'usage_percent': 0, 'status': 'unknown'},
 
 
 
 
 
 
+    """Coalescing stats for this worker; DELETE drops its stored analytics results."""
 
-                    'disk': {'usage_percent': 0, 'status': 'unknown'},
 
 
 
 
 
 
+    if request.method == 'DELETE':
 
-                    'network': {'bytes_sent_mb': 0, 'bytes_recv_mb': 0, 'status': 'unknown'}
 
 
 
 
 
 
+        clear_coalesced(request.args.get('endpoint'))
 
-                },
 
 
 
 
 
 
+        app.logger.info(f"Analytics cache cleared by {session.get('username')} (pid {os.getpid()})")
 
-                'overall_status': 'unknown',
 
 
 
 
 
 
+    return jsonify({'success': True, 'pid': os.getpid(), 'endpoints': coalesce_stats(), 'cache': cache.stats()})
 
-                'timestamp': datetime.now().isoformat()
 
 
 
 
 
 
+@app.route('/get_profiles')
+@admin_required_api
+def get_profiles():
+    """Profile files written by the sampling profiler (admin only)."""
+    return jsonify({'success': True, 'profiles': list_profiles()})
 
-            }
 
+@app.route('/profiles/start', methods=['POST'])
+@admin_required_api
+def start_profile_window():
+    """Sample every request handled by this worker for the next N seconds."""
+    data = request.get_json(silent=True) or {}
+    seconds = data.get('seconds', request.form.get('seconds', 30))
+    try:
+        seconds = int(seconds)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'seconds must be a number'}), 400
+    if not start_window(seconds):
+        return jsonify({'success': False, 'error': 'A profiling window is already running'}), 409
+    app.logger.info(f"Profiling window of {seconds}s started by {session.get('username')} (pid {os.getpid()})")
+    return jsonify({'success': True, 'seconds': seconds, 'pid': os.getpid()})
 
 
+@app.route('/profiles/<path:filename>')
+@admin_required_api
+def download_profile(filename):
+    """Download a collapsed-stack or speedscope profile."""
+    path = profile_path(filename)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, download_name=filename)
 
 
+@app.route('/get_system_health')
+@login_required
+def get_system_health():
+    """Latest background health sample; pass ?history=1 for the last hour as a time series."""
+    sample = latest_sample()
+    if sample is None:
+        return jsonify({'error': 'System monitoring unavailable'}), 503
+
+    def status(value, warning, critical):
+        if value is None:
+            return 'unknown'
+        return 'healthy' if value < warning else 'warning' if value < critical else 'critical'
+
+    def gigabytes(value):
+        return round(value / (1024**3), 2) if value is not None else None
+
+    def megabytes(value):
+        return round(value / (1024**2), 2) if value is not None else None
+
+    statuses = [
+        status(sample['cpu_percent'], 80, 95),
+        status(sample['memory_percent'], 80, 95),
+        status(sample['disk_percent'], 80, 95),
+        status(sample['db_round_trip_ms'], 100, 500) if sample['db_round_trip_ms'] is not None else 'critical',
+    ]
+    known = [s for s in statuses if s != 'unknown']
+    overall_status = 'critical' if 'critical' in known else 'warning' if 'warning' in known else 'healthy'
+
+    uptime = timedelta(seconds=sample['uptime_seconds'])
+    response = {
+        'system_info': health_system_info(),
+        'performance': {
+            'cpu': {
+                'usage_percent': sample['cpu_percent'],
+                'count': os.cpu_count(),
+                'status': statuses[0]
+            },
+            'memory': {
+                'usage_percent': sample['memory_percent'],
+                'total_gb': gigabytes(sample['memory_total']),
+                'available_gb': gigabytes(sample['memory_available']),
+                'used_gb': gigabytes(sample['memory_used']),
+                'status': statuses[1]
+            },
+            'disk': {
+                'usage_percent': sample['disk_percent'],
+                'total_gb': gigabytes(sample['disk_total']),
+                'free_gb': gigabytes(sample['disk_free']),
+                'used_gb': gigabytes(sample['disk_used']),
+                'status': statuses[2]
+            },
+            'network': {
+                'bytes_sent_mb': megabytes(sample['bytes_sent']),
+                'bytes_recv_mb': megabytes(sample['bytes_recv']),
+                'status': 'healthy' if sample['bytes_sent'] is not None else 'unknown'
+            }
+        },
+        'processes': {
+            'total_count': sample['process_count'],
+            'current_app': {
+                'pid': os.getpid(),
+                'memory_mb': megabytes(sample['rss']),
+                'cpu_percent': sample['process_cpu_percent']
+            }
+        },
+        'database': {
+            'query_time_ms': sample['db_round_trip_ms'],
+            'pool': sample['db_pool'],
+            'status': statuses[3]
+        },
+        'uptime': {
+            'formatted': f"{uptime.days}d {uptime.seconds // 3600}h {(uptime.seconds % 3600) // 60}m",
+            'total_hours': sample['uptime_seconds'] / 3600,
+            'status': 'healthy'
+        },
+        'overall_status': overall_status,
+        'timestamp': sample['timestamp'],
+        'psutil_available': psutil_available,
 
+        'analytics_cache': coalesce_stats(),
 
-        }), 200
+        'cache': cache.stats(),
 
+        'invalidation': bus_stats(),
+        'shelf_board': board_stats(),
+        'rate_limits': limiter.stats(),
+        'password_pool': pool_stats()
+    }
+    if request.args.get('history'):
+        response['history'] = [
+            {
+                'timestamp': point['timestamp'],
+                'cpu_percent': point['cpu_percent'],
+                'rss_mb': megabytes(point['rss']),
+                'db_round_trip_ms': point['db_round_trip_ms'],
+                'db_checked_out': (point['db_pool'] or {}).get('checkedout')
+            }
+            for point in sample_history()
+        ]
+    return jsonify(response)
 
 
 
@@ -23816,6 +20651,7 @@ def get_system_health():
 
 
 
+@app.route('/get_status_distribution')
 
 
 
@@ -23823,7 +20659,7 @@ def get_system_health():
 
 
 
-@app.route('/get_status_distribution')
+@login_required
 
 
 
@@ -23831,7 +20667,7 @@ def get_system_health():
 
 
 
-@login_required
+@database_required
 
 
 
@@ -23839,7 +20675,7 @@ def get_system_health():
 
 
 
-@database_required
+@coalesced(fresh=60, stale=600)
 
 
 
@@ -24119,6 +20955,14 @@ def get_status_distribution():
 
 
 
+@coalesced(fresh=120, stale=900)
+
+
+
+
+
+
+
 def get_delivery_trends_line():
 
 
@@ -24519,15 +21363,8 @@ def get_recent_deliveries():
 
 
 
-        # Build base query
-
-
-
-
-
-
-
-        query = Delivery.query
+        # Build filters
+        filters = []
 
 
 
@@ -24560,101 +21397,23 @@ def get_recent_deliveries():
 
 
                 start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-
-
-                query = query.filter(Delivery.created_at >= start_date)
-
-
-
+                filters.append(Delivery.created_at >= start_date)
             elif period == 'week':
-
-
-
                 start_date = now - timedelta(days=7)
-
-
-
-                query = query.filter(Delivery.created_at >= start_date)
-
-
-
+                filters.append(Delivery.created_at >= start_date)
             elif period == 'month':
-
-
-
                 start_date = now - timedelta(days=30)
-
-
-
-                query = query.filter(Delivery.created_at >= start_date)
-
-
-
+                filters.append(Delivery.created_at >= start_date)
             elif period == 'year':
-
-
-
                 start_date = now - timedelta(days=365)
-
-
-
-                query = query.filter(Delivery.created_at >= start_date)
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
+                filters.append(Delivery.created_at >= start_date)
         # Apply status filter
-
-
-
         if status != 'all':
-
-
-
-            query = query.filter(Delivery.status == status)
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
+            filters.append(Delivery.status == status)
         # Apply search filter
-
-
-
         if search:
-
-
-
             search_term = f"%{search}%"
-
-
-
-            query = query.filter(
-
-
-
+            filters.append(
                 db.or_(
 
 
@@ -24712,38 +21471,18 @@ def get_recent_deliveries():
 
 
         # Get total count for pagination info
-
-
-
-
-
-
-
-        total_count = query.count()
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
+        total_count = count_rows(Delivery, filters)
         # Get deliveries for current page
-
-
-
-
-
-
-
-        recent_deliveries = query.order_by(Delivery.created_at.desc()).offset(offset).limit(per_page).all()
+        recent_deliveries = project_rows(
+            Delivery.id, Delivery.display_id, Delivery.sender_name, Delivery.sender_phone,
+            Delivery.recipient_name, Delivery.recipient_phone, Delivery.recipient_address, Delivery.status,
+            Delivery.amount, Delivery.expenses, Delivery.delivery_person, Delivery.goods_type, Delivery.quantity,
+            Delivery.payment_by, Delivery.created_at,
+            where=filters,
+            order_by=(Delivery.created_at.desc(),),
+            limit=per_page,
+            offset=offset
+        )
 
 
 
@@ -27311,19 +24050,9 @@ def audit_logs():
 
         date_to = request.args.get('date_to', '')
 
+        search_query = request.args.get('q', '').strip()
 
-
-
-
-
-
-        
-
-
-
-
-
-
+        search_after = request.args.get('after', '')
 
         # Build query
 
@@ -27365,7 +24094,7 @@ def audit_logs():
 
 
 
-            query = query.filter(AuditLog.action.ilike(f'%{action_filter}%'))
+            query = query.filter(AuditLog.action_id.in_(get_audit_action_ids(action_filter)))
 
 
 
@@ -27493,47 +24222,34 @@ def audit_logs():
 
 
 
-        # Order by timestamp descending (newest first)
-
-
-
-
-
-
-
-        query = query.order_by(AuditLog.timestamp.desc())
-
-
-
-
-
-
-
-        
-
-
-
-
-
-
-
-        # Paginate
+        next_cursor = None
 
+        if search_query:
 
+            # Ranked full-text search, paginated by (rank, id) cursor instead of OFFSET
 
+            pagination = None
 
+            audit_logs, next_cursor = search_audit_logs(query, search_query, after=search_after, limit=per_page)
 
+        else:
 
+            # Order by timestamp descending (newest first)
 
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            query = query.order_by(AuditLog.timestamp.desc())
 
+            # Paginate
 
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
 
+            audit_logs = pagination.items
 
 
+        # Resolve dictionary ids for the whole page up front (one query per table at most)
 
+        prime_audit_lookups(AuditAction, [log.action_id for log in audit_logs])
 
-        audit_logs = pagination.items
+        prime_audit_lookups(AuditResourceType, [log.resource_type_id for log in audit_logs])
 
 
 
@@ -27591,13 +24307,11 @@ def audit_logs():
 
                              date_from=date_from,
 
+                             date_to=date_to,
 
+                             search_query=search_query,
 
-
-
-
-
-                             date_to=date_to)
+                             next_cursor=next_cursor)
 
 
 
@@ -27843,6 +24557,33 @@ def create_default_admin():
 
 
 
+SYSTEM_USERNAME = 'system'
+SYSTEM_ROLE = 'system'
+
+# Not a werkzeug hash, so no password ever verifies against it
+UNUSABLE_PASSWORD = '!'
+
+
+def system_user_id():
+    """Id of the account scheduled jobs act as, so their audit rows have a real user_id.
+
+    Created on first use (and by init-db). Its role grants no permissions, its password
+    hash is unusable and it is inactive, so it cannot log in; user management hides it.
+    """
+    user_id = db.session.query(User.id).filter_by(role=SYSTEM_ROLE).scalar()
+    if user_id is not None:
+        return user_id
+    try:
+        user = User(username=SYSTEM_USERNAME, role=SYSTEM_ROLE, is_active=False, password_hash=UNUSABLE_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    except IntegrityError:
+        # Another worker created it first
+        db.session.rollback()
+        return db.session.query(User.id).filter_by(role=SYSTEM_ROLE).scalar()
+
+
 def main():
 
 
@@ -27891,19 +24632,14 @@ def main():
 
 
 
-            # Ensure database tables exist
-
+            # Create and upgrade the schema and open the log files (importing the app does neither)
+            prepare_app(init_db=True)
 
 
 
 
 
 
-            db.create_all()
-
-
-
-
 
 
 
@@ -28101,7 +24837,13 @@ def get_pending_deliveries():
     """Get pending deliveries for staff quick actions."""
     try:
         # Get pending deliveries
-        pending_deliveries = Delivery.query.filter_by(status='Pending').order_by(Delivery.created_at.desc()).limit(20).all()
+        pending_deliveries = project_rows(
+            Delivery.id, Delivery.display_id, Delivery.sender_name, Delivery.recipient_name,
+            Delivery.amount, Delivery.status, Delivery.created_at,
+            where=(Delivery.status == 'Pending',),
+            order_by=(Delivery.created_at.desc(),),
+            limit=20
+        )
         
         return jsonify({
             'deliveries': [{
@@ -28153,6 +24895,85 @@ def get_sender_suggestions():
         app.logger.error(f"Error getting sender suggestions: {str(e)}", exc_info=True)
         return jsonify({'error': 'Failed to get suggestions'}), 500
 
+# Committed writes to these tables notify every worker and node (NOTIFY on PostgreSQL, a polled table on SQLite)
+
+app.config['INVALIDATION_POLL_INTERVAL'] = float(os.environ.get('INVALIDATION_POLL_INTERVAL', '0.5'))
+
+with app.app_context():
+    init_invalidation_bus(app, db.engine, [Delivery, Shelf, User])
+
+# New deliveries make the analytics stale: the next request is served at once and refreshes them
+
+on_change('delivery', lambda table, ids: mark_coalesced_stale())
+
+invalidate_prefixes('users', 'user:')
+
+
+def forget_user_auth(table, ids):
+    """Drop changed users' auth records from both cache tiers at once, so a role change or
+    deactivation reaches the permission snapshots on the very next request."""
+    if not ids:
+        load_user_auth.invalidate_all()
+    for user_id in ids:
+        load_user_auth.invalidate(user_id)
+
+
+on_change('users', forget_user_auth)
+
+invalidate_prefixes('shelf', 'shelf:')
+
+# Clears the shelf board in both cache tiers as soon as the writer commits, not only when its notice arrives
+on_change('shelf', invalidate_shelf_board)
+
+
+
+# Occupied shelves are flagged expiring/expired every RENTAL_EXPIRY_SCAN_INTERVAL seconds (0 disables);
+# set RENTAL_EXPIRY_AUTO_END_DAYS to also end rentals that many days past due
+app.config['RENTAL_EXPIRY_SCAN_INTERVAL'] = float(os.environ.get('RENTAL_EXPIRY_SCAN_INTERVAL', '300'))
+app.config['RENTAL_EXPIRING_DAYS'] = int(os.environ.get('RENTAL_EXPIRING_DAYS', '7'))
+app.config['RENTAL_EXPIRY_BATCH_SIZE'] = int(os.environ.get('RENTAL_EXPIRY_BATCH_SIZE', '200'))
+app.config['RENTAL_EXPIRY_AUTO_END_DAYS'] = (int(os.environ['RENTAL_EXPIRY_AUTO_END_DAYS'])
+                                             if os.environ.get('RENTAL_EXPIRY_AUTO_END_DAYS') else None)
+init_expiry_scanner(app, scan_rental_expiry, system_user_id)
+
+def run_schema_upgrade():
+    """Create missing tables and run the schema upgrades; returns False if an upgrade failed.
+
+    Importing the app does not touch the database: run this once per deploy (`flask --app app
+    init-db`, the Procfile release step) or let main() run it for local development.
+    """
+    with app.app_context():
+        ensure_invalidation_table(db.engine)   # schema writes below already publish notices
+    ensure_database_schema()
+    upgraded = upgrade_database_schema()
+    if upgraded:
+        with app.app_context():
+            system_user_id()
+    return upgraded
+
+
+def prepare_app(init_db=False):
+    """Open the log files (and with init_db, run init-db first) and return the module's app.
+
+    This is not an application factory: there is one app per process and its routes are
+    registered when the module is imported. Entry points (`gunicorn 'app:prepare_app()'`,
+    wsgi.py) call it so that importing the module stays free of side effects.
+    """
+    if init_db and not run_schema_upgrade():
+        raise RuntimeError('Database schema upgrade failed')
+    init_log_files()
+    return app
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create and upgrade the database schema."""
+    if not run_schema_upgrade():
+        raise SystemExit('Database schema upgrade failed - see the log above')
+    print('Database schema is up to date')
+
+
+
 if __name__ == '__main__':
 
 
@@ -0,0 +1,324 @@
+"""Endpoint micro-benchmarks through the Flask test client.
+
+Usage:
+    python seed_data.py --deliveries 100000
+    python benchmark.py --iterations 20 --output bench_sqlite.json
+    DATABASE_URL=postgresql://localhost/errantmate_bench python benchmark.py --baseline bench_pg.json
+
+Reports p50/p95 latency, SQL statements per request and peak Python memory (one
+tracemalloc-traced call per endpoint, so tracing does not skew the timings). With
+--baseline, exits non-zero when an endpoint's p95 regresses beyond --tolerance.
+
+Memory mode takes tracemalloc snapshots around one request per endpoint and reports
+peak and retained allocation. With --scales it seeds one SQLite database per size and
+runs each in a fresh process, and --memory-limit-mb fails any endpoint whose peak plus
+the worker's baseline RSS would not fit the instance:
+
+    python benchmark.py --memory --scales 10000,100000,1000000 --memory-limit-mb 512
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, db, User, Delivery
+from rate_limit import limiter
+
+
+# (name, url, role) - role is the account the request runs as
+BENCHMARKS = [
+    ('dashboard', '/', 'admin'),
+    ('get_summary', '/get_summary', 'admin'),
+    ('get_delivery_persons', '/get_delivery_persons', 'admin'),
+    ('get_delivery_stats', '/get_delivery_stats', 'admin'),
+    ('get_delivery_trends', '/get_delivery_trends?days=30', 'admin'),
+    ('get_delivery_trends_line', '/get_delivery_trends_line', 'admin'),
+    ('get_revenue_charts', '/get_revenue_charts', 'admin'),
+    ('get_revenue_analytics', '/get_revenue_analytics?period=daily', 'admin'),
+    ('get_status_distribution', '/get_status_distribution', 'admin'),
+    ('get_recent_deliveries', '/get_recent_deliveries', 'admin'),
+    ('get_unassigned_deliveries', '/get_unassigned_deliveries', 'admin'),
+    ('get_pending_deliveries', '/get_pending_deliveries', 'admin'),
+    ('get_staff_stats', '/get_staff_stats', 'staff'),
+    ('export_monthly', '/export/monthly', 'admin'),
+    ('api_export_deliveries_csv', '/api/export_deliveries_csv?period=month', 'admin'),
+    ('api_deliveries_search', '/api/deliveries?search=Kamau', 'admin'),
+    ('search_delivery_by_display_id', '/search_delivery_by_display_id?display_id={display_id}', 'admin'),
+    ('audit_logs_search', '/audit_logs?q={display_id}', 'admin'),
+    ('api_shelves', '/api/shelves', 'admin'),
+    ('get_sender_suggestions', '/get_sender_suggestions', 'admin'),
+    ('export_all', '/export/all', 'admin'),
+]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def login_as(client, role):
+    """Put a benchmark account of the given role into the client's session."""
+    with app.app_context():
+        user = User.query.filter_by(role=role, is_active=True).order_by(User.username.like('bench_%').desc()).first()
+        if user is None:
+            raise SystemExit(f"No active {role} user - run seed_data.py first")
+        user_id, username = user.id, user.username
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = username
+        sess['user_role'] = role
+
+
+def run_benchmark(clients, name, url, role, iterations, warmup):
+    client = clients[role]
+    for _ in range(warmup):
+        client.get(url)
+
+    latencies, statuses = [], set()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses.add(response.status_code)
+
+    queries = [0]
+    thread_id = threading.get_ident()
+
+    def count_query(*args):
+        # Ignore the background health sampler and EXPLAIN threads
+        if threading.get_ident() == thread_id:
+            queries[0] += 1
+
+    event.listen(Engine, 'before_cursor_execute', count_query)
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        event.remove(Engine, 'before_cursor_execute', count_query)
+
+    return {
+        'name': name,
+        'url': url,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries': queries[0],
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def rss_mb():
+    """Resident memory of this process, or None without psutil."""
+    if psutil is None:
+        return None
+    return round(psutil.Process().memory_info().rss / 1024**2, 1)
+
+
+def run_memory_benchmark(clients, name, url, role):
+    """Peak and retained Python allocation of one request, after a warm-up call."""
+    client = clients[role]
+    client.get(url)
+    gc.collect()
+    baseline_rss = rss_mb()
+    tracemalloc.start(10)
+    try:
+        before = tracemalloc.take_snapshot()
+        response = client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    top = after.compare_to(before, 'lineno')[:1]
+    return {
+        'name': name,
+        'url': url,
+        'status': [response.status_code],
+        'rss_mb': baseline_rss,
+        'peak_mb': round(peak / 1024**2, 2),
+        'retained_kb': round(sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / 1024, 1),
+        'top_site': str(top[0].traceback[0]) if top else None,
+    }
+
+
+def status_failures(results):
+    """Endpoints that answered anything other than 2xx/3xx; their timings are not valid results."""
+    return [f"{result['name']}: status {','.join(str(code) for code in result['status'])}"
+            for result in results if any(not 200 <= code < 400 for code in result['status'])]
+
+
+def status_marker(result):
+    return '  FAILED' if status_failures([result]) else ''
+
+
+def memory_violations(results, limit_mb):
+    """Endpoints whose baseline RSS plus request peak exceeds limit_mb."""
+    violations = []
+    for result in results:
+        projected = (result['rss_mb'] or 0) + result['peak_mb']
+        if projected > limit_mb:
+            violations.append(f"{result['name']}: {result['rss_mb']} MB RSS + {result['peak_mb']} MB peak > {limit_mb} MB")
+    return violations
+
+
+def run_scales(args):
+    """Seed one SQLite database per scale and run memory mode against each in a fresh process."""
+    matrix = {}
+    for scale in args.scales:
+        path = os.path.abspath(os.path.join(args.data_dir, f'bench_{scale}.db'))
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+        os.makedirs(args.data_dir, exist_ok=True)
+        if not os.path.exists(path):
+            print(f"Seeding {scale} deliveries into {path} ...")
+            subprocess.run([sys.executable, os.path.join(HERE, 'seed_data.py'), '--deliveries', str(scale)], env=env, check=True)
+        output = os.path.join(args.data_dir, f'memory_{scale}.json')
+        command = [sys.executable, os.path.join(HERE, 'benchmark.py'), '--memory', '--output', output]
+        for name in args.only or []:
+            command += ['--only', name]
+        # Exits 1 on failed endpoints, after writing its results; the matrix marks them below
+        subprocess.run(command, env=env)
+        with open(output) as f:
+            matrix[scale] = json.load(f)['results']
+
+    names = [result['name'] for result in matrix[args.scales[0]]]
+    print(f"\nPeak allocation per request (MB)\n{'endpoint':32}" + ''.join(f"{scale:>12}" for scale in args.scales))
+    for name in names:
+        row = ''.join(f"{next(r['peak_mb'] for r in matrix[scale] if r['name'] == name):>12}" for scale in args.scales)
+        print(f"{name:32}{row}")
+
+    failures = []
+    for scale in args.scales:
+        failures += [f"[{scale}] {line}" for line in status_failures(matrix[scale])]
+    if failures:
+        print('\nEndpoints that did not answer 2xx/3xx (their numbers are not valid):')
+        print('\n'.join(failures))
+
+    if args.memory_limit_mb:
+        violations = []
+        for scale in args.scales:
+            violations += [f"[{scale}] {line}" for line in memory_violations(matrix[scale], args.memory_limit_mb)]
+        if violations:
+            print(f"\nEndpoints that would not fit a {args.memory_limit_mb} MB instance:")
+            print('\n'.join(violations))
+            sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ErrantMate endpoints against DATABASE_URL.')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', action='append', help='benchmark name to run (repeatable)')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='JSON from a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='allowed p95 regression in percent')
+    parser.add_argument('--memory', action='store_true', help='report per-request peak/retained allocation instead of latency')
+    parser.add_argument('--scales', type=lambda value: [int(n) for n in value.split(',')],
+                        help='comma-separated delivery counts; seeds and runs memory mode per scale')
+    parser.add_argument('--data-dir', default='bench_data', help='where --scales keeps its seeded databases')
+    parser.add_argument('--memory-limit-mb', type=float, help='fail when RSS + request peak exceeds this (e.g. 512)')
+    parser.add_argument('--cached', action='store_true', help='keep analytics coalescing on (measures cache hits, not the queries)')
+    args = parser.parse_args()
+
+    app.config['ANALYTICS_CACHE_ENABLED'] = args.cached
+    # Every endpoint is replayed from one client; the public search limit would turn it into 429s
+    limiter.enabled = False
+
+    if args.scales:
+        run_scales(args)
+        return
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        deliveries = Delivery.query.count()
+        sample = Delivery.query.order_by(Delivery.id.desc()).first()
+        display_id = sample.display_id if sample else '0000000000'
+    print(f"{dialect}: {deliveries} deliveries, {args.iterations} iterations per endpoint")
+
+    clients = {role: app.test_client() for role in ('admin', 'staff')}
+    for role, client in clients.items():
+        login_as(client, role)
+
+    results = []
+    if args.memory:
+        print(f"{'endpoint':32} {'status':>8} {'RSS MB':>8} {'peak MB':>9} {'retained KB':>12}  top retained site")
+    else:
+        print(f"{'endpoint':32} {'status':>8} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>10}")
+    for name, url, role in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        url = url.format(display_id=display_id)
+        if args.memory:
+            result = run_memory_benchmark(clients, name, url, role)
+            results.append(result)
+            print(f"{name:32} {result['status'][0]:>8} {str(result['rss_mb']):>8} {result['peak_mb']:>9} "
+                  f"{result['retained_kb']:>12}  {result['top_site']}{status_marker(result)}")
+            continue
+        result = run_benchmark(clients, name, url, role, args.iterations, args.warmup)
+        results.append(result)
+        status = ','.join(str(code) for code in result['status'])
+        print(f"{name:32} {status:>8} {result['p50_ms']:>9} {result['p95_ms']:>9} {str(result['queries']):>8} "
+              f"{result['peak_kb']:>10}{status_marker(result)}")
+
+    report = {'dialect': dialect, 'deliveries': deliveries, 'iterations': args.iterations, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failures = status_failures(results)
+    if failures:
+        print('\nEndpoints that did not answer 2xx/3xx (their numbers are not valid):')
+        print('\n'.join(failures))
+
+    if args.memory:
+        violations = memory_violations(results, args.memory_limit_mb) if args.memory_limit_mb else []
+        if violations:
+            print(f"\nEndpoints that would not fit a {args.memory_limit_mb} MB instance:")
+            print('\n'.join(violations))
+        if failures or violations:
+            sys.exit(1)
+        return
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+        regressions = []
+        for result in results:
+            before = baseline.get(result['name'])
+            # A failed endpoint (now or in the baseline) has no valid timing to compare
+            if not before or status_failures([result, before]):
+                continue
+            if result['p95_ms'] > before['p95_ms'] * (1 + args.tolerance / 100):
+                regressions.append(f"{result['name']}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if regressions:
+            print('\nRegressions beyond tolerance:')
+            print('\n'.join(regressions))
+            sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
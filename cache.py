@@ -0,0 +1,327 @@
+"""Two-tier cache shared by the gunicorn workers.
+
+Tier 1 is an in-process LRU (entry-count bound, per-entry TTL). Tier 2 is shared by every
+worker on the host or cluster, chosen by CACHE_URL:
+
+    sqlite:////tmp/errantmate-cache.sqlite3   one WAL-mode SQLite file (default: one per database)
+    redis://localhost:6379/0                  any Redis-protocol server (needs `redis`)
+    local                                     no shared tier
+
+Reads try tier 1, then tier 2 (copying the value back into tier 1); writes go to both.
+Tier 1 keeps an entry for at most CACHE_LOCAL_TTL seconds, so deletes made by another
+worker are picked up within that window. Values cross tier 2 pickled, so only cache data
+the app itself produced. A failing shared tier is logged and treated as a miss.
+
+Keys are 'namespace:rest'; hit/miss counts are kept per namespace and tier.
+
+    @cached_lookup('user_role', ttl=60)
+    def get_user_role(user_id): ...
+
+    get_user_role.invalidate(user_id)
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from prometheus_client import Counter
+    CACHE_REQUESTS = Counter(
+        'errantmate_cache_requests_total',
+        'Cache reads by namespace and result: local_hit, shared_hit or miss',
+        ['namespace', 'result']
+    )
+except ImportError:
+    CACHE_REQUESTS = None
+
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def default_cache_url(database_url):
+    """SQLite cache file in the temp dir, one per database so benchmark DBs never share entries."""
+    digest = hashlib.sha1(database_url.encode()).hexdigest()[:12]
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'errantmate-cache-{digest}.sqlite3')
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU; evicts the least recently used entry beyond max_entries."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] is not None and entry[0] <= time.time():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl if ttl else None, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Shared tier in a single SQLite file; one connection per thread and process."""
+
+    # Expired rows are swept on every Nth write
+    SWEEP_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries '
+                         '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, value, time.time() + ttl if ttl else None))
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def delete_prefix(self, prefix):
+        # Range over the primary key instead of LIKE, which would not use the index
+        self._connection().execute('DELETE FROM cache_entries WHERE key >= ? AND key < ?',
+                                   (prefix, prefix + '\U0010ffff'))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+
+class RedisBackend:
+    """Shared tier on a Redis-protocol server; keys are prefixed so clear() stays scoped."""
+
+    def __init__(self, client, key_prefix='errantmate:'):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.client.get(self.key_prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.key_prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + key)
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.key_prefix + prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+
+class Cache:
+    """Local LRU in front of an optional shared backend, with per-namespace hit/miss counts."""
+
+    def __init__(self, local=None, shared=None, local_ttl=30):
+        self.local = local or LocalLRU()
+        self.shared = shared
+        self.local_ttl = local_ttl
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+
+    def _record(self, key, result):
+        namespace = key.split(':', 1)[0]
+        with self._counts_lock:
+            counts = self._counts.setdefault(namespace, {'local_hit': 0, 'shared_hit': 0, 'miss': 0})
+            counts[result] += 1
+        if CACHE_REQUESTS is not None:
+            CACHE_REQUESTS.labels(namespace=namespace, result=result).inc()
+
+    def _local_ttl(self, ttl):
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    def _shared(self, operation, *args):
+        try:
+            return getattr(self.shared, operation)(*args)
+        except Exception as e:
+            logger.warning(f"Shared cache {operation} failed: {e}")
+            return None
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._record(key, 'local_hit')
+            return value
+        if self.shared is not None:
+            payload = self._shared('get', key)
+            if payload is not None:
+                expires_at, value = pickle.loads(payload)
+                self.local.set(key, value, self._local_ttl(expires_at - time.time() if expires_at else None))
+                self._record(key, 'shared_hit')
+                return value
+        self._record(key, 'miss')
+        return default
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, self._local_ttl(ttl))
+        if self.shared is not None:
+            payload = pickle.dumps((time.time() + ttl if ttl else None, value), protocol=pickle.HIGHEST_PROTOCOL)
+            self._shared('set', key, payload, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self._shared('delete', key)
+
+    def delete_prefix(self, prefix):
+        self.local.delete_prefix(prefix)
+        if self.shared is not None:
+            self._shared('delete_prefix', prefix)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self._shared('clear')
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        with self._counts_lock:
+            namespaces = {namespace: dict(counts) for namespace, counts in self._counts.items()}
+        for counts in namespaces.values():
+            reads = sum(counts.values())
+            counts['hit_ratio'] = round((counts['local_hit'] + counts['shared_hit']) / reads, 3) if reads else None
+        return {
+            'backend': type(self.shared).__name__ if self.shared is not None else None,
+            'local_entries': len(self.local),
+            'local_max_entries': self.local.max_entries,
+            'namespaces': namespaces
+        }
+
+
+# Process-wide cache; init_cache() attaches the shared tier configured for the app
+cache = Cache()
+
+
+def create_backend(url):
+    """Shared backend for a CACHE_URL, or None for 'local'."""
+    if not url or url == 'local':
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError('CACHE_URL points at Redis but the redis package is not installed')
+        return RedisBackend(redis.Redis.from_url(url, socket_timeout=0.5))
+    raise ValueError(f'Unsupported CACHE_URL: {url}')
+
+
+def init_cache(app):
+    """Configure the process-wide cache from CACHE_URL, CACHE_LOCAL_MAX_ENTRIES and CACHE_LOCAL_TTL."""
+    url = app.config.get('CACHE_URL') or default_cache_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    try:
+        cache.shared = create_backend(url)
+    except Exception as e:
+        app.logger.error(f"Shared cache unavailable ({e}); using the in-process tier only")
+        cache.shared = None
+    cache.local.max_entries = int(app.config.get('CACHE_LOCAL_MAX_ENTRIES', 2048))
+    cache.local_ttl = float(app.config.get('CACHE_LOCAL_TTL', 30))
+    app.logger.info(f"Cache: local LRU ({cache.local.max_entries} entries) + {type(cache.shared).__name__ if cache.shared else 'no shared tier'}")
+
+
+def _key_part(value):
+    return str(value).replace(':', '%3A')
+
+
+def cached_lookup(namespace, ttl=60):
+    """Decorator for entity lookups keyed by their positional arguments.
+
+    The wrapped function gains invalidate(*args) and invalidate_all().
+    """
+
+    def decorator(fn):
+        def key_for(args):
+            return f"{namespace}:{':'.join(_key_part(arg) for arg in args)}"
+
+        @wraps(fn)
+        def wrapper(*args):
+            return cache.get_or_set(key_for(args), lambda: fn(*args), ttl)
+
+        wrapper.invalidate = lambda *args: cache.delete(key_for(args))
+        wrapper.invalidate_all = lambda: cache.delete_prefix(f'{namespace}:')
+        return wrapper
+
+    return decorator
+
+
+def response_key(prefix, per_user=False):
+    """Cache key for the current request: endpoint, sorted query args and optionally the user."""
+    args = '&'.join(f'{_key_part(k)}={_key_part(v)}' for k, v in sorted(request.args.items(multi=True)))
+    key = f'{prefix}:{request.endpoint}:{args}'
+    return f"{key}:{session.get('user_id')}" if per_user else key
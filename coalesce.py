@@ -0,0 +1,183 @@
+"""Single-flight and stale-while-revalidate for expensive, user-independent GET views.
+
+    @app.route('/get_revenue_analytics')
+    @login_required_api
+    @database_required
+    @coalesced(fresh=30, stale=300)
+    def get_revenue_analytics(): ...
+
+Responses are keyed by endpoint, query string and representation (JSON or msgpack). Within `fresh` seconds of being
+computed a result is served as-is; for a further `stale` seconds it is still served
+immediately while one background thread recomputes it. Concurrent misses for the same
+key wait for a single computation instead of each running the view. Place the decorator
+below the auth decorators so access is still checked on every request, and only on
+views whose output does not depend on who is asking.
+
+Results live in the shared cache (cache.py), so every worker serves what one computed;
+waiting and background refreshes are per worker. ANALYTICS_FRESHNESS overrides the bounds per endpoint,
+e.g. {'get_summary': (60, 600)}; ANALYTICS_CACHE_ENABLED=False turns caching off.
+"""
+
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request, session
+
+from cache import cache, response_key
+from response_encoding import representation
+
+try:
+    from prometheus_client import Counter
+    COALESCE_RESULTS = Counter(
+        'errantmate_coalesced_requests_total',
+        'Coalesced view results by endpoint: fresh, stale, coalesced or computed',
+        ['endpoint', 'result']
+    )
+except ImportError:
+    COALESCE_RESULTS = None
+
+
+# Followers give up waiting on a stuck leader after this long and compute themselves
+WAIT_TIMEOUT = 60
+
+_lock = threading.Lock()
+_in_flight = {}   # key -> _Flight
+_refreshing = set()
+_counts = {}
+# Results computed before this time are treated as stale (see mark_coalesced_stale)
+_state = {'stale_before': 0.0}
+
+
+class _Flight:
+    """One in-progress computation that followers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+
+
+def _record(endpoint, result):
+    with _lock:
+        counts = _counts.setdefault(endpoint, {'fresh': 0, 'stale': 0, 'coalesced': 0, 'computed': 0})
+        counts[result] += 1
+    if COALESCE_RESULTS is not None:
+        COALESCE_RESULTS.labels(endpoint=endpoint, result=result).inc()
+
+
+def _snapshot(response):
+    # Wall-clock time: the snapshot is shared with other worker processes
+    return (time.time(), response.get_data(), response.status_code, list(response.headers.items()))
+
+
+def _build(snapshot):
+    _, body, status, headers = snapshot
+    return current_app.response_class(body, status=status, headers=headers)
+
+
+def _compute(key, ttl, view, args, kwargs):
+    """Run the view and store its response for ttl seconds when it is a cacheable 200."""
+    response = current_app.make_response(view(*args, **kwargs))
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response, None
+    snapshot = _snapshot(response)
+    cache.set(key, snapshot, ttl)
+    return response, snapshot
+
+
+def _refresh_in_background(key, ttl, view, args, kwargs):
+    app = current_app._get_current_object()
+    endpoint, path, query_string, saved_session = request.endpoint, request.path, request.query_string.decode(), dict(session)
+    # The refreshed result must be the same representation the key was chosen for
+    headers = {'Accept': request.headers.get('Accept', '')}
+
+    def refresh():
+        try:
+            with app.test_request_context(path, query_string=query_string, headers=headers):
+                session.update(saved_session)
+                _compute(key, ttl, view, args, kwargs)
+        except Exception as e:
+            app.logger.error(f"Background refresh of {endpoint} failed: {e}")
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, name=f'refresh-{endpoint}', daemon=True).start()
+
+
+def coalesced(fresh=30, stale=300):
+    """Decorator: share one computation of a view between concurrent identical requests."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('ANALYTICS_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+            endpoint = request.endpoint
+            fresh_for, stale_for = current_app.config.get('ANALYTICS_FRESHNESS', {}).get(endpoint, (fresh, stale))
+            key = (response_key('coalesced') + ''.join(f':{name}={value}' for name, value in sorted(kwargs.items()))
+                   + f':{representation()}')
+            ttl = fresh_for + stale_for
+
+            snapshot = cache.get(key)
+            with _lock:
+                age = time.time() - snapshot[0] if snapshot else None
+                if age is not None and age < fresh_for and snapshot[0] >= _state['stale_before']:
+                    result = 'fresh'
+                elif age is not None and age < fresh_for + stale_for:
+                    result = 'stale'
+                    start_refresh = key not in _refreshing and key not in _in_flight
+                    if start_refresh:
+                        _refreshing.add(key)
+                else:
+                    result = None
+                    flight = _in_flight.get(key)
+                    leader = flight is None
+                    if leader:
+                        flight = _in_flight[key] = _Flight()
+
+            if result == 'fresh':
+                _record(endpoint, result)
+                return _build(snapshot)
+            if result == 'stale':
+                if start_refresh:
+                    _refresh_in_background(key, ttl, view, args, kwargs)
+                _record(endpoint, result)
+                return _build(snapshot)
+
+            if not leader:
+                if flight.done.wait(WAIT_TIMEOUT) and flight.snapshot is not None:
+                    _record(endpoint, 'coalesced')
+                    return _build(flight.snapshot)
+                return view(*args, **kwargs)
+
+            try:
+                response, snapshot = _compute(key, ttl, view, args, kwargs)
+                # Followers share even an error response rather than all retrying at once
+                flight.snapshot = snapshot or _snapshot(response)
+                _record(endpoint, 'computed')
+                return response
+            finally:
+                with _lock:
+                    _in_flight.pop(key, None)
+                flight.done.set()
+
+        return wrapper
+
+    return decorator
+
+
+def coalesce_stats():
+    """Per-endpoint counts of fresh/stale/coalesced/computed results in this worker."""
+    with _lock:
+        return {endpoint: dict(counts) for endpoint, counts in _counts.items()}
+
+
+def mark_coalesced_stale():
+    """Serve every stored result as stale from now on, so the next request refreshes it."""
+    _state['stale_before'] = time.time()
+
+
+def clear_coalesced(endpoint=None):
+    """Drop stored results, for one endpoint or all of them."""
+    cache.delete_prefix(f'coalesced:{endpoint}:' if endpoint else 'coalesced:')
@@ -0,0 +1,86 @@
+"""Cold-start cost of the app: what a new gunicorn worker (or a scale-up from zero) pays.
+
+Usage:
+    python cold_start.py              # median import and first-request time over 5 fresh interpreters
+    python cold_start.py --runs 10 --top 15   # also list the modules with the most import self-time
+
+Each run starts a new interpreter, imports app.py, then serves one GET /health. Importing
+must not touch the database (schema work is `flask --app app init-db`), so the script exits 1
+if the import opened any database connection.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connections = []
+event.listen(Pool, 'connect', lambda *args: connections.append(1))
+deps_started = time.perf_counter()
+import flask, flask_sqlalchemy, sqlalchemy
+deps = time.perf_counter() - deps_started
+before = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+import_connections = len(connections)
+status = app.test_client().get('/health').status_code
+print(json.dumps({'import_s': imported - started, 'app_module_s': imported - before, 'deps_s': deps,
+                  'first_request_s': time.perf_counter() - imported, 'import_connections': import_connections,
+                  'status': status}))
+"""
+
+
+def probe(env):
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=HERE, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_modules(env, top):
+    """(self µs, cumulative µs, module) from -X importtime, largest self time first."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=HERE, env=env,
+                            check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app import and first-request time in fresh interpreters.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='list the N modules with the most import self-time')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    probe(env)  # compile .pyc files so every measured run starts from the same state
+    runs = [probe(env) for _ in range(args.runs)]
+    for key in ('import_s', 'deps_s', 'app_module_s', 'first_request_s'):
+        values = [run[key] * 1000 for run in runs]
+        print(f"{key[:-2]:<15} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+    if args.top:
+        print(f"\n{'self ms':>8} {'cumul ms':>9}  module")
+        for self_us, cumulative_us, module in slowest_modules(env, args.top):
+            print(f"{self_us / 1000:8.1f} {cumulative_us / 1000:9.1f}  {module}")
+
+    connections = max(run['import_connections'] for run in runs)
+    if connections:
+        print(f"\nImporting app.py opened {connections} database connection(s); keep schema work in init-db")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
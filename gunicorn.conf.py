@@ -0,0 +1,34 @@
+"""Gunicorn settings (loaded automatically from the working directory)."""
+
+import os
+import shutil
+
+# Every worker writes its Prometheus samples here; /metrics merges them
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/errantmate-metrics')
+os.makedirs(prometheus_dir, exist_ok=True)
+
+# Import the app once in the master and fork the workers from it, so a new worker (or a
+# scale-up from zero) skips the import; importing app.py does not connect to the database
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    # Samples from a previous master would be double counted
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Never share a pooled connection the master may have opened with the workers
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
@@ -0,0 +1,183 @@
+"""Background sampler behind /get_system_health.
+
+A daemon thread per worker records CPU, memory, process uptime, DB pool usage and a
+DB round trip every few seconds into a bounded time series. Requests only read the
+latest sample, so the endpoint never blocks on psutil or the database. Nothing is
+invented: values psutil cannot provide are reported as None.
+"""
+
+import os
+import platform
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import text
+
+try:
+    import psutil
+    psutil_available = True
+except ImportError:
+    psutil_available = False
+
+
+# Seconds between samples, and how much history to keep for the page chart
+SAMPLE_INTERVAL = 10
+
+HISTORY_SECONDS = 3600
+
+_samples = deque(maxlen=HISTORY_SECONDS // SAMPLE_INTERVAL)
+
+_state = {'pid': None, 'engine': None, 'process': None, 'started': time.time()}
+
+_lock = threading.Lock()
+
+
+def process_started_at():
+    """Real start time of this process (epoch seconds)."""
+    if _state['process'] is not None:
+        try:
+            return _state['process'].create_time()
+        except Exception:
+            pass
+    return _state['started']
+
+
+def pool_stats(engine):
+    """Checkout statistics for the engine's connection pool, where the pool reports them."""
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            try:
+                stats[name] = method()
+            except Exception:
+                stats[name] = None
+    return stats
+
+
+def db_round_trip_ms(engine):
+    """Time a trivial statement on a pooled connection; None if the database is unreachable."""
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    except Exception:
+        return None
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def take_sample():
+    """Collect one sample; cheap calls only (cpu_percent is measured since the last sample)."""
+    now = time.time()
+    sample = {
+        'timestamp': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+        'epoch': now,
+        'uptime_seconds': round(now - process_started_at()),
+        'cpu_percent': None,
+        'process_cpu_percent': None,
+        'memory_percent': None,
+        'memory_total': None,
+        'memory_available': None,
+        'memory_used': None,
+        'rss': None,
+        'disk_percent': None,
+        'disk_total': None,
+        'disk_used': None,
+        'disk_free': None,
+        'bytes_sent': None,
+        'bytes_recv': None,
+        'process_count': None,
+        'db_round_trip_ms': None,
+        'db_pool': None,
+    }
+
+    if psutil_available:
+        process = _state['process']
+        try:
+            sample['cpu_percent'] = psutil.cpu_percent(interval=None)
+            sample['process_cpu_percent'] = process.cpu_percent(interval=None)
+            sample['rss'] = process.memory_info().rss
+            memory = psutil.virtual_memory()
+            sample.update(memory_percent=memory.percent, memory_total=memory.total,
+                          memory_available=memory.available, memory_used=memory.used)
+            disk = psutil.disk_usage('/')
+            sample.update(disk_percent=disk.percent, disk_total=disk.total,
+                          disk_used=disk.used, disk_free=disk.free)
+            network = psutil.net_io_counters()
+            if network:
+                sample.update(bytes_sent=network.bytes_sent, bytes_recv=network.bytes_recv)
+            sample['process_count'] = len(psutil.pids())
+        except Exception:
+            pass
+
+    engine = _state['engine']
+    if engine is not None:
+        sample['db_round_trip_ms'] = db_round_trip_ms(engine)
+        sample['db_pool'] = pool_stats(engine)
+
+    _samples.append(sample)
+    return sample
+
+
+def _sampler_loop():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        try:
+            take_sample()
+        except Exception:
+            pass
+
+
+def ensure_sampler_running():
+    """Start the sampler in this process (threads do not survive a gunicorn fork)."""
+    if _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        _samples.clear()
+        if psutil_available:
+            _state['process'] = psutil.Process()
+            # Prime the counters so the first sample covers a real interval
+            psutil.cpu_percent(interval=None)
+            _state['process'].cpu_percent(interval=None)
+        take_sample()
+        threading.Thread(target=_sampler_loop, name='health-sampler', daemon=True).start()
+
+
+def latest_sample():
+    """Most recent sample for this worker, or None before the first one."""
+    return _samples[-1] if _samples else None
+
+
+def sample_history(seconds=HISTORY_SECONDS):
+    """Samples from the last `seconds`, oldest first."""
+    cutoff = time.time() - seconds
+    return [sample for sample in list(_samples) if sample['epoch'] >= cutoff]
+
+
+def system_info():
+    """Static host description (does not change between samples)."""
+    return {
+        'platform': platform.system(),
+        'platform_release': platform.release(),
+        'platform_version': platform.version(),
+        'architecture': platform.machine(),
+        'hostname': platform.node(),
+        'processor': platform.processor(),
+    }
+
+
+def init_health_sampler(app, engine):
+    """Sample engine and this process in the background of every worker."""
+    global SAMPLE_INTERVAL, _samples
+    SAMPLE_INTERVAL = max(int(app.config.get('HEALTH_SAMPLE_INTERVAL', SAMPLE_INTERVAL)), 1)
+    _samples = deque(maxlen=HISTORY_SECONDS // SAMPLE_INTERVAL)
+    _state['engine'] = engine
+    if not psutil_available:
+        app.logger.warning("psutil not available - system health limited to uptime and database")
+    app.before_request(ensure_sampler_running)
@@ -0,0 +1,240 @@
+"""Cross-node cache invalidation bus.
+
+Every committed write to a watched table (delivery, shelf, users) publishes
+a change notice inside the same transaction, so it is only delivered if the commit
+succeeds:
+
+    PostgreSQL  NOTIFY on the errantmate_invalidation channel
+    SQLite      a row in cache_invalidation, polled every INVALIDATION_POLL_INTERVAL
+
+Each worker runs a listener thread that applies the notice to its local cache tier and
+any registered callbacks. The worker that made the write also clears the shared tier,
+once, after its commit. Tables are detected from the SQL itself, so raw-SQL writes are
+covered; ids of ORM-changed rows are included as a hint.
+
+    invalidate_prefixes('users', 'user:')                  # cache.py key prefixes
+    on_change('delivery', lambda table, ids: mark_coalesced_stale())
+"""
+
+import json
+import logging
+import os
+import re
+import select
+import socket
+import threading
+import time
+
+from sqlalchemy import event, text
+
+from cache import cache
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'errantmate_invalidation'
+
+# NOTIFY payloads must stay under 8000 bytes; beyond this many ids only the table is sent
+MAX_IDS_PER_TABLE = 200
+
+# SQLite notice rows are kept this long, then swept
+RETENTION_SECONDS = 600
+
+WRITE_STATEMENT = re.compile(r'^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+["`]?(\w+)', re.IGNORECASE)
+
+_prefixes = {}    # table -> [cache key prefixes]
+_callbacks = {}   # table -> [callback(table, ids)]
+_state = {'pid': None, 'engine': None, 'tables': set(), 'poll_interval': 0.5,
+          'published': 0, 'received': 0, 'last_lag_ms': None, 'max_lag_ms': None}
+_lock = threading.Lock()
+
+
+def invalidate_prefixes(table, *prefixes):
+    """Evict cache keys starting with any of prefixes whenever table changes."""
+    _prefixes.setdefault(table, []).extend(prefixes)
+
+
+def on_change(table, callback):
+    """Call callback(table, ids) in every worker when table changes (ids may be empty)."""
+    _callbacks.setdefault(table, []).append(callback)
+
+
+def origin():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _pending(conn):
+    return conn.info.setdefault('errantmate_invalidations', {})
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    match = WRITE_STATEMENT.match(statement)
+    if match and match.group(1).lower() in _state['tables']:
+        _pending(conn).setdefault(match.group(1).lower(), set())
+
+
+def _record_entity(mapper, connection, target):
+    ids = _pending(connection).setdefault(mapper.persist_selectable.name, set())
+    identity = mapper.primary_key_from_instance(target)
+    if len(identity) == 1 and identity[0] is not None:
+        ids.add(identity[0])
+
+
+def _payload(changes):
+    return json.dumps({
+        'origin': origin(),
+        'ts': time.time(),
+        'changes': {table: sorted(map(str, ids)) if len(ids) <= MAX_IDS_PER_TABLE else []
+                    for table, ids in changes.items()}
+    })
+
+
+def _publish(conn):
+    """Connection commit hook: write the notice inside the committing transaction."""
+    changes = conn.info.pop('errantmate_invalidations', None)
+    if not changes:
+        return
+    payload = _payload(changes)
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.name == 'postgresql':
+            cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, payload))
+        else:
+            cursor.execute('INSERT INTO cache_invalidation (payload, created_at) VALUES (?, ?)', (payload, time.time()))
+        _state['published'] += 1
+    except Exception as e:
+        logger.error(f"Could not publish cache invalidation: {e}")
+    finally:
+        cursor.close()
+    # This worker's own readers should not wait for the listener round trip
+    apply_changes(changes, shared=False)
+
+
+def _discard(conn):
+    conn.info.pop('errantmate_invalidations', None)
+
+
+def apply_changes(changes, shared=False):
+    """Evict registered prefixes and run callbacks for {table: ids}."""
+    for table, ids in changes.items():
+        for prefix in _prefixes.get(table, ()):
+            if shared:
+                cache.delete_prefix(prefix)
+            else:
+                cache.local.delete_prefix(prefix)
+        for callback in _callbacks.get(table, ()):
+            try:
+                callback(table, list(ids))
+            except Exception as e:
+                logger.error(f"Invalidation callback for {table} failed: {e}")
+
+
+def _dispatch(payload):
+    try:
+        notice = json.loads(payload)
+    except ValueError:
+        return
+    lag_ms = round((time.time() - notice.get('ts', time.time())) * 1000, 2)
+    _state['received'] += 1
+    _state['last_lag_ms'] = lag_ms
+    _state['max_lag_ms'] = max(_state['max_lag_ms'] or 0, lag_ms)
+    # The shared tier only needs clearing once, by the worker that wrote
+    apply_changes(notice.get('changes', {}), shared=notice.get('origin') == origin())
+
+
+def _listen_postgres(engine):
+    dsn = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 5) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        _dispatch(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning(f"Invalidation listener disconnected ({e}); reconnecting in {backoff}s")
+            if conn is not None:
+                conn.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def _poll_sqlite(engine):
+    with engine.connect() as conn:
+        last_id = conn.exec_driver_sql('SELECT COALESCE(MAX(id), 0) FROM cache_invalidation').scalar()
+    last_sweep = time.time()
+    while True:
+        time.sleep(_state['poll_interval'])
+        try:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql('SELECT id, payload FROM cache_invalidation WHERE id > ? ORDER BY id',
+                                            (last_id,)).fetchall()
+            for row_id, payload in rows:
+                _dispatch(payload)
+                last_id = row_id
+            if time.time() - last_sweep > 60:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql('DELETE FROM cache_invalidation WHERE created_at < ?',
+                                         (time.time() - RETENTION_SECONDS,))
+                last_sweep = time.time()
+        except Exception as e:
+            logger.warning(f"Invalidation poll failed: {e}")
+
+
+def ensure_invalidation_table(engine):
+    """Create the SQLite notice table (PostgreSQL needs none); run by init-db and by each worker's first request."""
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE IF NOT EXISTS cache_invalidation '
+                              '(id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)'))
+
+
+def ensure_listener_running():
+    """Start this worker's listener (threads do not survive a gunicorn fork)."""
+    if _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        engine = _state['engine']
+        if engine.dialect.name == 'postgresql':
+            if psycopg2 is None:
+                logger.warning("psycopg2 missing - cache invalidation from other nodes disabled")
+                return
+            target = _listen_postgres
+        else:
+            ensure_invalidation_table(engine)
+            target = _poll_sqlite
+        threading.Thread(target=target, args=(engine,), name='invalidation-listener', daemon=True).start()
+
+
+def bus_stats():
+    """Notices published and received by this worker, with delivery lag."""
+    return {key: _state[key] for key in ('published', 'received', 'last_lag_ms', 'max_lag_ms')}
+
+
+def init_invalidation_bus(app, engine, models):
+    """Publish committed changes to models' tables and listen for other workers' notices."""
+    _state['engine'] = engine
+    _state['tables'] = {model.__tablename__ for model in models}
+    _state['poll_interval'] = float(app.config.get('INVALIDATION_POLL_INTERVAL', 0.5))
+    event.listen(engine, 'after_cursor_execute', _record_statement)
+    event.listen(engine, 'commit', _publish)
+    event.listen(engine, 'rollback', _discard)
+    for model in models:
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, _record_entity)
+    app.before_request(ensure_listener_running)
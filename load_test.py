@@ -0,0 +1,268 @@
+"""Scenario load test against a running (or locally started) gunicorn.
+
+Usage:
+    python seed_data.py --deliveries 100000
+    python load_test.py --start-server --workers 3 --staff 20 --admins 3 --shelf 2 --duration 60
+    python load_test.py --url http://127.0.0.1:8000 --staff 50 --duration 120
+
+A server you start yourself needs RATE_LIMIT_ENABLED=false (or a RATE_LIMIT_LOGIN above
+the number of virtual users), since every user logs in from the same address.
+
+Virtual users log in with the seeded bench_staff_N / bench_admin_N accounts (cycling
+through them when there are more users than accounts) and loop over their flow until
+--duration elapses:
+
+    staff  add_delivery POST -> get_user_recent_deliveries -> quick_assign_delivery
+    admin  reports page -> the widget fetches the page fires on load
+    shelf  rent_shelf page -> /api/shelves -> rent -> end_rental -> complete_maintenance
+
+Prints throughput, error rates and latency percentiles per endpoint. Only the standard
+library is used, so it runs anywhere the app does.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+from app import app, User
+from seed_data import SEED_PASSWORD, GOODS_TYPES, AREAS, kenyan_phone, person_name
+
+
+# Widget fetches the reports page makes on load (see templates/reports.html)
+ADMIN_WIDGETS = [
+    '/get_summary',
+    '/get_delivery_persons?period=all',
+    '/get_unassigned_deliveries',
+    '/get_pending_deliveries',
+    '/get_recent_deliveries',
+    '/get_status_distribution?days=30',
+    '/get_delivery_trends?days=30',
+    '/get_revenue_analytics?period=daily',
+    '/api/users',
+    '/api/shelves',
+]
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report 302s as responses; following them would time the next page too."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Results:
+    """Thread-safe latency and status collection, keyed by endpoint label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, status, elapsed_ms):
+        with self.lock:
+            self.latencies[label].append(elapsed_ms)
+            self.statuses[label][status] += 1
+
+
+class VirtualUser:
+    """One logged-in browser session with its own cookie jar."""
+
+    def __init__(self, base_url, username, results, index):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.results = results
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+        self.rng = random.Random(index)
+
+    def request(self, label, path, data=None, json_body=None):
+        """Issue one request and record it; returns (status, body bytes)."""
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except Exception:
+            status, payload = 'error', b''
+        self.results.record(label, status, (time.perf_counter() - started) * 1000)
+        return status, payload
+
+    def json(self, label, path, **kwargs):
+        status, payload = self.request(label, path, **kwargs)
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def login(self):
+        status, _ = self.request('login', '/login', data={'username': self.username, 'password': SEED_PASSWORD})
+        return status == 302
+
+    def staff_flow(self):
+        self.request('add_delivery', '/add_delivery', data={
+            'sender_name': person_name(self.rng),
+            'sender_phone': kenyan_phone(self.rng),
+            'recipient_name': person_name(self.rng),
+            'recipient_phone': kenyan_phone(self.rng),
+            'recipient_address': f"{self.rng.choice(AREAS)}, Nairobi",
+            'goods_type': self.rng.choice(GOODS_TYPES),
+            'quantity': self.rng.randint(1, 3),
+            'payment_by': 'Errant',
+            'amount': 50,
+        })
+        self.request('get_user_recent_deliveries', '/get_user_recent_deliveries')
+        unassigned = self.json('get_unassigned_deliveries', '/get_unassigned_deliveries')
+        deliveries = (unassigned or {}).get('deliveries') or []
+        if deliveries:
+            delivery = self.rng.choice(deliveries[:20])
+            self.request('quick_assign_delivery', f"/quick_assign_delivery/{delivery['id']}", data={})
+
+    def admin_flow(self):
+        self.request('reports', '/reports')
+        for path in ADMIN_WIDGETS:
+            self.request(path.split('?')[0].lstrip('/').replace('/', '_'), path)
+
+    def shelf_flow(self):
+        self.request('rent_shelf', '/rent_shelf')
+        shelves = self.json('api_shelves', '/api/shelves') or []
+        available = [shelf['id'] for shelf in shelves if isinstance(shelf, dict) and shelf.get('status') == 'available']
+        if not available:
+            return
+        shelf_id = self.rng.choice(available)
+        status, _ = self.request('shelf_rent', '/api/shelves/transition', json_body={
+            'action': 'rent',
+            'shelfId': shelf_id,
+            'customerName': person_name(self.rng),
+            'customerPhone': kenyan_phone(self.rng),
+            'itemsDescription': self.rng.choice(GOODS_TYPES),
+            'rentalPeriod': self.rng.choice([1, 3, 6]),
+        })
+        if status == 200:
+            self.request('shelf_end_rental', '/api/shelves/transition', json_body={'action': 'end_rental', 'shelfId': shelf_id})
+            self.request('shelf_complete_maintenance', '/api/shelves/transition',
+                         json_body={'action': 'complete_maintenance', 'shelfId': shelf_id})
+
+
+def run_user(user, flow, deadline, think_time):
+    if not user.login():
+        return
+    step = getattr(user, f'{flow}_flow')
+    while time.time() < deadline:
+        step()
+        if think_time:
+            time.sleep(user.rng.uniform(0, think_time))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def print_report(results, elapsed):
+    total = sum(len(values) for values in results.latencies.values())
+    print(f"\n{total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s\n")
+    print(f"{'endpoint':30} {'requests':>9} {'req/s':>7} {'4xx':>6} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label in sorted(results.latencies):
+        latencies = results.latencies[label]
+        statuses = results.statuses[label]
+        client_errors = sum(count for status, count in statuses.items() if isinstance(status, int) and 400 <= status < 500)
+        errors = sum(count for status, count in statuses.items() if status == 'error' or (isinstance(status, int) and status >= 500))
+        print(f"{label:30} {len(latencies):>9} {len(latencies) / elapsed:>7.1f} {client_errors:>6} "
+              f"{errors / len(latencies):>6.1%} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+              f"{percentile(latencies, 99):>8.1f} {max(latencies):>8.1f}")
+
+
+def start_server(port, workers):
+    """Start gunicorn on port with the app's gunicorn.conf.py; returns the process once it answers."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+        # All virtual users log in from 127.0.0.1, which the login rate limit would stop after a few
+        env={**os.environ, 'RATE_LIMIT_ENABLED': 'false'}
+    )
+    for _ in range(120):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=2)
+            return process
+        except Exception:
+            if process.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit('gunicorn did not become ready')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay staff, admin and shelf flows against a running server.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--start-server', action='store_true', help='start gunicorn locally for the run')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers with --start-server')
+    parser.add_argument('--staff', type=int, default=10, help='concurrent staff users')
+    parser.add_argument('--admins', type=int, default=2, help='concurrent admin users')
+    parser.add_argument('--shelf', type=int, default=1, help='concurrent shelf-desk users (admin accounts)')
+    parser.add_argument('--duration', type=int, default=60, help='seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.5, help='max random pause between flow iterations')
+    args = parser.parse_args()
+
+    server = None
+    if args.start_server:
+        port = urllib.parse.urlparse(args.url).port or 8000
+        server = start_server(port, args.workers)
+
+    with app.app_context():
+        accounts = {
+            role: [user.username for user in User.query.filter(User.username.like(f'bench_{role}_%')).order_by(User.id)]
+            for role in ('staff', 'admin')
+        }
+    if not accounts['staff'] or not accounts['admin']:
+        raise SystemExit('No bench_staff_* / bench_admin_* accounts - run seed_data.py first')
+
+    results = Results()
+    users = [(accounts['staff'][i % len(accounts['staff'])], 'staff') for i in range(args.staff)]
+    users += [(accounts['admin'][i % len(accounts['admin'])], 'admin') for i in range(args.admins)]
+    users += [(accounts['admin'][i % len(accounts['admin'])], 'shelf') for i in range(args.shelf)]
+
+    started = time.time()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_user, args=(VirtualUser(args.url, username, results, index), flow, deadline, args.think_time))
+        for index, (username, flow) in enumerate(users)
+    ]
+    print(f"{args.staff} staff, {args.admins} admin, {args.shelf} shelf users for {args.duration}s against {args.url}")
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    logged_in = results.statuses['login'].get(302, 0)
+    if logged_in < len(users):
+        print(f"Warning: only {logged_in} of {len(users)} logins succeeded")
+    print_report(results, time.time() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Prometheus metrics for ErrantMate: per-route latency, status counts and SQL usage.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does this) so every
+worker writes its samples to a shared directory and /metrics aggregates them.
+
+/metrics is denied by default: scrapers send `Authorization: Bearer $METRICS_TOKEN`, and
+without a METRICS_TOKEN only loopback clients (a scraper on the same host) are served.
+"""
+
+import hmac
+import ipaddress
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                                   Histogram, generate_latest, multiprocess, REGISTRY)
+    prometheus_available = True
+except ImportError:
+    prometheus_available = False
+
+
+# Buckets tuned for a Flask app behind Render: most routes well under a second
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250)
+
+if prometheus_available:
+
+    REQUEST_LATENCY = Histogram(
+        'errantmate_http_request_duration_seconds',
+        'Request latency by Flask endpoint',
+        ['endpoint', 'method'],
+        buckets=LATENCY_BUCKETS
+    )
+
+    REQUEST_COUNT = Counter(
+        'errantmate_http_requests_total',
+        'Requests by Flask endpoint and response status',
+        ['endpoint', 'method', 'status']
+    )
+
+    REQUESTS_IN_PROGRESS = Gauge(
+        'errantmate_http_requests_in_progress',
+        'Requests currently being handled',
+        ['endpoint'],
+        multiprocess_mode='livesum'
+    )
+
+    DB_QUERIES_PER_REQUEST = Histogram(
+        'errantmate_db_queries_per_request',
+        'SQL statements executed per request',
+        ['endpoint'],
+        buckets=QUERY_COUNT_BUCKETS
+    )
+
+    DB_QUERIES = Counter(
+        'errantmate_db_queries_total',
+        'SQL statements executed, by Flask endpoint',
+        ['endpoint']
+    )
+
+    DB_TIME = Counter(
+        'errantmate_db_time_seconds_total',
+        'Time spent in SQL statements, by Flask endpoint',
+        ['endpoint']
+    )
+
+
+def current_endpoint():
+    """Label for the current route; bounded to registered endpoint names."""
+    if not has_request_context():
+        return '<background>'
+    return request.endpoint or '<unmatched>'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('errantmate_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('errantmate_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    endpoint = current_endpoint()
+    DB_QUERIES.labels(endpoint).inc()
+    DB_TIME.labels(endpoint).inc(elapsed)
+    if has_request_context() and 'db_query_count' in g:
+        g.db_query_count += 1
+        g.db_query_time += elapsed
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.db_query_count = 0
+    g.db_query_time = 0.0
+    REQUESTS_IN_PROGRESS.labels(current_endpoint()).inc()
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = current_endpoint()
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+        DB_QUERIES_PER_REQUEST.labels(endpoint).observe(g.db_query_count)
+        REQUESTS_IN_PROGRESS.labels(endpoint).dec()
+    return response
+
+
+def _teardown_request(error):
+    # after_request is skipped when a view raises; still count it and release the gauge
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = current_endpoint()
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUEST_COUNT.labels(endpoint, request.method, '500').inc()
+        REQUESTS_IN_PROGRESS.labels(endpoint).dec()
+
+
+def is_loopback(address):
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_view():
+    """Expose all metrics in Prometheus text format to authorized scrapers."""
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not is_loopback(request.remote_addr):
+        return Response('Forbidden: set METRICS_TOKEN to scrape remotely\n', status=403, mimetype='text/plain')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Instrument every route of app and register the /metrics endpoint."""
+    if not prometheus_available:
+        app.logger.warning("prometheus_client not available - /metrics disabled")
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
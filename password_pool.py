@@ -0,0 +1,158 @@
+"""Password hashing and verification in a bounded process pool.
+
+The werkzeug KDF is deliberately slow (~250 ms per call at pbkdf2:sha256:600000). Each
+worker hands it to a small ProcessPoolExecutor, which caps how many hashes run at once
+on the host and gives the queue a hard bound. When more than PASSWORD_POOL_QUEUE calls
+are already waiting, a new call waits at most PASSWORD_POOL_TIMEOUT seconds for a slot,
+then raises PasswordPoolBusy instead of piling on. Login latency at shift start stays
+bounded, and the rest of the request stays responsive.
+
+    if verify_password(user.password_hash if user else None, password): ...
+    if needs_rehash(user.password_hash): user.password_hash = hash_password(password)
+
+Unknown users are checked against a dummy hash made with the same parameters, so a
+wrong username costs as long as a wrong password. Hashes made with other KDF parameters
+(PASSWORD_HASH_METHOD) still verify and are reported by needs_rehash().
+"""
+
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    PASSWORD_POOL_QUEUE_DEPTH = Gauge(
+        'errantmate_password_pool_queue_depth',
+        'Password hash/verify calls submitted to the pool and not yet finished',
+        multiprocess_mode='livesum'
+    )
+    PASSWORD_POOL_SECONDS = Histogram(
+        'errantmate_password_pool_seconds',
+        'Time from submitting a password operation to its result, including queueing',
+        ['operation'],
+        buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    )
+    PASSWORD_POOL_REJECTED = Counter(
+        'errantmate_password_pool_rejected_total',
+        'Password operations refused because the pool queue stayed full'
+    )
+except ImportError:
+    PASSWORD_POOL_QUEUE_DEPTH = PASSWORD_POOL_SECONDS = PASSWORD_POOL_REJECTED = None
+
+
+logger = logging.getLogger(__name__)
+
+# Fork where available: spawn and forkserver children re-import the main module, which under
+# `python app.py` is the whole app. Forked children only ever run the werkzeug KDF.
+_context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+def dummy_hash(method):
+    """A well-formed hash for method that matches no password.
+
+    Checking against it runs the full KDF with method's parameters, like a real check, but
+    building it runs none: the digest is random rather than derived.
+    """
+    return f'{method}${secrets.token_hex(8)}${secrets.token_hex(32)}'
+
+
+_state = {'pid': None, 'executor': None, 'slots': None, 'method': 'pbkdf2:sha256:600000',
+          'workers': 2, 'queue': 16, 'timeout': 5.0, 'dummy_hash': dummy_hash('pbkdf2:sha256:600000'),
+          'depth': 0, 'max_depth': 0, 'completed': 0, 'rejected': 0}
+_lock = threading.Lock()
+
+
+class PasswordPoolBusy(Exception):
+    """The pool's queue stayed full for PASSWORD_POOL_TIMEOUT seconds."""
+
+
+def _executor():
+    """This process's pool (a forked gunicorn worker must not reuse its parent's)."""
+    if _state['pid'] != os.getpid():
+        with _lock:
+            if _state['pid'] != os.getpid():
+                _state['executor'] = ProcessPoolExecutor(max_workers=_state['workers'], mp_context=_context)
+                _state['slots'] = threading.BoundedSemaphore(_state['workers'] + _state['queue'])
+                _state['pid'] = os.getpid()
+    return _state['executor']
+
+
+def _discard_executor(executor):
+    """Shut down a failed pool; the next call in this process starts a new one."""
+    with _lock:
+        # Threads that hit the same failure replace it only once
+        if _state['executor'] is executor:
+            _state['executor'] = _state['pid'] = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(operation, fn, *args):
+    executor = _executor()
+    slots = _state['slots']
+    if not slots.acquire(timeout=_state['timeout']):
+        _state['rejected'] += 1
+        if PASSWORD_POOL_REJECTED is not None:
+            PASSWORD_POOL_REJECTED.inc()
+        raise PasswordPoolBusy('Password hashing queue is full')
+    started = time.perf_counter()
+    with _lock:
+        _state['depth'] += 1
+        _state['max_depth'] = max(_state['max_depth'], _state['depth'])
+    if PASSWORD_POOL_QUEUE_DEPTH is not None:
+        PASSWORD_POOL_QUEUE_DEPTH.inc()
+    try:
+        try:
+            return executor.submit(fn, *args).result()
+        except (RuntimeError, OSError) as e:
+            # A broken pool (e.g. a killed child) must not lock everyone out: replace it,
+            # stopping the old one's remaining workers, and run this call inline
+            logger.error(f"Password pool failed ({e}); running {operation} inline")
+            _discard_executor(executor)
+            return fn(*args)
+    finally:
+        with _lock:
+            _state['depth'] -= 1
+            _state['completed'] += 1
+        if PASSWORD_POOL_QUEUE_DEPTH is not None:
+            PASSWORD_POOL_QUEUE_DEPTH.dec()
+        if PASSWORD_POOL_SECONDS is not None:
+            PASSWORD_POOL_SECONDS.labels(operation=operation).observe(time.perf_counter() - started)
+        slots.release()
+
+
+def hash_password(password):
+    """Hash password with the configured PASSWORD_HASH_METHOD."""
+    return _run('hash', generate_password_hash, password, _state['method'])
+
+
+def verify_password(password_hash, password):
+    """True if password matches password_hash; a None hash (unknown user) costs the same and fails."""
+    if password_hash is None:
+        _run('verify', check_password_hash, _state['dummy_hash'], password)
+        return False
+    return _run('verify', check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when password_hash was made with KDF parameters other than the configured ones."""
+    return password_hash.split('$', 1)[0] != _state['method']
+
+
+def pool_stats():
+    """Pool size, current and peak queue depth, and completed/rejected calls in this worker."""
+    return {key: _state[key] for key in ('method', 'workers', 'queue', 'depth', 'max_depth', 'completed', 'rejected')}
+
+
+def init_password_pool(app):
+    """Configure from PASSWORD_HASH_METHOD, PASSWORD_POOL_WORKERS, PASSWORD_POOL_QUEUE and PASSWORD_POOL_TIMEOUT."""
+    _state['method'] = app.config.get('PASSWORD_HASH_METHOD') or _state['method']
+    _state['workers'] = max(int(app.config.get('PASSWORD_POOL_WORKERS', 2)), 1)
+    _state['queue'] = max(int(app.config.get('PASSWORD_POOL_QUEUE', 16)), 0)
+    _state['timeout'] = float(app.config.get('PASSWORD_POOL_TIMEOUT', 5))
+    _state['dummy_hash'] = dummy_hash(_state['method'])
@@ -0,0 +1,94 @@
+"""Permission snapshot kept in the (signed) session cookie.
+
+At login the user's role and a permission bitmask are written to session['permissions']
+together with a stamp of the user's role and is_active. Authorization then reads the
+session and never the users table:
+
+    if not has_permission('manage_deliveries'): ...
+
+Before each signed-in request the stamp is compared with the user's current one from
+load_auth(user_id), a short-TTL cached lookup that the invalidation bus clears when the
+users table changes. A changed role refreshes the snapshot; a deactivated or deleted
+user is signed out. On a cache hit this costs no query at all.
+"""
+
+import hashlib
+import logging
+
+from flask import session
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when the bit assignments change, so old snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+
+# Permission name -> bit; each matches a User.can_<name>() method
+PERMISSION_BITS = {
+    'view_reports': 1 << 0,
+    'view_audit_logs': 1 << 1,
+    'view_system_health': 1 << 2,
+    'delete_delivery': 1 << 3,
+    'manage_deliveries': 1 << 4,
+    'assign_deliveries': 1 << 5,
+    'manage_shelves': 1 << 6,
+    'view_shelf_rentals': 1 << 7,
+    'administer': 1 << 8,
+}
+
+_state = {'load_auth': None}
+
+
+def permission_mask(user):
+    """Bitmask of the PERMISSION_BITS the user's can_* methods grant."""
+    return sum(bit for name, bit in PERMISSION_BITS.items() if getattr(user, f'can_{name}')())
+
+
+def auth_stamp(role, is_active, perms):
+    """Short digest of what authorization depends on; it changes when any of them do."""
+    return hashlib.sha1(f'{SNAPSHOT_VERSION}:{role}:{bool(is_active)}:{perms}'.encode()).hexdigest()[:12]
+
+
+def auth_record(user):
+    """What load_auth() returns for a user: role, is_active, perms and their stamp."""
+    perms = permission_mask(user)
+    return {'role': user.role, 'is_active': bool(user.is_active), 'perms': perms,
+            'stamp': auth_stamp(user.role, user.is_active, perms)}
+
+
+def store_snapshot(auth):
+    """Write an auth record into the session (role stays in user_role for the templates)."""
+    session['user_role'] = auth['role']
+    session['permissions'] = {'perms': auth['perms'], 'stamp': auth['stamp']}
+
+
+def has_permission(name):
+    """True when the signed-in user's snapshot grants the named permission."""
+    snapshot = session.get('permissions')
+    return bool(snapshot and snapshot['perms'] & PERMISSION_BITS[name])
+
+
+def refresh_permission_snapshot():
+    """before_request: bring the snapshot up to date, or sign out a user who lost access."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return
+    try:
+        auth = _state['load_auth'](user_id)
+    except Exception as e:
+        # Keep the last signed snapshot rather than fail every request while the database is away
+        logger.warning(f"Could not check permissions for user {user_id}: {e}")
+        return
+    if auth is None or not auth['is_active']:
+        logger.info(f"Signing out user {user_id}: account removed or deactivated")
+        session.clear()
+        return
+    snapshot = session.get('permissions')
+    if not snapshot or snapshot.get('stamp') != auth['stamp'] or session.get('user_role') != auth['role']:
+        store_snapshot(auth)
+
+
+def init_permissions(app, load_auth):
+    """Check every signed-in request against load_auth(user_id) (an auth_record() or None)."""
+    _state['load_auth'] = load_auth
+    app.before_request(refresh_permission_snapshot)
@@ -0,0 +1,202 @@
+"""On-demand sampling profiler for admins.
+
+A request carrying `X-Profile: 1` (or `?_profile=1`) from an admin session is sampled
+from a helper thread via sys._current_frames(); a time window samples every request
+thread in the worker instead. Each profile is written to the profiles directory as a
+collapsed-stack file (flamegraph.pl / speedscope) and a speedscope JSON document.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session
+
+
+# Name prefixes of threads started by the app itself; never part of a request profile.
+# A module that starts a new background thread adds its prefix here.
+BACKGROUND_THREAD_PREFIXES = ('health-sampler', 'slow-query-explain', 'profiler', 'invalidation-listener',
+                              'rental-expiry-scanner', 'refresh-')
+
+MAX_WINDOW_SECONDS = 300
+
+_settings = {'directory': 'profiles', 'interval': 0.005}
+
+_window = {'sampler': None}
+
+_lock = threading.Lock()
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Root-first list of frame labels for a stack."""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class StackSampler:
+    """Samples the stacks of one thread (or of all request threads) every interval."""
+
+    def __init__(self, label, thread_id=None, interval=None):
+        self.label = label
+        self.thread_id = thread_id
+        self.interval = interval or _settings['interval']
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = datetime.now()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                targets = [self.thread_id] if self.thread_id in frames else []
+            else:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                targets = [ident for ident in frames
+                           if ident != own and not names.get(ident, '').startswith(BACKGROUND_THREAD_PREFIXES)]
+            for ident in targets:
+                self.stacks[collapse(frames[ident])] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop sampling and write the profile files; returns the base file name."""
+        self._stop.set()
+        self._thread.join()
+        return write_profile(self)
+
+
+def write_profile(sampler):
+    directory = _settings['directory']
+    os.makedirs(directory, exist_ok=True)
+    label = re.sub(r'[^A-Za-z0-9_.-]+', '_', sampler.label)
+    name = f"{sampler.started_at:%Y%m%d-%H%M%S}-{label}-{os.getpid()}"
+    interval_ms = sampler.interval * 1000
+
+    with open(os.path.join(directory, name + '.folded'), 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{';'.join(stack)} {count}\n")
+
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in sampler.stacks.items():
+        sample = []
+        for label in stack:
+            if label not in index:
+                index[label] = len(frames)
+                frames.append({'name': label})
+            sample.append(index[label])
+        samples.append(sample)
+        weights.append(count * interval_ms)
+    document = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': sampler.label,
+        'exporter': 'errantmate-profiler',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': sampler.label,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+    with open(os.path.join(directory, name + '.speedscope.json'), 'w') as f:
+        json.dump(document, f)
+    return name
+
+
+def list_profiles():
+    """Profile files on disk, newest first."""
+    directory = _settings['directory']
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in os.listdir(directory):
+        if filename.endswith('.folded') or filename.endswith('.speedscope.json'):
+            path = os.path.join(directory, filename)
+            profiles.append({
+                'filename': filename,
+                'size_kb': round(os.path.getsize(path) / 1024, 1),
+                'created': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds'),
+            })
+    return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+
+def profile_path(filename):
+    """Absolute path of a listed profile file, or None for anything else."""
+    if filename not in {profile['filename'] for profile in list_profiles()}:
+        return None
+    return os.path.abspath(os.path.join(_settings['directory'], filename))
+
+
+def start_window(seconds):
+    """Sample every request thread of this worker for `seconds`; False if one is running."""
+    seconds = max(1, min(int(seconds), MAX_WINDOW_SECONDS))
+    with _lock:
+        if _window['sampler'] is not None:
+            return False
+        _window['sampler'] = StackSampler(f'window-{seconds}s').start()
+
+    def finish():
+        time.sleep(seconds)
+        with _lock:
+            sampler, _window['sampler'] = _window['sampler'], None
+        if sampler is not None:
+            sampler.stop()
+
+    threading.Thread(target=finish, name='profiler', daemon=True).start()
+    return True
+
+
+def _profiling_requested():
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    return flag in ('1', 'true', 'yes') and session.get('user_role') == 'admin'
+
+
+def _before_request():
+    if _profiling_requested():
+        g.profiler = StackSampler(request.endpoint or 'unmatched', thread_id=threading.get_ident()).start()
+
+
+def _after_request(response):
+    sampler = g.pop('profiler', None)
+    if sampler is not None:
+        response.headers['X-Profile-File'] = sampler.stop()
+    return response
+
+
+def _teardown_request(error):
+    sampler = g.pop('profiler', None)
+    if sampler is not None:
+        sampler.stop()
+
+
+def init_profiler(app):
+    """Enable per-request profiling for admins; files go to PROFILES_DIR."""
+    _settings['directory'] = app.config.get('PROFILES_DIR', 'profiles')
+    _settings['interval'] = float(app.config.get('PROFILE_INTERVAL_MS', 5)) / 1000
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,281 @@
+"""Token-bucket rate limiter with state shared by the gunicorn workers.
+
+A policy is `capacity` requests per `period` seconds: a bucket starts full, each request
+takes a token, and tokens come back at capacity/period per second. A decision reads and
+writes one bucket by key, so it costs the same however many clients are tracked.
+Buckets live in the store chosen by RATE_LIMIT_URL:
+
+    sqlite:////tmp/errantmate-ratelimit.sqlite3   one WAL-mode SQLite file per host (default)
+    redis://localhost:6379/0                      any Redis-protocol server (needs `redis`)
+    memory                                        per-process only
+
+A bucket that has refilled completely carries no information and is swept (or, on
+Redis, expires). If the shared store fails the limiter falls back to its in-process
+store rather than locking everyone out.
+
+    @rate_limited('public_search')
+    def search(): ...
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import jsonify, request, session
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from prometheus_client import Counter
+    RATE_LIMIT_DECISIONS = Counter(
+        'errantmate_rate_limit_decisions_total',
+        'Rate limiter decisions by policy and result: allowed or limited',
+        ['policy', 'result']
+    )
+except ImportError:
+    RATE_LIMIT_DECISIONS = None
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps of fully refilled buckets
+SWEEP_INTERVAL = 60
+
+Policy = namedtuple('Policy', 'capacity period')
+
+Decision = namedtuple('Decision', 'allowed remaining retry_after')
+
+
+def take_token(tokens, updated_at, now, capacity, rate):
+    """Refill a bucket to now and try to take one token.
+
+    Returns (allowed, tokens left, seconds until the bucket is full again).
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(now - updated_at, 0) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return allowed, tokens, (capacity - tokens) / rate
+
+
+def default_rate_limit_url(database_url):
+    """SQLite bucket file in the temp dir, one per database like the cache file."""
+    digest = hashlib.sha1(database_url.encode()).hexdigest()[:12]
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'errantmate-ratelimit-{digest}.sqlite3')
+
+
+class MemoryStore:
+    """Buckets in a dict for this process; full buckets are swept every SWEEP_INTERVAL."""
+
+    def __init__(self):
+        self._buckets = {}   # key -> (tokens, updated_at, expires_at)
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def hit(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (None, now, None))
+            allowed, tokens, refill = take_token(tokens, updated_at, now, capacity, rate)
+            self._buckets[key] = (tokens, now, now + refill)
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                self._buckets = {k: bucket for k, bucket in self._buckets.items() if bucket[2] > now}
+                self._last_sweep = now
+        return allowed, tokens
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteStore:
+    """Buckets in one SQLite file; each decision is a primary-key read and upsert under BEGIN IMMEDIATE."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_expires_at ON rate_limit_buckets (expires_at)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key, capacity, rate, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            allowed, tokens, refill = take_token(row[0] if row else None, row[1] if row else now, now, capacity, rate)
+            conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at, expires_at) '
+                         'VALUES (?, ?, ?, ?)', (key, tokens, now, now + refill))
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                conn.execute('DELETE FROM rate_limit_buckets WHERE expires_at <= ?', (now,))
+                self._last_sweep = now
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+
+class RedisStore:
+    """Buckets as Redis hashes updated by one server-side script; Redis expires full ones."""
+
+    SCRIPT = """
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = capacity
+    if bucket[1] then
+        tokens = math.min(capacity, tonumber(bucket[1]) + math.max(now - tonumber(bucket[2]), 0) * rate)
+    end
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client, key_prefix='errantmate:ratelimit:'):
+        self.client = client
+        self.key_prefix = key_prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def hit(self, key, capacity, rate, now):
+        allowed, tokens = self._script(keys=[self.key_prefix + key], args=[capacity, rate, now])
+        return bool(allowed), float(tokens)
+
+
+def create_store(url):
+    """Bucket store for a RATE_LIMIT_URL."""
+    if not url or url == 'memory':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_URL points at Redis but the redis package is not installed')
+        return RedisStore(redis.Redis.from_url(url, socket_timeout=0.5))
+    raise ValueError(f'Unsupported RATE_LIMIT_URL: {url}')
+
+
+class RateLimiter:
+    """Named policies over a shared store, with an in-process store as fallback."""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+        self.fallback = MemoryStore()
+        self.policies = {}
+        self.enabled = True
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+
+    def _record(self, policy, result):
+        with self._counts_lock:
+            counts = self._counts.setdefault(policy, {'allowed': 0, 'limited': 0, 'store_errors': 0})
+            counts[result] += 1
+        if RATE_LIMIT_DECISIONS is not None and result != 'store_errors':
+            RATE_LIMIT_DECISIONS.labels(policy=policy, result=result).inc()
+
+    def hit(self, policy_name, key):
+        """Take a token from policy_name's bucket for key; returns a Decision."""
+        policy = self.policies[policy_name]
+        if not self.enabled:
+            return Decision(True, policy.capacity, 0)
+        rate = policy.capacity / policy.period
+        now = time.time()
+        bucket_key = f'{policy_name}:{key}'
+        try:
+            allowed, tokens = self.store.hit(bucket_key, policy.capacity, rate, now)
+        except Exception as e:
+            logger.warning(f"Rate limit store failed ({e}); using this worker's buckets")
+            self._record(policy_name, 'store_errors')
+            allowed, tokens = self.fallback.hit(bucket_key, policy.capacity, rate, now)
+        self._record(policy_name, 'allowed' if allowed else 'limited')
+        return Decision(allowed, int(tokens), 0 if allowed else round((1 - tokens) / rate, 1))
+
+    def stats(self):
+        with self._counts_lock:
+            counts = {policy: dict(values) for policy, values in self._counts.items()}
+        return {
+            'enabled': self.enabled,
+            'store': type(self.store).__name__,
+            'policies': {name: dict(policy._asdict()) for name, policy in self.policies.items()},
+            'decisions': counts
+        }
+
+
+# Process-wide limiter; init_rate_limiter() attaches the configured store and policies
+limiter = RateLimiter()
+
+
+def parse_policy(value):
+    """'5/300' -> Policy(capacity=5, period=300)."""
+    capacity, period = str(value).split('/', 1)
+    return Policy(int(capacity), float(period))
+
+
+def client_address():
+    """The client's IP. ProxyFix (PROXY_COUNT) has already resolved it from the hops the proxy
+    appended; the client-supplied part of X-Forwarded-For is never trusted."""
+    return request.remote_addr or 'unknown'
+
+
+def rate_limit_key():
+    """Signed-in users are limited per account, anonymous callers per IP."""
+    user_id = session.get('user_id')
+    return f'user:{user_id}' if user_id else f'ip:{client_address()}'
+
+
+def rate_limited(policy_name, key=rate_limit_key):
+    """Decorator: answer 429 with Retry-After once key() has used up policy_name's bucket."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            decision = limiter.hit(policy_name, key())
+            if not decision.allowed:
+                response = jsonify({'success': False, 'error': 'Too many requests. Please try again later.'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(int(decision.retry_after + 0.999), 1))
+                return response
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def init_rate_limiter(app):
+    """Configure the limiter from RATE_LIMIT_URL, RATE_LIMITS ({policy: 'capacity/period'}) and RATE_LIMIT_ENABLED."""
+    url = app.config.get('RATE_LIMIT_URL') or default_rate_limit_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    try:
+        limiter.store = create_store(url)
+    except Exception as e:
+        app.logger.error(f"Rate limit store unavailable ({e}); limits apply per worker")
+        limiter.store = MemoryStore()
+    limiter.policies = {name: parse_policy(value) for name, value in app.config.get('RATE_LIMITS', {}).items()}
+    limiter.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
@@ -0,0 +1,85 @@
+"""Scheduled shelf rental expiry scan.
+
+Every worker runs scan() in a daemon thread every RENTAL_EXPIRY_SCAN_INTERVAL seconds,
+inside a request context whose session is the system account (actor() returns its
+user id), so the transitions it makes are audited like any other. A lease in the shared cache keeps it to about one run
+per interval across workers; the lease is best effort, so scan() itself must stay safe
+to run concurrently (conditional, batched UPDATEs).
+
+    init_expiry_scanner(app, scan_rental_expiry, system_user_id)
+"""
+
+import logging
+import os
+import threading
+import time
+
+from flask import session
+
+from cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY = 'lease:rental_expiry'
+
+_state = {'pid': None, 'app': None, 'scan': None, 'actor': None, 'interval': 300,
+          'runs': 0, 'errors': 0, 'last_run': None, 'last_result': None}
+_lock = threading.Lock()
+
+
+def run_scan(app=None):
+    """Run one scan now, in a system request context; returns scan()'s result."""
+    app = app or _state['app']
+    started = time.time()
+    with app.test_request_context('/internal/rental-expiry-scan'):
+        try:
+            session.update(user_id=_state['actor'](), username='system', user_role='admin')
+            result = _state['scan']()
+        except Exception:
+            _state['errors'] += 1
+            raise
+    _state['runs'] += 1
+    _state['last_run'] = started
+    _state['last_result'] = dict(result, duration_ms=round((time.time() - started) * 1000, 2))
+    return result
+
+
+def _scanner_loop():
+    while True:
+        time.sleep(_state['interval'])
+        if cache.get(LEASE_KEY) is not None:
+            continue
+        cache.set(LEASE_KEY, os.getpid(), ttl=max(_state['interval'] - 1, 1))
+        try:
+            result = run_scan()
+            if any(result.values()):
+                logger.info(f"Rental expiry scan: {result}")
+        except Exception as e:
+            logger.error(f"Rental expiry scan failed: {e}")
+
+
+def ensure_scanner_running():
+    """Start the scanner in this process (threads do not survive a gunicorn fork)."""
+    if _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        threading.Thread(target=_scanner_loop, name='rental-expiry-scanner', daemon=True).start()
+
+
+def scanner_stats():
+    """Runs, errors and the last result of this worker's scanner."""
+    return {key: _state[key] for key in ('interval', 'runs', 'errors', 'last_run', 'last_result')}
+
+
+def init_expiry_scanner(app, scan, actor):
+    """Run scan() periodically in every worker as the user actor() returns; RENTAL_EXPIRY_SCAN_INTERVAL=0 disables the schedule."""
+    _state['app'] = app
+    _state['scan'] = scan
+    _state['actor'] = actor
+    _state['interval'] = float(app.config.get('RENTAL_EXPIRY_SCAN_INTERVAL', 300))
+    if _state['interval'] > 0:
+        app.before_request(ensure_scanner_running)
@@ -0,0 +1,123 @@
+"""Response encoding: fast JSON, negotiated compression and an opt-in msgpack representation.
+
+- JSON is encoded with orjson when it is installed and with the stdlib otherwise; both
+  keep stock jsonify semantics (sorted keys, HTTP dates, trailing newline), though
+  orjson writes non-ASCII characters as UTF-8 rather than \\u escapes.
+- Text-like responses above COMPRESS_MIN_SIZE bytes are brotli- or gzip-compressed when
+  the client's Accept-Encoding allows it (brotli only if the package is installed).
+- Clients that send `Accept: application/msgpack` (the internal dashboards) get msgpack
+  instead of JSON from every jsonify() call, when msgpack is installed (jsonify responses
+  then carry `Vary: Accept`).
+"""
+
+import gzip
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/javascript', 'application/msgpack', 'text/')
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify()/app.json backed by orjson, falling back to the stdlib encoder."""
+
+    def dumps(self, obj, **kwargs):
+        # jsonify() always passes compact separators, which is all orjson writes; pretty-printing
+        # (debug mode), other separators and unknown kwargs keep the stdlib path
+        if (orjson is None or set(kwargs) - {'sort_keys', 'ensure_ascii', 'default', 'separators'}
+                or kwargs.get('separators', COMPACT_SEPARATORS) != COMPACT_SEPARATORS):
+            return super().dumps(obj, **kwargs)
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=options).decode()
+        except TypeError:
+            # orjson rejects a few inputs the stdlib accepts (e.g. ints over 64 bits)
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if representation() == 'msgpack':
+            obj = self._prepare_response_obj(args, kwargs)
+            response = self._app.response_class(msgpack.packb(obj, default=self.default), mimetype=MSGPACK_MIMETYPE)
+        else:
+            response = super().response(*args, **kwargs)
+        if msgpack is not None:
+            # The same URL answers with JSON or msgpack depending on Accept
+            response.vary.add('Accept')
+        return response
+
+
+def wants_msgpack():
+    """True when the client explicitly prefers msgpack over JSON."""
+    accept = request.accept_mimetypes
+    # Browsers send */*; only an explicitly listed msgpack counts
+    quality = next((q for value, q in accept if value == MSGPACK_MIMETYPE), 0)
+    return quality > 0 and quality >= accept.quality('application/json')
+
+
+def representation():
+    """'msgpack' when jsonify() answers this request with msgpack, otherwise 'json'."""
+    return 'msgpack' if msgpack is not None and wants_msgpack() else 'json'
+
+
+def choose_encoding():
+    """Best of br/gzip allowed by Accept-Encoding, or None."""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    accepted = request.accept_encodings
+    best = max(offered, key=lambda encoding: accepted[encoding])
+    return best if accepted[best] > 0 else None
+
+
+def compress_response(response, min_size, gzip_level=6, brotli_quality=5):
+    """after_request hook: compress buffered, text-like responses above min_size."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_MIMETYPES)):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=brotli_quality)
+    else:
+        compressed = gzip.compress(data, compresslevel=gzip_level)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        # The compressed body is a different representation of the same resource
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_response_encoding(app):
+    """Install the fast JSON provider and response compression on app."""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+    min_size = int(app.config.get('COMPRESS_MIN_SIZE', 1024))
+    app.after_request(lambda response: compress_response(response, min_size))
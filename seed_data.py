@@ -0,0 +1,279 @@
+"""Seed the database with realistic volumes of users, deliveries, audit logs and shelves.
+
+Usage:
+    python seed_data.py --deliveries 100000
+    DATABASE_URL=postgresql://localhost/errantmate_bench python seed_data.py --deliveries 1000000
+
+Rows are written with multi-row INSERTs in batches, so 1M deliveries take minutes
+rather than hours. Intended for benchmark databases only - never run against production.
+"""
+
+import argparse
+import itertools
+import random
+import string
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import func, insert, text
+
+from app import (app, db, User, Delivery, AuditLog, AuditAction, AuditResourceType, AuditUserAgent, Shelf,
+                 AUDIT_SEARCH_DETAILS_SQLITE, AUDIT_SEARCH_VECTOR_SQL, get_audit_lookup_id, get_current_time, run_schema_upgrade,
+                 shelf_rental_for)
+from werkzeug.security import generate_password_hash
+
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['Wanjiku', 'Kamau', 'Otieno', 'Achieng', 'Mwangi', 'Njeri', 'Kiprop', 'Chebet', 'Mutua', 'Wambui',
+               'Omondi', 'Akinyi', 'Kariuki', 'Nyambura', 'Barasa', 'Auma', 'Kimani', 'Jepkosgei', 'Ochieng', 'Muthoni']
+
+LAST_NAMES = ['Kamau', 'Odhiambo', 'Mwangi', 'Wafula', 'Kiptoo', 'Njoroge', 'Onyango', 'Mutiso', 'Cheruiyot', 'Macharia',
+              'Owino', 'Gitau', 'Kibet', 'Wekesa', 'Nduta']
+
+AREAS = ['Westlands', 'Kilimani', 'Kasarani', 'Embakasi', 'Karen', 'Roysambu', 'Ruaka', 'Rongai', 'Thika Road',
+         'Ngong Road', 'CBD', 'Parklands', 'South B', 'Kahawa West', 'Donholm']
+
+GOODS_TYPES = ['Documents', 'Electronics', 'Clothing', 'Groceries', 'Cosmetics', 'Shoes', 'Phone accessories',
+               'Books', 'Household items', 'Medicine']
+
+# Status mix of a typical month: most deliveries are done, a tail is still moving
+STATUSES = ['Delivered'] * 7 + ['In Transit'] * 2 + ['Pending']
+
+PAYMENT_AMOUNTS = {'Errant': 50.0, 'Pickup Location': 30.0}
+
+AUDIT_ACTIONS = ['LOGIN', 'LOGOUT', 'CREATE', 'UPDATE', 'VIEW', 'EXPORT']
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Linux; Android 13; SM-A145F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+]
+
+SEED_PASSWORD = 'benchmark123'
+
+
+def kenyan_phone(rng):
+    """Safaricom/Airtel style mobile number in the local 07xx / 01xx format."""
+    prefix = rng.choice(['070', '071', '072', '074', '079', '011', '010', '075'])
+    return prefix + ''.join(rng.choices(string.digits, k=7))
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def insert_batches(table, rows):
+    """Multi-row INSERT of an iterable of rows in BATCH_SIZE chunks; returns the number written.
+
+    Rows are consumed lazily, so a million-row seed never holds more than one chunk.
+    """
+    rows = iter(rows)
+    written = 0
+    while True:
+        chunk = list(itertools.islice(rows, BATCH_SIZE))
+        if not chunk:
+            return written
+        db.session.execute(insert(table), chunk)
+        db.session.commit()
+        written += len(chunk)
+
+
+def seed_users(rng, count):
+    """Create benchmark staff/admin accounts (bench_admin_N / bench_staff_N, password SEED_PASSWORD)."""
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    existing = {username for (username,) in db.session.query(User.username).filter(User.username.like('bench_%'))}
+    rows = []
+    for i in range(count):
+        role = 'admin' if i % 10 == 0 else 'staff'
+        username = f'bench_{role}_{i}'
+        if username in existing:
+            continue
+        rows.append({
+            'username': username,
+            'email': f'{username}@bench.errantmate.local',
+            'phone_number': None,
+            'password_hash': password_hash,
+            'role': role,
+            'created_at': get_current_time() - timedelta(days=rng.randint(30, 720)),
+            'is_active': True,
+        })
+    insert_batches(User.__table__, rows)
+    return [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('bench_%'))]
+
+
+def seed_deliveries(rng, count, user_ids, days, delivery_persons):
+    """Spread count deliveries over the last `days` days with per-day display ID sequences."""
+    now = get_current_time()
+    persons = [person_name(rng) for _ in range(delivery_persons)]
+    used_ids = {display_id for (display_id,) in db.session.query(Delivery.display_id)}
+    sequences = {}
+
+    def delivery_row():
+        created_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+        day = created_at.strftime('%y%m%d')
+        sequence = sequences.get(day, 0)
+        while True:
+            sequence += 1
+            display_id = f'{day}{sequence:04d}'
+            if display_id not in used_ids:
+                break
+        sequences[day] = sequence
+        status = rng.choice(STATUSES)
+        payment_by = rng.choice(list(PAYMENT_AMOUNTS))
+        return {
+            'display_id': display_id,
+            'sender_name': person_name(rng),
+            'sender_phone': kenyan_phone(rng),
+            'recipient_name': person_name(rng),
+            'recipient_phone': kenyan_phone(rng),
+            'recipient_address': f"{rng.choice(AREAS)}, Nairobi",
+            'delivery_person': rng.choice(persons) if status != 'Pending' or rng.random() < 0.3 else None,
+            'goods_type': rng.choice(GOODS_TYPES),
+            'quantity': rng.randint(1, 5),
+            'amount': PAYMENT_AMOUNTS[payment_by],
+            'expenses': rng.choice([0.0, 0.0, 20.0, 50.0, 100.0]),
+            'payment_by': payment_by,
+            'status': status,
+            'created_at': created_at,
+            'created_by': rng.choice(user_ids),
+        }
+
+    return insert_batches(Delivery.__table__, (delivery_row() for _ in range(count)))
+
+
+def seed_audit_logs(rng, count, user_ids, days):
+    """Structured audit rows, then one set-based pass to index them for search."""
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)))
+    action_ids = {name: get_audit_lookup_id(AuditAction, name) for name in AUDIT_ACTIONS}
+    resource_ids = {name: get_audit_lookup_id(AuditResourceType, name) for name in ('USER', 'DELIVERY', 'REPORT')}
+    agent_ids = [get_audit_lookup_id(AuditUserAgent, agent) for agent in USER_AGENTS]
+    db.session.commit()
+    display_ids = [display_id for (display_id,) in db.session.query(Delivery.display_id).limit(10000)]
+
+    first_id = (db.session.query(func.max(AuditLog.id)).scalar() or 0) + 1
+    now = get_current_time()
+
+    def audit_row():
+        user_id = rng.choice(user_ids)
+        action = rng.choice(AUDIT_ACTIONS)
+        if action in ('CREATE', 'UPDATE') and display_ids:
+            resource_type, resource_id = 'DELIVERY', rng.choice(display_ids)
+            details = {'message': f'{action.title()}d delivery {resource_id}', 'status': rng.choice(STATUSES)}
+        elif action == 'EXPORT':
+            resource_type, resource_id = 'REPORT', None
+            details = {'message': 'Exported deliveries', 'period': rng.choice(['daily', 'weekly', 'monthly'])}
+        else:
+            resource_type, resource_id = 'USER', str(user_id)
+            details = {'message': f'User {action.lower()}'}
+        return {
+            'user_id': user_id,
+            'username': usernames[user_id],
+            'action_id': action_ids[action],
+            'resource_type_id': resource_ids[resource_type],
+            'resource_id': resource_id,
+            'details_json': details,
+            'ip_address': f'41.90.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            'user_agent_id': rng.choice(agent_ids),
+            'timestamp': now - timedelta(seconds=rng.randint(0, days * 86400)),
+        }
+
+    written = insert_batches(AuditLog.__table__, (audit_row() for _ in range(count)))
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(f"UPDATE audit_log SET search_vector = {AUDIT_SEARCH_VECTOR_SQL} WHERE search_vector IS NULL"))
+    else:
+        db.session.execute(text(f"""
+            INSERT OR REPLACE INTO audit_log_fts (rowid, username, resource_id, details)
+            SELECT id, username, resource_id, {AUDIT_SEARCH_DETAILS_SQLITE} FROM audit_log WHERE id >= :first_id
+        """), {'first_id': first_id})
+    db.session.commit()
+    return written
+
+
+def seed_shelves(rng, count):
+    """Shelves A-01, A-02, ... (60 per zone) with a realistic occupancy mix.
+
+    Occupied shelves get their due date and an open shelf_rental row, as renting one does.
+    """
+    existing = {shelf_id for (shelf_id,) in db.session.query(Shelf.id)}
+    today = get_current_time().date()
+    rows, rentals = [], []
+    for i in range(count):
+        shelf_id = f"{string.ascii_uppercase[(i // 60) % 26]}{i // (60 * 26) or ''}-{i % 60 + 1:02d}"
+        if shelf_id in existing:
+            continue
+        size = rng.choice(['Small', 'Small', 'Large'])
+        # executemany needs the same keys in every row
+        row = {
+            'id': shelf_id,
+            'status': 'available',
+            'size': size,
+            'price': 1500 if size == 'Small' else 3000,
+            'customer_name': None,
+            'customer_phone': None,
+            'rented_date': None,
+            'items_description': None,
+            'rental_period': None,
+            'discount': 0.0,
+            'maintenance_reason': None,
+            'due_date': None,
+            'expiry_notice': None,
+        }
+        roll = rng.random()
+        if roll < 0.6:
+            row.update(
+                status='occupied',
+                customer_name=person_name(rng),
+                customer_phone=kenyan_phone(rng),
+                rented_date=today - timedelta(days=rng.randint(0, 365)),
+                items_description=rng.choice(GOODS_TYPES),
+                rental_period=rng.choice([1, 3, 6, 12]),
+                discount=rng.choice([0.0, 0.0, 5.0, 10.0]),
+            )
+            rentals.append(shelf_rental_for(SimpleNamespace(**row)))
+            row['due_date'] = rentals[-1].due_date
+        elif roll < 0.65:
+            row.update(status='maintenance', maintenance_reason='Scheduled repair')
+        rows.append(row)
+    written = insert_batches(Shelf.__table__, rows)
+    db.session.add_all(rentals)
+    db.session.commit()
+    return written
+
+
+def seed(deliveries=10000, users=None, audit_logs=None, shelves=120, days=365, delivery_persons=40, seed=42):
+    """Populate the configured database; returns a dict of rows written per table."""
+    rng = random.Random(seed)
+    users = users or max(10, deliveries // 2000)
+    audit_logs = deliveries * 2 if audit_logs is None else audit_logs
+    run_schema_upgrade()
+    with app.app_context():
+        user_ids = seed_users(rng, users)
+        return {
+            'users': len(user_ids),
+            'deliveries': seed_deliveries(rng, deliveries, user_ids, days, delivery_persons),
+            'audit_logs': seed_audit_logs(rng, audit_logs, user_ids, days),
+            'shelves': seed_shelves(rng, shelves),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database (DATABASE_URL) with benchmark data.')
+    parser.add_argument('--deliveries', type=int, default=10000, help='deliveries to create (e.g. 10000, 100000, 1000000)')
+    parser.add_argument('--users', type=int, default=None, help='staff/admin accounts (default: deliveries / 2000, min 10)')
+    parser.add_argument('--audit-logs', type=int, default=None, help='audit rows (default: 2 per delivery)')
+    parser.add_argument('--shelves', type=int, default=120)
+    parser.add_argument('--days', type=int, default=365, help='spread created_at over this many days')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for reproducible datasets')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = seed(args.deliveries, args.users, args.audit_logs, args.shelves, args.days, seed=args.seed)
+    print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+    print(f"Log in as bench_admin_0 / bench_staff_1 with password '{SEED_PASSWORD}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Shelf rental billing, computed per calendar month in one SQL statement.
+
+Every rental in shelf_rental is billed at monthly_price less its discount (percent):
+
+    expected  the contracted charges falling due in the month: one per rental month,
+              on the start date's day, for rental_period months (none after an early end)
+    accrued   what occupancy in the month earned: the monthly charge prorated by the
+              days the shelf was held (up to end_date, or up to as_of while running)
+    overdue   the part of accrued earned after the rental's due_date, i.e. shelves kept
+              past their paid-for term
+
+Months are a small derived table joined to the rentals, so the database does the
+arithmetic for every rental and month at once; nothing loops over rentals in Python.
+"""
+
+import calendar
+from datetime import date, timedelta
+
+from sqlalchemy import Date, Integer, and_, case, extract, func, literal, or_, select, union_all
+
+
+def add_months(start, months):
+    """start moved by whole months, clipped to the last day of a shorter month."""
+    month_index = start.year * 12 + start.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(start.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def month_range(first, last):
+    """(month_start, next_month_start) for every month from first to last inclusive."""
+    months = []
+    current = first.replace(day=1)
+    while current <= last:
+        following = add_months(current, 1)
+        months.append((current, following))
+        current = following
+    return months
+
+
+def _months_table(months):
+    rows = [
+        select(
+            literal(position, Integer).label('position'),
+            literal(start, Date).label('month_start'),
+            literal(end, Date).label('month_end'),
+            literal((end - start).days, Integer).label('days'),
+            literal(start.year * 12 + start.month - 1, Integer).label('month_index'),
+        )
+        for position, (start, end) in enumerate(months)
+    ]
+    return union_all(*rows).subquery('months')
+
+
+def _days_between(later, earlier, dialect):
+    if dialect == 'postgresql':
+        return later - earlier
+    return func.julianday(later) - func.julianday(earlier)
+
+
+def _least(a, b):
+    return case((a < b, a), else_=b)
+
+
+def _greatest(a, b):
+    return case((a > b, a), else_=b)
+
+
+def _month_index(column):
+    return extract('year', column) * 12 + extract('month', column) - 1
+
+
+def billing_by_month(session, rental_table, first_month, last_month, as_of=None):
+    """Accrued, expected and overdue shelf revenue for each month from first_month to last_month.
+
+    rental_table is the shelf_rental Table; as_of (default today) is the last day
+    occupancy has happened for running rentals.
+    """
+    as_of = as_of or date.today()
+    months = month_range(first_month, last_month)
+    m = _months_table(months)
+    r = rental_table.c
+    dialect = session.get_bind().dialect.name
+
+    net = r.monthly_price * (1 - func.coalesce(r.discount, 0) / 100.0)
+    stop = func.coalesce(r.end_date, literal(as_of + timedelta(days=1), Date))
+    held_until = _least(stop, m.c.month_end)
+    occupied_days = _greatest(_days_between(held_until, _greatest(r.start_date, m.c.month_start), dialect), 0)
+    overdue_days = _greatest(_days_between(held_until, _greatest(r.due_date, m.c.month_start), dialect), 0)
+
+    contract_month = m.c.month_index - _month_index(r.start_date)
+    due_before_end = or_(
+        r.end_date.is_(None),
+        _month_index(r.end_date) > m.c.month_index,
+        and_(_month_index(r.end_date) == m.c.month_index, extract('day', r.end_date) > extract('day', r.start_date)),
+    )
+    expected = case(
+        (and_(contract_month >= 0, contract_month < func.coalesce(r.rental_period, 1), due_before_end), net),
+        else_=0
+    )
+
+    stmt = (
+        select(
+            m.c.position,
+            func.sum(net * occupied_days / m.c.days).label('accrued'),
+            func.sum(expected).label('expected'),
+            func.sum(net * overdue_days / m.c.days).label('overdue'),
+            func.sum(case((occupied_days > 0, 1), else_=0)).label('rentals'),
+        )
+        .select_from(m.join(rental_table, r.start_date < m.c.month_end))
+        .where(or_(r.end_date.is_(None), r.end_date > months[0][0]))
+        .group_by(m.c.position)
+    )
+    totals = {row.position: row for row in session.execute(stmt)}
+
+    result = []
+    for position, (start, _) in enumerate(months):
+        row = totals.get(position)
+        result.append({
+            'month': start.strftime('%Y-%m'),
+            'accrued': round(float(row.accrued or 0), 2) if row else 0.0,
+            'expected': round(float(row.expected or 0), 2) if row else 0.0,
+            'overdue': round(float(row.overdue or 0), 2) if row else 0.0,
+            'rentals': int(row.rentals or 0) if row else 0,
+        })
+    return result
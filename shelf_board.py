@@ -0,0 +1,102 @@
+"""Shelf board snapshot shared by the rent shelf page, /api/shelves and /api/shelves/stats.
+
+The board is every shelf as its /api/shelves dict plus availability, occupancy and
+revenue aggregates per zone (the id up to its last '-') and per size. It is built on a miss,
+serialized once, and kept in the shared cache under 'shelf:board'. A shelf
+change clears it in every worker through the invalidation bus, so page views and
+refreshes in between are served from memory. BOARD_TTL only bounds how long a board
+built while a write was committing can survive.
+
+Its version is a hash of the serialized board, so every worker hands out the same
+ETag for the same board.
+"""
+
+import hashlib
+import threading
+import time
+
+from flask import current_app
+
+from cache import cache
+
+
+BOARD_KEY = 'shelf:board'
+
+BOARD_TTL = 300
+
+STATUSES = ('available', 'occupied', 'maintenance')
+
+_state = {'generation': 0, 'builds': 0}
+_lock = threading.Lock()
+
+
+def shelf_zone(shelf_id):
+    """'A' for 'A-01', 'B2' for 'B2-10'; ids without a '-' are their own zone."""
+    return shelf_id.rsplit('-', 1)[0] if '-' in shelf_id else shelf_id
+
+
+def _empty_group():
+    return {'total': 0, **dict.fromkeys(STATUSES, 0), 'revenue': 0.0, 'occupancy': 0.0}
+
+
+def aggregate(shelves):
+    """Counts per status, monthly revenue of occupied shelves (after discount) and occupancy."""
+    totals, zones, sizes = _empty_group(), {}, {}
+    for shelf in shelves:
+        groups = (totals, zones.setdefault(shelf_zone(shelf['id']), _empty_group()),
+                  sizes.setdefault(shelf['size'], _empty_group()))
+        revenue = shelf['price'] * (1 - (shelf['discount'] or 0) / 100) if shelf['status'] == 'occupied' else 0
+        for group in groups:
+            group['total'] += 1
+            if shelf['status'] in STATUSES:
+                group[shelf['status']] += 1
+            group['revenue'] += revenue
+    for group in (totals, *zones.values(), *sizes.values()):
+        group['revenue'] = round(group['revenue'], 2)
+        group['occupancy'] = round(group['occupied'] / group['total'], 3) if group['total'] else 0.0
+    return totals, dict(sorted(zones.items())), dict(sorted(sizes.items()))
+
+
+def build_board(shelves, extra=None):
+    """Board for a list of shelf dicts; extra is merged in (e.g. this month's billing)."""
+    body = current_app.json.dumps(shelves) + '\n'
+    digest = hashlib.sha1(body.encode())
+    digest.update(current_app.json.dumps(extra or {}).encode())
+    totals, zones, sizes = aggregate(shelves)
+    return {
+        'version': digest.hexdigest()[:16],
+        'built_at': time.time(),
+        'shelves': shelves,
+        'body': body.encode(),
+        'totals': totals,
+        'zones': zones,
+        'sizes': sizes,
+        **(extra or {}),
+    }
+
+
+def shelf_board(load):
+    """The current board; load() returns (shelf dicts, extra) when it has to be rebuilt."""
+    board = cache.get(BOARD_KEY)
+    if board is not None:
+        return board
+    generation = _state['generation']
+    board = build_board(*load())
+    with _lock:
+        _state['builds'] += 1
+        # A shelf changed while this board was being built: serve it once, do not store it
+        if generation == _state['generation']:
+            cache.set(BOARD_KEY, board, BOARD_TTL)
+    return board
+
+
+def invalidate_shelf_board(*_):
+    """Drop the board everywhere (bus callback: table, ids are ignored)."""
+    with _lock:
+        _state['generation'] += 1
+    cache.delete(BOARD_KEY)
+
+
+def board_stats():
+    """Builds in this worker and the generation counter."""
+    return dict(_state)
@@ -0,0 +1,158 @@
+"""Slow-query recorder: keeps SQL statements over a threshold, with their query plans.
+
+Entries go to an in-process ring buffer (shown on the system health page) and, once
+open_slow_query_log() has run, to a rotating JSON-lines file shared by all workers. Plans are captured by a background
+thread on a separate connection, so the slow request is not delayed further and its
+transaction is never touched.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+EXPLAINABLE_PREFIXES = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+# Re-explain the same statement at most this often (seconds)
+EXPLAIN_COOLDOWN = 300
+
+slow_query_buffer = deque(maxlen=100)
+
+slow_query_logger = logging.getLogger('errantmate.slow_queries')
+
+_explain_queue = queue.Queue(maxsize=100)
+
+_last_explained = {}
+
+_worker = {'pid': None}
+
+_settings = {'threshold_ms': 250.0, 'log_dir': 'logs', 'file_handler': None}
+
+
+def describe_parameters(parameters):
+    """Shape of the bound parameters (types and lengths, never the values)."""
+    def shape(value):
+        if isinstance(value, str):
+            return f'str({len(value)})'
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shape(value) for value in parameters]
+    return shape(parameters)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('errantmate_slow_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('errantmate_slow_query_start')
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    if duration_ms < _settings['threshold_ms']:
+        return
+
+    entry = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'duration_ms': round(duration_ms, 2),
+        'statement': statement,
+        'parameters': describe_parameters(parameters),
+        'executemany': executemany,
+        'route': None,
+        'plan': None,
+        'pid': os.getpid(),
+    }
+    if has_request_context():
+        entry['route'] = f"{request.method} {request.endpoint or request.path}"
+    slow_query_buffer.appendleft(entry)
+
+    explainable = not executemany and statement.lstrip().upper().startswith(EXPLAINABLE_PREFIXES)
+    last = _last_explained.get(statement, 0)
+    if explainable and time.monotonic() - last > EXPLAIN_COOLDOWN:
+        if len(_last_explained) > 1000:
+            _last_explained.clear()
+        _last_explained[statement] = time.monotonic()
+        _ensure_worker()
+        try:
+            _explain_queue.put_nowait((conn.engine, entry, parameters))
+            return
+        except queue.Full:
+            pass
+    slow_query_logger.warning(json.dumps(entry, default=str))
+
+
+def explain(engine, statement, parameters):
+    """Return the query plan for statement as a list of text lines."""
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+        raw.rollback()
+    finally:
+        raw.close()
+    if engine.dialect.name == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def _explain_worker():
+    while True:
+        engine, entry, parameters = _explain_queue.get()
+        try:
+            entry['plan'] = explain(engine, entry['statement'], parameters)
+        except Exception as e:
+            entry['plan'] = [f'EXPLAIN failed: {e}']
+        slow_query_logger.warning(json.dumps(entry, default=str))
+
+
+def _ensure_worker():
+    # Threads do not survive a fork, so each gunicorn worker starts its own
+    if _worker['pid'] != os.getpid():
+        _worker['pid'] = os.getpid()
+        threading.Thread(target=_explain_worker, name='slow-query-explain', daemon=True).start()
+
+
+def recent_slow_queries(limit=50):
+    """Newest-first slow queries recorded by this worker."""
+    return list(slow_query_buffer)[:limit]
+
+
+def open_slow_query_log():
+    """Also write entries to log_dir/slow_queries.log (creates the directory); idempotent."""
+    if _settings['file_handler'] is not None:
+        return
+    os.makedirs(_settings['log_dir'], exist_ok=True)
+    handler = RotatingFileHandler(os.path.join(_settings['log_dir'], 'slow_queries.log'),
+                                  maxBytes=5 * 1024 * 1024, backupCount=5)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_query_logger.addHandler(handler)
+    _settings['file_handler'] = handler
+
+
+def init_slow_query_log(app, log_dir='logs'):
+    """Start recording statements slower than SLOW_QUERY_THRESHOLD_MS; open_slow_query_log() adds the file."""
+    _settings['threshold_ms'] = float(app.config.get('SLOW_QUERY_THRESHOLD_MS', 250))
+    _settings['log_dir'] = log_dir
+    # Until the file is opened, entries only go to the ring buffer
+    slow_query_logger.addHandler(logging.NullHandler())
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,72 @@
+"""Shared fixtures: a throwaway seeded SQLite database, logged-in clients and a query counter.
+
+app.py reads DATABASE_URL, CACHE_URL and RATE_LIMIT_URL when it is imported, so they are
+pointed at a temporary directory here, before any test module imports it.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+_database_dir = tempfile.mkdtemp(prefix='errantmate-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ['CACHE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'cache.sqlite3')}"
+os.environ['RATE_LIMIT_URL'] = f"sqlite:///{os.path.join(_database_dir, 'ratelimit.sqlite3')}"
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ['RENTAL_EXPIRY_SCAN_INTERVAL'] = '0'
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryRecorder:
+    """Collects statements issued by the current thread (background samplers are ignored)."""
+
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_database_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The app on a database seeded with seed_data.py (500 deliveries, 60 shelves)."""
+    from app import app
+    from seed_data import seed
+
+    seed(deliveries=500, shelves=60)
+    return app
+
+
+@pytest.fixture(scope='session')
+def clients(app):
+    """Test clients logged in as a seeded admin and staff account, keyed by role."""
+    from benchmark import login_as
+
+    clients = {role: app.test_client() for role in ('admin', 'staff')}
+    for role, client in clients.items():
+        login_as(client, role)
+    return clients
+
+
+@pytest.fixture
+def count_queries():
+    """`with count_queries() as recorder:` records the SQL issued inside the block."""
+    return QueryRecorder
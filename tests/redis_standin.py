@@ -0,0 +1,143 @@
+"""Minimal in-memory Redis-protocol (RESP2) server for tests.
+
+Implements what the cache's RedisBackend uses through redis-py: PING, GET, SET (with EX/PX),
+DEL, SCAN (with MATCH/COUNT) and FLUSHDB, plus the CLIENT/SELECT handshake commands.
+
+    server = RedisStandIn().start()
+    backend = create_backend(server.url)
+    ...
+    server.stop()   # later connections are refused, as with a Redis that went down
+"""
+
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.server.standin.connections.add(self.connection)
+
+    def finish(self):
+        self.server.standin.connections.discard(self.connection)
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            try:
+                reply = self.server.standin.execute(command)
+            except Exception as e:
+                reply = RuntimeError(str(e))
+            self.wfile.write(_encode(reply))
+
+    def _read_command(self):
+        try:
+            line = self.rfile.readline()
+        except OSError:
+            return None
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()   # inline command
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, RuntimeError):
+        return f'-ERR {reply}\r\n'.encode()
+    if isinstance(reply, str):
+        return f'+{reply}\r\n'.encode()
+    if isinstance(reply, int):
+        return f':{reply}\r\n'.encode()
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RedisStandIn:
+    """One database of bytes values with optional expiry, served on 127.0.0.1."""
+
+    def __init__(self):
+        self.data = {}   # key -> (value, expires_at)
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.standin = self
+        threading.Thread(target=self._server.serve_forever, name='redis-standin', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, command):
+        name, args = command[0].upper().decode(), command[1:]
+        with self._lock:
+            if name == 'PING':
+                return 'PONG'
+            if name in ('CLIENT', 'SELECT'):
+                return 'OK'
+            if name == 'GET':
+                entry = self._live(args[0])
+                return entry[0] if entry else None
+            if name == 'SET':
+                expires_at, options = None, [arg.upper() for arg in args[2:]]
+                if b'EX' in options:
+                    expires_at = time.time() + int(args[2 + options.index(b'EX') + 1])
+                if b'PX' in options:
+                    expires_at = time.time() + int(args[2 + options.index(b'PX') + 1]) / 1000
+                self.data[args[0]] = (args[1], expires_at)
+                return 'OK'
+            if name == 'DEL':
+                return sum(self.data.pop(key, None) is not None for key in args)
+            if name == 'SCAN':
+                # Everything in one page: cursor 0 back means the scan is complete
+                options = [arg.upper() for arg in args[1:]]
+                pattern = args[1 + options.index(b'MATCH') + 1].decode() if b'MATCH' in options else '*'
+                keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+                return [b'0', keys]
+            if name == 'FLUSHDB':
+                self.data.clear()
+                return 'OK'
+        raise RuntimeError(f"unknown command '{name}'")
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from cache import Cache, LocalLRU, MISSING, RedisBackend, SQLiteBackend, create_backend
+from redis_standin import RedisStandIn
+
+
+@pytest.fixture
+def redis_server():
+    pytest.importorskip('redis')
+    server = RedisStandIn().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def shared_url(request, tmp_path):
+    """CACHE_URL of a shared tier: a SQLite file or the Redis-protocol stand-in."""
+    if request.param == 'sqlite':
+        return f"sqlite:///{tmp_path / 'cache.sqlite3'}"
+    return request.getfixturevalue('redis_server').url
+
+
+def worker(url, **kwargs):
+    """A Cache as one gunicorn worker would build it: its own LRU over the shared backend."""
+    return Cache(shared=create_backend(url), **kwargs)
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LocalLRU(max_entries=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+
+    assert lru.get('b') is MISSING
+    assert (lru.get('a'), lru.get('c')) == (1, 3)
+    assert len(lru) == 2
+
+
+def test_lru_expires_entries():
+    lru = LocalLRU()
+    lru.set('a', 1, ttl=0.05)
+    time.sleep(0.1)
+    assert lru.get('a') is MISSING
+
+
+def test_create_backend_picks_the_shared_tier(shared_url):
+    assert isinstance(create_backend(shared_url), (SQLiteBackend, RedisBackend))
+    assert create_backend('local') is None
+
+
+def test_read_through_from_the_shared_tier(shared_url):
+    first, second = worker(shared_url), worker(shared_url)
+    first.set('user:1', {'name': 'Amina'}, ttl=60)
+
+    assert second.get('user:1') == {'name': 'Amina'}   # shared hit, copied into the local tier
+    assert second.get('user:1') == {'name': 'Amina'}   # local hit
+    assert second.stats()['namespaces']['user'] == {'local_hit': 1, 'shared_hit': 1, 'miss': 0, 'hit_ratio': 1.0}
+
+
+def test_evicted_local_entries_are_read_back_from_the_shared_tier(shared_url):
+    cache = worker(shared_url)
+    cache.local.max_entries = 2
+    for n in range(3):
+        cache.set(f'user:{n}', n, ttl=60)
+
+    assert cache.local.get('user:0') is MISSING
+    assert cache.get('user:0') == 0
+    assert cache.stats()['namespaces']['user']['shared_hit'] == 1
+
+
+def test_deletes_reach_other_workers_within_the_local_ttl(shared_url):
+    first, second = worker(shared_url), worker(shared_url, local_ttl=0.05)
+    first.set('shelf:board', 'v1', ttl=60)
+    first.set('shelf:stats', 'v1', ttl=60)
+    assert second.get('shelf:board') == 'v1'
+
+    first.delete_prefix('shelf:')
+    time.sleep(0.1)
+
+    assert second.get('shelf:board') is None
+    assert second.get('shelf:stats') is None
+
+
+def test_shared_entries_expire(shared_url):
+    first, second = worker(shared_url), worker(shared_url)
+    first.set('user:1', 'Amina', ttl=1)
+    time.sleep(1.1)
+    assert second.get('user:1') is None
+
+
+def test_unavailable_shared_tier_is_a_miss(redis_server, caplog):
+    cache = worker(redis_server.url)
+    cache.set('user:1', 'Amina', ttl=60)
+    redis_server.stop()
+
+    # Writes and reads keep working on the local tier; the shared tier's failures are logged
+    cache.set('user:2', 'Baraka', ttl=60)
+    assert cache.get('user:2') == 'Baraka'
+    cache.local.clear()
+    assert cache.get('user:1', 'fallback') == 'fallback'
+    assert cache.get_or_set('user:3', lambda: 'computed', ttl=60) == 'computed'
+    assert 'Shared cache get failed' in caplog.text
+
+
+def test_unsupported_cache_url_falls_back_to_the_local_tier(app, monkeypatch):
+    from cache import cache, init_cache
+
+    shared = cache.shared
+    monkeypatch.setitem(app.config, 'CACHE_URL', 'memcached://localhost')
+    try:
+        init_cache(app)
+        assert cache.shared is None
+    finally:
+        cache.shared = shared
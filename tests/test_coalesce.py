@@ -0,0 +1,21 @@
+import pytest
+
+from coalesce import clear_coalesced
+
+msgpack = pytest.importorskip('msgpack')
+
+
+def test_representations_are_cached_separately(clients):
+    client = clients['admin']
+    clear_coalesced('get_status_distribution')
+
+    packed = client.get('/get_status_distribution', headers={'Accept': 'application/msgpack'})
+    plain = client.get('/get_status_distribution', headers={'Accept': 'text/html,*/*;q=0.8'})
+    # Both are now stored, so these are served from the cache
+    packed_again = client.get('/get_status_distribution', headers={'Accept': 'application/msgpack'})
+    plain_again = client.get('/get_status_distribution')
+
+    assert packed.status_code == plain.status_code == 200
+    assert packed.mimetype == packed_again.mimetype == 'application/msgpack'
+    assert plain.mimetype == plain_again.mimetype == 'application/json'
+    assert msgpack.unpackb(packed.get_data()) == plain.get_json() == plain_again.get_json()
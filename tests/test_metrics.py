@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip('prometheus_client')
+
+
+def scrape(app, address, **headers):
+    return app.test_client().get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': address})
+
+
+def test_metrics_without_token_are_loopback_only(app, monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+
+    assert scrape(app, '127.0.0.1').status_code == 200
+    assert scrape(app, '203.0.113.7').status_code == 403
+    # A client cannot claim to be local through X-Forwarded-For
+    assert scrape(app, '10.0.0.2', **{'X-Forwarded-For': '127.0.0.1, 203.0.113.7'}).status_code == 403
+
+
+def test_metrics_token_is_required_once_set(app, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-me')
+
+    assert scrape(app, '127.0.0.1').status_code == 401
+    assert scrape(app, '203.0.113.7', Authorization='Bearer wrong').status_code == 401
+    response = scrape(app, '203.0.113.7', Authorization='Bearer scrape-me')
+    assert response.status_code == 200
+    assert b'errantmate_http_requests_total' in response.data
@@ -0,0 +1,64 @@
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import password_pool
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture(autouse=True)
+def pool_state():
+    saved = dict(password_pool._state)
+    password_pool._state.update(method=FAST_METHOD, dummy_hash=password_pool.dummy_hash(FAST_METHOD),
+                                pid=None, executor=None, slots=None)
+    yield password_pool._state
+    if password_pool._state['executor'] is not None:
+        password_pool._state['executor'].shutdown(wait=True, cancel_futures=True)
+    password_pool._state.clear()
+    password_pool._state.update(saved)
+
+
+class BrokenExecutor:
+    """Stands in for a pool whose worker died: every submit fails."""
+
+    def __init__(self):
+        self.shutdowns = []
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+    def shutdown(self, **kwargs):
+        self.shutdowns.append(kwargs)
+
+
+def test_failed_pool_is_shut_down_and_replaced(pool_state):
+    password_pool._executor()
+    pool_state['executor'].shutdown(wait=True)
+    broken = pool_state['executor'] = BrokenExecutor()
+
+    # The failing call still gets its answer, computed inline
+    assert password_pool.verify_password(generate_password_hash('secret', FAST_METHOD), 'secret')
+    assert broken.shutdowns == [{'wait': False, 'cancel_futures': True}]
+    assert pool_state['executor'] is None
+
+    assert password_pool.verify_password(password_pool.hash_password('secret'), 'secret')
+    assert pool_state['executor'] is not broken
+
+
+def test_killed_worker_does_not_break_logins(pool_state):
+    password_hash = password_pool.hash_password('secret')
+    executor = pool_state['executor']
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    assert password_pool.verify_password(password_hash, 'secret')
+    assert password_pool.verify_password(password_hash, 'secret')
+    assert pool_state['executor'] is not executor
+
+
+def test_unknown_user_never_verifies():
+    assert password_pool.verify_password(None, 'secret') is False
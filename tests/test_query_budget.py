@@ -0,0 +1,107 @@
+"""Per-route SQL query budgets.
+
+Each route is called once to warm per-process caches, then the statements its second
+call issues are counted. A route fails when it
+
+  * answers with anything but a 2xx/3xx (or redirects to the login page), since a
+    failing or unauthenticated route issues fewer queries and would pass its budget,
+  * issues more statements than its budget, or
+  * scans a large table with no WHERE/LIMIT (an unbounded .all()) that it is not
+    explicitly allowed to in `full_scans`.
+
+When a change lowers a route's count, lower its budget here in the same commit
+(`pytest tests/test_query_budget.py -s` prints the measured counts).
+"""
+
+import re
+
+import pytest
+
+from app import Delivery
+
+# Tables where a statement without WHERE/LIMIT means loading the whole history
+LARGE_TABLES = ('delivery', 'audit_log')
+
+# Route -> url, optional method/role/data, and the statement budget (the count measured
+# when the budget was set). full_scans lists the large tables a route may still read in
+# full; shrink it as routes move to aggregates.
+QUERY_BUDGETS = {
+    'dashboard': {'url': '/', 'queries': 1, 'full_scans': ['delivery']},
+    'get_summary': {'url': '/get_summary', 'queries': 6, 'full_scans': ['delivery']},
+    'get_delivery_persons': {'url': '/get_delivery_persons', 'queries': 2},
+    'get_staff_stats': {'url': '/get_staff_stats', 'role': 'staff', 'queries': 4},
+    'get_delivery_trends': {'url': '/get_delivery_trends?days=30', 'queries': 1},
+    'get_delivery_trends_line': {'url': '/get_delivery_trends_line', 'queries': 1},
+    'get_revenue_charts': {'url': '/get_revenue_charts', 'queries': 1},
+    'get_revenue_analytics': {'url': '/get_revenue_analytics?period=daily', 'queries': 1},
+    'get_status_distribution': {'url': '/get_status_distribution', 'queries': 1},
+    'get_recent_deliveries': {'url': '/get_recent_deliveries', 'queries': 2},
+    'get_user_recent_deliveries': {'url': '/get_user_recent_deliveries', 'role': 'staff', 'queries': 2},
+    'get_unassigned_deliveries': {'url': '/get_unassigned_deliveries', 'queries': 1},
+    'get_pending_deliveries': {'url': '/get_pending_deliveries', 'queries': 1},
+    'search_delivery_by_display_id': {'url': '/search_delivery_by_display_id?display_id={display_id}', 'queries': 1},
+    'get_delivery_by_display_id': {'url': '/get_delivery_by_display_id/{display_id}', 'queries': 1},
+    'audit_logs_search': {'url': '/audit_logs?q={display_id}', 'queries': 1},
+    'api_shelves': {'url': '/api/shelves', 'queries': 0},
+    'api_shelves_stats': {'url': '/api/shelves/stats', 'queries': 0},
+    'add_delivery': {'url': '/add_delivery', 'method': 'POST', 'role': 'staff', 'queries': 6, 'data': {
+        'sender_name': 'Budget Sender', 'sender_phone': '0712345678', 'recipient_name': 'Budget Recipient',
+        'recipient_phone': '0722345678', 'recipient_address': 'Westlands, Nairobi', 'goods_type': 'Documents',
+        'quantity': '1', 'payment_by': 'Errant', 'amount': '50'}},
+}
+
+UNBOUNDED = re.compile(r'\bFROM\s+"?(%s)"?\b' % '|'.join(LARGE_TABLES), re.IGNORECASE)
+
+
+def unbounded_tables(statement):
+    """Large tables a SELECT reads without any WHERE, LIMIT or aggregate."""
+    sql = ' '.join(statement.split()).upper()
+    if not sql.startswith('SELECT') or ' WHERE ' in sql or ' LIMIT ' in sql:
+        return set()
+    if re.search(r'\b(COUNT|SUM|MAX|MIN|AVG)\(', sql):
+        return set()
+    return {match.lower() for match in UNBOUNDED.findall(sql)}
+
+
+def check_status(name, response):
+    assert 200 <= response.status_code < 400, f"{name} answered {response.status_code}"
+    assert '/login' not in response.headers.get('Location', ''), f"{name} redirected to the login page"
+
+
+@pytest.fixture(scope='module')
+def display_id(app):
+    with app.app_context():
+        return Delivery.query.order_by(Delivery.id).first().display_id
+
+
+@pytest.fixture(scope='module', autouse=True)
+def uncached_analytics(app):
+    # Budget the work a view does, not a hit on its stored analytics result
+    app.config['ANALYTICS_CACHE_ENABLED'] = False
+    yield
+    app.config['ANALYTICS_CACHE_ENABLED'] = True
+
+
+@pytest.mark.parametrize('name', QUERY_BUDGETS)
+def test_query_budget(name, clients, display_id, count_queries):
+    budget = QUERY_BUDGETS[name]
+    client = clients[budget.get('role', 'admin')]
+    url = budget['url'].format(display_id=display_id)
+
+    def call():
+        if budget.get('method', 'GET') == 'POST':
+            return client.post(url, data=budget.get('data'))
+        return client.get(url)
+
+    check_status(name, call())
+    with count_queries() as recorder:
+        response = call()
+    check_status(name, response)
+
+    statements = recorder.statements
+    scans = set().union(*(unbounded_tables(statement) for statement in statements)) if statements else set()
+    print(f"{name:32} {len(statements):>3} queries (budget {budget['queries']})  full scans: {', '.join(sorted(scans)) or '-'}")
+    listing = '\n'.join('    ' + ' '.join(statement.split())[:200] for statement in statements)
+    assert len(statements) <= budget['queries'], f"{len(statements)} queries, budget {budget['queries']}:\n{listing}"
+    new_scans = scans - set(budget.get('full_scans', []))
+    assert not new_scans, f"unbounded read of {', '.join(sorted(new_scans))}:\n{listing}"
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+from flask import jsonify
+
+import response_encoding
+
+
+def test_jsonify_encodes_with_orjson(app, monkeypatch):
+    orjson = pytest.importorskip('orjson')
+    encode, calls = orjson.dumps, []
+
+    def dumps(*args, **kwargs):
+        calls.append(args)
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(response_encoding.orjson, 'dumps', dumps)
+    payload = {'b': 1, 'a': datetime.datetime(2024, 5, 1, 12, 30)}
+    with app.test_request_context('/'):
+        response = jsonify(payload)
+
+    assert [args for args in calls if args[0] is payload]
+    assert response.get_data(as_text=True) == '{"a":"Wed, 01 May 2024 12:30:00 GMT","b":1}\n'
+
+
+def test_pretty_printing_keeps_the_stdlib_encoder(app):
+    assert app.json.dumps({'a': 1}, indent=2) == '{\n  "a": 1\n}'
+
+
+def test_shelf_representations_vary_on_accept(clients):
+    pytest.importorskip('msgpack')
+    client = clients['admin']
+
+    plain = client.get('/api/shelves')
+    packed = client.get('/api/shelves', headers={'Accept': 'application/msgpack'})
+
+    assert plain.mimetype == 'application/json' and packed.mimetype == 'application/msgpack'
+    assert 'Accept' in plain.vary and 'Accept' in packed.vary
+    assert plain.get_etag() != packed.get_etag()
+    # A JSON ETag must not revalidate the msgpack representation
+    revalidated = client.get('/api/shelves', headers={'Accept': 'application/msgpack',
+                                                      'If-None-Match': plain.headers['ETag']})
+    assert revalidated.status_code == 200
@@ -0,0 +1,22 @@
+from app import SYSTEM_ROLE, SYSTEM_USERNAME, User, db, system_user_id
+
+
+def test_system_account_cannot_sign_in(app):
+    with app.app_context():
+        user = db.session.get(User, system_user_id())
+        assert (user.username, user.role, user.is_active) == (SYSTEM_USERNAME, SYSTEM_ROLE, False)
+        assert not user.check_password('')
+        assert not user.check_password(user.password_hash)
+
+    response = app.test_client().post('/login', data={'username': SYSTEM_USERNAME, 'password': ''})
+    assert response.status_code != 302
+
+
+def test_system_account_is_hidden_from_user_management(app, clients):
+    with app.app_context():
+        system_id = system_user_id()
+
+    usernames = [user['username'] for user in clients['admin'].get('/get_users').get_json()]
+    assert SYSTEM_USERNAME not in usernames
+    assert clients['admin'].delete(f'/delete_user/{system_id}').status_code == 403
+    assert clients['admin'].put(f'/update_user/{system_id}', json={'is_active': True}).status_code == 403
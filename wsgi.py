@@ -1,4 +1,7 @@
-from app import app
+from app import prepare_app
+
+# Servers started from here get an upgraded schema even without the Procfile release step
+app = prepare_app(init_db=True)
 
 if __name__ == "__main__":
     app.run()